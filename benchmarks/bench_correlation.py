@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Benchmark and check: sliding-window cross-flow correlation in fixed memory.
+
+Streams flow start records from background clients, drawn from a pool of
+N addresses, talking to a few hundred servers on their usual ports, with
+five attacks
+mixed in: an SSH brute force, a vertical and a horizontal port scan, a
+single-source flood and a distributed flood. Checks that
+``CorrelationEngine`` reports every attack and no background flow, that
+each attack raises a single alert however many of its flows are flagged, and
+compares its time per flow and allocated memory with exact sliding-window
+counting (a deque of recent flows plus per-key counters and sets), whose
+memory grows with the number of addresses in the window.
+
+Usage: python benchmarks/bench_correlation.py [--sources 10000,100000,1000000] [--flows N] [--rate N]
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sentinel_core.analysis.correlation import (  # noqa: E402
+    CorrelationEngine, CorrelationThresholds, AUTH_SERVICES, BRUTE_FORCE, VERTICAL_SCAN, HORIZONTAL_SCAN, FLOOD,
+    DDOS
+)
+
+# Reason prefix of each detection in CorrelationEngine findings
+REASONS = {"Brute force": BRUTE_FORCE, "Vertical port scan": VERTICAL_SCAN, "Horizontal scan": HORIZONTAL_SCAN,
+           "Flood": FLOOD, "DDoS": DDOS}
+SERVICES = ((443, "HTTPS"), (443, "HTTPS"), (80, "HTTP"), (53, "DNS"), (22, "SSH"), (3306, "MySQL"))
+
+
+class ExactCorrelator:
+    """Exact counts over the same window: every flow kept until it leaves the window."""
+
+    def __init__(self, thresholds: CorrelationThresholds, window: float):
+        self.thresholds = thresholds
+        self.window = window
+        self.recent = deque()
+        self.counts = Counter()
+        self.distinct = defaultdict(Counter)
+
+    def observe(self, flow):
+        now = flow["timestamp"]
+        src, dst, port, protocol = flow["src_ip"], flow["dst_ip"], flow["dst_port"], flow["protocol"]
+        service = flow["app_type"].upper()
+        keys = [("pair", src, dst), ("sweep", src, protocol, port), ("src", src), ("dst", dst)]
+        if service in AUTH_SERVICES:
+            keys.append(("service", src, dst, service))
+        members = [((src, dst), (protocol, port)), ((src, protocol, port), dst), (dst, src)]
+        self.recent.append((now, keys, members))
+        for key in keys:
+            self.counts[key] += 1
+        for key, item in members:
+            self.distinct[key][item] += 1
+        while self.recent and self.recent[0][0] <= now - self.window:
+            _, old_keys, old_members = self.recent.popleft()
+            for key in old_keys:
+                self.counts[key] -= 1
+                if not self.counts[key]:
+                    del self.counts[key]
+            for key, item in old_members:
+                items = self.distinct[key]
+                items[item] -= 1
+                if not items[item]:
+                    del items[item]
+                    if not items:
+                        del self.distinct[key]
+        thresholds = self.thresholds
+        found = []
+        if self.counts[("service", src, dst, service)] >= thresholds.brute_force:
+            found.append(BRUTE_FORCE)
+        if len(self.distinct.get((src, dst), ())) >= thresholds.vertical_scan:
+            found.append(VERTICAL_SCAN)
+        if len(self.distinct.get((src, protocol, port), ())) >= thresholds.horizontal_scan:
+            found.append(HORIZONTAL_SCAN)
+        if self.counts[("src", src)] >= thresholds.flood:
+            found.append(FLOOD)
+        if (self.counts[("dst", dst)] >= thresholds.ddos_flows
+                and len(self.distinct.get(dst, ())) >= thresholds.ddos_sources):
+            found.append(DDOS)
+        return found
+
+
+def ip(prefix: str, n: int) -> str:
+    return f"{prefix}.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+
+
+def traffic(sources: int, count: int, rate: float, rng: random.Random):
+    """(flow, attack or None) pairs: ``count`` background flows at ``rate`` per second plus the attacks."""
+    flows = []
+    now = 1_700_000_000.0
+    servers = [ip("93", n) for n in range(400)]
+    for _ in range(count):
+        now += rng.expovariate(rate)
+        port, app = rng.choice(SERVICES)
+        flows.append(({"src_ip": ip("10", rng.randrange(sources)), "dst_ip": rng.choice(servers),
+                       "src_port": rng.randint(1024, 65535), "dst_port": port, "protocol": "TCP",
+                       "app_type": app, "timestamp": now, "event": "start"}, None))
+    start, end = flows[0][0]["timestamp"], flows[-1][0]["timestamp"]
+
+    def inject(kind, count, make):
+        at = rng.uniform(start, max(start, end - 30))
+        for n in range(count):
+            flow = {"src_port": rng.randint(1024, 65535), "protocol": "TCP", "app_type": "Unknown",
+                    "timestamp": at + n * 20.0 / count, "event": "start"}
+            flow.update(make(n))
+            flows.append((flow, kind))
+
+    inject(BRUTE_FORCE, 60, lambda n: {"src_ip": "198.51.100.1", "dst_ip": servers[7], "dst_port": 22,
+                                       "app_type": "SSH"})
+    inject(VERTICAL_SCAN, 200, lambda n: {"src_ip": "198.51.100.2", "dst_ip": servers[8], "dst_port": 1 + n * 13})
+    inject(HORIZONTAL_SCAN, 500, lambda n: {"src_ip": "198.51.100.3", "dst_ip": ip("172", n), "dst_port": 445})
+    inject(FLOOD, 6000, lambda n: {"src_ip": "198.51.100.4", "dst_ip": servers[n % 3], "dst_port": 80,
+                                   "app_type": "HTTP"})
+    inject(DDOS, 12000, lambda n: {"src_ip": ip("203", n % 2000), "dst_ip": "192.0.2.80", "dst_port": 80,
+                                   "app_type": "HTTP"})
+    flows.sort(key=lambda pair: pair[0]["timestamp"])
+    return flows
+
+
+def run(correlator, flows, detections):
+    """Feed ``flows``; returns (us per flow, {attack: flagged flows}, background flows flagged)."""
+    flagged = Counter()
+    false_positives = 0
+    start = time.perf_counter()
+    for flow, attack in flows:
+        found = detections(correlator.observe(flow))
+        if attack is None:
+            false_positives += bool(found)
+        elif attack in found:
+            flagged[attack] += 1
+    return (time.perf_counter() - start) / len(flows) * 1e6, flagged, false_positives
+
+
+def sketch_detections(findings):
+    return [REASONS[reason.split(":")[0]] for _, _, reason, _ in findings]
+
+
+def measured(factory, flows, detections):
+    tracemalloc.start()
+    correlator = factory()
+    elapsed, flagged, false_positives = run(correlator, flows, detections)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return correlator, memory, flagged, false_positives
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sources", default="10000,100000,1000000")
+    parser.add_argument("--flows", type=int, default=150_000, help="background flows per run")
+    parser.add_argument("--rate", type=float, default=5000, help="background flows per second")
+    args = parser.parse_args()
+    rng = random.Random(5)
+    thresholds = CorrelationThresholds()
+
+    print(f"{'sources':>9} {'flows':>9} {'sketch us':>10} {'sketch MB':>10} {'exact us':>9} {'exact MB':>9}  "
+          f"flagged attack flows (sketch / exact)")
+    for sources in map(int, args.sources.split(",")):
+        flows = traffic(sources, args.flows, args.rate, rng)
+        engine, sketch_memory, flagged, false_positives = measured(CorrelationEngine, flows, sketch_detections)
+        assert not false_positives, f"{false_positives} background flows flagged"
+        assert set(flagged) == {BRUTE_FORCE, VERTICAL_SCAN, HORIZONTAL_SCAN, FLOOD, DDOS}, flagged
+        # Every attack lasts 20s, within one window: one alert each
+        alerts = engine.get_stats()["alerts"]
+        assert all(count == 1 for count in alerts.values()), alerts
+        sketch_us = run(CorrelationEngine(), flows, sketch_detections)[0]
+
+        exact, exact_memory, exact_flagged, exact_false = measured(
+            lambda: ExactCorrelator(thresholds, engine.window), flows, lambda found: found)
+        assert not exact_false
+        exact_us = run(ExactCorrelator(thresholds, engine.window), flows, lambda found: found)[0]
+        summary = ", ".join(f"{kind} {flagged[kind]}/{exact_flagged[kind]}" for kind in exact_flagged)
+        print(f"{sources:>9,} {len(flows):>9,} {sketch_us:>10.1f} {sketch_memory / 1e6:>10.1f} {exact_us:>9.1f} "
+              f"{exact_memory / 1e6:>9.1f}  {summary}")
+    stats = engine.get_stats()
+    print(f"sketch memory bound: {engine.memory_bytes() / 1e6:.1f} MB; last run: flagged {stats['detections']}, "
+          f"alerts {stats['alerts']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Benchmark: JSON vs columnar flow export, and columnar column loads.
+
+Fills a PacketCapture flow table with synthetic flows, exports it with
+``export_flows`` in both formats and reports time and size, then times
+loading two numeric columns back memory-mapped and checks that an empty
+export reads back.
+
+Usage: python benchmarks/bench_flow_export.py [--flows N] [--out DIR]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sentinel_core.capture.columnar import ColumnarFlowReader  # noqa: E402
+from sentinel_core.capture.flow import FlowStats  # noqa: E402
+from sentinel_core.capture.live_capture import PacketCapture  # noqa: E402
+
+
+def fill(capture: PacketCapture, count: int):
+    for i in range(count):
+        key = ("TCP", f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", 1024 + i % 60000, "93.184.216.34", 443)
+        flow = FlowStats(key, False, 1_700_000_000.0 + i)
+        flow.last_seen = flow.start_time + 1.5
+        flow.packets = 10 + i % 100
+        flow.bytes_sent = 1000 + i
+        flow.bytes_received = 5000 + i
+        flow.app_type = "HTTPS"
+        flow.tls_version = "TLS 1.3"
+        flow.sni = f"host{i % 1000}.example.com"
+        capture.flows.insert(key, flow)
+
+
+def size_of(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flows", type=int, default=200_000)
+    parser.add_argument("--out", default=None, help="scratch directory (default: a temp dir)")
+    args = parser.parse_args()
+
+    out = args.out or tempfile.mkdtemp(prefix="sentinel-export-")
+    capture = PacketCapture(interface="lo", max_flows=args.flows + 1)
+    fill(capture, args.flows)
+    try:
+        for label, path in (("json", os.path.join(out, "flows.json")),
+                            ("columnar", os.path.join(out, "flows.cols"))):
+            start = time.perf_counter()
+            capture.export_flows(path, format=label)
+            elapsed = time.perf_counter() - start
+            print(f"{label:>9}: {args.flows:>9} flows in {elapsed:7.3f}s "
+                  f"-> {args.flows / elapsed:>10,.0f} flows/s, {size_of(path) / 1e6:8.1f} MB")
+
+        start = time.perf_counter()
+        with ColumnarFlowReader(os.path.join(out, "flows.cols")) as reader:
+            columns = reader.read(["bytes_sent", "bytes_received"])
+            total = sum(int(sum(column[:1])) for column in columns.values())
+        print(f"     load: 2 columns memory-mapped in {time.perf_counter() - start:7.4f}s "
+              f"(numpy={reader.use_numpy}, check {total})")
+
+        # An empty table round-trips through the columnar format, with and without NumPy
+        empty = os.path.join(out, "empty.cols")
+        assert PacketCapture(interface="lo").export_flows(empty, format="columnar") == 0
+        for use_numpy in (True, False):
+            with ColumnarFlowReader(empty, use_numpy=use_numpy) as reader:
+                assert reader.rows == 0
+                assert all(not reader.values(name) for name in reader.columns)
+        print("    empty: 0-row export reads back")
+    finally:
+        if args.out is None:
+            shutil.rmtree(out, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
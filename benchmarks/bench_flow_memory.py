@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Benchmark: bytes per flow for the legacy FlowKey/FlowStats objects vs the compact ones.
+
+Allocates N concurrent flows (default 1,000,000) into a dict keyed the way each
+implementation keys its flow table and reports tracemalloc's net allocation
+divided by N. The "before" classes are verbatim copies of the pre-slots
+implementation so the comparison stays reproducible.
+
+Usage: python benchmarks/bench_flow_memory.py [--flows N]
+"""
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sentinel_core.capture.flow import FlowStats, canonical_flow_key  # noqa: E402
+from sentinel_core.capture.flow_table import FlowTable  # noqa: E402
+
+
+class LegacyFlowKey:
+    """Pre-change flow key (one object per packet, per-instance __dict__)."""
+    def __init__(self, src_ip, dst_ip, src_port, dst_port, protocol):
+        self.src_ip = src_ip
+        self.dst_ip = dst_ip
+        self.src_port = src_port
+        self.dst_port = dst_port
+        self.protocol = protocol
+
+    def __hash__(self):
+        return hash((self.src_ip, self.dst_ip, self.src_port, self.dst_port, self.protocol))
+
+    def __eq__(self, other):
+        return (self.src_ip == other.src_ip and self.dst_ip == other.dst_ip and
+                self.src_port == other.src_port and self.dst_port == other.dst_port and
+                self.protocol == other.protocol)
+
+
+class LegacyFlowStats:
+    """Pre-change flow record (instance __dict__ plus two unused sets)."""
+    def __init__(self, flow_key):
+        self.flow_key = flow_key
+        self.start_time = time.time()
+        self.last_seen = time.time()
+        self.packets = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.tls_version = None
+        self.sni = None
+        self.ja3 = None
+        self.app_type = "unknown"
+        self.payload_hashes = set()
+        self.ports_seen = set()
+
+
+def endpoints(i: int):
+    """Distinct, freshly allocated address strings/ports for flow ``i``."""
+    return (f"10.{(i >> 16) & 0xFF}.{(i >> 8) & 0xFF}.{i & 0xFF}", f"172.16.{(i >> 8) & 0xFF}.{i & 0xFF}",
+            40000 + (i % 20000), 443, "TCP")
+
+
+def measure(label: str, build, flows: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    table = build(flows)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    per_flow = used / flows
+    print(f"{label:>22}: {used / 2**20:9.1f} MiB total, {per_flow:7.1f} bytes/flow ({len(table)} flows)")
+    del table
+    return per_flow
+
+
+def build_legacy(flows: int):
+    table = {}
+    for i in range(flows):
+        key = LegacyFlowKey(*endpoints(i))
+        table[key] = LegacyFlowStats(key)
+    return table
+
+
+def build_compact_dict(flows: int):
+    table = {}
+    now = time.time()
+    for i in range(flows):
+        key, reverse = canonical_flow_key(*endpoints(i))
+        table[key] = FlowStats(key, reverse, now)
+    return table
+
+
+def build_compact_table(flows: int):
+    table = FlowTable(max_flows=flows)
+    now = time.time()
+    for i in range(flows):
+        key, reverse = canonical_flow_key(*endpoints(i))
+        table.insert(key, FlowStats(key, reverse, now))
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    before = measure("before (dict)", build_legacy, args.flows)
+    after = measure("after (dict)", build_compact_dict, args.flows)
+    measure("after (FlowTable+wheel)", build_compact_table, args.flows)
+    print(f"reduction: {before / after:.2f}x fewer bytes per flow "
+          f"(address strings are included in both)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Benchmark and check: incremental HTTP/1.x and HTTP/2 request parsing.
+
+Checks HPACK against the RFC 7541 appendix C examples (Huffman strings and
+the dynamic table), then feeds pipelined HTTP/1.1 requests (Content-Length
+and chunked bodies) and an HTTP/2 connection (padded and continued header
+blocks, DATA across frames) in TCP-sized and 1-byte pieces, checking every
+request against what was sent. Timing: MB/s of request stream parsed
+(bodies beyond the kept prefix are only counted) and requests/s with the
+attack classifier run on each request's inspected fields.
+
+Usage: python benchmarks/bench_http_parser.py [--requests N] [--body BYTES]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sentinel_core.analysis.attack_classifier import AttackClassifier  # noqa: E402
+from sentinel_core.capture.http_parser import (  # noqa: E402
+    HTTP2_PREFACE, DEFAULT_MAX_BODY, HPACKDecoder, HTTPStreamParser, huffman_decode,
+)
+
+# RFC 7541 C.4: three requests on one connection, Huffman-coded, sharing the dynamic table
+RFC_BLOCKS = (
+    ("828684418cf1e3c2e5f23a6ba0ab90f4ff", b"/", b"www.example.com"),
+    ("828684be5886a8eb10649cbf", b"/", b"www.example.com"),
+    ("828785bf408825a849e95ba97d7f8925a849e95bb8e8b4bf", b"/index.html", b"www.example.com"),
+)
+RFC_HUFFMAN = (
+    ("d07abe941054d444a8200595040b8166e082a62d1bff", b"Mon, 21 Oct 2013 20:13:21 GMT"),
+    ("9d29ad171863c78f0b97c8e9ae82ae43d3", b"https://www.example.com"),
+)
+
+
+def http1_stream(requests: int, body: bytes) -> bytes:
+    out = []
+    for i in range(requests):
+        if i % 3 == 0:
+            out.append(f"GET /item?id={i} HTTP/1.1\r\nHost: bench.example\r\nUser-Agent: bench\r\n\r\n".encode())
+        elif i % 3 == 1:
+            out.append(f"POST /form/{i} HTTP/1.1\r\nHost: bench.example\r\nContent-Length: {len(body)}\r\n"
+                       f"Cookie: a=1\r\n\r\n".encode() + body)
+        else:
+            chunks = b"".join(b"%x;ext=1\r\n%s\r\n" % (len(body[j:j + 1000]), body[j:j + 1000])
+                              for j in range(0, len(body), 1000))
+            out.append(f"PUT /upload/{i} HTTP/1.1\r\nHost: bench.example\r\nTransfer-Encoding: chunked\r\n\r\n"
+                       .encode() + chunks + b"0\r\nX-Trailer: 1\r\n\r\n")
+    return b"".join(out)
+
+
+def literal(name: bytes, value: bytes) -> bytes:
+    """HPACK literal header field without indexing, new name, no Huffman (lengths < 127)."""
+    return b"\x00" + bytes((len(name),)) + name + bytes((len(value),)) + value
+
+
+def frame(frame_type: int, flags: int, stream_id: int, payload: bytes) -> bytes:
+    return len(payload).to_bytes(3, "big") + bytes((frame_type, flags)) + stream_id.to_bytes(4, "big") + payload
+
+
+def http2_stream(requests: int, body: bytes) -> bytes:
+    out = [HTTP2_PREFACE, frame(0x4, 0, 0, b""), frame(0x8, 0, 0, b"\x00\x01\x00\x00")]
+    for block, _, _ in RFC_BLOCKS:
+        stream_id = 2 * len(out) + 1
+        out.append(frame(0x1, 0x5, stream_id, bytes.fromhex(block)))
+    for i in range(requests):
+        stream_id = 1001 + 2 * i
+        block = (b"\x83" + literal(b":path", b"/api/%d" % i) + literal(b":authority", b"bench.example")
+                 + literal(b"user-agent", b"bench") + literal(b"x-ignored", b"1"))
+        # Padded + priority HEADERS, then a CONTINUATION with the rest of the block
+        head = b"\x03" + b"\x00\x00\x00\x00\x10" + block[:10] + b"\x00" * 3
+        out.append(frame(0x1, 0x8 | 0x20, stream_id, head))
+        out.append(frame(0x9, 0x4, stream_id, block[10:]))
+        half = len(body) // 2
+        out.append(frame(0x0, 0x8, stream_id, b"\x02" + body[:half] + b"\x00\x00"))
+        out.append(frame(0x0, 0x1, stream_id, body[half:]))
+    return b"".join(out)
+
+
+def parse(stream: bytes, piece: int, classify: bool = False):
+    requests = []
+    if classify:
+        def on_request(request):
+            requests.append(request)
+            AttackClassifier.classify_request(request.inspection_text())
+    else:
+        on_request = requests.append
+    parser = HTTPStreamParser(on_request)
+    for i in range(0, len(stream), piece):
+        assert parser.feed(stream[i:i + piece]), parser.error
+    return requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--body", type=int, default=8192)
+    args = parser.parse_args()
+    body = (b"comment=" + b"lorem ipsum dolor " * (args.body // 18 + 1))[:args.body]
+
+    for encoded, text in RFC_HUFFMAN:
+        assert huffman_decode(bytes.fromhex(encoded)) == text
+    decoder = HPACKDecoder()
+    for block, path, authority in RFC_BLOCKS:
+        headers = dict(decoder.decode(bytes.fromhex(block)))
+        assert headers[b":path"] == path and headers[b":authority"] == authority, headers
+    assert decoder.table_size == 164, decoder.table_size
+
+    streams = (("HTTP/1.1", http1_stream(args.requests, body)), ("HTTP/2", http2_stream(args.requests, body)))
+    for label, stream in streams:
+        expected = args.requests + (len(RFC_BLOCKS) if label == "HTTP/2" else 0)
+        small = parse(stream[:200_000], 1)
+        requests = parse(stream, 1460)
+        assert len(requests) == expected, (label, len(requests))
+        assert [r.uri for r in small] == [r.uri for r in requests[:len(small)]], label
+        for request in requests[-args.requests:]:
+            assert request.header(b"host") == "bench.example", (label, request.headers)
+            if request.method != b"GET":
+                assert request.body_length == len(body) and bytes(request.body) == body[:DEFAULT_MAX_BODY], label
+        if label == "HTTP/2":
+            assert b"x-ignored" not in requests[-1].headers
+        start = time.perf_counter()
+        parse(stream, 1460)
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        parse(stream, 1460, classify=True)
+        classified = time.perf_counter() - start
+        print(f"{label:>9}: {len(stream) / elapsed / 1e6:7.1f} MB/s, {expected / elapsed:9,.0f} requests/s; "
+              f"with classify_request {expected / classified:8,.0f} requests/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Benchmark: cost of hot-path instrumentation in PacketCapture.
+
+Runs the same synthetic frame mix through ``process_frame`` (fast path) and
+``process_packet`` (pre-dissected Scapy packets) with ``instrument=False``
+and ``instrument=True``, interleaving the runs and keeping the best of
+``--rounds`` to damp noise, and reports the relative overhead.
+
+Usage: python benchmarks/bench_instrumentation.py [--packets N] [--flows N] [--rounds N]
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scapy.all import Ether  # noqa: E402
+
+from bench_capture_decoder import build_frames  # noqa: E402
+from sentinel_core.capture.live_capture import PacketCapture  # noqa: E402
+
+
+def run_once(instrument: bool, items, scapy: bool) -> float:
+    capture = PacketCapture(interface="lo", fast_path=not scapy, instrument=instrument)
+    process = capture.process_packet if scapy else capture.process_frame
+    start = time.perf_counter()
+    for item in items:
+        process(item)
+    elapsed = time.perf_counter() - start
+    if instrument and not scapy:
+        run_once.last_metrics = capture.get_metrics()
+    return elapsed
+
+
+def compare(label: str, items, scapy: bool, rounds: int):
+    best = {False: float("inf"), True: float("inf")}
+    for _ in range(rounds):
+        for instrument in (False, True):
+            best[instrument] = min(best[instrument], run_once(instrument, items, scapy))
+    off, on = best[False], best[True]
+    print(f"{label:>6}: off {len(items) / off:>10,.0f} pkt/s | on {len(items) / on:>10,.0f} pkt/s "
+          f"| overhead {100 * (on - off) / off:+.2f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packets", type=int, default=100_000)
+    parser.add_argument("--flows", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    frames = build_frames(args.packets, args.flows)
+    compare("fast", frames, scapy=False, rounds=args.rounds)
+    packets = [Ether(frame) for frame in frames[:args.packets // 5]]
+    compare("scapy", packets, scapy=True, rounds=args.rounds)
+
+    metrics = run_once.last_metrics
+    print("stages:", json.dumps({stage: {k: v for k, v in stats.items() if k != "buckets"}
+                                 for stage, stats in metrics["stages"].items()}, indent=1))
+
+
+if __name__ == "__main__":
+    main()
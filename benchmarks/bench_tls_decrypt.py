@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Benchmark and check: decrypting TLS 1.2 / 1.3 sessions with key log secrets.
+
+Runs real OpenSSL client/server handshakes in memory (``ssl.MemoryBIO``)
+with ``keylog_filename`` set, records both directions' bytes, then feeds
+them to ``TLSSession`` in small chunks and checks the decrypted plaintext
+against what was sent. Unsupported (CBC) suites must be reported as such.
+Timing: session throughput in MB/s of application data, with keys derived
+once per session.
+
+Usage: python benchmarks/bench_tls_decrypt.py [--mb N]
+"""
+import argparse
+import datetime
+import os
+import shutil
+import ssl
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cryptography import x509  # noqa: E402
+from cryptography.hazmat.primitives import hashes, serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec  # noqa: E402
+from cryptography.x509.oid import NameOID  # noqa: E402
+
+from sentinel_core.capture.keylog import KeyStore, KeyLogFollower  # noqa: E402
+from sentinel_core.capture.tls_session import TLSSession, STATE_DECRYPTING, STATE_UNSUPPORTED  # noqa: E402
+
+REQUEST = b"GET /bench HTTP/1.1\r\nHost: bench.example\r\nUser-Agent: bench/1.0\r\n\r\n"
+
+
+def write_certificate(directory: str):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "bench.example")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(1).not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1)).sign(key, hashes.SHA256()))
+    cert_path, key_path = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+def record_session(directory: str, keylog: str, version, ciphers, response_bytes: int):
+    """Handshake, one request and a response of ``response_bytes``; returns [(direction, bytes)]."""
+    cert_path, key_path = write_certificate(directory)
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(cert_path, key_path)
+    client_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    client_context.check_hostname = False
+    client_context.verify_mode = ssl.CERT_NONE
+    client_context.keylog_filename = keylog
+    for context in (server_context, client_context):
+        context.minimum_version = context.maximum_version = version
+        if ciphers:
+            context.set_ciphers(ciphers)
+    client_in, client_out, server_in, server_out = (ssl.MemoryBIO() for _ in range(4))
+    client = client_context.wrap_bio(client_in, client_out, server_hostname="bench.example")
+    server = server_context.wrap_bio(server_in, server_out, server_side=True)
+    wire = []
+
+    def pump():
+        data = client_out.read()
+        if data:
+            wire.append((0, data))
+            server_in.write(data)
+        data = server_out.read()
+        if data:
+            wire.append((1, data))
+            client_in.write(data)
+
+    done = [False, False]
+    while not all(done):
+        for i, side in enumerate((client, server)):
+            if not done[i]:
+                try:
+                    side.do_handshake()
+                    done[i] = True
+                except ssl.SSLWantReadError:
+                    pass
+        pump()
+    client.write(REQUEST)
+    pump()
+    server.read(65536)
+    chunk = os.urandom(16384)
+    for _ in range(response_bytes // len(chunk)):
+        server.write(chunk)
+        pump()
+    return wire
+
+
+def decrypt(wire, store, chunk: int = 1460):
+    received = {0: 0, 1: 0}
+
+    def sink(_key, direction, plaintext):
+        received[direction] += len(plaintext)
+    session = TLSSession(("TCP", "10.0.0.1", 40000, "10.0.0.2", 443), store.get, sink)
+    for direction, data in wire:
+        for i in range(0, len(data), chunk):
+            session.feed(direction, data[i:i + chunk])
+    return session, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=float, default=16, help="response size per session")
+    args = parser.parse_args()
+    response_bytes = int(args.mb * 1024 * 1024) // 16384 * 16384
+
+    directory = tempfile.mkdtemp(prefix="sentinel-tls-")
+    try:
+        cases = (
+            ("TLS 1.3 AES-GCM", ssl.TLSVersion.TLSv1_3, None),
+            ("TLS 1.2 AES-128-GCM", ssl.TLSVersion.TLSv1_2, "ECDHE-ECDSA-AES128-GCM-SHA256"),
+            ("TLS 1.2 AES-256-GCM", ssl.TLSVersion.TLSv1_2, "ECDHE-ECDSA-AES256-GCM-SHA384"),
+            ("TLS 1.2 CHACHA20", ssl.TLSVersion.TLSv1_2, "ECDHE-ECDSA-CHACHA20-POLY1305"),
+        )
+        for label, version, ciphers in cases:
+            keylog = os.path.join(directory, f"keys-{len(os.listdir(directory))}.log")
+            wire = record_session(directory, keylog, version, ciphers, response_bytes)
+            store = KeyStore()
+            KeyLogFollower(keylog, store).poll()
+            start = time.perf_counter()
+            session, received = decrypt(wire, store)
+            elapsed = time.perf_counter() - start
+            assert session.state == STATE_DECRYPTING, (label, session.state, session.reason)
+            assert received == {0: len(REQUEST), 1: response_bytes}, (label, received)
+            assert session.http and session.http["uri"] == "/bench", label
+            print(f"{label:>20}: {response_bytes / elapsed / 1e6:7.1f} MB/s  "
+                  f"({session.records_decrypted} records, {session.key_derivations} key derivations)")
+
+        keylog = os.path.join(directory, "keys-cbc.log")
+        wire = record_session(directory, keylog, ssl.TLSVersion.TLSv1_2, "ECDHE-ECDSA-AES128-SHA", 16384)
+        store = KeyStore()
+        KeyLogFollower(keylog, store).poll()
+        session, _ = decrypt(wire, store)
+        assert session.state == STATE_UNSUPPORTED, session.state
+        print(f"{'TLS 1.2 CBC':>20}: {session.reason}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
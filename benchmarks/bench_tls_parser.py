@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Benchmark and corpus/fuzz check for the structural ClientHello parser.
+
+Corpus: real ClientHellos produced by the local OpenSSL (``ssl.MemoryBIO``)
+under a range of client settings, plus a synthetic Chrome-style hello with
+GREASE values whose JA4 is the published reference value. Each corpus entry
+is checked against Scapy's TLS dissector (SNI, cipher suites, extension
+order, ALPN), re-parsed split across several TLS records, and every strict
+prefix must raise ``TLSIncomplete``. The fuzz pass mutates corpus entries
+(bit flips, byte overwrites, corrupted length fields, truncation) and
+requires the parser to either succeed or raise ``TLSParseError``.
+
+Timing: ``parse_client_hello`` + JA3 + JA4 vs Scapy's ``TLS()`` dissection.
+
+Usage: python benchmarks/bench_tls_parser.py [--iterations N] [--fuzz N]
+"""
+import argparse
+import random
+import ssl
+import struct
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scapy.layers.tls.all import TLS  # noqa: E402
+
+from sentinel_core.capture.tls_parser import (  # noqa: E402
+    parse_client_hello, TLSParseError, TLSIncomplete, is_grease
+)
+
+# JA4 of the Chrome ClientHello described in the JA4 specification
+REFERENCE_JA4 = "t13d1516h2_8daaf6152771_02713d6af862"
+
+
+def openssl_client_hello(server_hostname=None, alpn=None, maximum_version=None, ciphers=None) -> bytes:
+    """First flight of a real OpenSSL client handshake."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    if alpn:
+        context.set_alpn_protocols(alpn)
+    if maximum_version:
+        context.maximum_version = maximum_version
+    if ciphers:
+        context.set_ciphers(ciphers)
+    incoming, outgoing = ssl.MemoryBIO(), ssl.MemoryBIO()
+    client = context.wrap_bio(incoming, outgoing, server_hostname=server_hostname)
+    try:
+        client.do_handshake()
+    except ssl.SSLWantReadError:
+        pass
+    return outgoing.read()
+
+
+def _ext(ext_type: int, body: bytes) -> bytes:
+    return struct.pack("!HH", ext_type, len(body)) + body
+
+
+def _u16s(values) -> bytes:
+    return b"".join(struct.pack("!H", v) for v in values)
+
+
+def chrome_like_client_hello() -> bytes:
+    """A ClientHello with the cipher/extension/signature lists of the JA4 reference example."""
+    ciphers = [0x0A0A, 0x1301, 0x1302, 0x1303, 0xC02B, 0xC02F, 0xC02C, 0xC030, 0xCCA9, 0xCCA8,
+               0xC013, 0xC014, 0x009C, 0x009D, 0x002F, 0x0035]
+    sig_algs = [0x0403, 0x0804, 0x0401, 0x0503, 0x0805, 0x0501, 0x0806, 0x0601]
+    name = b"www.example.com"
+    sni = struct.pack("!HBH", len(name) + 3, 0, len(name)) + name
+    alpn_list = b"\x02h2\x08http/1.1"
+    extensions = b"".join([
+        _ext(0x1A1A, b""),
+        _ext(0x0000, sni),
+        _ext(0x0017, b""),
+        _ext(0xFF01, b"\x00"),
+        _ext(0x000A, struct.pack("!H", 8) + _u16s([0x2A2A, 0x001D, 0x0017, 0x0018])),
+        _ext(0x000B, b"\x01\x00"),
+        _ext(0x0023, b""),
+        _ext(0x0010, struct.pack("!H", len(alpn_list)) + alpn_list),
+        _ext(0x0005, b"\x01\x00\x00\x00\x00"),
+        _ext(0x000D, struct.pack("!H", 2 * len(sig_algs)) + _u16s(sig_algs)),
+        _ext(0x0012, b""),
+        _ext(0x0033, struct.pack("!H", 5) + _u16s([0x3A3A, 0x0001]) + b"\x00"),
+        _ext(0x002D, b"\x01\x01"),
+        _ext(0x002B, b"\x06" + _u16s([0x4A4A, 0x0304, 0x0303])),
+        _ext(0x001B, b"\x02\x00\x02"),
+        _ext(0x4469, b"\x00\x03\x02h2"),
+        _ext(0xFE0D, b"\x00" * 8),
+        _ext(0x5A5A, b"\x00"),
+    ])
+    body = (struct.pack("!H", 0x0303) + bytes(range(32)) + b"\x20" + bytes(32)
+            + struct.pack("!H", 2 * len(ciphers)) + _u16s(ciphers) + b"\x01\x00"
+            + struct.pack("!H", len(extensions)) + extensions)
+    handshake = b"\x01" + len(body).to_bytes(3, "big") + body
+    return struct.pack("!BHH", 0x16, 0x0301, len(handshake)) + handshake
+
+
+def build_corpus():
+    corpus = {
+        "default-sni": openssl_client_hello("example.com"),
+        "no-sni": openssl_client_hello(None),
+        "alpn-h2": openssl_client_hello("api.example.org", alpn=["h2", "http/1.1"]),
+        "tls12-only": openssl_client_hello("legacy.example.net", maximum_version=ssl.TLSVersion.TLSv1_2),
+        "tls12-ecdhe": openssl_client_hello("x.example", maximum_version=ssl.TLSVersion.TLSv1_2,
+                                            ciphers="ECDHE+AESGCM"),
+        "long-sni": openssl_client_hello("a" * 60 + ".b" * 40 + ".example.com", alpn=["http/1.1"]),
+        "chrome-like": chrome_like_client_hello(),
+    }
+    return corpus
+
+
+def split_records(data: bytes, sizes) -> bytes:
+    """Re-frame one handshake record's payload across several records of the given sizes."""
+    payload = data[5:]
+    out = []
+    pos = 0
+    for size in sizes:
+        if pos >= len(payload):
+            break
+        out.append(struct.pack("!BHH", 0x16, 0x0301, len(payload[pos:pos + size])) + payload[pos:pos + size])
+        pos += size
+    if pos < len(payload):
+        out.append(struct.pack("!BHH", 0x16, 0x0301, len(payload) - pos) + payload[pos:])
+    return b"".join(out)
+
+
+def check_corpus(corpus) -> None:
+    for name, data in corpus.items():
+        hello = parse_client_hello(data)
+        reference = TLS(data).msg[0]
+        ref_ext = [ext.type for ext in (reference.ext or [])]
+        assert hello.cipher_suites == list(reference.ciphers), name
+        assert hello.extensions == ref_ext, (name, hello.extensions, ref_ext)
+        assert hello.random[4:] == bytes(reference.random_bytes), name
+        if 0 in ref_ext and hello.sni is None:
+            raise AssertionError(f"{name}: SNI missed")
+        for ext in reference.ext or []:
+            if ext.type == 0 and ext.servernames:
+                assert hello.sni == ext.servernames[0].servername.decode(), name
+            if ext.type == 16:
+                assert hello.alpn == [p.protocol.decode() for p in ext.protocols], name
+        assert not any(is_grease(int(v)) for field in hello.ja3_string().split(",")[1:]
+                       for v in field.split("-") if v), f"{name}: GREASE in JA3 string"
+        # Same result when the handshake is split over several records
+        for sizes in ([1, 3, 50], [2], [100, 100, 100], [7] * 200):
+            split = parse_client_hello(split_records(data, sizes))
+            assert (split.sni, split.cipher_suites, split.extensions, split.ja4()) == \
+                (hello.sni, hello.cipher_suites, hello.extensions, hello.ja4()), (name, sizes)
+        # Every strict prefix is incomplete, never an error or a bogus result
+        for cut in range(len(data)):
+            try:
+                parse_client_hello(data[:cut])
+            except TLSIncomplete:
+                continue
+            raise AssertionError(f"{name}: prefix of {cut} bytes did not raise TLSIncomplete")
+        print(f"  {name:>12}: {len(data):4d} B  {hello.version_name:<7}  sni={hello.sni!s:<24.24}  "
+              f"alpn={','.join(hello.alpn) or '-':<11} ja4={hello.ja4()}")
+    assert parse_client_hello(corpus["chrome-like"]).ja4() == REFERENCE_JA4, "JA4 reference mismatch"
+
+
+def fuzz(corpus, iterations: int, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    samples = list(corpus.values())
+    outcomes = {"parsed": 0, "incomplete": 0, "rejected": 0}
+    for _ in range(iterations):
+        data = bytearray(rng.choice(samples))
+        mutation = rng.randrange(4)
+        if mutation == 0:
+            for _ in range(rng.randint(1, 8)):
+                data[rng.randrange(len(data))] ^= 1 << rng.randrange(8)
+        elif mutation == 1:
+            for _ in range(rng.randint(1, 4)):
+                data[rng.randrange(len(data))] = rng.randrange(256)
+        elif mutation == 2:
+            # Corrupt a 16-bit length-looking field
+            pos = rng.randrange(len(data) - 1)
+            struct.pack_into("!H", data, pos, rng.choice([0, 1, 0xFFFF, len(data), rng.randrange(65536)]))
+        else:
+            del data[rng.randrange(len(data)):]
+        try:
+            hello = parse_client_hello(data)
+            hello.ja3()
+            hello.ja4()
+            outcomes["parsed"] += 1
+        except TLSIncomplete:
+            outcomes["incomplete"] += 1
+        except TLSParseError:
+            outcomes["rejected"] += 1
+    print(f"  fuzz: {iterations} mutations -> {outcomes} (no unexpected exceptions)")
+
+
+def bench(label, fn, data, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(data)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>22}: {iterations / elapsed:>10,.0f} hellos/s ({elapsed / iterations * 1e6:7.2f} us)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--fuzz", type=int, default=50_000)
+    args = parser.parse_args()
+
+    corpus = build_corpus()
+    print("corpus:")
+    check_corpus(corpus)
+    fuzz(corpus, args.fuzz)
+
+    data = corpus["alpn-h2"]
+    parse_only = bench("parse_client_hello", parse_client_hello, data, args.iterations)
+
+    def fingerprint(raw):
+        hello = parse_client_hello(raw)
+        return hello.ja3(), hello.ja4()
+    bench("parse + JA3 + JA4", fingerprint, data, args.iterations)
+    scapy = bench("scapy TLS()", TLS, data, max(1, args.iterations // 20))
+    print(f"parse speedup vs scapy: {scapy / max(1, args.iterations // 20) / (parse_only / args.iterations):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 """Attack type classification with CVSS 3.1 scoring and industry-standard signatures."""
-import re
 import hashlib
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
+from .rules import RuleEngine
+from .intel import ThreatIntel, INTEL_CONFIDENCE
+
 
 class AttackType(Enum):
     """OWASP Top 10 + CWE attack classifications."""
@@ -23,6 +25,7 @@ class AttackType(Enum):
     PATH_TRAVERSAL = "CWE-22 Path Traversal"
     COMMAND_INJECTION = "CWE-78 OS Command Injection"
     INFORMATION_DISCLOSURE = "Information Disclosure"
+    RECONNAISSANCE = "Reconnaissance / Port Scan"
     NORMAL = "Normal Traffic"
 
 
@@ -69,108 +72,85 @@ class CVSSScore:
 class AttackClassifier:
     """Classify network traffic and payloads for attack patterns."""
     
-    # Attack signatures and patterns
-    ATTACK_SIGNATURES = {
-        AttackType.SQL_INJECTION: [
-            r"'\s*(OR|AND)\s*'?1'?\s*=\s*'?1'?",
-            r"(UNION|SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE)\s*\(",
-            r"(union\s+select|select.*from|insert.*into|drop\s+table)",
-            r";.*--(--|#|/\*)",
-        ],
-        AttackType.CROSS_SITE_SCRIPTING: [
-            r"<script[^>]*>",
-            r"javascript:",
-            r"on(load|error|click|mouseover|focus)\s*=",
-            r"<iframe[^>]*>",
-            r"<img[^>]*onerror=",
-            r"<svg[^>]*on",
-        ],
-        AttackType.PATH_TRAVERSAL: [
-            r"(\.\./|\.\.\\|\.\%2f|\.\%5c|%2e%2e)",
-            r"(/etc/passwd|/etc/shadow|c:\\windows\\system32)",
-            r"(\.{2,}[/\\])+",
-        ],
-        AttackType.COMMAND_INJECTION: [
-            r"([|&;`$\(\)\{\}])+.*(/bin/sh|cmd\.exe|powershell)",
-            r"(\$\(|`)[^)]*(/bin|cmd|powershell)",
-        ],
-        AttackType.MALWARE_INDICATOR: [
-            r"\.(exe|dll|scr|vbs|bat|cmd|ps1|msi|cab)\b",
-            r"(mimikatz|psexec|metasploit|havoc|cobalt)",
-        ],
-    }
-    
-    # Common C2 domains (stub - in real scenario, use threat intel feeds)
-    C2_DOMAINS = {
-        "malware-c2.com", "botnet-command.net", "exploit-kit.ru"
-    }
-    
-    # Port-based suspicious patterns
-    SUSPICIOUS_PORTS = {
-        4444, 5555, 6666, 7777, 8888,  # Metasploit defaults
-        31337,  # Back Orifice
-        666, 999,  # Common backdoors
-    }
+    # Signatures, suspicious ports and flow thresholds live in a rule file
+    # (default.rules); the engine is built on first use or set by use_rules()
+    _rule_engine: Optional[RuleEngine] = None
+    # Known C2 / malicious domains and networks (feeds/); built on first use or set by use_intel()
+    _intel: Optional[ThreatIntel] = None
+
+    @staticmethod
+    def rule_engine() -> RuleEngine:
+        """The rule engine classification uses (the default rules unless use_rules was called)."""
+        engine = AttackClassifier._rule_engine
+        if engine is None:
+            engine = AttackClassifier._rule_engine = RuleEngine()
+        return engine
 
     @staticmethod
-    def classify_flow(flow: Dict) -> Tuple[AttackType, float, List[str]]:
+    def use_rules(engine: RuleEngine):
+        """Classify with ``engine`` from now on."""
+        AttackClassifier._rule_engine = engine
+
+    @staticmethod
+    def intel() -> ThreatIntel:
+        """The threat intel classification uses (the bundled feeds unless use_intel was called)."""
+        intel = AttackClassifier._intel
+        if intel is None:
+            intel = AttackClassifier._intel = ThreatIntel()
+        return intel
+
+    @staticmethod
+    def use_intel(intel: ThreatIntel):
+        """Check flows against ``intel`` from now on."""
+        AttackClassifier._intel = intel
+
+    @staticmethod
+    def classify_flow(flow: Dict, rules: Optional[RuleEngine] = None,
+                      intel: Optional[ThreatIntel] = None) -> Tuple[AttackType, float, List[str]]:
         """Classify a flow and return (attack_type, confidence, reasons)."""
         reasons = []
         confidence = 0.0
         attack_type = AttackType.NORMAL
         
-        # Check for brute force patterns
-        if flow.get("app_type") in ["SSH", "HTTP"]:
-            # In real scenario, correlate multiple flows
-            if flow.get("packets") > 100 and flow.get("duration", 1) < 5:
-                reasons.append("High packet rate in short duration (brute force indicator)")
-                confidence = max(confidence, 0.65)
-                attack_type = AttackType.BROKEN_AUTH
+        # Flow rules in file order; the last match sets the type
+        for rule in (rules or AttackClassifier.rule_engine()).match_flow(flow):
+            reasons.append(rule.reason(flow))
+            confidence = max(confidence, rule.confidence)
+            attack_type = rule.attack_type
         
-        # Check for suspicious ports
-        if flow.get("dst_port") in AttackClassifier.SUSPICIOUS_PORTS:
-            reasons.append(f"Traffic to suspicious port {flow.get('dst_port')}")
-            confidence = max(confidence, 0.55)
+        # SNI, HTTP host and addresses listed by threat intel feeds
+        for match in (intel or AttackClassifier.intel()).match_flow(flow):
+            reasons.append(match.reason())
+            confidence = max(confidence, INTEL_CONFIDENCE)
             attack_type = AttackType.MALWARE_INDICATOR
         
-        # Check for unencrypted sensitive data
-        if flow.get("app_type") == "HTTP" and flow.get("bytes_received", 0) > 10000:
-            reasons.append("Large unencrypted HTTP transfer (potential data exposure)")
-            confidence = max(confidence, 0.60)
-            attack_type = AttackType.SENSITIVE_DATA_EXPOSURE
-        
-        # Check for C2-like behavior
-        if flow.get("sni") in AttackClassifier.C2_DOMAINS:
-            reasons.append(f"Connection to known C2 domain: {flow.get('sni')}")
-            confidence = max(confidence, 0.95)
-            attack_type = AttackType.MALWARE_INDICATOR
-        
-        # Large exfiltration patterns
-        if flow.get("bytes_sent", 0) > 50_000_000:  # >50MB
-            reasons.append(f"Large data exfiltration ({flow.get('bytes_sent')} bytes)")
-            confidence = max(confidence, 0.75)
-            attack_type = AttackType.DATA_EXFILTRATION
-        
         return attack_type, min(1.0, confidence), reasons
 
     @staticmethod
-    def classify_payload(payload: str) -> Tuple[AttackType, float, List[str]]:
+    def classify_payload(payload: str, app_type: Optional[str] = None, dst_port: Optional[int] = None,
+                         rules: Optional[RuleEngine] = None) -> Tuple[AttackType, float, List[str]]:
         """Classify payload content for injection/XSS attacks."""
         reasons = []
         highest_confidence = 0.0
         detected_type = AttackType.NORMAL
         
-        for attack_type, patterns in AttackClassifier.ATTACK_SIGNATURES.items():
-            for pattern in patterns:
-                if re.search(pattern, payload, re.IGNORECASE | re.DOTALL):
-                    reasons.append(f"Matched pattern for {attack_type.value}")
-                    confidence = 0.85
-                    if confidence > highest_confidence:
-                        highest_confidence = confidence
-                        detected_type = attack_type
+        for rule in (rules or AttackClassifier.rule_engine()).match_payload(payload, app_type, dst_port):
+            reasons.append(rule.reason())
+            if rule.confidence > highest_confidence:
+                highest_confidence = rule.confidence
+                detected_type = rule.attack_type
         
         return detected_type, highest_confidence, reasons
 
+    @staticmethod
+    def classify_request(fields: str, dst_port: Optional[int] = None,
+                         rules: Optional[RuleEngine] = None) -> Optional[Dict]:
+        """Classify the inspected fields of one HTTP request; a plain dict for flow records, None if clean."""
+        attack_type, confidence, reasons = AttackClassifier.classify_payload(fields, "http", dst_port, rules)
+        if attack_type == AttackType.NORMAL:
+            return None
+        return {"attack_type": attack_type.value, "confidence": confidence, "reasons": reasons}
+
     @staticmethod
     def get_cvss_for_attack(attack_type: AttackType) -> Dict:
         """Return CVSS parameters for an attack type."""
@@ -207,6 +187,10 @@ class AttackClassifier:
                 "av": "NETWORK", "ac": "LOW", "pr": "NONE", "ui": "NONE",
                 "scope": "UNCHANGED", "c": "NONE", "i": "NONE", "a": "HIGH", "base": 7.5
             },
+            AttackType.RECONNAISSANCE: {
+                "av": "NETWORK", "ac": "LOW", "pr": "NONE", "ui": "NONE",
+                "scope": "UNCHANGED", "c": "LOW", "i": "NONE", "a": "NONE", "base": 5.3
+            },
         }
         
         return cvss_map.get(attack_type, {
@@ -0,0 +1,233 @@
+"""Cross-flow correlation: brute force, port scans, floods and DDoS.
+
+``AttackClassifier.classify_flow`` judges one flow record at a time; the
+attacks here only show up across many flows. ``CorrelationEngine`` counts
+every flow once (on its ``start`` record by default) into fixed-size
+sliding-window sketches and checks, for every record, the counts of the
+keys the flow belongs to:
+
+==================  ==============================  ============================
+detection           key                             statistic
+==================  ==============================  ============================
+brute force         src, dst, login service         connections (count-min)
+vertical scan       src, dst                        distinct dst ports (HLL)
+horizontal scan     src, protocol, dst port         distinct dst hosts (HLL)
+flood               src                             flows (count-min)
+DDoS                dst                             flows (count-min) and
+                                                    distinct sources (HLL)
+==================  ==============================  ============================
+
+Memory is fixed whatever the number of addresses. Counts live in three
+count-min sketches, so the busy source/destination totals do not inflate
+the small login-attempt counts: ``attempts`` (login services only),
+``volume`` (per source and per destination) and ``gates`` (per pair and
+per sweep). A key gets HyperLogLog registers only once its gate count
+reaches ``track_after`` in the window, in tables of at most
+``max_tracked`` keys (least recently updated out first). Distinct counts
+therefore start with the key's ``track_after``-th flow and may be
+``track_after - 1`` low; a destination's sources are only counted once it
+has received a tenth of ``ddos_flows``, so busy servers do not churn the
+table.
+
+Once a key crosses a threshold, every later record of it is part of the
+detection and gets the finding, but only the first one in
+``realert_interval`` (the window by default) is marked as an alert, so an
+attack of thousands of flows raises one alert per interval, not one per
+flow. The last alert time is kept for at most ``max_tracked`` keys.
+"""
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from .attack_classifier import AttackType
+from .sketches import (
+    CountMinSketch, DistinctCounter, DEFAULT_WINDOW, DEFAULT_BUCKETS, DEFAULT_WIDTH, DEFAULT_DEPTH,
+    DEFAULT_PRECISION, DEFAULT_MAX_KEYS
+)
+
+logger = logging.getLogger(__name__)
+
+# Services whose repeated connections are login attempts (app types, upper case)
+AUTH_SERVICES = frozenset((
+    "SSH", "FTP", "TELNET", "RDP", "VNC", "SMTP", "SMTPS", "POP3", "POP3S", "IMAP", "IMAPS",
+    "MYSQL", "POSTGRESQL", "MSSQL", "REDIS", "MONGODB", "LDAP", "SMB",
+))
+# Keys are tracked for distinct counts from their Nth flow in the window
+DEFAULT_TRACK_AFTER = 3
+# The flow record event that counts a flow ("start", or "end" when start records are not emitted)
+DEFAULT_COUNT_EVENT = "start"
+
+BRUTE_FORCE = "brute_force"
+VERTICAL_SCAN = "vertical_scan"
+HORIZONTAL_SCAN = "horizontal_scan"
+FLOOD = "flood"
+DDOS = "ddos"
+DETECTIONS = (BRUTE_FORCE, VERTICAL_SCAN, HORIZONTAL_SCAN, FLOOD, DDOS)
+
+CONFIDENCES = {
+    BRUTE_FORCE: 0.80,
+    VERTICAL_SCAN: 0.70,
+    HORIZONTAL_SCAN: 0.70,
+    FLOOD: 0.75,
+    DDOS: 0.85,
+}
+
+# (attack type, confidence, reason, alert): alert is False for repeats within the re-alert interval
+Finding = Tuple[AttackType, float, str, bool]
+
+
+@dataclass
+class CorrelationThresholds:
+    """Counts within one window at which a detection fires."""
+    # Connections from one source to one login service on one host
+    brute_force: int = 30
+    # Distinct ports one source probes on one host
+    vertical_scan: int = 25
+    # Distinct hosts one source probes on one port
+    horizontal_scan: int = 100
+    # Flows from one source
+    flood: int = 3000
+    # Flows to one host, from at least ddos_sources distinct sources
+    ddos_flows: int = 5000
+    ddos_sources: int = 50
+
+
+class CorrelationEngine:
+    """Sliding-window cross-flow detections over flow records (single-threaded: the analysis stage)."""
+
+    def __init__(self, thresholds: Optional[CorrelationThresholds] = None, window: float = DEFAULT_WINDOW,
+                 buckets: int = DEFAULT_BUCKETS, width: int = DEFAULT_WIDTH, depth: int = DEFAULT_DEPTH,
+                 precision: int = DEFAULT_PRECISION, max_tracked: int = DEFAULT_MAX_KEYS,
+                 track_after: int = DEFAULT_TRACK_AFTER, auth_services: Iterable[str] = AUTH_SERVICES,
+                 count_event: str = DEFAULT_COUNT_EVENT, realert_interval: Optional[float] = None):
+        self.thresholds = thresholds or CorrelationThresholds()
+        self.window = window
+        self.track_after = max(1, track_after)
+        # A destination's sources are counted from a tenth of ddos_flows on
+        self.ddos_track_after = max(self.track_after, self.thresholds.ddos_flows // 10)
+        self.auth_services: FrozenSet[str] = frozenset(service.upper() for service in auth_services)
+        self.count_event = count_event
+        self.realert_interval = window if realert_interval is None else realert_interval
+        self.max_tracked = max_tracked
+        # (detection, key) -> time of its last alert, least recently alerted first
+        self._alerted: "OrderedDict[Tuple, float]" = OrderedDict()
+        self.attempts = CountMinSketch(width, depth, window, buckets)
+        self.volume = CountMinSketch(width, depth, window, buckets)
+        self.gates = CountMinSketch(width, depth, window, buckets)
+        # (src, dst) -> dst ports; (src, protocol, dst port) -> dst hosts; dst -> sources
+        self.ports = DistinctCounter(precision, window, buckets, max_tracked)
+        self.hosts = DistinctCounter(precision, window, buckets, max_tracked)
+        self.sources = DistinctCounter(precision, window, buckets, max_tracked)
+
+        # Counters
+        self.records = 0
+        self.flows_counted = 0
+        self.detections: Dict[str, int] = dict.fromkeys(DETECTIONS, 0)
+        self.alerts: Dict[str, int] = dict.fromkeys(DETECTIONS, 0)
+
+    def service(self, flow: Dict) -> str:
+        """The flow's app type, or ``PROTOCOL/port`` when it was not identified."""
+        app_type = flow.get("app_type")
+        if app_type and app_type.lower() != "unknown":
+            return app_type.upper()
+        return f"{flow.get('protocol')}/{flow.get('dst_port')}"
+
+    @staticmethod
+    def _count(sketch: CountMinSketch, key, counted: bool, now: float) -> int:
+        return sketch.add(key, now) if counted else sketch.estimate(key, now)
+
+    @staticmethod
+    def _distinct(table: DistinctCounter, key, item, track: bool, counted: bool, now: float) -> int:
+        if counted and track:
+            return table.add(key, item, now)
+        return table.estimate(key, now) or 0
+
+    def observe(self, flow: Dict) -> List[Finding]:
+        """Count ``flow`` (if it is a counted event) and return the cross-flow detections it is part of."""
+        src = flow.get("src_ip")
+        dst = flow.get("dst_ip")
+        if not src or not dst:
+            return []
+        self.records += 1
+        timestamp = flow.get("timestamp")
+        now = timestamp if isinstance(timestamp, (int, float)) else time.time()
+        event = flow.get("event")
+        counted = event is None or event == self.count_event
+        if counted:
+            self.flows_counted += 1
+
+        protocol = flow.get("protocol")
+        port = flow.get("dst_port")
+        service = self.service(flow)
+        thresholds = self.thresholds
+        findings = []
+
+        if service in self.auth_services:
+            attempts = self._count(self.attempts, (src, dst, service), counted, now)
+            if attempts >= thresholds.brute_force:
+                findings.append(self._finding(BRUTE_FORCE, (src, dst, service), now, AttackType.BROKEN_AUTH,
+                                              f"Brute force: {attempts} connections from {src} to {service} "
+                                              f"on {dst} in {self.window:g}s"))
+
+        pair = self._count(self.gates, ("pair", src, dst), counted, now)
+        ports = self._distinct(self.ports, (src, dst), (protocol, port), pair >= self.track_after, counted, now)
+        if ports >= thresholds.vertical_scan:
+            findings.append(self._finding(VERTICAL_SCAN, (src, dst), now, AttackType.RECONNAISSANCE,
+                                          f"Vertical port scan: ~{ports} ports of {dst} probed by {src} "
+                                          f"in {self.window:g}s"))
+
+        sweep = self._count(self.gates, ("sweep", src, protocol, port), counted, now)
+        hosts = self._distinct(self.hosts, (src, protocol, port), dst, sweep >= self.track_after, counted, now)
+        if hosts >= thresholds.horizontal_scan:
+            findings.append(self._finding(HORIZONTAL_SCAN, (src, protocol, port), now, AttackType.RECONNAISSANCE,
+                                          f"Horizontal scan: ~{hosts} hosts probed on {protocol}/{port} by {src} "
+                                          f"in {self.window:g}s"))
+
+        sent = self._count(self.volume, ("src", src), counted, now)
+        if sent >= thresholds.flood:
+            findings.append(self._finding(FLOOD, src, now, AttackType.DDoS_ATTACK,
+                                          f"Flood: {sent} flows from {src} in {self.window:g}s"))
+
+        received = self._count(self.volume, ("dst", dst), counted, now)
+        sources = self._distinct(self.sources, dst, src, received >= self.ddos_track_after, counted, now)
+        if received >= thresholds.ddos_flows and sources >= thresholds.ddos_sources:
+            findings.append(self._finding(DDOS, dst, now, AttackType.DDoS_ATTACK,
+                                          f"DDoS: {received} flows to {dst} from ~{sources} sources "
+                                          f"in {self.window:g}s"))
+        return findings
+
+    def _finding(self, detection: str, key, now: float, attack_type: AttackType, reason: str) -> Finding:
+        self.detections[detection] += 1
+        alerted = self._alerted.get((detection, key))
+        alert = alerted is None or not 0 <= now - alerted < self.realert_interval
+        if alert:
+            self.alerts[detection] += 1
+            self._alerted[(detection, key)] = now
+            self._alerted.move_to_end((detection, key))
+            while len(self._alerted) > self.max_tracked:
+                self._alerted.popitem(last=False)
+        return attack_type, CONFIDENCES[detection], reason, alert
+
+    def memory_bytes(self) -> int:
+        """Upper bound of the sketch memory; independent of the number of addresses seen."""
+        return sum(table.memory_bytes() for table in (self.attempts, self.volume, self.gates, self.ports,
+                                                      self.hosts, self.sources))
+
+    def get_stats(self) -> Dict:
+        return {
+            "window": self.window,
+            "records": self.records,
+            "flows_counted": self.flows_counted,
+            "detections": dict(self.detections),
+            "alerts": dict(self.alerts),
+            "realert_interval": self.realert_interval,
+            "attempts": self.attempts.get_stats(),
+            "volume": self.volume.get_stats(),
+            "gates": self.gates.get_stats(),
+            "ports": self.ports.get_stats(),
+            "hosts": self.hosts.get_stats(),
+            "sources": self.sources.get_stats(),
+            "memory_bytes": self.memory_bytes(),
+        }
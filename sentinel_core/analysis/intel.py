@@ -0,0 +1,682 @@
+"""Threat intelligence index: known-bad domains and IP networks from feed files.
+
+Feeds are text files with one indicator per line: a domain (matching the
+domain and all its subdomains; ``*.`` and URL forms are reduced to the
+host), an IP address or a CIDR network. ``#`` starts a comment, hosts-file
+lines (``0.0.0.0 evil.example``) and CSV lines (indicator first) are
+accepted, and a ``# category: <name>`` comment sets the category reported
+for the feed's indicators (default: the file name). A directory stands for
+all the feed files in it.
+
+``build_index`` compiles feeds into one file that is memory-mapped, not
+parsed, when loaded, so any number of processes open it at once and share
+its pages:
+
+* domains: a sorted array of 64-bit hashes of every listed domain. A name
+  is looked up by hashing each of its suffixes (``a.b.evil.example``,
+  ``b.evil.example``, ``evil.example``, ...), most specific first; the top
+  bits of a hash index a directory of runs of about one entry, searched
+  in place. An optional blocked Bloom filter over the same hashes rejects
+  most clean names without touching the array, which pays off once the
+  index is too large to stay resident.
+* networks: a path-compressed binary (Patricia) trie over IPv4-mapped and
+  IPv6 prefixes, stored as parallel arrays, giving the longest listed
+  prefix that contains an address.
+
+``ThreatIntel`` keeps the current index and rebuilds / remaps it in the
+background when the feed files or the index file change; a lookup uses the
+index it started with, so a swap never blocks or breaks it.
+"""
+import bisect
+import hashlib
+import ipaddress
+import itertools
+import json
+import logging
+import mmap
+import os
+import re
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+FORMAT_NAME = "sentinel-intel"
+FORMAT_VERSION = 1
+MAGIC = b"SNTLINTL"
+
+# Feeds used when none are configured
+DEFAULT_FEEDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feeds")
+DEFAULT_RELOAD_INTERVAL = 30.0
+# Bloom filter bits per domain in front of the domain hashes (0 = none). A lookup
+# in resident memory is as fast without it; it keeps clean names off the hash
+# array when the index is too large to stay resident (page faults)
+DEFAULT_BLOOM_BITS = 0
+# Confidence of a flow that touches a listed domain or address
+INTEL_CONFIDENCE = 0.95
+
+# Flow record fields checked against the index
+DOMAIN_FIELDS = ("sni", "http_host")
+ADDRESS_FIELDS = ("dst_ip", "src_ip")
+
+# magic, version, section count, then (offset, length) of each section
+_HEADER = struct.Struct("<8sII")
+_SECTION = struct.Struct("<QQ")
+# (section, array typecode)
+_SECTIONS = (
+    ("domains", "Q"),
+    ("domain_values", "I"),
+    ("directory", "I"),
+    ("bloom", "Q"),
+    ("node_high", "Q"),
+    ("node_low", "Q"),
+    ("node_bits", "B"),
+    ("node_values", "i"),
+    ("node_children", "I"),
+    ("metadata", "B"),
+)
+_ALIGN = 8
+_NEEDS_BYTESWAP = sys.byteorder != "little"
+_IPV4_MAPPED = 0xFFFF << 32
+_MASK64 = (1 << 64) - 1
+_DOMAIN = re.compile(r"[\w-]{1,63}(?:\.[\w-]{1,63})*")
+
+
+class IntelFormatError(ValueError):
+    """Raised when a file is not a readable threat intel index."""
+
+
+def domain_hash(domain: str) -> int:
+    """64-bit hash of a normalized domain; stable across processes, unlike ``hash()``."""
+    return int.from_bytes(hashlib.blake2b(domain.encode("utf-8", "surrogateescape"), digest_size=8).digest(),
+                          "little")
+
+
+def normalize_domain(name: str) -> str:
+    return name.strip().rstrip(".").lower()
+
+
+def address_key(address: str) -> Optional[int]:
+    """An address as a 128-bit integer (IPv4 mapped into ``::ffff:0:0/96``); None if it is not one."""
+    try:
+        if ":" in address:
+            return int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+        return _IPV4_MAPPED | int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big")
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def _prefix_text(key: int, bits: int) -> str:
+    if bits >= 96 and key >> 32 == 0xFFFF:
+        return str(ipaddress.IPv4Network((key & 0xFFFFFFFF, bits - 96)))
+    return str(ipaddress.IPv6Network((key, bits)))
+
+
+# --- Feeds -----------------------------------------------------------------------
+
+def _indicator(line: str) -> Optional[str]:
+    """The indicator of one feed line (comments, hosts-file and CSV forms stripped); None for blank lines."""
+    line = line.split("#", 1)[0].strip()
+    if not line:
+        return None
+    fields = line.replace(",", " ").split()
+    if len(fields) > 1 and fields[0] in ("0.0.0.0", "127.0.0.1", "::", "::1"):
+        return fields[1]
+    return fields[0]
+
+
+def _parse_indicator(token: str):
+    """("network", (key, bits)) or ("domain", name) for one indicator; raises ValueError."""
+    if "://" in token:
+        token = token.split("://", 1)[1]
+        token = token.split("/", 1)[0].split("?", 1)[0].rsplit("@", 1)[-1]
+        if token.startswith("["):
+            token = token[1:token.find("]")]
+        elif token.count(":") == 1:
+            token = token.split(":", 1)[0]
+    address, slash, length = token.partition("/")
+    key = address_key(address)
+    if key is not None:
+        # Host bits are dropped: 10.1.2.3/8 lists 10.0.0.0/8
+        offset = 0 if ":" in address else 96
+        bits = int(length) + offset if slash and length.isdigit() else 128 if not slash else -1
+        if not offset <= bits <= 128:
+            raise ValueError(f"bad prefix length: {token!r}")
+        return "network", (key >> (128 - bits) << (128 - bits) if bits else 0, bits)
+    domain = normalize_domain(token)
+    if domain.startswith("*."):
+        domain = domain[2:]
+    if len(domain) > 253 or not _DOMAIN.fullmatch(domain):
+        raise ValueError(f"not a domain, address or network: {token!r}")
+    return "domain", domain
+
+
+def feed_files(feeds: Iterable[str]) -> List[str]:
+    """Feed paths with directories expanded to the (non-hidden) files in them, sorted."""
+    files = []
+    for feed in feeds:
+        if os.path.isdir(feed):
+            files.extend(sorted(os.path.join(feed, name) for name in os.listdir(feed)
+                                if not name.startswith(".") and os.path.isfile(os.path.join(feed, name))))
+        else:
+            files.append(feed)
+    return files
+
+
+def read_feed(path: str):
+    """(feed name, category, domains, networks, errors) of one feed file."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    category = name
+    domains = []
+    networks = []
+    errors = []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for number, line in enumerate(f, 1):
+            stripped = line.strip()
+            if stripped.startswith("#"):
+                key, _, value = stripped.lstrip("#").partition(":")
+                if key.strip().lower() == "category" and value.strip():
+                    category = value.strip()
+                continue
+            token = _indicator(line)
+            if token is None:
+                continue
+            try:
+                kind, value = _parse_indicator(token)
+            except ValueError as e:
+                errors.append(f"{path}:{number}: {e}")
+                continue
+            (domains if kind == "domain" else networks).append(value)
+    return name, category, domains, networks, errors
+
+
+# --- Building ----------------------------------------------------------------------
+
+def _build_trie(prefixes: List[Tuple[int, int, int]]):
+    """Patricia trie arrays (high, low, bits, value, children) over sorted, distinct (key, bits, value).
+
+    Every node holds the prefix its subtree shares: the node for
+    ``prefixes[lo:hi]`` is at the common prefix of all of them (no longer
+    than the shortest), takes the value of the prefix ending exactly there,
+    and splits the rest on the next bit into children ``2 * node`` (0) and
+    ``2 * node + 1`` (1). Node 0 is the root, so 0 also means "no child".
+    """
+    keys = [key for key, _, _ in prefixes]
+    lengths = [bits for _, bits, _ in prefixes]
+    high, low, node_bits = array("Q"), array("Q"), array("B")
+    values, children = array("i"), array("I")
+
+    def build(lo: int, hi: int) -> int:
+        common = 128 - (keys[lo] ^ keys[hi - 1]).bit_length()
+        bits = min(common, min(lengths[lo:hi]))
+        prefix = keys[lo] >> (128 - bits) << (128 - bits) if bits else 0
+        node = len(node_bits)
+        high.append(prefix >> 64)
+        low.append(prefix & _MASK64)
+        node_bits.append(bits)
+        values.append(-1)
+        children.extend((0, 0))
+        if lengths[lo] == bits:
+            values[node] = prefixes[lo][2]
+            lo += 1
+        if lo < hi:
+            middle = bisect.bisect_left(keys, prefix | 1 << (127 - bits), lo, hi)
+            if lo < middle:
+                children[2 * node] = build(lo, middle)
+            if middle < hi:
+                children[2 * node + 1] = build(middle, hi)
+        return node
+
+    if prefixes:
+        build(0, len(prefixes))
+    return high, low, node_bits, values, children
+
+
+def _directory(hashes: Sequence[int]) -> array:
+    """Start of each run of sorted hashes sharing their top bits (about one hash per run), plus the end."""
+    bits = max(1, len(hashes).bit_length() - 1)
+    shift = 64 - bits
+    directory = array("I", bytes(4 * ((1 << bits) + 1)))
+    for h in hashes:
+        directory[(h >> shift) + 1] += 1
+    return array("I", itertools.accumulate(directory))
+
+
+def _bloom_mask(h: int) -> int:
+    """The bits of hash ``h`` in its Bloom filter word: three 6-bit positions from bit 34 up."""
+    return 1 << (h >> 34 & 63) | 1 << (h >> 40 & 63) | 1 << (h >> 46 & 63)
+
+
+def _bloom(hashes: Sequence[int], bits_per_item: int) -> array:
+    """A blocked Bloom filter: each hash sets three bits of one 64-bit word, so a check reads one word."""
+    if not bits_per_item or not hashes:
+        return array("Q")
+    words = max(1, len(hashes) * bits_per_item // 64)
+    bloom = array("Q", bytes(8 * words))
+    for h in hashes:
+        bloom[h % words] |= _bloom_mask(h)
+    return bloom
+
+
+def build_index(feeds: Iterable[str], path: Optional[str] = None,
+                bloom_bits: int = DEFAULT_BLOOM_BITS) -> bytes:
+    """Compile feed files into index bytes; also written to ``path`` (atomically replaced) if given."""
+    if _NEEDS_BYTESWAP:
+        raise IntelFormatError("threat intel indexes are little-endian only")
+    labels: List[Tuple[str, str]] = []
+    domains: Dict[int, set] = {}
+    networks: Dict[Tuple[int, int], set] = {}
+    sources = []
+    for feed in feed_files(feeds):
+        name, category, feed_domains, feed_networks, errors = read_feed(feed)
+        label = len(labels)
+        labels.append((name, category))
+        for domain in feed_domains:
+            domains.setdefault(domain_hash(domain), set()).add(label)
+        for network in feed_networks:
+            networks.setdefault(network, set()).add(label)
+        for error in errors[:10]:
+            logger.warning(f"Skipped feed line {error}")
+        sources.append({"feed": name, "path": feed, "category": category, "domains": len(feed_domains),
+                        "networks": len(feed_networks), "errors": len(errors)})
+
+    # Indicators listed by several feeds point at the sorted tuple of their labels
+    label_sets: Dict[Tuple[int, ...], int] = {}
+
+    def value(label_set: set) -> int:
+        return label_sets.setdefault(tuple(sorted(label_set)), len(label_sets))
+
+    hashes = array("Q", sorted(domains))
+    domain_values = array("I", (value(domains[h]) for h in hashes))
+    directory = _directory(hashes)
+    bloom = _bloom(hashes, bloom_bits)
+    prefixes = sorted((key, bits, value(network_labels)) for (key, bits), network_labels in networks.items())
+    trie = _build_trie(prefixes)
+    metadata = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "built": time.time(),
+        "labels": labels,
+        "label_sets": [list(label_set) for label_set in label_sets],
+        "feeds": sources,
+        "domains": len(hashes),
+        "networks": len(prefixes),
+    }
+    payloads = [hashes, domain_values, directory, bloom, *trie, json.dumps(metadata).encode()]
+
+    offset = _HEADER.size + _SECTION.size * len(_SECTIONS)
+    table = []
+    chunks = []
+    for payload in payloads:
+        data = bytes(payload)
+        padding = -offset % _ALIGN
+        chunks.append(bytes(padding) + data)
+        offset += padding
+        table.append((offset, len(data)))
+        offset += len(data)
+    data = b"".join([_HEADER.pack(MAGIC, FORMAT_VERSION, len(_SECTIONS))]
+                    + [_SECTION.pack(*entry) for entry in table] + chunks)
+    if path is not None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(prefix=".intel-", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+    return data
+
+
+def default_index_path(feeds: Sequence[str], bloom_bits: int = DEFAULT_BLOOM_BITS) -> str:
+    """The cache file (``$XDG_CACHE_HOME/sentinel``) every process indexing the same feeds maps."""
+    key = json.dumps([[os.path.abspath(feed) for feed in feeds], bloom_bits])
+    cache = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache, "sentinel", f"intel-{hashlib.blake2b(key.encode(), digest_size=8).hexdigest()}.idx")
+
+
+# --- Lookups -----------------------------------------------------------------------
+
+class IntelMatch:
+    """A flow field value found in the index."""
+
+    __slots__ = ("field", "value", "indicator", "labels")
+
+    def __init__(self, field: str, value: str, indicator: str, labels: List[Tuple[str, str]]):
+        self.field = field
+        self.value = value
+        # The listed domain or network that matched
+        self.indicator = indicator
+        # (feed, category) of every feed listing it
+        self.labels = labels
+
+    def reason(self) -> str:
+        listed = ", ".join(f"{feed} ({category})" if category != feed else feed for feed, category in self.labels)
+        if self.indicator == self.value:
+            return f"Threat intel: {self.field} {self.value} listed in {listed}"
+        return f"Threat intel: {self.field} {self.value} in {self.indicator} listed in {listed}"
+
+    def to_dict(self) -> Dict:
+        return {"field": self.field, "value": self.value, "indicator": self.indicator,
+                "labels": [list(label) for label in self.labels]}
+
+
+class ThreatIntelIndex:
+    """Read-only lookups over compiled index bytes or a memory-mapped index file."""
+
+    def __init__(self, data, path: Optional[str] = None):
+        self.path = path
+        self._mapped = data if isinstance(data, mmap.mmap) else None
+        view = memoryview(data)
+        if len(view) < _HEADER.size or bytes(view[:len(MAGIC)]) != MAGIC:
+            raise IntelFormatError(f"{path or 'data'} is not a {FORMAT_NAME} index")
+        _, version, count = _HEADER.unpack_from(view)
+        if version != FORMAT_VERSION or count != len(_SECTIONS):
+            raise IntelFormatError(f"{path or 'data'} is a v{version} index; expected v{FORMAT_VERSION}")
+        if _NEEDS_BYTESWAP:
+            raise IntelFormatError("threat intel indexes are little-endian only")
+        sections = {}
+        for i, (name, typecode) in enumerate(_SECTIONS):
+            offset, length = _SECTION.unpack_from(view, _HEADER.size + i * _SECTION.size)
+            if offset + length > len(view):
+                raise IntelFormatError(f"{path or 'data'}: section {name} is truncated")
+            sections[name] = view[offset:offset + length].cast(typecode)
+        self.metadata = json.loads(bytes(sections.pop("metadata")))
+        self.domains = sections["domains"]
+        self.domain_values = sections["domain_values"]
+        self.directory = sections["directory"]
+        # The top bits of a hash pick its run of the sorted array
+        self.directory_shift = 65 - max(2, len(self.directory)).bit_length()
+        self.bloom = sections["bloom"]
+        self.node_high = sections["node_high"]
+        self.node_low = sections["node_low"]
+        self.node_bits = sections["node_bits"]
+        self.node_values = sections["node_values"]
+        self.node_children = sections["node_children"]
+        labels = [tuple(label) for label in self.metadata["labels"]]
+        self.label_sets = [[labels[label] for label in label_set] for label_set in self.metadata["label_sets"]]
+        self.size = len(view)
+
+        # Counters
+        self.lookups = 0
+        self.hits = 0
+        self.bloom_rejects = 0
+
+    @classmethod
+    def open(cls, path: str) -> "ThreatIntelIndex":
+        """Memory-map an index file (pages are shared with every other process mapping it)."""
+        with open(path, "rb") as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise IntelFormatError(f"{path}: {e}")
+        return cls(mapped, path)
+
+    def __len__(self) -> int:
+        return len(self.domains) + self.metadata["networks"]
+
+    def _listed(self, h: int) -> int:
+        """Label set of the domain hash ``h``, or -1."""
+        bloom = self.bloom
+        if bloom:
+            # _bloom_mask, inlined
+            mask = 1 << (h >> 34 & 63) | 1 << (h >> 40 & 63) | 1 << (h >> 46 & 63)
+            if bloom[h % len(bloom)] & mask != mask:
+                self.bloom_rejects += 1
+                return -1
+        directory = self.directory
+        run = h >> self.directory_shift
+        end = directory[run + 1]
+        domains = self.domains
+        i = bisect.bisect_left(domains, h, directory[run], end)
+        if i < end and domains[i] == h:
+            return self.domain_values[i]
+        return -1
+
+    def lookup_domain(self, name: str) -> Optional[Tuple[str, List[Tuple[str, str]]]]:
+        """(listed domain, labels) for the most specific listed suffix of ``name``, or None."""
+        self.lookups += 1
+        name = normalize_domain(name)
+        start = 0
+        while name:
+            suffix = name[start:] if start else name
+            label_set = self._listed(domain_hash(suffix))
+            if label_set >= 0:
+                self.hits += 1
+                return suffix, self.label_sets[label_set]
+            start = name.find(".", start) + 1
+            if not start:
+                break
+        return None
+
+    def lookup_address(self, address: str) -> Optional[Tuple[str, List[Tuple[str, str]]]]:
+        """(longest listed network, labels) containing ``address``, or None."""
+        self.lookups += 1
+        key = address_key(address)
+        if key is None or not len(self.node_bits):
+            return None
+        high, low, node_bits = self.node_high, self.node_low, self.node_bits
+        values, children = self.node_values, self.node_children
+        node = 0
+        best = -1
+        # Descend on the address bits; a node's prefix only needs checking where it carries a
+        # value, since a mismatch there also rules out everything below it
+        while True:
+            bits = node_bits[node]
+            if values[node] >= 0:
+                if (key ^ (high[node] << 64 | low[node])) >> (128 - bits):
+                    break
+                best = node
+            if bits == 128:
+                break
+            node = children[2 * node + (key >> (127 - bits) & 1)]
+            if not node:
+                break
+        if best < 0:
+            return None
+        self.hits += 1
+        return (_prefix_text(high[best] << 64 | low[best], node_bits[best]),
+                self.label_sets[values[best]])
+
+    def match_flow(self, flow: Dict) -> List[IntelMatch]:
+        """Every DOMAIN_FIELDS / ADDRESS_FIELDS value of a flow record found in the index."""
+        matches = []
+        http = flow.get("http")
+        for field in DOMAIN_FIELDS:
+            name = http.get("host") if field == "http_host" and http else flow.get(field)
+            if name and name.count(":") == 1:
+                name = name.rsplit(":", 1)[0]
+            if name:
+                found = self.lookup_domain(name)
+                if found:
+                    matches.append(IntelMatch(field, name, *found))
+        for field in ADDRESS_FIELDS:
+            address = flow.get(field)
+            if address:
+                found = self.lookup_address(address)
+                if found:
+                    matches.append(IntelMatch(field, address, *found))
+        return matches
+
+    def get_stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "feeds": self.metadata["feeds"],
+            "built": self.metadata["built"],
+            "domains": len(self.domains),
+            "networks": self.metadata["networks"],
+            "trie_nodes": len(self.node_bits),
+            "bloom_bytes": self.bloom.nbytes,
+            "index_bytes": self.size,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "bloom_rejects": self.bloom_rejects,
+        }
+
+
+class ThreatIntel:
+    """The current index of a set of feeds, rebuilt or remapped in the background when they change.
+
+    With ``index_path`` the feeds are compiled into that file (when it is
+    older than them) and the file is memory-mapped; without feeds the file
+    is used as built elsewhere, e.g. by ``python -m sentinel_core.analysis.intel
+    build``. Without ``index_path`` the index is compiled in memory. Readers
+    take ``intel.index`` once per lookup; a reload replaces the attribute in
+    one step, and a replaced mapping is released once no lookup uses it.
+    Instances pickle as their configuration and reload in the new process.
+    """
+
+    def __init__(self, feeds: Optional[Sequence[str]] = None, index_path: Optional[str] = None,
+                 reload_interval: float = DEFAULT_RELOAD_INTERVAL, bloom_bits: int = DEFAULT_BLOOM_BITS):
+        if feeds is None and index_path is None:
+            feeds = (DEFAULT_FEEDS_PATH,)
+        self.feeds = list(feeds) if feeds is not None else None
+        self.index_path = index_path
+        self.reload_interval = reload_interval
+        self.bloom_bits = bloom_bits
+        self._stamp = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # Counters
+        self.reloads = 0
+        self.reload_errors = 0
+        self.matches = 0
+
+        self.index = self._load()
+
+    def __getstate__(self):
+        return {"feeds": self.feeds, "index_path": self.index_path, "reload_interval": self.reload_interval,
+                "bloom_bits": self.bloom_bits}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+        self.start()
+
+    def _sources_stamp(self):
+        """Identity of every feed file and of the index file; changes when any of them does."""
+        paths = feed_files(self.feeds) if self.feeds is not None else []
+        if self.index_path is not None:
+            paths.append(self.index_path)
+        stamp = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stamp.append((path, None))
+                continue
+            stamp.append((path, stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return tuple(stamp)
+
+    def _stale(self) -> bool:
+        """True if the index file is missing or older than a feed file."""
+        try:
+            built = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return True
+        return any(os.stat(feed).st_mtime_ns > built for feed in feed_files(self.feeds))
+
+    def _built_from_feeds(self, index: ThreatIntelIndex) -> bool:
+        """True if ``index`` was compiled from exactly the current feed files."""
+        return [source["path"] for source in index.metadata["feeds"]] == feed_files(self.feeds)
+
+    def _load(self) -> ThreatIntelIndex:
+        start = time.perf_counter()
+        if self.index_path is None:
+            index = ThreatIntelIndex(build_index(self.feeds, bloom_bits=self.bloom_bits))
+        else:
+            if self.feeds is not None and self._stale():
+                build_index(self.feeds, self.index_path, self.bloom_bits)
+            index = ThreatIntelIndex.open(self.index_path)
+            if self.feeds is not None and not self._built_from_feeds(index):
+                # A feed file was added or removed without changing the others' times
+                build_index(self.feeds, self.index_path, self.bloom_bits)
+                index = ThreatIntelIndex.open(self.index_path)
+        self._stamp = self._sources_stamp()
+        logger.info(f"Loaded threat intel: {len(index.domains)} domains, {index.metadata['networks']} networks "
+                    f"in {(time.perf_counter() - start) * 1e3:.0f} ms")
+        return index
+
+    def reload(self) -> bool:
+        """Rebuild / remap the index and swap it in; on failure keep the current one."""
+        with self._lock:
+            try:
+                index = self._load()
+            except (OSError, ValueError) as e:
+                self.reload_errors += 1
+                logger.error(f"Threat intel reload failed, keeping the current index: {e}")
+                return False
+            self.index = index
+            self.reloads += 1
+            return True
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            if self._sources_stamp() != self._stamp:
+                self.reload()
+
+    def start(self):
+        """Start watching the feeds and the index file (no-op when reload_interval is 0)."""
+        if self.reload_interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="intel-reload", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def match_flow(self, flow: Dict) -> List[IntelMatch]:
+        matches = self.index.match_flow(flow)
+        self.matches += len(matches)
+        return matches
+
+    def get_stats(self) -> Dict:
+        stats = self.index.get_stats()
+        stats.update(reloads=self.reloads, reload_errors=self.reload_errors, matches=self.matches,
+                     reload_interval=self.reload_interval)
+        return stats
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """``build INDEX FEED...`` compiles feeds; ``lookup INDEX VALUE...`` checks domains and addresses."""
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m sentinel_core.analysis.intel", description=main.__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="compile feed files or directories into an index file")
+    build.add_argument("index")
+    build.add_argument("feeds", nargs="+")
+    build.add_argument("--bloom-bits", type=int, default=DEFAULT_BLOOM_BITS, help="Bloom filter bits per domain")
+    lookup = commands.add_parser("lookup", help="look domains and addresses up in an index file")
+    lookup.add_argument("index")
+    lookup.add_argument("values", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        build_index(args.feeds, args.index, args.bloom_bits)
+        index = ThreatIntelIndex.open(args.index)
+        print(f"{args.index}: {len(index.domains)} domains, {index.metadata['networks']} networks, "
+              f"{index.size} bytes in {time.perf_counter() - start:.1f}s")
+        return
+    index = ThreatIntelIndex.open(args.index)
+    for value in args.values:
+        found = index.lookup_address(value) if address_key(value) is not None else index.lookup_domain(value)
+        print(f"{value}: {f'{found[0]} {found[1]}' if found else 'not listed'}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,617 @@
+"""Detection rules loaded from a file, compiled into an indexed plan and hot-reloaded.
+
+Rules use a subset of the Suricata syntax, one per line (``\\`` continues a
+line, ``#`` starts a comment)::
+
+    alert http any any -> any any (msg:"SQL injection: UNION SELECT"; \\
+        content:"union"; nocase; pcre:"/union\\s+select/is"; \\
+        attack_type:SQL_INJECTION; confidence:0.85; sid:2000003;)
+    alert ip any any -> any [4444,31337] (msg:"Traffic to suspicious port {dst_port}"; \\
+        attack_type:MALWARE_INDICATOR; confidence:0.55; sid:1000010;)
+
+Header: the action is ``alert``; the protocol is ``ip``/``any``, ``tcp``,
+``udp``, ``icmp`` or an application type compared with the flow's
+``app_type`` (``http``, ``ssh``, ``https``, ...); addresses must be
+``any``; ports are ``any``, a port, ``lo:hi``, ``!port`` or a ``[...]``
+list of those; the direction is ``->`` or ``<>``.
+
+Options:
+
+* ``content:"..."`` (``|41 42|`` for hex bytes) with the ``nocase``,
+  ``startswith`` and ``endswith`` modifiers, and ``pcre:"/.../ismx"``.
+  They apply to the inspected payload (HTTP request fields) unless a
+  sticky buffer keyword before them selects a flow field: ``tls.sni``,
+  ``ja3.hash``, ``ja4.hash``, ``http.method``, ``http.uri``, ``http.host``,
+  ``http.user_agent`` (``pkt_data`` switches back to the payload).
+* ``threshold:packets>100,duration<5`` compares numeric flow fields
+  (``packets``, ``bytes_sent``, ``bytes_received``, ``duration``,
+  ``src_port``, ``dst_port``); unlike Suricata's rate ``threshold``, it is
+  a condition on the flow record.
+* ``msg`` (``{field}`` is replaced from the flow record), ``sid``
+  (required, unique), ``attack_type`` (an ``AttackType`` member name,
+  required), ``confidence`` (default 0.85). ``rev``, ``classtype``,
+  ``reference``, ``metadata``, ``priority``, ``gid`` and ``flow`` are
+  accepted and ignored.
+
+A rule with payload conditions is a payload rule, matched against HTTP
+requests through a ``SignatureMatcher`` (one literal scan gating the
+regexes); any other rule is a flow rule, matched against flow records.
+``RulePlan`` indexes flow rules by destination port, application type and
+transport protocol, so a flow is checked only against the rules that can
+apply to it. ``RuleEngine`` keeps the current plan and, from a watcher
+thread, rebuilds it when the file changes and swaps it in with a single
+assignment: classification never waits for a reload, and a file that fails
+to load leaves the previous plan in place.
+"""
+import os
+import re
+import time
+import string
+import logging
+import operator
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .signatures import SIGNATURE_FLAGS, SignatureMatcher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "default.rules")
+DEFAULT_RELOAD_INTERVAL = 5.0
+DEFAULT_CONFIDENCE = 0.85
+# Rules with at most this many destination ports are indexed by port
+MAX_INDEXED_PORTS = 1024
+
+ANY_PROTOCOLS = ("ip", "any")
+TRANSPORT_PROTOCOLS = ("tcp", "udp", "icmp")
+THRESHOLD_FIELDS = ("packets", "bytes_sent", "bytes_received", "duration", "src_port", "dst_port")
+# Flow record fields a msg may include as {field}
+MSG_FIELDS = THRESHOLD_FIELDS + ("src_ip", "dst_ip", "protocol", "app_type", "sni", "ja3", "ja4")
+# Sticky buffer keyword -> path into the flow record
+FLOW_BUFFERS = {
+    "tls.sni": ("sni",),
+    "ja3.hash": ("ja3",),
+    "ja4.hash": ("ja4",),
+    "http.method": ("http", "method"),
+    "http.uri": ("http", "uri"),
+    "http.host": ("http", "host"),
+    "http.user_agent": ("http", "user_agent"),
+}
+PAYLOAD_BUFFER = "pkt_data"
+IGNORED_KEYWORDS = frozenset(("rev", "classtype", "reference", "metadata", "priority", "gid", "flow"))
+_PCRE_FLAGS = {"i": re.IGNORECASE, "s": re.DOTALL, "m": re.MULTILINE, "x": re.VERBOSE}
+_COMPARISONS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+                "=": operator.eq, "!=": operator.ne}
+_THRESHOLD = re.compile(r"\s*([a-z_]+)\s*(>=|<=|!=|>|<|=)\s*([0-9]+(?:\.[0-9]+)?)\s*$")
+_HEADER_TOKEN = re.compile(r"\[[^\]]*\]|\S+")
+_HEX = re.compile(r"\|([0-9A-Fa-f\s]*)\|")
+
+
+class RuleError(ValueError):
+    """A rule that cannot be parsed."""
+
+
+class PortSpec:
+    """Suricata port expression: ``any``, ``80``, ``1024:``, ``!22``, ``[80,443,8000:8100,!8080]``."""
+    __slots__ = ("included", "excluded")
+
+    def __init__(self, spec: str):
+        self.included: List[Tuple[int, int]] = []
+        self.excluded: List[Tuple[int, int]] = []
+        if spec == "any":
+            return
+        items = spec[1:-1].split(",") if spec.startswith("[") and spec.endswith("]") else [spec]
+        for item in items:
+            item = item.strip()
+            negated = item.startswith("!")
+            item = item.lstrip("!").strip()
+            try:
+                if ":" in item:
+                    low, _, high = item.partition(":")
+                    port_range = (int(low or 0), int(high or 65535))
+                else:
+                    port_range = (int(item), int(item))
+            except ValueError:
+                raise RuleError(f"Invalid port {item!r} in {spec!r}") from None
+            if not 0 <= port_range[0] <= port_range[1] <= 65535:
+                raise RuleError(f"Invalid port range {item!r} in {spec!r}")
+            (self.excluded if negated else self.included).append(port_range)
+
+    def __contains__(self, port) -> bool:
+        if port is None:
+            return not self.included and not self.excluded
+        if self.included and not any(low <= port <= high for low, high in self.included):
+            return False
+        return not any(low <= port <= high for low, high in self.excluded)
+
+    @property
+    def any(self) -> bool:
+        return not self.included and not self.excluded
+
+    def ports(self) -> Optional[frozenset]:
+        """The ports matched, if few enough to index; None for any, negations or wide ranges."""
+        if not self.included or self.excluded:
+            return None
+        if sum(high - low + 1 for low, high in self.included) > MAX_INDEXED_PORTS:
+            return None
+        return frozenset(port for low, high in self.included for port in range(low, high + 1))
+
+
+class Rule:
+    """One parsed rule."""
+    __slots__ = ("sid", "msg", "protocol", "src_ports", "dst_ports", "bidirectional", "attack_type",
+                 "confidence", "payload", "buffers", "thresholds", "index", "fields")
+
+    def __init__(self, sid: int, msg: str, protocol: str, src_ports: PortSpec, dst_ports: PortSpec,
+                 bidirectional: bool, attack_type, confidence: float, payload: Tuple[re.Pattern, ...],
+                 buffers: Tuple[Tuple[Tuple[str, ...], re.Pattern], ...],
+                 thresholds: Tuple[Tuple[str, Callable, float], ...], index: int = 0):
+        self.sid = sid
+        self.msg = msg
+        self.protocol = protocol
+        self.src_ports = src_ports
+        self.dst_ports = dst_ports
+        self.bidirectional = bidirectional
+        self.attack_type = attack_type
+        self.confidence = confidence
+        # Regexes that must all match the inspected payload (contents and pcres)
+        self.payload = payload
+        # (flow record path, regex) pairs that must all match
+        self.buffers = buffers
+        # (flow field, comparison, value) that must all hold
+        self.thresholds = thresholds
+        # Position in the rule file: matches are reported in file order
+        self.index = index
+        # Flow record fields used in msg
+        self.fields = tuple(field for _, field, _, _ in string.Formatter().parse(msg) if field)
+
+    def __repr__(self) -> str:
+        return f"Rule(sid={self.sid}, msg={self.msg!r})"
+
+    def matches_protocol(self, protocol: Optional[str], app_type: Optional[str]) -> bool:
+        if self.protocol in ANY_PROTOCOLS:
+            return True
+        if self.protocol in TRANSPORT_PROTOCOLS:
+            return (protocol or "").lower() == self.protocol
+        return (app_type or "").lower() == self.protocol
+
+    def matches_ports(self, src_port, dst_port) -> bool:
+        if src_port in self.src_ports and dst_port in self.dst_ports:
+            return True
+        return self.bidirectional and dst_port in self.src_ports and src_port in self.dst_ports
+
+    def matches_server_port(self, port: Optional[int]) -> bool:
+        """Port check for payload rules, where only the server port may be known."""
+        if port is None:
+            return True
+        return port in self.dst_ports or (self.bidirectional and port in self.src_ports)
+
+    def matches_flow(self, flow: Dict) -> bool:
+        if not self.matches_protocol(flow.get("protocol"), flow.get("app_type")):
+            return False
+        if not self.matches_ports(flow.get("src_port"), flow.get("dst_port")):
+            return False
+        for field, compare, value in self.thresholds:
+            actual = flow.get(field)
+            if actual is None or not compare(actual, value):
+                return False
+        for path, regex in self.buffers:
+            value = flow
+            for name in path:
+                value = value.get(name) if isinstance(value, dict) else None
+            if not isinstance(value, str) or not regex.search(value):
+                return False
+        return True
+
+    def reason(self, flow: Optional[Dict] = None) -> str:
+        if not self.fields or flow is None:
+            return self.msg
+        return self.msg.format_map({field: flow.get(field) for field in self.fields})
+
+
+def _options(text: str) -> Iterator[Tuple[str, Optional[str]]]:
+    """(keyword, raw value) pairs of a rule's option list; quoted values keep their escapes."""
+    pos = 0
+    size = len(text)
+    while pos < size:
+        end = pos
+        while end < size and text[end] not in ":;":
+            end += 1
+        keyword = text[pos:end].strip()
+        if end == size:
+            if keyword:
+                raise RuleError(f"Option {keyword!r} is not terminated by ';'")
+            return
+        if text[end] == ";":
+            yield keyword, None
+            pos = end + 1
+            continue
+        pos = end + 1
+        while pos < size and text[pos] == " ":
+            pos += 1
+        quoted = pos < size and text[pos] == '"'
+        start = pos + 1 if quoted else pos
+        pos = start
+        while pos < size and text[pos] != ('"' if quoted else ";"):
+            pos += 2 if text[pos] == "\\" else 1
+        if pos >= size:
+            raise RuleError(f"Option {keyword!r} is not terminated")
+        value = text[start:pos]
+        if quoted:
+            pos += 1
+            while pos < size and text[pos] == " ":
+                pos += 1
+            if pos < size and text[pos] != ";":
+                raise RuleError(f"Unexpected text after the value of {keyword!r}")
+        yield keyword, value
+        pos += 1
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\([\\\";])", r"\1", value)
+
+
+def _content(value: str) -> str:
+    """A content string with ``|..|`` hex runs decoded (bytes map to latin-1 characters)."""
+    try:
+        return _HEX.sub(lambda m: bytes.fromhex(m.group(1)).decode("latin-1"), _unescape(value))
+    except ValueError:
+        raise RuleError(f"Invalid hex in content {value!r}") from None
+
+
+def _pcre(value: str) -> re.Pattern:
+    if not value.startswith("/") or value.rfind("/") == 0:
+        raise RuleError(f"pcre must be /pattern/flags: {value!r}")
+    end = value.rfind("/")
+    flags = 0
+    for flag in value[end + 1:]:
+        if flag not in _PCRE_FLAGS:
+            raise RuleError(f"Unsupported pcre flag {flag!r} in {value!r}")
+        flags |= _PCRE_FLAGS[flag]
+    try:
+        return re.compile(value[1:end], flags)
+    except re.error as e:
+        raise RuleError(f"Invalid pcre {value!r}: {e}") from None
+
+
+def parse_rule(line: str, index: int = 0) -> Rule:
+    """Parse one rule line."""
+    from .attack_classifier import AttackType
+
+    head, paren, rest = line.partition("(")
+    rest = rest.rstrip()
+    if not paren or not rest.endswith(")"):
+        raise RuleError("Expected an option list in parentheses")
+    header = _HEADER_TOKEN.findall(head)
+    if len(header) != 7:
+        raise RuleError(f"Expected 'action proto src sport -> dst dport', got {head.strip()!r}")
+    action, protocol, src, src_ports, direction, dst, dst_ports = header
+    if action != "alert":
+        raise RuleError(f"Unsupported action {action!r}")
+    if src != "any" or dst != "any":
+        raise RuleError("Only 'any' addresses are supported")
+    if direction not in ("->", "<>"):
+        raise RuleError(f"Invalid direction {direction!r}")
+
+    msg = ""
+    sid = None
+    attack_type = None
+    confidence = DEFAULT_CONFIDENCE
+    payload: List[re.Pattern] = []
+    buffers: List[Tuple[Tuple[str, ...], re.Pattern]] = []
+    thresholds = []
+    buffer = PAYLOAD_BUFFER
+    # The last content, as (text, nocase, startswith, endswith) until its modifiers are read
+    content = None
+
+    def finish_content():
+        text, nocase, starts, ends = content
+        regex = re.compile(("\\A" if starts else "") + re.escape(text) + ("\\Z" if ends else ""),
+                           SIGNATURE_FLAGS if nocase else re.DOTALL)
+        if buffer == PAYLOAD_BUFFER:
+            payload.append(regex)
+        else:
+            buffers.append((FLOW_BUFFERS[buffer], regex))
+
+    for keyword, value in _options(rest[:-1]):
+        if keyword in ("nocase", "startswith", "endswith"):
+            if content is None:
+                raise RuleError(f"{keyword} without a preceding content")
+            content[{"nocase": 1, "startswith": 2, "endswith": 3}[keyword]] = True
+            continue
+        if content is not None:
+            finish_content()
+            content = None
+        if keyword == "content":
+            if value is None or value.startswith("!"):
+                raise RuleError("content needs a (non-negated) string")
+            content = [_content(value), False, False, False]
+        elif keyword == "pcre":
+            regex = _pcre(value or "")
+            if buffer == PAYLOAD_BUFFER:
+                payload.append(regex)
+            else:
+                buffers.append((FLOW_BUFFERS[buffer], regex))
+        elif keyword in FLOW_BUFFERS or keyword == PAYLOAD_BUFFER:
+            buffer = keyword
+        elif keyword == "msg":
+            msg = _unescape(value or "")
+        elif keyword == "sid":
+            try:
+                sid = int(value)
+            except (TypeError, ValueError):
+                raise RuleError(f"Invalid sid {value!r}") from None
+        elif keyword == "attack_type":
+            try:
+                attack_type = AttackType[(value or "").strip()]
+            except KeyError:
+                raise RuleError(f"Unknown attack_type {value!r}") from None
+        elif keyword == "confidence":
+            try:
+                confidence = float(value)
+            except (TypeError, ValueError):
+                raise RuleError(f"Invalid confidence {value!r}") from None
+            if not 0.0 <= confidence <= 1.0:
+                raise RuleError(f"confidence must be within 0..1, got {confidence}")
+        elif keyword == "threshold":
+            for condition in (value or "").split(","):
+                match = _THRESHOLD.match(condition)
+                if match is None or match.group(1) not in THRESHOLD_FIELDS:
+                    raise RuleError(f"Invalid threshold {condition.strip()!r}; fields are {THRESHOLD_FIELDS}")
+                field, comparison, number = match.groups()
+                thresholds.append((field, _COMPARISONS[comparison], float(number)))
+        elif keyword not in IGNORED_KEYWORDS:
+            raise RuleError(f"Unsupported keyword {keyword!r}")
+    if content is not None:
+        finish_content()
+
+    if sid is None:
+        raise RuleError("Missing sid")
+    if attack_type is None:
+        raise RuleError("Missing attack_type")
+    try:
+        rule = Rule(sid, msg, protocol.lower(), PortSpec(src_ports), PortSpec(dst_ports), direction == "<>",
+                    attack_type, confidence, tuple(payload), tuple(buffers), tuple(thresholds), index)
+    except ValueError as e:
+        raise RuleError(f"Invalid msg {msg!r}: {e}") from None
+    if rule.payload and (rule.buffers or rule.thresholds or rule.fields):
+        raise RuleError("Payload rules cannot use flow buffers, thresholds or {fields} in msg")
+    unknown = [field for field in rule.fields if field not in MSG_FIELDS]
+    if unknown:
+        raise RuleError(f"Unknown flow field(s) {unknown} in msg; expected {MSG_FIELDS}")
+    return rule
+
+
+def parse_rules(text: str, source: str = "<rules>") -> Tuple[List[Rule], List[str]]:
+    """Parse a rule file; returns the rules and one error string per rule that was skipped."""
+    rules: List[Rule] = []
+    errors: List[str] = []
+    sids: Dict[int, int] = {}
+    pending = ""
+    first = 0
+    for number, line in enumerate(text.splitlines(), 1):
+        stripped = line.strip()
+        if not pending and (not stripped or stripped.startswith("#")):
+            continue
+        if not pending:
+            first = number
+        if stripped.endswith("\\"):
+            pending += stripped[:-1] + " "
+            continue
+        rule_text, pending = pending + stripped, ""
+        try:
+            rule = parse_rule(rule_text, len(rules))
+            if rule.sid in sids:
+                raise RuleError(f"Duplicate sid {rule.sid} (first on line {sids[rule.sid]})")
+        except RuleError as e:
+            errors.append(f"{source}:{first}: {e}")
+            continue
+        sids[rule.sid] = first
+        rules.append(rule)
+    if pending:
+        errors.append(f"{source}:{first}: Unterminated line continuation")
+    return rules, errors
+
+
+def _merge(*groups: Sequence[Rule]) -> List[Rule]:
+    """Rules of several index buckets, deduplicated, in file order."""
+    groups = [group for group in groups if group]
+    if len(groups) == 1:
+        return list(groups[0])
+    return sorted({rule.index: rule for group in groups for rule in group}.values(), key=lambda rule: rule.index)
+
+
+class RulePlan:
+    """An immutable, indexed evaluation plan for one rule set."""
+
+    def __init__(self, rules: Sequence[Rule], source: str = "<rules>", errors: Sequence[str] = ()):
+        self.rules = tuple(rules)
+        self.source = source
+        self.errors = tuple(errors)
+        self.loaded_at = time.time()
+        self.flow_rules = tuple(rule for rule in self.rules if not rule.payload)
+        self.payload_rules = tuple(rule for rule in self.rules if rule.payload)
+
+        # Flow rules go into one bucket each: application type, destination
+        # ports, transport protocol, or the rules checked for every flow
+        by_app: Dict[str, List[Rule]] = {}
+        by_port: Dict[int, List[Rule]] = {}
+        by_transport: Dict[str, List[Rule]] = {}
+        generic: List[Rule] = []
+        for rule in self.flow_rules:
+            ports = rule.dst_ports.ports() if not rule.bidirectional else None
+            if rule.protocol not in ANY_PROTOCOLS + TRANSPORT_PROTOCOLS:
+                by_app.setdefault(rule.protocol, []).append(rule)
+            elif ports is not None:
+                for port in ports:
+                    by_port.setdefault(port, []).append(rule)
+            elif rule.protocol in TRANSPORT_PROTOCOLS:
+                by_transport.setdefault(rule.protocol, []).append(rule)
+            else:
+                generic.append(rule)
+        self.by_app = {app: tuple(rules) for app, rules in by_app.items()}
+        self.by_port = {port: tuple(rules) for port, rules in by_port.items()}
+        self.by_transport = {protocol: tuple(rules) for protocol, rules in by_transport.items()}
+        self.generic = tuple(generic)
+
+        # Payload rules: all of them (no context) and those that can apply to each application type
+        self.payload_matchers: Dict[Optional[str], SignatureMatcher] = {
+            None: SignatureMatcher({rule: [rule.payload] for rule in self.payload_rules})}
+        apps = {rule.protocol for rule in self.payload_rules} - set(ANY_PROTOCOLS + TRANSPORT_PROTOCOLS)
+        for app in apps | {"http"}:
+            self.payload_matchers[app] = SignatureMatcher({
+                rule: [rule.payload] for rule in self.payload_rules
+                if rule.protocol in ANY_PROTOCOLS or rule.protocol in ("tcp", app)})
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def flow_candidates(self, flow: Dict) -> List[Rule]:
+        """The flow rules that can apply to ``flow``, from its buckets, in file order."""
+        return _merge(self.generic,
+                      self.by_transport.get((flow.get("protocol") or "").lower()),
+                      self.by_app.get((flow.get("app_type") or "").lower()),
+                      self.by_port.get(flow.get("dst_port")))
+
+    def match_flow(self, flow: Dict) -> List[Rule]:
+        """Flow rules matching a flow record, in file order."""
+        return [rule for rule in self.flow_candidates(flow) if rule.matches_flow(flow)]
+
+    def match_payload(self, payload: str, app_type: Optional[str] = None,
+                      dst_port: Optional[int] = None) -> List[Rule]:
+        """Payload rules matching ``payload``, in file order.
+
+        With ``app_type`` only the rules for that application (and for any
+        TCP/IP traffic) are checked; with ``dst_port`` their ports must match.
+        """
+        matcher = self.payload_matchers.get(app_type.lower() if app_type else None)
+        if matcher is None:
+            matcher = self.payload_matchers[None]
+        return [rule for rule, _ in matcher.matches(payload) if rule.matches_server_port(dst_port)]
+
+    def ports(self) -> List[int]:
+        """Destination ports that flow rules are indexed by."""
+        return sorted(self.by_port)
+
+    def get_stats(self) -> Dict:
+        matcher = self.payload_matchers[None].get_stats()
+        return {
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+            "rules": len(self.rules),
+            "flow_rules": len(self.flow_rules),
+            "payload_rules": len(self.payload_rules),
+            "errors": list(self.errors),
+            "indexed_ports": len(self.by_port),
+            "app_buckets": sorted(self.by_app),
+            "generic_flow_rules": len(self.generic),
+            "payload_literals": matcher["literals"],
+            "payload_always_checked": matcher["always_checked"],
+        }
+
+
+def load_rules(path: str) -> RulePlan:
+    """Read and compile a rule file (OSError if it cannot be read)."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    rules, errors = parse_rules(text, path)
+    for error in errors:
+        logger.warning(f"Skipped rule: {error}")
+    return RulePlan(rules, path, errors)
+
+
+class RuleEngine:
+    """The current RulePlan of a rule file, reloaded in the background when the file changes.
+
+    Readers take ``engine.plan`` once per classification; a reload builds the
+    new plan on the watcher thread and replaces the attribute in one step.
+    Engines pickle as (path, reload interval) and reload in the new process,
+    so they can be handed to capture worker processes.
+    """
+
+    def __init__(self, path: Optional[str] = None, reload_interval: float = DEFAULT_RELOAD_INTERVAL):
+        self.path = path or DEFAULT_RULES_PATH
+        self.reload_interval = reload_interval
+        self._stamp = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # Counters
+        self.reloads = 0
+        self.reload_errors = 0
+
+        self.plan = self._load()
+
+    def __getstate__(self):
+        return {"path": self.path, "reload_interval": self.reload_interval}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["reload_interval"])
+        self.start()
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _load(self) -> RulePlan:
+        self._stamp = self._file_stamp()
+        plan = load_rules(self.path)
+        logger.info(f"Loaded {len(plan)} rules from {self.path} ({len(plan.errors)} skipped)")
+        return plan
+
+    def reload(self) -> bool:
+        """Rebuild the plan from the file and swap it in; on failure keep the current one."""
+        with self._lock:
+            try:
+                plan = self._load()
+            except (OSError, ValueError) as e:
+                self.reload_errors += 1
+                logger.error(f"Rule reload from {self.path} failed, keeping {len(self.plan)} rules: {e}")
+                return False
+            if not plan.rules and plan.errors:
+                self.reload_errors += 1
+                logger.error(f"No valid rules in {self.path}, keeping the previous {len(self.plan)}")
+                return False
+            self.plan = plan
+            self.reloads += 1
+            return True
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            try:
+                if self._file_stamp() != self._stamp:
+                    self.reload()
+            except OSError:
+                continue
+            except Exception as e:
+                # Hot reload must outlive any one bad edit
+                self.reload_errors += 1
+                logger.error(f"Rule reload from {self.path} failed: {e}")
+
+    def start(self):
+        """Start watching the rule file (no-op when reload_interval is 0)."""
+        if self.reload_interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="rule-reload", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def match_flow(self, flow: Dict) -> List[Rule]:
+        return self.plan.match_flow(flow)
+
+    def match_payload(self, payload: str, app_type: Optional[str] = None,
+                      dst_port: Optional[int] = None) -> List[Rule]:
+        return self.plan.match_payload(payload, app_type, dst_port)
+
+    def get_stats(self) -> Dict:
+        stats = self.plan.get_stats()
+        stats.update(reloads=self.reloads, reload_errors=self.reload_errors,
+                     reload_interval=self.reload_interval)
+        return stats
@@ -0,0 +1,323 @@
+"""Multi-pattern signature matching with a literal prefilter.
+
+``SignatureMatcher`` compiles a signature table (``{key: [regex, ...]}``,
+e.g. the payload rules of a rule file) once. For every
+regex, the literal sets that any match must hit are worked out from its
+parse tree (``required_literals``): ``(union\\s+select|drop\\s+table)``
+needs one of ``{"select", "table"}``, ``eval.*base64`` needs both
+``{"eval"}`` and ``{"base64"}``. All literals go into one trie-shaped
+alternation, so a payload is scanned a single time for every literal of
+every signature, and a signature's full regex runs only when each of its
+literal sets has a hit. Regexes without a usable literal (``.*`` alone, a
+character class) run on every payload.
+
+Matching is case-insensitive like ``re.IGNORECASE``: literals and payload
+are folded the same way (``str.lower`` plus the extra equivalences ``re``
+applies, such as dotless i), so the prefilter never drops a payload the
+regex would match; it only ever lets extra ones through to the regex.
+"""
+import re
+from typing import Dict, FrozenSet, Hashable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+try:
+    from re._casefix import _EXTRA_CASES
+except ImportError:
+    _EXTRA_CASES = {}
+
+SIGNATURE_FLAGS = re.IGNORECASE | re.DOTALL
+# Exact-string sets larger than this are not expanded further
+MAX_LITERAL_SET = 64
+# Literals are cut to this length; a prefix of a required literal is still required
+MAX_LITERAL_LENGTH = 32
+# Shorter literals are not scanned for
+MIN_LITERAL_LENGTH = 2
+# Literal sets checked per signature
+MAX_GATES = 3
+# Character classes up to this size count as a set of one-character literals
+MAX_CLASS_SIZE = 16
+
+# Lowercase characters that re.IGNORECASE treats as equal (i and dotless i,
+# s and long s, ...) map to one representative; the combining dot above that
+# str.lower() leaves after "i" for U+0130 is dropped.
+_CANONICAL = {0x307: None}
+for _code, _others in _EXTRA_CASES.items():
+    _CANONICAL[_code] = chr(min((_code,) + _others))
+_CANONICAL = {code: rep for code, rep in _CANONICAL.items() if rep is None or ord(rep) != code}
+_NEEDS_CANONICAL = re.compile("[" + "".join(re.escape(chr(code)) for code in _CANONICAL) + "]")
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+_ZERO_WIDTH = {sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT}
+
+Signature = Union[str, re.Pattern, Tuple[Union[str, re.Pattern], ...]]
+Info = Tuple[Optional[Set[str]], List[Set[str]]]
+
+
+def fold(text: str) -> str:
+    """Case-fold ``text`` so that re.IGNORECASE-equal strings fold to the same string."""
+    if text.isascii():
+        return text.lower()
+    folded = text.lower()
+    if _NEEDS_CANONICAL.search(folded):
+        folded = folded.translate(_CANONICAL)
+    return folded
+
+
+def _selectivity(literals: Set[str]) -> Tuple[int, int]:
+    """Longest shortest literal first, then fewest literals."""
+    return min(map(len, literals)), -len(literals)
+
+
+def _best(sets) -> Optional[Set[str]]:
+    sets = [literals for literals in sets if literals and "" not in literals]
+    return max(sets, key=_selectivity) if sets else None
+
+
+def _product(left: Set[str], right: Set[str]) -> Optional[Set[str]]:
+    if len(left) * len(right) > MAX_LITERAL_SET:
+        return None
+    return {a + b for a in left for b in right}
+
+
+def _sequence(items) -> Info:
+    """(exact, gates) for a parsed sequence.
+
+    ``exact`` is the complete set of strings the sequence can match (None if
+    unbounded or too large); ``gates`` are literal sets such that every
+    match contains a literal from each of them.
+    """
+    gates = []
+    run = {""}
+    whole = True
+    for op, av in items:
+        exact, node_gates = _node(op, av)
+        if exact is not None:
+            product = _product(run, exact)
+            if product is not None:
+                run = product
+                continue
+            gates.append(run)
+            run = exact
+        else:
+            gates.append(run)
+            gates.extend(node_gates)
+            run = {""}
+        whole = False
+    if whole:
+        return run, [run]
+    gates.append(run)
+    return None, [literals for literals in gates if "" not in literals]
+
+
+def _node(op, av) -> Info:
+    if op is sre_constants.LITERAL:
+        literal = {fold(chr(av))}
+        return literal, [literal]
+    if op is sre_constants.IN:
+        chars = set()
+        for item_op, item_av in av:
+            if item_op is sre_constants.LITERAL:
+                chars.add(fold(chr(item_av)))
+            elif item_op is sre_constants.RANGE and item_av[1] - item_av[0] < MAX_CLASS_SIZE:
+                chars.update(fold(chr(code)) for code in range(item_av[0], item_av[1] + 1))
+            else:
+                return None, []
+        if len(chars) > MAX_CLASS_SIZE:
+            return None, []
+        return chars, [chars]
+    if op is sre_constants.SUBPATTERN:
+        return _sequence(av[-1])
+    if op is getattr(sre_constants, "ATOMIC_GROUP", None):
+        return _sequence(av)
+    if op is sre_constants.BRANCH:
+        infos = [_sequence(branch) for branch in av[1]]
+        if all(exact is not None for exact, _ in infos):
+            exact = set().union(*(exact for exact, _ in infos))
+            if len(exact) <= MAX_LITERAL_SET:
+                return exact, [exact]
+        # Each branch contributes its most selective gate; any of them may match
+        union = set()
+        for exact, gates in infos:
+            literals = _best([exact] if exact is not None else gates)
+            if literals is None:
+                return None, []
+            union |= literals
+        return None, [union]
+    if op in _REPEATS:
+        low, high, item = av
+        exact, gates = _sequence(item)
+        if exact is not None and high is not sre_constants.MAXREPEAT and high <= 4:
+            # Short bounded repeats of exact strings stay exact: '?, x{2,3}
+            expanded = set()
+            power = {""}
+            for count in range(high + 1):
+                if count >= low:
+                    expanded |= power
+                power = _product(power, exact) if count < high else power
+                if power is None:
+                    break
+            else:
+                if len(expanded) <= MAX_LITERAL_SET:
+                    return expanded, [expanded]
+        if low == 0:
+            return None, []
+        if exact is not None:
+            power = {""}
+            for _ in range(low):
+                power = _product(power, exact)
+                if power is None:
+                    return None, [exact]
+            return None, [power]
+        return None, gates
+    if op in _ZERO_WIDTH:
+        return {""}, []
+    return None, []
+
+
+def _select(gates) -> List[FrozenSet[str]]:
+    """The most selective MAX_GATES gates whose literals are all at least MIN_LITERAL_LENGTH long."""
+    kept = []
+    for literals in sorted(gates, key=_selectivity, reverse=True):
+        literals = frozenset(literal[:MAX_LITERAL_LENGTH] for literal in literals)
+        if min(map(len, literals)) < MIN_LITERAL_LENGTH or literals in kept:
+            continue
+        kept.append(literals)
+        if len(kept) == MAX_GATES:
+            break
+    return kept
+
+
+def required_literals(pattern: str, flags: int = SIGNATURE_FLAGS) -> List[FrozenSet[str]]:
+    """Gates for ``pattern``: folded literal sets such that every match contains one literal of each.
+
+    Only gates whose literals are all at least MIN_LITERAL_LENGTH long are
+    kept (single characters would hit on nearly every payload), the most
+    selective MAX_GATES of them; an empty list means the regex always runs.
+    """
+    exact, gates = _sequence(sre_parse.parse(pattern, flags))
+    return _select([exact] if exact is not None else gates)
+
+
+def _trie_pattern(literals) -> str:
+    """One regex alternation shaped like a trie of ``literals``; it matches the longest one at a position."""
+    root: Dict = {}
+    for literal in literals:
+        node = root
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def emit(node: Dict) -> str:
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return "(?:" + body + ")?"
+        return body
+
+    return emit(root)
+
+
+class SignatureMatcher:
+    """A signature table compiled into one literal scan plus gated regexes.
+
+    A signature is a regex string (compiled with ``flags``), a compiled
+    ``re.Pattern`` (own flags), or a tuple of those that must all match.
+    """
+
+    __slots__ = ("keys", "patterns", "regexes", "literals", "gates", "always", "triggers", "scanner",
+                 "payloads", "regex_runs", "matches_found")
+
+    def __init__(self, signatures: Dict[Hashable, Sequence[Signature]], flags: int = SIGNATURE_FLAGS):
+        self.keys: List[Hashable] = []
+        self.patterns: List[Signature] = []
+        self.regexes: List[Tuple[re.Pattern, ...]] = []
+        # literal -> {signature index: bit of each of its gates the literal is in}
+        self.literals: Dict[str, Dict[int, int]] = {}
+        # signature index -> bits of all its gates
+        self.gates: Dict[int, int] = {}
+        # Indices of signatures with no gate: checked on every payload
+        self.always: List[int] = []
+        for key, patterns in signatures.items():
+            for pattern in patterns:
+                index = len(self.patterns)
+                self.keys.append(key)
+                self.patterns.append(pattern)
+                regexes = tuple(re.compile(part, flags) if isinstance(part, str) else part
+                                for part in (pattern if isinstance(pattern, tuple) else (pattern,)))
+                self.regexes.append(regexes)
+                gates = _select([literals for regex in regexes
+                                 for literals in required_literals(regex.pattern, regex.flags)])
+                if not gates:
+                    self.always.append(index)
+                    continue
+                self.gates[index] = (1 << len(gates)) - 1
+                for bit, literals in enumerate(gates):
+                    for literal in literals:
+                        bits = self.literals.setdefault(literal, {})
+                        bits[index] = bits.get(index, 0) | 1 << bit
+
+        # The scan reports the longest literal at each position; a hit also
+        # counts for every literal that is a prefix of it
+        self.triggers: Dict[str, Tuple[Tuple[int, int], ...]] = {}
+        for literal in self.literals:
+            bits: Dict[int, int] = {}
+            for end in range(MIN_LITERAL_LENGTH, len(literal) + 1):
+                for index, gate_bits in self.literals.get(literal[:end], {}).items():
+                    bits[index] = bits.get(index, 0) | gate_bits
+            self.triggers[literal] = tuple(bits.items())
+        self.scanner: Optional[re.Pattern] = None
+        if self.literals:
+            self.scanner = re.compile("(?=(" + _trie_pattern(self.literals) + "))", re.DOTALL)
+
+        # Counters
+        self.payloads = 0
+        self.regex_runs = 0
+        self.matches_found = 0
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def candidates(self, payload: str) -> List[int]:
+        """Indices of the signatures whose gates all have a literal in ``payload``, in table order."""
+        if self.scanner is None:
+            return list(self.always)
+        triggers = self.triggers
+        found: Dict[int, int] = {}
+        for literal in set(self.scanner.findall(fold(payload))):
+            for index, bits in triggers[literal]:
+                found[index] = found.get(index, 0) | bits
+        gates = self.gates
+        indices = [index for index, bits in found.items() if bits == gates[index]]
+        indices.extend(self.always)
+        indices.sort()
+        return indices
+
+    def matches(self, payload: str) -> Iterator[Tuple[Hashable, Signature]]:
+        """(key, pattern) for every signature that matches ``payload``, in table order."""
+        self.payloads += 1
+        regexes = self.regexes
+        for index in self.candidates(payload):
+            self.regex_runs += 1
+            if all(regex.search(payload) for regex in regexes[index]):
+                self.matches_found += 1
+                yield self.keys[index], self.patterns[index]
+
+    def get_stats(self) -> Dict:
+        return {
+            "signatures": len(self.patterns),
+            "literals": len(self.literals),
+            "always_checked": len(self.always),
+            "payloads": self.payloads,
+            "regex_runs": self.regex_runs,
+            "matches": self.matches_found,
+        }
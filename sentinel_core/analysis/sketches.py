@@ -0,0 +1,286 @@
+"""Fixed-size sliding-window sketches for cross-flow statistics.
+
+Both sketches divide a window of ``window`` seconds into ``buckets`` time
+buckets kept in a ring: an observation goes into the bucket of its
+timestamp, and once a newer observation is ``buckets`` buckets ahead the
+old bucket's contents are dropped, so estimates cover the current bucket
+and the ``buckets - 1`` before it. Timestamps are the callers' (packet
+times when replaying a pcap); observations older than that are ignored.
+
+* ``CountMinSketch`` counts events per key in ``depth`` rows of ``width``
+  counters, whatever the number of distinct keys. An estimate never
+  undercounts, and overcounts by at most ``e / width`` of all events in the
+  window with probability ``1 - exp(-depth)``.
+* ``DistinctCounter`` keeps a HyperLogLog (``2 ** precision`` one-byte
+  registers per bucket, standard error ``1.04 / sqrt(2 ** precision)``) for
+  at most ``max_keys`` keys, the least recently updated key making room
+  for a new one.
+"""
+import math
+import operator
+from array import array
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+DEFAULT_WINDOW = 60.0
+DEFAULT_BUCKETS = 6
+DEFAULT_WIDTH = 1 << 15
+DEFAULT_DEPTH = 4
+DEFAULT_PRECISION = 7
+DEFAULT_MAX_KEYS = 4096
+
+_MASK64 = (1 << 64) - 1
+
+
+def hash64(item: Hashable) -> int:
+    """A well-mixed 64-bit hash of ``item`` (``hash()`` through the splitmix64 finalizer).
+
+    Python hashes small ints to themselves; the finalizer spreads them over
+    all 64 bits. Like ``hash()`` of a str, it differs between processes.
+    """
+    x = hash(item) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class CountMinSketch:
+    """Per-key event counts over a sliding window, in fixed memory."""
+
+    __slots__ = ("width", "depth", "offsets", "buckets", "bucket_seconds", "slots", "totals", "epoch", "current",
+                 "late")
+
+    def __init__(self, width: int = DEFAULT_WIDTH, depth: int = DEFAULT_DEPTH,
+                 window: float = DEFAULT_WINDOW, buckets: int = DEFAULT_BUCKETS):
+        # A power of two, so a cell index is a mask of the hash
+        self.width = 1 << max(0, width - 1).bit_length()
+        self.depth = depth
+        # Start of each row in the counter arrays
+        self.offsets = tuple(row * self.width for row in range(depth))
+        self.buckets = max(1, buckets)
+        self.bucket_seconds = window / self.buckets
+        # One counter array per bucket; totals is their sum, so an estimate reads one array
+        self.slots: List[array] = [self._zeros() for _ in range(self.buckets)]
+        self.totals = self._zeros()
+        # Newest bucket number seen (timestamp // bucket_seconds) and its counter array
+        self.epoch: Optional[int] = None
+        self.current = self.slots[0]
+
+        # Counters
+        self.late = 0
+
+    def _zeros(self) -> array:
+        return array("I", bytes(4 * self.width * self.depth))
+
+    def _advance(self, bucket: int) -> None:
+        """Make ``bucket`` the newest one, dropping the buckets that fall out of the window."""
+        epoch = self.epoch
+        self.epoch = bucket
+        if epoch is not None and bucket - epoch >= self.buckets:
+            self.slots = [self._zeros() for _ in range(self.buckets)]
+            self.totals = self._zeros()
+        elif epoch is not None:
+            for expired in range(epoch + 1, bucket + 1):
+                index = expired % self.buckets
+                self.totals = array("I", map(operator.sub, self.totals, self.slots[index]))
+                self.slots[index] = self._zeros()
+        self.current = self.slots[bucket % self.buckets]
+
+    def add(self, key: Hashable, now: float, count: int = 1) -> int:
+        """Count ``count`` events of ``key`` at time ``now``; returns the key's estimate."""
+        bucket = int(now // self.bucket_seconds)
+        if bucket == self.epoch:
+            slot = self.current
+        elif self.epoch is None or bucket > self.epoch:
+            self._advance(bucket)
+            slot = self.current
+        elif bucket > self.epoch - self.buckets:
+            slot = self.slots[bucket % self.buckets]
+        else:
+            self.late += 1
+            return self.estimate(key)
+        # Row i uses cell (h1 + i * h2) mod width
+        h = hash64(key)
+        cell = h & 0xFFFFFFFF
+        step = (h >> 32) | 1
+        mask = self.width - 1
+        totals = self.totals
+        least = None
+        for offset in self.offsets:
+            index = (cell & mask) + offset
+            slot[index] += count
+            total = totals[index] = totals[index] + count
+            if least is None or total < least:
+                least = total
+            cell += step
+        return least
+
+    def estimate(self, key: Hashable, now: Optional[float] = None) -> int:
+        """Events of ``key`` in the window (ending at ``now`` if given, else at the newest event)."""
+        if now is not None:
+            bucket = int(now // self.bucket_seconds)
+            if self.epoch is None or bucket > self.epoch:
+                self._advance(bucket)
+        h = hash64(key)
+        cell = h & 0xFFFFFFFF
+        step = (h >> 32) | 1
+        mask = self.width - 1
+        totals = self.totals
+        least = None
+        for offset in self.offsets:
+            total = totals[(cell & mask) + offset]
+            if least is None or total < least:
+                least = total
+            cell += step
+        return least
+
+    def memory_bytes(self) -> int:
+        return (self.buckets + 1) * self.width * self.depth * 4
+
+    def get_stats(self) -> dict:
+        return {
+            "width": self.width,
+            "depth": self.depth,
+            "events": sum(self.totals[:self.width]),
+            "late": self.late,
+            "memory_bytes": self.memory_bytes(),
+        }
+
+
+class _Registers:
+    """The HyperLogLog registers of one key: one array per bucket plus their running maximum."""
+
+    __slots__ = ("epoch", "slots", "merged", "inverse", "zeros")
+
+    def __init__(self, epoch: int, buckets: int, size: int):
+        self.epoch = epoch
+        self.slots: List[Optional[bytearray]] = [None] * buckets
+        self.merged = bytearray(size)
+        # sum(2 ** -register) and the number of zero registers of merged, kept up to date on every change
+        self.inverse = float(size)
+        self.zeros = size
+
+
+class DistinctCounter:
+    """Sliding-window HyperLogLog distinct counts for a bounded set of keys."""
+
+    __slots__ = ("precision", "size", "buckets", "bucket_seconds", "max_keys", "alpha", "powers", "keys",
+                 "admitted", "evicted", "late")
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, window: float = DEFAULT_WINDOW,
+                 buckets: int = DEFAULT_BUCKETS, max_keys: int = DEFAULT_MAX_KEYS):
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+        self.precision = precision
+        self.size = 1 << precision
+        self.buckets = max(1, buckets)
+        self.bucket_seconds = window / self.buckets
+        self.max_keys = max_keys
+        self.alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(self.size, 0.7213 / (1 + 1.079 / self.size))
+        self.powers = [2.0 ** -rank for rank in range(66 - precision)]
+        # key -> registers, least recently updated first
+        self.keys: "OrderedDict[Hashable, _Registers]" = OrderedDict()
+
+        # Counters
+        self.admitted = 0
+        self.evicted = 0
+        self.late = 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.keys
+
+    def _current(self, registers: _Registers, bucket: int) -> bool:
+        """Drop the buckets of ``registers`` that are out of the window at ``bucket``; False if ``bucket`` is."""
+        epoch = registers.epoch
+        if bucket <= epoch:
+            return bucket > epoch - self.buckets
+        slots = registers.slots
+        dropped = False
+        for expired in range(epoch + 1, min(bucket, epoch + self.buckets) + 1):
+            index = expired % self.buckets
+            if slots[index] is not None:
+                slots[index] = None
+                dropped = True
+        registers.epoch = bucket
+        if dropped:
+            live = [slot for slot in slots if slot is not None]
+            if not live:
+                merged = bytearray(self.size)
+            elif len(live) == 1:
+                merged = bytearray(live[0])
+            else:
+                merged = bytearray(map(max, *live))
+            registers.merged = merged
+            registers.inverse = sum(map(self.powers.__getitem__, merged))
+            registers.zeros = merged.count(0)
+        return True
+
+    def add(self, key: Hashable, item: Hashable, now: float) -> int:
+        """Record ``item`` for ``key`` at ``now`` (tracking ``key`` if new); returns the key's estimate."""
+        bucket = int(now // self.bucket_seconds)
+        keys = self.keys
+        registers = keys.get(key)
+        if registers is None:
+            if len(keys) >= self.max_keys:
+                keys.popitem(last=False)
+                self.evicted += 1
+            registers = keys[key] = _Registers(bucket, self.buckets, self.size)
+            self.admitted += 1
+        else:
+            keys.move_to_end(key)
+        if not self._current(registers, bucket):
+            self.late += 1
+            return self._estimate(registers)
+
+        h = hash64(item)
+        index = h & (self.size - 1)
+        rank = 65 - self.precision - (h >> self.precision).bit_length()
+        slot = registers.slots[bucket % self.buckets]
+        if slot is None:
+            slot = registers.slots[bucket % self.buckets] = bytearray(self.size)
+        if rank > slot[index]:
+            slot[index] = rank
+            merged = registers.merged
+            old = merged[index]
+            if rank > old:
+                merged[index] = rank
+                registers.inverse += self.powers[rank] - self.powers[old]
+                if not old:
+                    registers.zeros -= 1
+        return self._estimate(registers)
+
+    def estimate(self, key: Hashable, now: Optional[float] = None) -> Optional[int]:
+        """Distinct items of ``key`` in the window; None if ``key`` is not tracked."""
+        registers = self.keys.get(key)
+        if registers is None:
+            return None
+        if now is not None and not self._current(registers, int(now // self.bucket_seconds)):
+            return 0
+        return self._estimate(registers)
+
+    def _estimate(self, registers: _Registers) -> int:
+        size = self.size
+        zeros = registers.zeros
+        raw = self.alpha * size * size / registers.inverse
+        if raw <= 2.5 * size and zeros:
+            # Linear counting is more accurate for small cardinalities
+            raw = size * math.log(size / zeros)
+        return round(raw)
+
+    def memory_bytes(self) -> int:
+        """Upper bound of the register memory at ``max_keys`` keys with every bucket in use."""
+        return self.max_keys * (self.buckets + 1) * self.size
+
+    def get_stats(self) -> dict:
+        return {
+            "keys": len(self.keys),
+            "max_keys": self.max_keys,
+            "precision": self.precision,
+            "admitted": self.admitted,
+            "evicted": self.evicted,
+            "late": self.late,
+            "memory_bytes": self.memory_bytes(),
+        }
@@ -7,7 +7,7 @@ import asyncio
 import logging
 import random
 import uuid
-from typing import List, Dict
+from typing import Callable, List, Dict
 from datetime import datetime, timedelta
 from collections import deque
 
@@ -266,37 +266,67 @@ def create_app():
     logger.info(f"Initialized {len(flows_db)} fake HTTP/HTTPS decrypted flows for demo")
     logger.info(f"Flows: {[f['host'] + f['path'] for f in fake_flows]}")
     
+    # name -> callable returning a stats dict (pipeline stages, capture counters, ...)
+    stats_sources: Dict[str, Callable[[], Dict]] = {}
+    
+    def register_stats_source(name: str, source: Callable[[], Dict]):
+        """Expose a component's get_stats() under /api/pipeline."""
+        stats_sources[name] = source
+    
+    # name -> callable returning hot-path metrics (rates, drops, stage latency histograms)
+    metrics_sources: Dict[str, Callable[[], Dict]] = {}
+    
+    def register_metrics_source(name: str, source: Callable[[], Dict]):
+        """Expose a component's metrics under /api/metrics."""
+        metrics_sources[name] = source
+    
+    # name -> callable(limit) returning decrypted session summaries (TLS decryptor)
+    decrypted_sources: Dict[str, Callable[[int], List[Dict]]] = {}
+    
+    def register_decrypted_source(name: str, source: Callable[[int], List[Dict]]):
+        """Expose a component's decrypted sessions under /api/decrypted."""
+        decrypted_sources[name] = source
+    
     @app.get("/health")
     async def health():
         return {"status": "ok", "timestamp": datetime.utcnow().isoformat()}
     
+    @app.get("/api/pipeline")
+    async def get_pipeline_stats():
+        """Queue depths, drops and per-stage counters for capture -> analysis -> broadcast."""
+        result = {}
+        for name, source in list(stats_sources.items()):
+            try:
+                result[name] = source()
+            except Exception as e:
+                result[name] = {"error": str(e)}
+        return {"stages": result, "timestamp": datetime.utcnow().isoformat()}
+    
+    @app.get("/api/metrics")
+    async def get_metrics():
+        """Packets/bytes per second, stage latency histograms, flow table size and drops."""
+        result = {}
+        for name, source in list(metrics_sources.items()):
+            try:
+                result[name] = source()
+            except Exception as e:
+                result[name] = {"error": str(e)}
+        return {"metrics": result, "timestamp": datetime.utcnow().isoformat()}
+    
     @app.get("/api/decrypted")
     async def get_decrypted_flows(protocol: str = Query(None), limit: int = Query(50)):
-        """Get decrypted HTTP/HTTPS flows with headers and payload."""
-        results = list(flows_db.values())
+        """Get TLS sessions decrypted with SSLKEYLOG keys: request line, host and plaintext previews."""
+        results = []
+        for name, source in list(decrypted_sources.items()):
+            try:
+                results.extend(source(limit))
+            except Exception as e:
+                logger.error(f"Decrypted source {name} failed: {e}")
         
         if protocol:
             results = [f for f in results if f.get("protocol") == protocol.upper()]
         
-        decrypted_data = []
-        for flow in results[-limit:]:
-            decrypted_data.append({
-                "flow_id": flow.get("flow_id"),
-                "src_ip": flow.get("src_ip"),
-                "dst_ip": flow.get("dst_ip"),
-                "protocol": flow.get("protocol"),
-                "host": flow.get("host"),
-                "method": flow.get("method"),
-                "path": flow.get("path"),
-                "user_agent": flow.get("user_agent", "N/A"),
-                "request_body": flow.get("request_body", ""),
-                "attack_type": flow.get("attack_type"),
-                "severity": flow.get("severity"),
-                "cvss_score": flow.get("cvss_score"),
-                "timestamp": flow.get("timestamp"),
-            })
-        
-        return {"decrypted_flows": decrypted_data, "count": len(decrypted_data)}
+        return {"decrypted_flows": results[:limit], "count": len(results[:limit])}
     
     @app.get("/api/flows")
     async def get_flows(
@@ -504,5 +534,8 @@ def create_app():
     
     app.broadcast_flow = broadcast_flow
     app.broadcast_alert = broadcast_alert
+    app.register_stats_source = register_stats_source
+    app.register_metrics_source = register_metrics_source
+    app.register_decrypted_source = register_decrypted_source
     
     return app
@@ -0,0 +1,182 @@
+"""Linux AF_PACKET TPACKET_V3 memory-mapped ring capture backend.
+
+The kernel writes frames into a ring of blocks shared with userspace; we
+walk each retired block in place, yielding every frame as a ``memoryview``
+into the mapping, and hand the block back to the kernel once the consumer
+has moved past it. There is one ``poll`` per block instead of one ``recv``
+per packet, and no per-frame copy.
+
+Frame views are only valid until the generator advances past their block;
+consumers must copy anything they keep.
+"""
+import mmap
+import select
+import socket
+import struct
+import logging
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+from .bpf import Instruction, attach_filter
+
+logger = logging.getLogger(__name__)
+
+# <linux/if_packet.h>
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+PACKET_FANOUT = 18
+TPACKET_V3 = 2
+PACKET_FANOUT_HASH = 0
+PACKET_FANOUT_FLAG_DEFRAG = 0x8000
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+ETH_P_ALL = 0x0003
+
+# struct tpacket_req3
+_TPACKET_REQ3 = struct.Struct("=IIIIIII")
+# struct tpacket_block_desc: version, offset_to_priv, then tpacket_hdr_v1
+# (block_status, num_pkts, offset_to_first_pkt, blk_len, seq_num, ts_first, ts_last)
+_BLOCK_STATUS_OFFSET = 8
+_unpack_block_hdr = struct.Struct("=III").unpack_from  # block_status, num_pkts, offset_to_first_pkt
+# struct tpacket3_hdr: tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac, tp_net
+_unpack_frame_hdr = struct.Struct("=IIIIIIHH").unpack_from
+# struct tpacket_stats_v3: tp_packets, tp_drops, tp_freeze_q_cnt
+_TPACKET_STATS_V3 = struct.Struct("=III")
+# struct tpacket_stats (sockets without a ring): tp_packets, tp_drops
+_TPACKET_STATS = struct.Struct("=II")
+
+# (timestamp, frame)
+RingFrame = Tuple[float, memoryview]
+
+
+def read_socket_stats(sock) -> Tuple[int, int]:
+    """Read (and reset) the kernel's (packets, drops) counters of a ring-less AF_PACKET socket."""
+    raw = sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, _TPACKET_STATS.size)
+    return _TPACKET_STATS.unpack(raw)
+
+
+class AFPacketRing:
+    """A TPACKET_V3 receive ring bound to one interface.
+
+    ``block_size * block_count`` bytes are mapped (default 64 x 1 MiB). A block
+    is handed to userspace when it fills up or after ``block_timeout_ms``.
+    ``fanout_group`` joins a PACKET_FANOUT hash group for sharded capture, and
+    ``bpf_program`` (see ``bpf.CaptureFilter.compile``) filters in the kernel.
+    """
+
+    def __init__(self, interface: str, block_size: int = 1 << 20, block_count: int = 64,
+                 frame_size: int = 2048, block_timeout_ms: int = 64,
+                 fanout_group: Optional[int] = None,
+                 bpf_program: Optional[Sequence[Instruction]] = None):
+        self.interface = interface
+        self.block_size = block_size
+        self.block_count = block_count
+        self.frame_size = frame_size
+        self.block_timeout_ms = block_timeout_ms
+        self.fanout_group = fanout_group
+        self.bpf_program = bpf_program
+        self.sock: Optional[socket.socket] = None
+        self.ring: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+        self._block = 0
+
+        # Cumulative kernel counters (PACKET_STATISTICS resets on every read)
+        self.kernel_packets = 0
+        self.kernel_drops = 0
+        self.kernel_freeze_q = 0
+
+    def open(self):
+        """Create the socket, set up and map the ring, and bind to the interface."""
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            if self.bpf_program:
+                # Before the ring exists, so unfiltered frames never reach it
+                attach_filter(sock, self.bpf_program)
+            sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            req = _TPACKET_REQ3.pack(
+                self.block_size, self.block_count, self.frame_size,
+                (self.block_size // self.frame_size) * self.block_count,
+                self.block_timeout_ms, 0, 0)
+            sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+            self.ring = mmap.mmap(sock.fileno(), self.block_size * self.block_count,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            sock.bind((self.interface, 0))
+            if self.fanout_group is not None:
+                fanout_arg = self.fanout_group | ((PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG) << 16)
+                sock.setsockopt(SOL_PACKET, PACKET_FANOUT, fanout_arg)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+        self._view = memoryview(self.ring)
+        self._block = 0
+        logger.info(f"TPACKET_V3 ring on {self.interface}: {self.block_count} x {self.block_size} bytes")
+        return self
+
+    def close(self):
+        """Unmap the ring and close the socket."""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self.ring is not None:
+            try:
+                self.ring.close()
+            except BufferError:
+                # A consumer still holds a frame view; the mapping goes with it
+                pass
+            self.ring = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def iter_frames(self, poll_timeout: float = 1.0) -> Iterator[Optional[RingFrame]]:
+        """Yield ``(timestamp, frame)`` for every captured frame, forever.
+
+        Yields ``None`` whenever ``poll_timeout`` seconds pass without a
+        retired block, so callers can run housekeeping or stop.
+        """
+        view = self._view
+        poller = select.poll()
+        poller.register(self.sock.fileno(), select.POLLIN | select.POLLERR)
+        timeout_ms = int(poll_timeout * 1000)
+        block_size = self.block_size
+        while True:
+            block_offset = self._block * block_size
+            status, num_pkts, first_pkt = _unpack_block_hdr(view, block_offset + _BLOCK_STATUS_OFFSET)
+            if not status & TP_STATUS_USER:
+                if not poller.poll(timeout_ms):
+                    yield None
+                continue
+
+            pkt_offset = block_offset + first_pkt
+            for _ in range(num_pkts):
+                next_offset, sec, nsec, snaplen, _len, _status, mac, _net = _unpack_frame_hdr(view, pkt_offset)
+                start = pkt_offset + mac
+                yield sec + nsec * 1e-9, view[start:start + snaplen]
+                pkt_offset += next_offset
+
+            # Hand the block back to the kernel and move on
+            struct.pack_into("=I", view, block_offset + _BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL)
+            self._block = (self._block + 1) % self.block_count
+
+    def get_stats(self) -> Dict:
+        """Read and accumulate the kernel's packet/drop counters for this socket."""
+        if self.sock is not None:
+            raw = self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, _TPACKET_STATS_V3.size)
+            packets, drops, freeze_q = _TPACKET_STATS_V3.unpack(raw)
+            self.kernel_packets += packets
+            self.kernel_drops += drops
+            self.kernel_freeze_q += freeze_q
+        return {
+            "backend": "afpacket",
+            "kernel_packets": self.kernel_packets,
+            "kernel_drops": self.kernel_drops,
+            "kernel_freeze_queue": self.kernel_freeze_q,
+        }
@@ -0,0 +1,71 @@
+"""Application identification from the server port or the first payload bytes.
+
+Identification is decided once per flow: a known server port settles it on
+the first packet, otherwise the first few payload-bearing packets are
+checked against ``PAYLOAD_SIGNATURES`` and the flow is frozen as soon as one
+matches or the probe budget runs out.
+"""
+import json
+import os
+from typing import Dict, Optional
+
+UNKNOWN_APP = "Unknown"
+
+# Well-known server ports -> application type. Extend per capture with
+# PacketCapture(app_ports=...), which also reaches spawned shard workers.
+APP_PORTS: Dict[int, str] = {
+    80: "HTTP", 8080: "HTTP", 8000: "HTTP",
+    443: "HTTPS", 8443: "HTTPS",
+    25: "SMTP", 587: "SMTP", 465: "SMTPS",
+    110: "POP3", 995: "POP3S",
+    143: "IMAP", 993: "IMAPS",
+    53: "DNS",
+    22: "SSH", 2222: "SSH",
+    3306: "MySQL", 5432: "PostgreSQL",
+    6379: "Redis", 27017: "MongoDB",
+    3389: "RDP", 5900: "VNC",
+    5672: "AMQP", 9092: "Kafka"
+}
+
+# (needle, app type), checked in order within the first SIGNATURE_WINDOW bytes
+PAYLOAD_SIGNATURES = (
+    (b"HTTP/", "HTTP"),
+    (b"GET ", "HTTP"),
+    (b"POST ", "HTTP"),
+    (b"SSH", "SSH"),
+    (b"SMTP", "SMTP"),
+)
+SIGNATURE_WINDOW = 100
+
+# Payload-bearing packets inspected before a flow is frozen as Unknown
+DEFAULT_PROBE_PACKETS = 4
+
+
+def identify_payload(payload) -> Optional[str]:
+    """Match the start of an L4 payload against PAYLOAD_SIGNATURES."""
+    head = bytes(payload[:SIGNATURE_WINDOW])
+    for needle, app_type in PAYLOAD_SIGNATURES:
+        if needle in head:
+            return app_type
+    return None
+
+
+def parse_app_ports(spec: Optional[str]) -> Dict[int, str]:
+    """Parse ``"8081=HTTP,9000-9005=Custom"`` or a JSON file of ``{"8081": "HTTP"}``."""
+    if not spec:
+        return {}
+    if os.path.isfile(spec):
+        with open(spec) as f:
+            return {int(port): str(app) for port, app in json.load(f).items()}
+    ports = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        port_spec, _, app_type = item.partition("=")
+        if not app_type:
+            raise ValueError(f"Invalid app port mapping {item!r}; expected PORT=APP")
+        low, _, high = port_spec.strip().partition("-")
+        for port in range(int(low), int(high or low) + 1):
+            ports[port] = app_type.strip()
+    return ports
+
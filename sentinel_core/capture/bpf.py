@@ -0,0 +1,398 @@
+"""Kernel-side capture filters (classic BPF) for the Scapy and raw-socket backends.
+
+A ``CaptureFilter`` is either a free-form BPF expression (compiled by
+libpcap through Scapy, or by ``tcpdump -ddd``) or a structured list of
+protocols / ports / subnets, which is compiled here directly to classic BPF
+so it works without libpcap. Either way the program is attached to the
+capture socket with SO_ATTACH_FILTER, so frames we would never analyse are
+dropped in the kernel instead of being copied to userspace and dissected.
+
+The structured compiler errs on the side of passing frames it cannot judge
+cheaply (802.1Q/802.1ad tagged frames, non-first IPv4 fragments, IPv6 with
+extension headers); the userspace decoder sorts those out.
+"""
+import ctypes
+import socket
+import ipaddress
+import logging
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from .decoder import (
+    LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LINUX_SLL, LINKTYPE_IPV4, LINKTYPE_IPV6,
+    IPPROTO_ICMP, IPPROTO_TCP, IPPROTO_UDP,
+)
+
+logger = logging.getLogger(__name__)
+
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+
+# Classic BPF opcodes (<linux/filter.h>)
+BPF_LD_W_ABS = 0x20
+BPF_LD_H_ABS = 0x28
+BPF_LD_B_ABS = 0x30
+BPF_LD_H_IND = 0x48
+BPF_LDX_B_MSH = 0xB1
+BPF_ALU_AND_K = 0x54
+BPF_JMP_JA = 0x05
+BPF_JMP_JEQ_K = 0x15
+BPF_JMP_JGT_K = 0x25
+BPF_JMP_JGE_K = 0x35
+BPF_JMP_JSET_K = 0x45
+BPF_RET_K = 0x06
+
+# Returned snap length for accepted frames (the whole frame)
+ACCEPT_SNAPLEN = 0x40000
+
+# Protocols the flow pipeline builds records for (see decoder.decode_frame /
+# PacketCapture.process_packet): TCP and UDP over IPv4/IPv6, ICMP over IPv4.
+PROTOCOL_NUMBERS = {"tcp": IPPROTO_TCP, "udp": IPPROTO_UDP, "icmp": IPPROTO_ICMP}
+DEFAULT_PROTOCOLS = ("tcp", "udp", "icmp")
+
+_ETH_P_IP = 0x0800
+_ETH_P_IPV6 = 0x86DD
+_ETH_P_8021Q = 0x8100
+_ETH_P_8021AD = 0x88A8
+# IPv6 hop-by-hop, routing, fragment, destination options
+_IPV6_EXTENSION_HEADERS = (0, 43, 44, 60)
+
+# tcpdump -y names for compile_expression's fallback
+_DLT_NAMES = {LINKTYPE_ETHERNET: "EN10MB", LINKTYPE_RAW: "RAW", LINKTYPE_LINUX_SLL: "LINUX_SLL",
+              LINKTYPE_IPV4: "IPV4", LINKTYPE_IPV6: "IPV6"}
+
+# (code, jt, jf, k)
+Instruction = Tuple[int, int, int, int]
+PortSpec = Union[int, str, Tuple[int, int]]
+
+
+class BPFError(ValueError):
+    """A capture filter could not be compiled or attached."""
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [("code", ctypes.c_ushort), ("jt", ctypes.c_ubyte),
+                ("jf", ctypes.c_ubyte), ("k", ctypes.c_uint32)]
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_ushort), ("filter", ctypes.POINTER(_SockFilter))]
+
+
+def parse_port(spec: PortSpec) -> Tuple[int, int]:
+    """Normalise ``80``, ``"80"``, ``"8000-8100"`` or ``(8000, 8100)`` to an inclusive range."""
+    if isinstance(spec, tuple):
+        low, high = spec
+    elif isinstance(spec, str) and "-" in spec:
+        low, high = spec.split("-", 1)
+    else:
+        low = high = spec
+    low, high = int(low), int(high)
+    if not 0 <= low <= high <= 0xFFFF:
+        raise BPFError(f"Invalid port or port range {spec!r}")
+    return low, high
+
+
+@dataclass
+class CaptureFilter:
+    """What to capture: a BPF ``expression``, or protocols AND ports AND subnets.
+
+    ``ports`` only restrict TCP/UDP (either direction); ICMP is kept when
+    listed in ``protocols``. Empty ``ports``/``subnets`` mean "any".
+    """
+    protocols: Sequence[str] = DEFAULT_PROTOCOLS
+    ports: Sequence[PortSpec] = ()
+    subnets: Sequence[str] = ()
+    expression: Optional[str] = None
+
+    def __post_init__(self):
+        self.protocols = tuple(p.lower() for p in self.protocols)
+        unknown = [p for p in self.protocols if p not in PROTOCOL_NUMBERS]
+        if unknown:
+            raise BPFError(f"Unsupported protocol(s) {unknown}; expected {sorted(PROTOCOL_NUMBERS)}")
+        self.ports = tuple(self.ports)
+        self.subnets = tuple(self.subnets)
+        self._ranges = [parse_port(p) for p in self.ports]
+        try:
+            self._networks = [ipaddress.ip_network(s, strict=False) for s in self.subnets]
+        except ValueError as e:
+            raise BPFError(f"Invalid subnet: {e}") from None
+        self._compiled: Dict[int, List[Instruction]] = {}
+
+    @classmethod
+    def for_classifier(cls, extra_ports: Sequence[PortSpec] = (), **kwargs) -> "CaptureFilter":
+        """Only the ports the app-type table and the classifier's port rules key on.
+
+        Much narrower than the default on a busy link, but flows on other
+        ports are no longer seen at all (e.g. the port-agnostic
+        exfiltration rule). Ports come from the rules loaded at startup.
+        """
+        from .app_id import APP_PORTS
+        from ..analysis.attack_classifier import AttackClassifier
+
+        ports = set(APP_PORTS) | set(AttackClassifier.rule_engine().plan.ports())
+        return cls(ports=sorted(ports) + list(extra_ports), **kwargs)
+
+    def to_expression(self) -> str:
+        """The equivalent libpcap expression (for logs, tcpdump or Scapy's own filter=)."""
+        if self.expression:
+            return self.expression
+        l4 = [p for p in self.protocols if p != "icmp"]
+        terms = []
+        if l4:
+            term = " or ".join(l4)
+            if self._ranges:
+                ports = " or ".join(f"port {lo}" if lo == hi else f"portrange {lo}-{hi}"
+                                    for lo, hi in self._ranges)
+                term = f"({term}) and ({ports})"
+            terms.append(f"({term})" if len(l4) > 1 or self._ranges else term)
+        if "icmp" in self.protocols:
+            terms.append("icmp")
+        expression = " or ".join(terms)
+        if self._networks:
+            nets = " or ".join(f"net {n}" for n in self._networks)
+            expression = f"({expression}) and ({nets})"
+        return expression
+
+    def compile(self, linktype: int = LINKTYPE_ETHERNET) -> List[Instruction]:
+        """Compile to classic BPF for frames of ``linktype`` (cached per linktype)."""
+        program = self._compiled.get(linktype)
+        if program is None:
+            if self.expression:
+                program = compile_expression(self.expression, linktype)
+            else:
+                program = _StructuredCompiler(self).compile(linktype)
+            self._compiled[linktype] = program
+        return program
+
+    def attach(self, sock: socket.socket, linktype: int = LINKTYPE_ETHERNET) -> int:
+        """Compile for ``linktype`` and attach to ``sock``; returns the program length."""
+        program = self.compile(linktype)
+        attach_filter(sock, program)
+        logger.info(f"Attached capture filter ({len(program)} BPF instructions): {self.to_expression()}")
+        return len(program)
+
+
+def parse_filter_spec(spec: Optional[str], protocols: Optional[str] = None,
+                      ports: Optional[str] = None, subnets: Optional[str] = None) -> Optional[CaptureFilter]:
+    """Build a CaptureFilter from configuration strings.
+
+    ``spec`` is ``"default"`` (or empty), ``"none"``/``"off"``,
+    ``"classifier"``, or a BPF expression. ``protocols``/``ports``/``subnets``
+    are comma-separated lists applied to the default/classifier presets.
+    """
+    spec = (spec or "default").strip()
+    if spec.lower() in ("none", "off", "0", "false"):
+        return None
+    kwargs = {}
+    if protocols:
+        kwargs["protocols"] = _split_list(protocols)
+    if subnets:
+        kwargs["subnets"] = _split_list(subnets)
+    if spec.lower() == "classifier":
+        return CaptureFilter.for_classifier(_split_list(ports), **kwargs)
+    if spec.lower() == "default":
+        return CaptureFilter(ports=_split_list(ports), **kwargs)
+    return CaptureFilter(expression=spec)
+
+
+def _split_list(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+
+def compile_expression(expression: str, linktype: int = LINKTYPE_ETHERNET) -> List[Instruction]:
+    """Compile a libpcap filter expression with libpcap (via Scapy) or ``tcpdump -ddd``."""
+    try:
+        from scapy.arch.common import compile_filter
+        program = compile_filter(expression, linktype=linktype)
+        return [(program.bf_insns[i].code, program.bf_insns[i].jt,
+                 program.bf_insns[i].jf, program.bf_insns[i].k) for i in range(program.bf_len)]
+    except ImportError:
+        pass
+    except Exception as e:
+        raise BPFError(f"Invalid capture filter {expression!r}: {e}") from None
+
+    try:
+        out = subprocess.run(["tcpdump", "-ddd", "-y", _DLT_NAMES.get(linktype, "EN10MB"), expression],
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        raise BPFError("Compiling a BPF expression needs libpcap or tcpdump; "
+                       "use a ports/subnets/protocols filter instead") from None
+    if out.returncode != 0:
+        raise BPFError(f"Invalid capture filter {expression!r}: {out.stderr.strip()}")
+    lines = out.stdout.split()
+    return [tuple(int(v) for v in lines[i:i + 4]) for i in range(1, len(lines), 4)]
+
+
+def attach_filter(sock: socket.socket, program: Sequence[Instruction]) -> None:
+    """Attach a classic BPF program to a socket (Linux SO_ATTACH_FILTER)."""
+    insns = (_SockFilter * len(program))(*program)
+    fprog = _SockFprog(len(program), insns)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER,
+                        ctypes.string_at(ctypes.addressof(fprog), ctypes.sizeof(fprog)))
+    except OSError as e:
+        raise BPFError(f"Could not attach capture filter: {e}") from None
+
+
+def detach_filter(sock: socket.socket) -> None:
+    """Remove a previously attached filter."""
+    sock.setsockopt(socket.SOL_SOCKET, SO_DETACH_FILTER, 0)
+
+
+class _StructuredCompiler:
+    """Emits classic BPF for a structured ``CaptureFilter`` with symbolic jump labels.
+
+    Conditional jumps only reach 255 instructions ahead, so each section
+    (IPv4, IPv6) ends in its own accept instruction and the link-layer
+    dispatch reaches the IPv6 section with a long ``ja``.
+    """
+
+    def __init__(self, capture_filter: CaptureFilter):
+        self.filter = capture_filter
+        self.insns: List[list] = []
+        self.labels: Dict[str, int] = {}
+
+    def emit(self, code: int, k=0, jt: Optional[str] = None, jf: Optional[str] = None):
+        self.insns.append([code, jt, jf, k])
+
+    def label(self, name: str):
+        self.labels[name] = len(self.insns)
+
+    def compile(self, linktype: int) -> List[Instruction]:
+        if linktype == LINKTYPE_ETHERNET:
+            l3 = self._link_ethertype(12, 14)
+        elif linktype == LINKTYPE_LINUX_SLL:
+            l3 = self._link_ethertype(14, 16)
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+            l3 = 0
+            self.emit(BPF_LD_B_ABS, 0)
+            self.emit(BPF_ALU_AND_K, 0xF0)
+            self.emit(BPF_JMP_JEQ_K, 0x40, jt="ipv4")
+            self.emit(BPF_JMP_JEQ_K, 0x60, jf="reject")
+        else:
+            raise BPFError(f"No built-in BPF compiler for linktype {linktype}; use an expression")
+        self.emit(BPF_JMP_JA, "ipv6")
+        self.label("reject")
+        self.emit(BPF_RET_K, 0)
+        self.label("accept")
+        self.emit(BPF_RET_K, ACCEPT_SNAPLEN)
+
+        self.label("ipv4")
+        self._ipv4(l3)
+        self.label("ipv6")
+        self._ipv6(l3)
+        return self._assemble()
+
+    def _link_ethertype(self, offset: int, l3: int) -> int:
+        self.emit(BPF_LD_H_ABS, offset)
+        # Tagged frames: the decoder strips up to two tags, let it decide
+        self.emit(BPF_JMP_JEQ_K, _ETH_P_8021Q, jt="accept")
+        self.emit(BPF_JMP_JEQ_K, _ETH_P_8021AD, jt="accept")
+        self.emit(BPF_JMP_JEQ_K, _ETH_P_IP, jt="ipv4")
+        self.emit(BPF_JMP_JEQ_K, _ETH_P_IPV6, jf="reject")
+        return l3
+
+    def _ipv4(self, l3: int):
+        if self.filter._networks:
+            for net in (n for n in self.filter._networks if n.version == 4):
+                mask = int(net.netmask)
+                for addr_offset in (12, 16):
+                    self.emit(BPF_LD_W_ABS, l3 + addr_offset)
+                    if mask != 0xFFFFFFFF:
+                        self.emit(BPF_ALU_AND_K, mask)
+                    self.emit(BPF_JMP_JEQ_K, int(net.network_address), jt="ipv4_proto")
+            self.emit(BPF_RET_K, 0)
+        self.label("ipv4_proto")
+        self.emit(BPF_LD_B_ABS, l3 + 9)
+        for name in self.filter.protocols:
+            target = "ipv4_ports" if name != "icmp" and self.filter._ranges else "ipv4_accept"
+            self.emit(BPF_JMP_JEQ_K, PROTOCOL_NUMBERS[name], jt=target)
+        self.emit(BPF_RET_K, 0)
+        self.label("ipv4_accept")
+        self.emit(BPF_RET_K, ACCEPT_SNAPLEN)
+        if self.filter._ranges:
+            self.label("ipv4_ports")
+            # Non-first fragments carry no ports
+            self.emit(BPF_LD_H_ABS, l3 + 6)
+            self.emit(BPF_JMP_JSET_K, 0x1FFF, jt="ipv4_port_match")
+            self.emit(BPF_LDX_B_MSH, l3)
+            for port_offset in (0, 2):
+                self.emit(BPF_LD_H_IND, l3 + port_offset)
+                self._port_checks("ipv4_port_match")
+            self.emit(BPF_RET_K, 0)
+            self.label("ipv4_port_match")
+            self.emit(BPF_RET_K, ACCEPT_SNAPLEN)
+
+    def _ipv6(self, l3: int):
+        if self.filter._networks:
+            for i, net in enumerate(n for n in self.filter._networks if n.version == 6):
+                for side, addr_offset in enumerate((8, 24)):
+                    self._ipv6_prefix(l3 + addr_offset, net, f"ipv6_net{i}_{side}")
+            self.emit(BPF_RET_K, 0)
+        self.label("ipv6_proto")
+        self.emit(BPF_LD_B_ABS, l3 + 6)
+        l4 = [name for name in self.filter.protocols if name != "icmp"]
+        if l4:
+            # Ports sit behind the extension header chain: let the decoder walk it
+            for next_header in _IPV6_EXTENSION_HEADERS:
+                self.emit(BPF_JMP_JEQ_K, next_header, jt="ipv6_accept")
+        for name in l4:
+            self.emit(BPF_JMP_JEQ_K, PROTOCOL_NUMBERS[name],
+                      jt="ipv6_ports" if self.filter._ranges else "ipv6_accept")
+        self.emit(BPF_RET_K, 0)
+        self.label("ipv6_accept")
+        self.emit(BPF_RET_K, ACCEPT_SNAPLEN)
+        if self.filter._ranges:
+            self.label("ipv6_ports")
+            for port_offset in (40, 42):
+                self.emit(BPF_LD_H_ABS, l3 + port_offset)
+                self._port_checks("ipv6_port_match")
+            self.emit(BPF_RET_K, 0)
+            self.label("ipv6_port_match")
+            self.emit(BPF_RET_K, ACCEPT_SNAPLEN)
+
+    def _ipv6_prefix(self, offset: int, net, miss: str):
+        """Compare the address at ``offset`` word by word against ``net``; match -> ipv6_proto."""
+        address = int(net.network_address).to_bytes(16, "big")
+        prefix = net.prefixlen
+        words = max(1, (prefix + 31) // 32)
+        for w in range(words):
+            bits = min(32, prefix - 32 * w)
+            mask = (0xFFFFFFFF << (32 - bits)) & 0xFFFFFFFF if bits > 0 else 0
+            value = int.from_bytes(address[4 * w:4 * w + 4], "big") & mask
+            self.emit(BPF_LD_W_ABS, offset + 4 * w)
+            if mask != 0xFFFFFFFF:
+                self.emit(BPF_ALU_AND_K, mask)
+            self.emit(BPF_JMP_JEQ_K, value, jt="ipv6_proto" if w == words - 1 else None, jf=miss)
+        self.label(miss)
+
+    def _port_checks(self, match: str):
+        """Jump to ``match`` if the port in A falls in any configured range."""
+        for low, high in self.filter._ranges:
+            if low == high:
+                self.emit(BPF_JMP_JEQ_K, low, jt=match)
+            else:
+                skip = f"port_skip{len(self.insns)}"
+                self.emit(BPF_JMP_JGE_K, low, jf=skip)
+                self.emit(BPF_JMP_JGT_K, high, jf=match)
+                self.label(skip)
+
+    def _assemble(self) -> List[Instruction]:
+        program = []
+        for index, (code, jt, jf, k) in enumerate(self.insns):
+            if code == BPF_JMP_JA:
+                program.append((code, 0, 0, self.labels[k] - index - 1))
+                continue
+            offsets = []
+            for target in (jt, jf):
+                offset = 0 if target is None else self.labels[target] - index - 1
+                if not 0 <= offset <= 255:
+                    raise BPFError("Capture filter too large for classic BPF jumps; "
+                                   "use fewer ports/subnets or a BPF expression")
+                offsets.append(offset)
+            program.append((code, offsets[0], offsets[1], k))
+        if len(program) > 4096:
+            raise BPFError("Capture filter exceeds 4096 BPF instructions")
+        return program
@@ -0,0 +1,418 @@
+"""Streaming columnar flow export and a memory-mapped reader.
+
+An export is a directory with one NumPy ``.npy`` file per column plus a
+``manifest.json`` describing them. Rows are buffered per column and appended
+to the files every ``batch_size`` flows, so memory stays bounded however many
+flows are exported; the ``.npy`` headers are written with a fixed size and
+patched with the final row count on close. Writing needs only the standard
+library; any ``.npy`` reader (``numpy.load(..., mmap_mode="r")``) can open
+the columns.
+
+Column kinds (``manifest["columns"][name]["kind"]``):
+
+* ``float`` / ``uint``: one little-endian value per row (``<f8``, ``<u2``, ...)
+* ``ip``: ``(rows, 16)`` ``uint8``; IPv4 addresses are stored IPv4-mapped
+  (``::ffff:a.b.c.d``)
+* ``category``: ``<u2`` codes into ``manifest["columns"][name]["categories"]``;
+  code 0 is None
+* ``string``: Arrow-style ``<name>.offsets.npy`` (``<u8``, rows + 1) and
+  ``<name>.data.npy`` (UTF-8 bytes); row ``i`` is ``data[offsets[i]:offsets[i+1]]``
+  and an empty value reads back as None
+
+``http_attack`` (the payload signature match of a flow's HTTP requests) is
+a string column holding the match dict as JSON.
+"""
+import ast
+import json
+import mmap
+import os
+import socket
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+FORMAT_NAME = "sentinel-flows-columnar"
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+DEFAULT_BATCH_SIZE = 65536
+
+KIND_FLOAT = "float"
+KIND_UINT = "uint"
+KIND_IP = "ip"
+KIND_CATEGORY = "category"
+KIND_STRING = "string"
+
+# (column, kind, .npy dtype) in export order
+FLOW_COLUMNS = (
+    ("timestamp", KIND_FLOAT, "<f8"),
+    ("duration", KIND_FLOAT, "<f8"),
+    ("src_ip", KIND_IP, "|u1"),
+    ("dst_ip", KIND_IP, "|u1"),
+    ("src_port", KIND_UINT, "<u2"),
+    ("dst_port", KIND_UINT, "<u2"),
+    ("protocol", KIND_CATEGORY, "<u2"),
+    ("packets", KIND_UINT, "<u8"),
+    ("bytes_sent", KIND_UINT, "<u8"),
+    ("bytes_received", KIND_UINT, "<u8"),
+    ("sample_rate", KIND_UINT, "<u4"),
+    ("app_type", KIND_CATEGORY, "<u2"),
+    ("tls_version", KIND_CATEGORY, "<u2"),
+    ("sni", KIND_STRING, "|u1"),
+    ("ja3", KIND_STRING, "|u1"),
+    ("ja4", KIND_STRING, "|u1"),
+    ("alpn", KIND_CATEGORY, "<u2"),
+    ("http_method", KIND_CATEGORY, "<u2"),
+    ("http_host", KIND_STRING, "|u1"),
+    ("http_uri", KIND_STRING, "|u1"),
+    ("http_user_agent", KIND_STRING, "|u1"),
+    ("http_attack", KIND_STRING, "|u1"),
+)
+
+# .npy dtype -> array/memoryview typecode
+_TYPECODES = {"<f8": "d", "<u8": "Q", "<u4": "I", "<u2": "H", "|u1": "B"}
+_MAX_CATEGORIES = 0xFFFF
+
+# .npy v1.0: magic, version, header length, then a padded dict literal; we
+# reserve room for any row count so the header can be patched in place
+_NPY_MAGIC = b"\x93NUMPY\x01\x00"
+_NPY_HEADER_SIZE = 128
+_NEEDS_BYTESWAP = sys.byteorder != "little"
+_IPV4_MAPPED = b"\x00" * 10 + b"\xff\xff"
+
+
+class ColumnarFormatError(ValueError):
+    """Raised when a directory is not a readable columnar flow export."""
+
+
+def _npy_header(descr: str, shape: tuple) -> bytes:
+    text = repr({"descr": descr, "fortran_order": False, "shape": shape})
+    body_size = _NPY_HEADER_SIZE - len(_NPY_MAGIC) - 2
+    return _NPY_MAGIC + struct.pack("<H", body_size) + text.ljust(body_size - 1).encode("latin-1") + b"\n"
+
+
+def _pack_ip(address: Optional[str]) -> bytes:
+    if not address:
+        return bytes(16)
+    if ":" in address:
+        return socket.inet_pton(socket.AF_INET6, address)
+    return _IPV4_MAPPED + socket.inet_aton(address)
+
+
+def _unpack_ip(packed: bytes) -> Optional[str]:
+    if packed[:12] == _IPV4_MAPPED:
+        return socket.inet_ntoa(packed[12:])
+    if not any(packed):
+        return None
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+
+class _NpyFile:
+    """An append-only 1-D/2-D ``.npy`` file whose row count is filled in on close."""
+
+    def __init__(self, path: str, descr: str, row_width: int = 0):
+        self.descr = descr
+        self.row_width = row_width
+        self.items = 0
+        self._file = open(path, "wb")
+        self._file.write(_npy_header(descr, (0,)))
+
+    def append(self, data) -> None:
+        if isinstance(data, array):
+            self.items += len(data)
+            if _NEEDS_BYTESWAP and data.itemsize > 1:
+                data = array(data.typecode, data)
+                data.byteswap()
+            data.tofile(self._file)
+        else:
+            self.items += len(data)
+            self._file.write(data)
+
+    def close(self) -> None:
+        shape = (self.items // self.row_width, self.row_width) if self.row_width else (self.items,)
+        self._file.seek(0)
+        self._file.write(_npy_header(self.descr, shape))
+        self._file.close()
+
+
+class ColumnarFlowWriter:
+    """Writes flows to a columnar export directory in bounded-memory batches.
+
+    Accepts ``FlowStats`` objects (``write_flow``) or flow record dicts
+    (``write``, usable as a ``PacketCapture`` ``flow_sink``).
+    """
+
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.rows = 0
+        os.makedirs(path, exist_ok=True)
+        self._pending = 0
+        self._files: Dict[str, _NpyFile] = {}
+        self._buffers: Dict[str, object] = {}
+        self._categories: Dict[str, Dict[Optional[str], int]] = {}
+        self._offsets: Dict[str, int] = {}
+        for name, kind, descr in FLOW_COLUMNS:
+            if kind == KIND_STRING:
+                self._files[name + ".offsets"] = _NpyFile(os.path.join(path, f"{name}.offsets.npy"), "<u8")
+                self._files[name + ".data"] = _NpyFile(os.path.join(path, f"{name}.data.npy"), descr)
+                self._buffers[name + ".offsets"] = array("Q", [0])
+                self._buffers[name + ".data"] = bytearray()
+                self._offsets[name] = 0
+            else:
+                self._files[name] = _NpyFile(os.path.join(path, f"{name}.npy"), descr,
+                                             16 if kind == KIND_IP else 0)
+                self._buffers[name] = bytearray() if kind == KIND_IP else array(_TYPECODES[descr])
+                if kind == KIND_CATEGORY:
+                    self._categories[name] = {None: 0}
+
+    def __enter__(self) -> "ColumnarFlowWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_flow(self, flow) -> None:
+        """Append one ``FlowStats`` without building a record dict."""
+        protocol, ip_a, port_a, ip_b, port_b = flow.key
+        if flow.reverse:
+            ip_a, port_a, ip_b, port_b = ip_b, port_b, ip_a, port_a
+        self._append(flow.start_time, flow.last_seen - flow.start_time, ip_a, ip_b, port_a, port_b,
+                     protocol, flow.packets, flow.bytes_sent, flow.bytes_received, flow.sample_rate,
+                     flow.app_type, flow.tls_version, flow.sni, flow.ja3, flow.ja4,
+                     flow.alpn, flow.http, flow.http_attack)
+
+    def write(self, record: Dict) -> None:
+        """Append one flow record dict (``FlowStats.to_dict`` layout)."""
+        get = record.get
+        self._append(get("timestamp") or 0.0, get("duration") or 0.0, get("src_ip"), get("dst_ip"),
+                     get("src_port") or 0, get("dst_port") or 0, get("protocol"), get("packets") or 0,
+                     get("bytes_sent") or 0, get("bytes_received") or 0, get("sample_rate") or 1,
+                     get("app_type"), get("tls_version"), get("sni"), get("ja3"), get("ja4"),
+                     get("alpn"), get("http"), get("http_attack"))
+
+    def write_many(self, flows: Iterable) -> int:
+        """Append ``FlowStats`` objects or record dicts; returns how many were written."""
+        count = 0
+        for flow in flows:
+            if isinstance(flow, dict):
+                self.write(flow)
+            else:
+                self.write_flow(flow)
+            count += 1
+        return count
+
+    def _append(self, timestamp, duration, src_ip, dst_ip, src_port, dst_port, protocol, packets,
+                bytes_sent, bytes_received, sample_rate, app_type, tls_version, sni, ja3, ja4, alpn, http,
+                http_attack):
+        buffers = self._buffers
+        buffers["timestamp"].append(timestamp)
+        buffers["duration"].append(duration)
+        buffers["src_ip"] += _pack_ip(src_ip)
+        buffers["dst_ip"] += _pack_ip(dst_ip)
+        buffers["src_port"].append(src_port)
+        buffers["dst_port"].append(dst_port)
+        buffers["protocol"].append(self._code("protocol", protocol))
+        buffers["packets"].append(packets)
+        buffers["bytes_sent"].append(bytes_sent)
+        buffers["bytes_received"].append(bytes_received)
+        buffers["sample_rate"].append(sample_rate)
+        buffers["app_type"].append(self._code("app_type", app_type))
+        buffers["tls_version"].append(self._code("tls_version", tls_version))
+        self._string("sni", sni)
+        self._string("ja3", ja3)
+        self._string("ja4", ja4)
+        buffers["alpn"].append(self._code("alpn", alpn))
+        http = http or {}
+        buffers["http_method"].append(self._code("http_method", http.get("method")))
+        self._string("http_host", http.get("host"))
+        self._string("http_uri", http.get("uri"))
+        self._string("http_user_agent", http.get("user_agent"))
+        self._string("http_attack", json.dumps(http_attack) if http_attack else None)
+        self.rows += 1
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def _code(self, column: str, value) -> int:
+        categories = self._categories[column]
+        code = categories.get(value)
+        if code is None:
+            if len(categories) > _MAX_CATEGORIES:
+                raise ColumnarFormatError(f"Too many distinct values in category column {column!r}")
+            code = categories[value] = len(categories)
+        return code
+
+    def _string(self, column: str, value: Optional[str]) -> None:
+        if value:
+            encoded = value.encode("utf-8", "surrogateescape")
+            self._buffers[column + ".data"] += encoded
+            self._offsets[column] += len(encoded)
+        self._buffers[column + ".offsets"].append(self._offsets[column])
+
+    def flush(self) -> None:
+        """Append the buffered rows to the column files."""
+        for name, buffer in self._buffers.items():
+            if buffer:
+                self._files[name].append(buffer)
+                del buffer[:]
+        self._pending = 0
+
+    def close(self) -> None:
+        """Flush, patch the ``.npy`` headers with the final row count and write the manifest."""
+        if not self._files:
+            return
+        self.flush()
+        for npy in self._files.values():
+            npy.close()
+        columns = {}
+        for name, kind, descr in FLOW_COLUMNS:
+            column = {"kind": kind, "dtype": descr}
+            if kind == KIND_STRING:
+                column["offsets"] = f"{name}.offsets.npy"
+                column["data"] = f"{name}.data.npy"
+            else:
+                column["file"] = f"{name}.npy"
+            if kind == KIND_CATEGORY:
+                categories = self._categories[name]
+                column["categories"] = sorted(categories, key=categories.get)
+            columns[name] = column
+        manifest = {"format": FORMAT_NAME, "version": FORMAT_VERSION, "rows": self.rows, "columns": columns}
+        with open(os.path.join(self.path, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+        self._files = {}
+
+
+def _map_npy(path: str):
+    """Memory-map a ``.npy`` file without NumPy: returns (mmap, memoryview of the data, shape)."""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped[:6] != _NPY_MAGIC[:6]:
+        mapped.close()
+        raise ColumnarFormatError(f"{path} is not a .npy file")
+    header_size = struct.unpack_from("<H", mapped, 8)[0]
+    header = ast.literal_eval(mapped[10:10 + header_size].decode("latin-1"))
+    typecode = _TYPECODES.get(header["descr"])
+    if typecode is None or header["fortran_order"] or (_NEEDS_BYTESWAP and typecode != "B"):
+        mapped.close()
+        raise ColumnarFormatError(f"{path}: unsupported dtype {header['descr']!r}")
+    view = memoryview(mapped)[10 + header_size:]
+    shape = header["shape"]
+    count = 1
+    for dim in shape:
+        count *= dim
+    view = view[:count * struct.calcsize(typecode)].cast(typecode)
+    if len(shape) > 1 and count:
+        # memoryview cannot take a shape with a zero dimension; an empty column stays flat
+        view = view.cast("B", shape=list(shape))
+    return mapped, view, shape
+
+
+class ColumnarFlowReader:
+    """Loads selected columns of a columnar flow export, memory-mapped.
+
+    ``column(name)`` returns a read-only ``numpy.memmap``-backed array when
+    NumPy is installed (``use_numpy=False`` forces the fallback) and a
+    ``memoryview`` over an ``mmap`` otherwise; string columns return their
+    ``(offsets, data)`` pair. ``values(name)`` decodes any column to Python
+    objects (IP strings, category values, str or None).
+    """
+
+    def __init__(self, path: str, use_numpy: bool = True):
+        self.path = path
+        self.use_numpy = use_numpy and NUMPY_AVAILABLE
+        try:
+            with open(os.path.join(path, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ColumnarFormatError(f"Cannot read {MANIFEST} in {path}: {e}")
+        if self.manifest.get("format") != FORMAT_NAME or self.manifest.get("version") != FORMAT_VERSION:
+            raise ColumnarFormatError(f"{path} is not a {FORMAT_NAME} v{FORMAT_VERSION} export")
+        self.rows: int = self.manifest["rows"]
+        self._maps: List[mmap.mmap] = []
+        self._views: List[memoryview] = []
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.manifest["columns"])
+
+    def __enter__(self) -> "ColumnarFlowReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _schema(self, name: str) -> Dict:
+        try:
+            return self.manifest["columns"][name]
+        except KeyError:
+            raise KeyError(f"No column {name!r}; available: {self.columns}") from None
+
+    def _load(self, filename: str):
+        path = os.path.join(self.path, filename)
+        if self.use_numpy:
+            return np.load(path, mmap_mode="r")
+        mapped, view, _shape = _map_npy(path)
+        self._maps.append(mapped)
+        self._views.append(view)
+        return view
+
+    def column(self, name: str):
+        """The raw (memory-mapped) column; string columns return ``(offsets, data)``."""
+        schema = self._schema(name)
+        if schema["kind"] == KIND_STRING:
+            return self._load(schema["offsets"]), self._load(schema["data"])
+        return self._load(schema["file"])
+
+    def read(self, columns: Optional[Iterable[str]] = None) -> Dict:
+        """Raw columns by name (all of them by default)."""
+        return {name: self.column(name) for name in (columns or self.columns)}
+
+    def categories(self, name: str) -> List:
+        """Dictionary of a category column (index = code)."""
+        return self._schema(name)["categories"]
+
+    def values(self, name: str) -> List:
+        """Decode a column to a list of Python values."""
+        kind = self._schema(name)["kind"]
+        raw = self.column(name)
+        if kind == KIND_IP:
+            data = raw.tobytes()
+            return [_unpack_ip(data[i:i + 16]) for i in range(0, len(data), 16)]
+        if kind == KIND_CATEGORY:
+            categories = self.categories(name)
+            return [categories[code] for code in raw.tolist()]
+        if kind == KIND_STRING:
+            offsets, data = raw
+            offsets = offsets.tolist()
+            data = bytes(data)
+            return [data[start:end].decode("utf-8", "surrogateescape") or None
+                    for start, end in zip(offsets, offsets[1:])]
+        return raw.tolist()
+
+    def close(self) -> None:
+        """Release fallback memory maps (NumPy memmaps close when garbage collected)."""
+        for view in self._views:
+            view.release()
+        self._views = []
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                # A caller still holds a view into this column
+                pass
+        self._maps = []
+
+
+def export_flows_columnar(flows: Iterable, path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Write ``FlowStats`` objects or record dicts to a columnar export; returns the row count."""
+    with ColumnarFlowWriter(path, batch_size) as writer:
+        writer.write_many(flows)
+    return writer.rows
@@ -0,0 +1,162 @@
+"""Raw-bytes fast-path decoder for Ethernet/IPv4/IPv6/TCP/UDP/ICMP frames.
+
+Decodes the fields the flow table needs straight out of the frame buffer with
+``struct`` and ``memoryview`` instead of building Scapy layer objects. Anything
+the decoder does not understand (fragments, tunnels, exotic link types, ...)
+is reported as ``None`` so the caller can hand the frame to Scapy instead.
+"""
+import socket
+import struct
+from typing import Optional, Tuple
+
+# Link types (pcap LINKTYPE_* values)
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+# EtherTypes
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_8021Q = 0x8100
+ETH_P_8021AD = 0x88A8
+
+# IP protocol numbers
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+# IPv6 extension headers the decoder walks over (fragments go to Scapy)
+_IPV6_SKIPPABLE_EXT = {0, 43, 60}
+_IPV6_FRAGMENT = 44
+
+# TCP flag bits
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+
+# Returned for frames that decode cleanly but carry nothing the flow table tracks
+# (ARP, LLDP, GRE, ICMPv6, ...). Falsy, unlike a decoded tuple, and not None.
+SKIP = ()
+
+_unpack_u16 = struct.Struct("!H").unpack_from
+_unpack_ports = struct.Struct("!HH").unpack_from
+_unpack_tcp = struct.Struct("!HHIIBB").unpack_from
+_inet_ntop = socket.inet_ntop
+_AF_INET = socket.AF_INET
+_AF_INET6 = socket.AF_INET6
+
+# Decoded packet: (src_ip, dst_ip, src_port, dst_port, protocol, tcp_flags,
+#                  tcp_seq, payload_offset, payload_length)
+DecodedPacket = Tuple[str, str, int, int, str, int, int, int, int]
+
+
+def decode_frame(frame, linktype: int = LINKTYPE_ETHERNET) -> Optional[DecodedPacket]:
+    """Decode a raw link-layer frame.
+
+    Returns a ``DecodedPacket`` tuple, ``SKIP`` for frames that carry no
+    trackable flow, or ``None`` when the frame needs the Scapy fallback.
+    ``payload_offset``/``payload_length`` index into ``frame`` so callers can
+    slice the L4 payload out of a memoryview without copying.
+    """
+    try:
+        if linktype == LINKTYPE_ETHERNET:
+            ethertype = _unpack_u16(frame, 12)[0]
+            offset = 14
+            # Up to two VLAN tags (802.1Q / QinQ)
+            if ethertype == ETH_P_8021Q or ethertype == ETH_P_8021AD:
+                ethertype = _unpack_u16(frame, 16)[0]
+                offset = 18
+                if ethertype == ETH_P_8021Q:
+                    ethertype = _unpack_u16(frame, 20)[0]
+                    offset = 22
+        elif linktype == LINKTYPE_LINUX_SLL:
+            ethertype = _unpack_u16(frame, 14)[0]
+            offset = 16
+        elif linktype == LINKTYPE_RAW or linktype == LINKTYPE_IPV4 or linktype == LINKTYPE_IPV6:
+            version = frame[0] >> 4
+            ethertype = ETH_P_IP if version == 4 else ETH_P_IPV6 if version == 6 else 0
+            offset = 0
+        else:
+            return None
+
+        if ethertype == ETH_P_IP:
+            return _decode_ipv4(frame, offset)
+        if ethertype == ETH_P_IPV6:
+            return _decode_ipv6(frame, offset)
+        if ethertype == ETH_P_8021Q or ethertype == ETH_P_8021AD:
+            # Deeper VLAN stacks are rare; let Scapy handle them
+            return None
+        return SKIP
+    except (struct.error, IndexError, ValueError):
+        # Truncated or malformed header
+        return None
+
+
+def _decode_ipv4(frame, offset: int) -> Optional[DecodedPacket]:
+    """Decode an IPv4 header and its L4 header starting at ``offset``."""
+    ver_ihl = frame[offset]
+    if ver_ihl >> 4 != 4:
+        return None
+    ihl = (ver_ihl & 0x0F) * 4
+    total_length = _unpack_u16(frame, offset + 2)[0]
+    frag = _unpack_u16(frame, offset + 6)[0]
+    if frag & 0x3FFF:
+        # Fragmented datagram (MF set or non-zero offset)
+        return None
+    proto = frame[offset + 9]
+    src_ip = _inet_ntop(_AF_INET, frame[offset + 12:offset + 16])
+    dst_ip = _inet_ntop(_AF_INET, frame[offset + 16:offset + 20])
+    l4 = offset + ihl
+    # Bound the payload by the IP length so Ethernet padding is not counted
+    end = min(offset + total_length, len(frame)) if total_length else len(frame)
+
+    if proto == IPPROTO_TCP:
+        return _decode_tcp(frame, l4, end, src_ip, dst_ip)
+    if proto == IPPROTO_UDP:
+        return _decode_udp(frame, l4, end, src_ip, dst_ip)
+    if proto == IPPROTO_ICMP:
+        payload_offset = l4 + 8
+        return (src_ip, dst_ip, 0, 0, "ICMP", 0, 0, payload_offset, max(0, end - payload_offset))
+    return SKIP
+
+
+def _decode_ipv6(frame, offset: int) -> Optional[DecodedPacket]:
+    """Decode an IPv6 header (walking simple extension headers) and its L4 header."""
+    if frame[offset] >> 4 != 6:
+        return None
+    payload_length = _unpack_u16(frame, offset + 4)[0]
+    next_header = frame[offset + 6]
+    src_ip = _inet_ntop(_AF_INET6, frame[offset + 8:offset + 24])
+    dst_ip = _inet_ntop(_AF_INET6, frame[offset + 24:offset + 40])
+    l4 = offset + 40
+    end = min(l4 + payload_length, len(frame)) if payload_length else len(frame)
+
+    while next_header in _IPV6_SKIPPABLE_EXT:
+        next_header, ext_len = frame[l4], frame[l4 + 1]
+        l4 += (ext_len + 1) * 8
+    if next_header == _IPV6_FRAGMENT:
+        return None
+
+    if next_header == IPPROTO_TCP:
+        return _decode_tcp(frame, l4, end, src_ip, dst_ip)
+    if next_header == IPPROTO_UDP:
+        return _decode_udp(frame, l4, end, src_ip, dst_ip)
+    return SKIP
+
+
+def _decode_tcp(frame, l4: int, end: int, src_ip: str, dst_ip: str) -> DecodedPacket:
+    src_port, dst_port, seq, _ack, data_offset, flags = _unpack_tcp(frame, l4)
+    payload_offset = l4 + (data_offset >> 4) * 4
+    return (src_ip, dst_ip, src_port, dst_port, "TCP", flags, seq,
+            payload_offset, max(0, end - payload_offset))
+
+
+def _decode_udp(frame, l4: int, end: int, src_ip: str, dst_ip: str) -> DecodedPacket:
+    src_port, dst_port = _unpack_ports(frame, l4)
+    payload_offset = l4 + 8
+    return (src_ip, dst_ip, src_port, dst_port, "UDP", 0, 0,
+            payload_offset, max(0, end - payload_offset))
@@ -0,0 +1,134 @@
+"""Flow update emission policies.
+
+``PacketCapture`` used to hand a fresh ``to_dict()`` to its callback on every
+packet. ``FlowEmitter`` decides instead *when* a flow is worth reporting -
+when it starts, when it ends or expires, and/or as periodic interim updates
+for flows that changed - and optionally delivers those records in batches,
+so downstream classification scales with flows rather than packets.
+
+Every emitted record carries an ``event`` field: ``start``, ``update`` or ``end``.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EVENT_START = "start"
+EVENT_UPDATE = "update"
+EVENT_END = "end"
+
+
+@dataclass
+class EmitPolicy:
+    """When flow records are emitted and how they are delivered."""
+    on_start: bool = True
+    on_end: bool = True
+    # Seconds between interim updates for flows that changed (None = never)
+    interim_interval: Optional[float] = 5.0
+    # Legacy behaviour: one record per packet (overrides the settings above)
+    per_packet: bool = False
+    # Deliver records in lists of up to batch_size, at least every batch_interval seconds
+    batch_size: int = 1
+    batch_interval: float = 1.0
+
+    @classmethod
+    def legacy(cls) -> "EmitPolicy":
+        """One record per packet, delivered individually (the original behaviour)."""
+        return cls(on_start=False, on_end=False, interim_interval=None, per_packet=True)
+
+
+class FlowEmitter:
+    """Applies an ``EmitPolicy`` to flow events and delivers the resulting records.
+
+    Records go to ``batch_callback(list)`` when one is set, otherwise to
+    ``callback(record)`` one by one. Times are packet timestamps.
+    """
+
+    def __init__(self, policy: Optional[EmitPolicy] = None,
+                 callback: Optional[Callable[[Dict], None]] = None,
+                 batch_callback: Optional[Callable[[List[Dict]], None]] = None):
+        self.policy = policy or EmitPolicy()
+        self.callback = callback
+        self.batch_callback = batch_callback
+        self.dirty: Dict = {}
+        self.pending: List[Dict] = []
+        self._next_interim: Optional[float] = None
+        self._next_batch: Optional[float] = None
+
+        # Counters
+        self.records_emitted = 0
+        self.batches_delivered = 0
+
+    def flow_updated(self, key, flow, created: bool, now: float) -> None:
+        """Record that ``flow`` saw a packet at ``now`` (``created`` for its first packet)."""
+        policy = self.policy
+        if policy.per_packet:
+            self._emit(flow.to_dict(), EVENT_START if created else EVENT_UPDATE, now)
+        elif created and policy.on_start:
+            self._emit(flow.to_dict(), EVENT_START, now)
+        elif policy.interim_interval:
+            self.dirty[key] = flow
+
+        if self._next_interim is None or now >= self._next_interim or (
+                self._next_batch is not None and now >= self._next_batch):
+            self.tick(now)
+
+    def flow_ended(self, key, record: Dict, now: Optional[float] = None) -> None:
+        """Emit the final record of a flow that expired, was evicted or was flushed."""
+        self.dirty.pop(key, None)
+        if self.policy.on_end:
+            self._emit(record, EVENT_END, now)
+
+    def tick(self, now: float) -> None:
+        """Emit due interim updates and deliver a due batch."""
+        interval = self.policy.interim_interval
+        if self._next_interim is None:
+            self._next_interim = now + interval if interval else float("inf")
+        elif now >= self._next_interim:
+            dirty, self.dirty = self.dirty, {}
+            for flow in dirty.values():
+                self._emit(flow.to_dict(), EVENT_UPDATE, now)
+            self._next_interim = now + interval
+
+        if self.pending and self._next_batch is not None and now >= self._next_batch:
+            self._deliver()
+
+    def flush(self) -> None:
+        """Deliver everything still pending (end of capture)."""
+        if self.pending:
+            self._deliver()
+
+    def _emit(self, record: Dict, event: str, now: Optional[float]) -> None:
+        record["event"] = event
+        self.records_emitted += 1
+        if not self.batch_callback:
+            if self.callback:
+                try:
+                    self.callback(record)
+                except Exception as e:
+                    logger.error(f"Flow callback error: {e}")
+            return
+        if not self.pending and now is not None:
+            self._next_batch = now + self.policy.batch_interval
+        self.pending.append(record)
+        if len(self.pending) >= self.policy.batch_size:
+            self._deliver()
+
+    def _deliver(self) -> None:
+        batch, self.pending = self.pending, []
+        self._next_batch = None
+        self.batches_delivered += 1
+        try:
+            self.batch_callback(batch)
+        except Exception as e:
+            logger.error(f"Flow batch callback error: {e}")
+
+    def get_stats(self) -> Dict:
+        """Return emission counters."""
+        return {
+            "records_emitted": self.records_emitted,
+            "batches_delivered": self.batches_delivered,
+            "dirty_flows": len(self.dirty),
+            "pending_records": len(self.pending),
+        }
@@ -0,0 +1,111 @@
+"""Compact flow key and flow record types.
+
+A flow key is a plain tuple ``(protocol, ip_a, port_a, ip_b, port_b)`` whose
+endpoints are sorted, so both directions of a conversation map to the same
+key. ``FlowStats`` remembers which side initiated the flow and keeps the
+per-direction byte counters in ``__slots__`` instead of an instance dict.
+"""
+import time
+from typing import Dict, Optional, Tuple
+
+# (protocol, ip_a, port_a, ip_b, port_b) with (ip_a, port_a) <= (ip_b, port_b)
+FlowKey = Tuple[str, str, int, str, int]
+
+
+def canonical_flow_key(src_ip: str, dst_ip: str, src_port: int, dst_port: int,
+                       protocol: str) -> Tuple[FlowKey, bool]:
+    """Return ``(key, reversed)`` where ``reversed`` is True if src is the key's b-side."""
+    if src_ip < dst_ip or (src_ip == dst_ip and src_port <= dst_port):
+        return (protocol, src_ip, src_port, dst_ip, dst_port), False
+    return (protocol, dst_ip, dst_port, src_ip, src_port), True
+
+
+def flow_key_from_dict(flow: Dict) -> FlowKey:
+    """Rebuild the canonical key of a flow record produced by ``FlowStats.to_dict``."""
+    return canonical_flow_key(flow["src_ip"], flow["dst_ip"], flow["src_port"],
+                              flow["dst_port"], flow["protocol"])[0]
+
+
+class FlowStats:
+    """Aggregates statistics for a bidirectional flow.
+
+    ``reverse`` is True when the initiator is the key's b-side; ``bytes_sent``
+    counts initiator→responder payload and ``bytes_received`` the reverse.
+    """
+    __slots__ = (
+        "key", "reverse", "start_time", "last_seen", "packets",
+        "bytes_sent", "bytes_received", "tls_version", "sni", "ja3", "ja4", "alpn", "app_type",
+        "app_probes", "tls_packets", "http", "http_attack", "sample_rate",
+    )
+
+    def __init__(self, key: FlowKey, reverse: bool = False, timestamp: Optional[float] = None):
+        self.key = key
+        self.reverse = reverse
+        self.start_time = timestamp if timestamp is not None else time.time()
+        self.last_seen = self.start_time
+        self.packets = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.tls_version = None
+        self.sni = None
+        self.ja3 = None
+        self.ja4 = None
+        # First ALPN protocol offered in the ClientHello
+        self.alpn = None
+        self.app_type = "unknown"
+        # Payload packets left to inspect for app identification (0 = decided)
+        self.app_probes = 0
+        # Packets left for TLS handshake inspection (0 = done or not inspected)
+        self.tls_packets = 0
+        # First HTTP request head (method, uri, host, user_agent), once reassembled
+        self.http = None
+        # Strongest payload signature match over the flow's HTTP requests (attack_type, confidence, reasons)
+        self.http_attack = None
+        # 1 = every packet counted; N = sampled 1-in-N (counters scaled in packet mode)
+        self.sample_rate = 1
+
+    @property
+    def src_ip(self) -> str:
+        return self.key[3] if self.reverse else self.key[1]
+
+    @property
+    def dst_ip(self) -> str:
+        return self.key[1] if self.reverse else self.key[3]
+
+    @property
+    def src_port(self) -> int:
+        return self.key[4] if self.reverse else self.key[2]
+
+    @property
+    def dst_port(self) -> int:
+        return self.key[2] if self.reverse else self.key[4]
+
+    @property
+    def protocol(self) -> str:
+        return self.key[0]
+
+    def to_dict(self) -> Dict:
+        protocol, ip_a, port_a, ip_b, port_b = self.key
+        if self.reverse:
+            ip_a, port_a, ip_b, port_b = ip_b, port_b, ip_a, port_a
+        return {
+            "src_ip": ip_a,
+            "dst_ip": ip_b,
+            "src_port": port_a,
+            "dst_port": port_b,
+            "protocol": protocol,
+            "packets": self.packets,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "duration": self.last_seen - self.start_time,
+            "tls_version": self.tls_version,
+            "sni": self.sni,
+            "ja3": self.ja3,
+            "ja4": self.ja4,
+            "alpn": self.alpn,
+            "app_type": self.app_type,
+            "http": self.http,
+            "http_attack": self.http_attack,
+            "sample_rate": self.sample_rate,
+            "timestamp": self.start_time
+        }
@@ -0,0 +1,219 @@
+"""Bounded flow table with NetFlow-style idle/active timeouts.
+
+Expiry is driven by a hashed timing wheel: every flow sits in exactly one
+slot, keyed by its next possible expiry time. When a slot comes due the
+flow's real deadline is re-checked against ``last_seen``/``start_time``;
+flows that are still alive are simply re-slotted. Inserting, touching and
+expiring a flow are therefore O(1) amortized, with no full-table scans.
+"""
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# NetFlow defaults: 15 s inactive timeout, 30 min active timeout
+DEFAULT_IDLE_TIMEOUT = 15.0
+DEFAULT_ACTIVE_TIMEOUT = 1800.0
+DEFAULT_MAX_FLOWS = 1_000_000
+
+# Eviction policies applied when the table is full
+EVICT_LRU = "lru"            # evict the least recently seen flow
+EVICT_OLDEST = "oldest"      # evict the flow that started first
+EVICT_DROP_NEW = "drop_new"  # keep existing flows, do not track the new one
+EVICTION_POLICIES = (EVICT_LRU, EVICT_OLDEST, EVICT_DROP_NEW)
+
+# End reasons attached to final flow records
+END_IDLE = "idle_timeout"
+END_ACTIVE = "active_timeout"
+END_EVICTED = "evicted"
+END_FLUSH = "flush"
+
+
+class TimerWheel:
+    """Hashed timing wheel with ``tick``-second resolution.
+
+    Entries whose deadline lies beyond one revolution stay in their slot
+    and are skipped until the wheel comes round to the right lap.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self.tick = tick
+        self.slots: List[list] = [[] for _ in range(slots)]
+        self.current_tick: Optional[int] = None
+
+    def schedule(self, deadline: float, entry) -> None:
+        """Place ``entry`` in the slot for ``deadline``."""
+        deadline_tick = int(deadline // self.tick)
+        if self.current_tick is not None and deadline_tick <= self.current_tick:
+            deadline_tick = self.current_tick + 1
+        self.slots[deadline_tick % len(self.slots)].append((deadline_tick, entry))
+
+    def advance(self, now: float) -> List:
+        """Move the wheel to ``now`` and return every entry that came due."""
+        now_tick = int(now // self.tick)
+        if self.current_tick is None:
+            self.current_tick = now_tick
+            return []
+        if now_tick <= self.current_tick:
+            return []
+
+        due = []
+        num_slots = len(self.slots)
+        # A jump of more than one revolution visits every slot once
+        steps = min(now_tick - self.current_tick, num_slots)
+        for step in range(1, steps + 1):
+            index = (self.current_tick + step) % num_slots
+            bucket = self.slots[index]
+            if not bucket:
+                continue
+            keep = []
+            for deadline_tick, entry in bucket:
+                if deadline_tick <= now_tick:
+                    due.append(entry)
+                else:
+                    keep.append((deadline_tick, entry))
+            self.slots[index] = keep
+        self.current_tick = now_tick
+        return due
+
+    def clear(self) -> None:
+        """Drop every scheduled entry."""
+        self.slots = [[] for _ in range(len(self.slots))]
+
+
+class FlowTable:
+    """Flow table (dict-like) with idle/active timeouts, a size cap and a final-record sink.
+
+    ``sink(record)`` receives the final ``to_dict()`` of every flow that leaves
+    the table, with an ``end_reason`` field added.
+    """
+
+    def __init__(self, idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 active_timeout: float = DEFAULT_ACTIVE_TIMEOUT,
+                 max_flows: int = DEFAULT_MAX_FLOWS,
+                 eviction_policy: str = EVICT_LRU,
+                 sink: Optional[Callable[[Dict], None]] = None,
+                 tick: float = 1.0):
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {eviction_policy!r}; expected one of {EVICTION_POLICIES}")
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.max_flows = max_flows
+        self.eviction_policy = eviction_policy
+        self.sink = sink
+        self.wheel = TimerWheel(tick=tick)
+        self._flows: "OrderedDict" = OrderedDict()
+        self._next_check = float("-inf")
+
+        # Counters
+        self.expired_idle = 0
+        self.expired_active = 0
+        self.evicted = 0
+        self.dropped_new = 0
+
+    # Dict-style read access
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    def __contains__(self, key) -> bool:
+        return key in self._flows
+
+    def __getitem__(self, key):
+        return self._flows[key]
+
+    def __iter__(self) -> Iterator:
+        return iter(self._flows)
+
+    def get(self, key, default=None):
+        return self._flows.get(key, default)
+
+    def keys(self):
+        return self._flows.keys()
+
+    def values(self):
+        return self._flows.values()
+
+    def items(self):
+        return self._flows.items()
+
+    def _deadline(self, flow) -> float:
+        return min(flow.last_seen + self.idle_timeout, flow.start_time + self.active_timeout)
+
+    def lookup(self, key):
+        """Return the flow for ``key`` (refreshing its LRU position) or None."""
+        flow = self._flows.get(key)
+        if flow is not None and self.eviction_policy == EVICT_LRU:
+            self._flows.move_to_end(key)
+        return flow
+
+    def insert(self, key, flow) -> bool:
+        """Track a new flow; returns False if the table is full and the policy drops it."""
+        if len(self._flows) >= self.max_flows:
+            if self.eviction_policy == EVICT_DROP_NEW:
+                self.dropped_new += 1
+                return False
+            # LRU order and insertion order both keep the victim at the front
+            victim_key, victim = self._flows.popitem(last=False)
+            self.evicted += 1
+            self._emit(victim, END_EVICTED)
+        self._flows[key] = flow
+        self.wheel.schedule(self._deadline(flow), (key, flow))
+        return True
+
+    def expire(self, now: float) -> int:
+        """Expire flows whose idle or active timeout has passed; returns how many."""
+        if now < self._next_check:
+            return 0
+        self._next_check = (int(now // self.wheel.tick) + 1) * self.wheel.tick
+
+        expired = 0
+        for key, flow in self.wheel.advance(now):
+            if self._flows.get(key) is not flow:
+                # Already evicted, or replaced by a newer flow with the same key
+                continue
+            if now >= flow.last_seen + self.idle_timeout:
+                reason = END_IDLE
+                self.expired_idle += 1
+            elif now >= flow.start_time + self.active_timeout:
+                reason = END_ACTIVE
+                self.expired_active += 1
+            else:
+                # Seen since it was slotted: re-slot at its new deadline
+                self.wheel.schedule(self._deadline(flow), (key, flow))
+                continue
+            del self._flows[key]
+            self._emit(flow, reason)
+            expired += 1
+        return expired
+
+    def flush(self) -> int:
+        """Emit and remove every flow (e.g. at the end of a replay)."""
+        count = len(self._flows)
+        while self._flows:
+            _key, flow = self._flows.popitem(last=False)
+            self._emit(flow, END_FLUSH)
+        self.wheel.clear()
+        return count
+
+    def _emit(self, flow, reason: str) -> None:
+        if not self.sink:
+            return
+        record = flow.to_dict()
+        record["end_reason"] = reason
+        try:
+            self.sink(record)
+        except Exception as e:
+            logger.error(f"Flow sink error: {e}")
+
+    def get_stats(self) -> Dict:
+        """Return table size and expiry/eviction counters."""
+        return {
+            "flows": len(self._flows),
+            "max_flows": self.max_flows,
+            "eviction_policy": self.eviction_policy,
+            "expired_idle": self.expired_idle,
+            "expired_active": self.expired_active,
+            "evicted": self.evicted,
+            "dropped_new": self.dropped_new,
+        }
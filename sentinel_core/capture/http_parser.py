@@ -0,0 +1,659 @@
+"""Incremental HTTP/1.x and HTTP/2 request parsing for payload inspection.
+
+Client->server streams (plain TCP or decrypted TLS) are fed as their bytes
+arrive. ``HTTPStreamParser`` picks HTTP/2 when a stream starts with the
+client connection preface and HTTP/1.x otherwise. Every complete request
+is handed to ``on_request`` as an ``HTTPRequest`` that holds only what
+payload signatures inspect: method, URI, the ``INSPECTED_HEADERS`` and the
+first ``max_body`` bytes of the body, all as bytes; ``inspection_text``
+decodes just those fields.
+
+Buffering is bounded per stream: a request head or HTTP/2 header block
+longer than ``max_head`` ends parsing of that stream, body bytes past
+``max_body`` are counted but not kept, and at most ``max_streams`` HTTP/2
+streams are open at once. HTTP/2 header blocks are decoded with
+``HPACKDecoder`` (RFC 7541); every block is decoded, also for streams that
+are not tracked, to keep the dynamic table in step with the encoder.
+"""
+import bisect
+import logging
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote_to_bytes
+
+logger = logging.getLogger(__name__)
+
+# Request head / HTTP/2 header block bytes buffered per stream
+DEFAULT_MAX_HEAD = 16 * 1024
+# Body bytes kept per request for inspection
+DEFAULT_MAX_BODY = 4096
+# HTTP/2 streams tracked at once per connection (oldest handed on first)
+DEFAULT_MAX_STREAMS = 128
+
+HTTP2_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+
+# Headers kept besides the request line (lower-case names)
+INSPECTED_HEADERS = frozenset((b"host", b"user-agent", b"referer", b"cookie"))
+
+
+class HTTPParseError(ValueError):
+    """Raised for bytes that do not follow HTTP/1.x, HTTP/2 or HPACK framing."""
+
+
+class HTTPRequest:
+    """One request: method, URI, inspected headers and a body prefix, all bytes."""
+    __slots__ = ("version", "method", "uri", "headers", "body", "body_length", "stream_id")
+
+    def __init__(self, version: str, method: bytes = b"", uri: bytes = b"", stream_id: int = 0):
+        self.version = version
+        self.method = method
+        self.uri = uri
+        # Lower-case name -> value, INSPECTED_HEADERS only
+        self.headers: Dict[bytes, bytes] = {}
+        self.body = bytearray()
+        self.body_length = 0
+        self.stream_id = stream_id
+
+    def keep_header(self, name: bytes, value: bytes):
+        """Keep an inspected header (``name`` lower-case); repeated cookies are joined."""
+        if name not in INSPECTED_HEADERS:
+            return
+        previous = self.headers.get(name)
+        if previous is None:
+            self.headers[name] = value
+        elif name == b"cookie":
+            self.headers[name] = previous + b"; " + value
+
+    def header(self, name: bytes) -> Optional[str]:
+        value = self.headers.get(name)
+        return value.decode("latin-1") if value is not None else None
+
+    def to_dict(self) -> Dict:
+        """Method, URI, Host and User-Agent: the ``http`` field of flow records."""
+        return {"method": self.method.decode("ascii", "replace"), "uri": self.uri.decode("latin-1"),
+                "host": self.header(b"host"), "user_agent": self.header(b"user-agent")}
+
+    def inspection_text(self) -> str:
+        """The fields payload signatures look at (URI, inspected headers, body prefix), one per line.
+
+        A percent-encoded URI is given decoded as well, since signatures are written for plain text.
+        """
+        parts = [self.uri]
+        if b"%" in self.uri or b"+" in self.uri:
+            parts.append(unquote_to_bytes(self.uri.replace(b"+", b" ")))
+        parts.extend(self.headers.values())
+        if self.body:
+            parts.append(bytes(self.body))
+        return b"\n".join(parts).decode("latin-1")
+
+
+RequestCallback = Callable[[HTTPRequest], None]
+
+
+# HTTP/1.x parser states
+_HEAD, _BODY, _CHUNK_SIZE, _CHUNK_DATA, _CHUNK_END, _TRAILERS, _DONE = range(7)
+
+
+class HTTP1Parser:
+    """Incremental HTTP/1.x request parser: pipelining, Content-Length and chunked bodies."""
+
+    def __init__(self, on_request: RequestCallback, max_head: int = DEFAULT_MAX_HEAD,
+                 max_body: int = DEFAULT_MAX_BODY):
+        self.on_request = on_request
+        self.max_head = max_head
+        self.max_body = max_body
+        self.state = _HEAD
+        # Start of a head / chunk line that continues in the next feed
+        self.partial = b""
+        self.request: Optional[HTTPRequest] = None
+        self.remaining = 0
+        self.requests = 0
+        self.error: Optional[str] = None
+
+    def feed(self, data) -> bool:
+        """Parse the next stream bytes; False once the stream cannot be followed any further."""
+        if self.state == _DONE:
+            return False
+        data = self.partial + bytes(data) if self.partial else bytes(data)
+        self.partial = b""
+        pos = 0
+        size = len(data)
+        while pos < size and self.state != _DONE:
+            state = self.state
+            if state == _BODY or state == _CHUNK_DATA:
+                take = min(self.remaining, size - pos)
+                self._body(data, pos, take)
+                pos += take
+                self.remaining -= take
+                if not self.remaining:
+                    if state == _BODY:
+                        self._finish()
+                    else:
+                        self.state = _CHUNK_END
+                continue
+            if state == _HEAD:
+                # Tolerate empty lines between pipelined requests
+                while data.startswith(b"\r\n", pos):
+                    pos += 2
+                end = data.find(b"\r\n\r\n", pos)
+                if end < 0:
+                    return self._wait(data, pos)
+                if not self._head(data[pos:end]):
+                    return False
+                pos = end + 4
+                continue
+            end = data.find(b"\r\n", pos)
+            if end < 0:
+                return self._wait(data, pos)
+            line = data[pos:end]
+            pos = end + 2
+            if state == _CHUNK_SIZE:
+                try:
+                    self.remaining = int(line.split(b";", 1)[0].strip(), 16)
+                except ValueError:
+                    return self._fail("bad chunk size")
+                self.state = _CHUNK_DATA if self.remaining else _TRAILERS
+            elif state == _CHUNK_END:
+                self.state = _CHUNK_SIZE
+            elif not line:
+                # Empty line after the last chunk (and any trailers)
+                self._finish()
+        return self.state != _DONE
+
+    def _wait(self, data: bytes, pos: int) -> bool:
+        if len(data) - pos > self.max_head:
+            return self._fail("request head too long")
+        self.partial = data[pos:]
+        return True
+
+    def _fail(self, reason: str) -> bool:
+        self.error = reason
+        self.state = _DONE
+        self.request = None
+        return False
+
+    def _head(self, head: bytes) -> bool:
+        lines = head.split(b"\r\n")
+        parts = lines[0].split(b" ")
+        if len(parts) != 3 or not parts[2].startswith(b"HTTP/1.") or not parts[0].replace(b"-", b"").isalpha():
+            return self._fail("not an HTTP/1.x request line")
+        request = self.request = HTTPRequest(parts[2].decode("latin-1"), parts[0], parts[1])
+        length = 0
+        chunked = upgrade = False
+        for line in lines[1:]:
+            name, _, value = line.partition(b":")
+            name = name.strip().lower()
+            value = value.strip()
+            if name == b"content-length":
+                try:
+                    length = int(value)
+                except ValueError:
+                    return self._fail("bad Content-Length")
+            elif name == b"transfer-encoding":
+                chunked = b"chunked" in value.lower()
+            elif name == b"upgrade":
+                upgrade = True
+            else:
+                request.keep_header(name, value)
+        if chunked:
+            self.state = _CHUNK_SIZE
+        elif length > 0:
+            self.state = _BODY
+            self.remaining = length
+        else:
+            self._finish()
+        if upgrade or request.method == b"CONNECT":
+            # What follows is a tunnel or another protocol, not more requests
+            if self.state == _HEAD:
+                self.state = _DONE
+        return True
+
+    def _body(self, data: bytes, pos: int, length: int):
+        request = self.request
+        request.body_length += length
+        room = self.max_body - len(request.body)
+        if room > 0:
+            request.body += data[pos:pos + min(room, length)]
+
+    def _finish(self):
+        request = self.request
+        self.request = None
+        self.state = _HEAD
+        self.requests += 1
+        self.on_request(request)
+
+
+# RFC 7541 appendix A
+HPACK_STATIC_TABLE: Tuple[Tuple[bytes, bytes], ...] = (
+    (b":authority", b""), (b":method", b"GET"), (b":method", b"POST"), (b":path", b"/"),
+    (b":path", b"/index.html"), (b":scheme", b"http"), (b":scheme", b"https"), (b":status", b"200"),
+    (b":status", b"204"), (b":status", b"206"), (b":status", b"304"), (b":status", b"400"),
+    (b":status", b"404"), (b":status", b"500"), (b"accept-charset", b""),
+    (b"accept-encoding", b"gzip, deflate"), (b"accept-language", b""), (b"accept-ranges", b""),
+    (b"accept", b""), (b"access-control-allow-origin", b""), (b"age", b""), (b"allow", b""),
+    (b"authorization", b""), (b"cache-control", b""), (b"content-disposition", b""),
+    (b"content-encoding", b""), (b"content-language", b""), (b"content-length", b""),
+    (b"content-location", b""), (b"content-range", b""), (b"content-type", b""), (b"cookie", b""),
+    (b"date", b""), (b"etag", b""), (b"expect", b""), (b"expires", b""), (b"from", b""), (b"host", b""),
+    (b"if-match", b""), (b"if-modified-since", b""), (b"if-none-match", b""), (b"if-range", b""),
+    (b"if-unmodified-since", b""), (b"last-modified", b""), (b"link", b""), (b"location", b""),
+    (b"max-forwards", b""), (b"proxy-authenticate", b""), (b"proxy-authorization", b""), (b"range", b""),
+    (b"referer", b""), (b"refresh", b""), (b"retry-after", b""), (b"server", b""), (b"set-cookie", b""),
+    (b"strict-transport-security", b""), (b"transfer-encoding", b""), (b"user-agent", b""), (b"vary", b""),
+    (b"via", b""), (b"www-authenticate", b""),
+)
+
+# RFC 7541 appendix B: Huffman code length of symbols 0-255 and EOS (256). The code is
+# canonical (codes assigned in order of length, then symbol), so the lengths define it.
+_HUFFMAN_LENGTHS = (
+    13, 23, 28, 28, 28, 28, 28, 28, 28, 24, 30, 28, 28, 30, 28, 28,
+    28, 28, 28, 28, 28, 28, 30, 28, 28, 28, 28, 28, 28, 28, 28, 28,
+    6, 10, 10, 12, 13, 6, 8, 11, 10, 10, 8, 11, 8, 6, 6, 6,
+    5, 5, 5, 6, 6, 6, 6, 6, 6, 6, 7, 8, 15, 6, 12, 10,
+    13, 6, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7,
+    7, 7, 7, 7, 7, 7, 7, 7, 8, 7, 8, 13, 19, 13, 14, 6,
+    15, 5, 6, 5, 6, 5, 6, 6, 6, 5, 7, 7, 6, 6, 6, 5,
+    6, 7, 6, 5, 5, 6, 7, 7, 7, 7, 7, 15, 11, 14, 13, 28,
+    20, 22, 20, 20, 22, 22, 22, 23, 22, 23, 23, 23, 23, 23, 24, 23,
+    24, 24, 22, 23, 24, 23, 23, 23, 23, 21, 22, 23, 22, 23, 23, 24,
+    22, 21, 20, 22, 22, 23, 23, 21, 23, 22, 22, 24, 21, 22, 23, 23,
+    21, 21, 22, 21, 23, 22, 23, 23, 20, 22, 22, 22, 23, 22, 22, 23,
+    26, 26, 20, 19, 22, 23, 22, 25, 26, 26, 26, 27, 27, 26, 24, 25,
+    19, 21, 26, 27, 27, 26, 27, 24, 21, 21, 26, 26, 28, 27, 27, 27,
+    20, 24, 20, 21, 22, 21, 21, 23, 22, 22, 25, 25, 24, 24, 26, 23,
+    26, 27, 26, 26, 27, 27, 27, 27, 27, 28, 27, 27, 27, 27, 27, 26,
+    30,
+)
+_HUFFMAN_EOS = 256
+_HUFFMAN_BITS = 30
+_HUFFMAN_MASK = (1 << _HUFFMAN_BITS) - 1
+
+
+def _build_huffman_decoder():
+    """Canonical codes left-aligned to 30 bits (ascending) with their symbols and lengths."""
+    symbols = sorted(range(len(_HUFFMAN_LENGTHS)), key=lambda s: (_HUFFMAN_LENGTHS[s], s))
+    starts, lengths = [], []
+    code = 0
+    previous = _HUFFMAN_LENGTHS[symbols[0]]
+    for symbol in symbols:
+        length = _HUFFMAN_LENGTHS[symbol]
+        code <<= length - previous
+        previous = length
+        starts.append(code << (_HUFFMAN_BITS - length))
+        lengths.append(length)
+        code += 1
+    return starts, symbols, lengths
+
+
+_HUFFMAN_STARTS, _HUFFMAN_SYMBOLS, _HUFFMAN_CODE_LENGTHS = _build_huffman_decoder()
+
+
+def huffman_decode(data: bytes) -> bytes:
+    """Decode an HPACK Huffman-coded string (padding: at most 7 one-bits)."""
+    out = bytearray()
+    starts, symbols, lengths = _HUFFMAN_STARTS, _HUFFMAN_SYMBOLS, _HUFFMAN_CODE_LENGTHS
+    acc = 0
+    bits = 0
+    pos = 0
+    size = len(data)
+    while True:
+        while bits < _HUFFMAN_BITS and pos < size:
+            acc = (acc << 8) | data[pos]
+            pos += 1
+            bits += 8
+        if not bits:
+            break
+        if bits >= _HUFFMAN_BITS:
+            peek = (acc >> (bits - _HUFFMAN_BITS)) & _HUFFMAN_MASK
+        else:
+            # Past the end: pad with ones, like the EOS prefix
+            pad = _HUFFMAN_BITS - bits
+            peek = ((acc << pad) | ((1 << pad) - 1)) & _HUFFMAN_MASK
+        index = bisect.bisect_right(starts, peek) - 1
+        length = lengths[index]
+        if length > bits:
+            if bits > 7 or acc & ((1 << bits) - 1) != (1 << bits) - 1:
+                raise HTTPParseError("bad Huffman padding")
+            break
+        if symbols[index] == _HUFFMAN_EOS:
+            raise HTTPParseError("EOS in Huffman string")
+        out.append(symbols[index])
+        bits -= length
+        acc &= (1 << bits) - 1
+    return bytes(out)
+
+
+# HPACK dynamic table size accepted from the encoder (the peer's SETTINGS are not seen)
+MAX_HPACK_TABLE_SIZE = 64 * 1024
+DEFAULT_HPACK_TABLE_SIZE = 4096
+_HPACK_ENTRY_OVERHEAD = 32
+
+
+def _hpack_integer(data: bytes, pos: int, prefix: int) -> Tuple[int, int]:
+    """HPACK integer with a ``prefix``-bit prefix at ``pos``; returns (value, next position)."""
+    mask = (1 << prefix) - 1
+    value = data[pos] & mask
+    pos += 1
+    if value < mask:
+        return value, pos
+    shift = 0
+    while True:
+        if pos >= len(data) or shift > 28:
+            raise HTTPParseError("bad HPACK integer")
+        byte = data[pos]
+        pos += 1
+        value += (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+class HPACKDecoder:
+    """HPACK header block decoder with its dynamic table (one per connection direction)."""
+
+    def __init__(self, max_table_size: int = DEFAULT_HPACK_TABLE_SIZE):
+        # Newest entry first (index 62)
+        self.table = deque()
+        self.table_size = 0
+        self.max_table_size = max_table_size
+
+    def decode(self, block: bytes) -> List[Tuple[bytes, bytes]]:
+        """Decode a complete header block into (name, value) pairs."""
+        headers = []
+        pos = 0
+        size = len(block)
+        try:
+            while pos < size:
+                first = block[pos]
+                if first & 0x80:
+                    index, pos = _hpack_integer(block, pos, 7)
+                    headers.append(self._entry(index))
+                elif first & 0x40:
+                    name, value, pos = self._literal(block, pos, 6)
+                    self._add(name, value)
+                    headers.append((name, value))
+                elif first & 0x20:
+                    max_size, pos = _hpack_integer(block, pos, 5)
+                    if max_size > MAX_HPACK_TABLE_SIZE:
+                        raise HTTPParseError(f"HPACK table size {max_size} too large")
+                    self.max_table_size = max_size
+                    self._evict()
+                else:
+                    # Literal without indexing / never indexed
+                    name, value, pos = self._literal(block, pos, 4)
+                    headers.append((name, value))
+        except IndexError:
+            raise HTTPParseError("truncated HPACK block")
+        return headers
+
+    def _entry(self, index: int) -> Tuple[bytes, bytes]:
+        if 0 < index <= len(HPACK_STATIC_TABLE):
+            return HPACK_STATIC_TABLE[index - 1]
+        index -= len(HPACK_STATIC_TABLE) + 1
+        if index < 0 or index >= len(self.table):
+            raise HTTPParseError("HPACK index out of range")
+        return self.table[index]
+
+    def _string(self, block: bytes, pos: int) -> Tuple[bytes, int]:
+        huffman = block[pos] & 0x80
+        length, pos = _hpack_integer(block, pos, 7)
+        end = pos + length
+        if end > len(block):
+            raise HTTPParseError("HPACK string past end of block")
+        value = block[pos:end]
+        return (huffman_decode(value) if huffman else value), end
+
+    def _literal(self, block: bytes, pos: int, prefix: int) -> Tuple[bytes, bytes, int]:
+        index, pos = _hpack_integer(block, pos, prefix)
+        if index:
+            name = self._entry(index)[0]
+        else:
+            name, pos = self._string(block, pos)
+        value, pos = self._string(block, pos)
+        return name, value, pos
+
+    def _add(self, name: bytes, value: bytes):
+        self.table.appendleft((name, value))
+        self.table_size += len(name) + len(value) + _HPACK_ENTRY_OVERHEAD
+        self._evict()
+
+    def _evict(self):
+        table = self.table
+        while self.table_size > self.max_table_size and table:
+            name, value = table.pop()
+            self.table_size -= len(name) + len(value) + _HPACK_ENTRY_OVERHEAD
+
+
+FRAME_DATA = 0x0
+FRAME_HEADERS = 0x1
+FRAME_RST_STREAM = 0x3
+FRAME_CONTINUATION = 0x9
+FLAG_END_STREAM = 0x1
+FLAG_END_HEADERS = 0x4
+FLAG_PADDED = 0x8
+FLAG_PRIORITY = 0x20
+FRAME_HEADER_LENGTH = 9
+# Frames read whole (header blocks, RST_STREAM); DATA is streamed, the rest skipped
+_BUFFERED_FRAMES = frozenset((FRAME_HEADERS, FRAME_CONTINUATION, FRAME_RST_STREAM))
+
+
+class HTTP2Parser:
+    """Incremental parser of the client side of an HTTP/2 connection, preface included."""
+
+    def __init__(self, on_request: RequestCallback, max_head: int = DEFAULT_MAX_HEAD,
+                 max_body: int = DEFAULT_MAX_BODY, max_streams: int = DEFAULT_MAX_STREAMS):
+        self.on_request = on_request
+        self.max_head = max_head
+        self.max_body = max_body
+        self.max_streams = max_streams
+        self.hpack = HPACKDecoder()
+        # Stream id -> request whose END_STREAM has not been seen
+        self.streams: "OrderedDict[int, HTTPRequest]" = OrderedDict()
+        self.partial = b""
+        self.preface = False
+        # DATA / skipped frame being read: (type, flags, stream id), bytes left, trailing padding
+        self.frame: Optional[Tuple[int, int, int]] = None
+        self.remaining = 0
+        self.padding = 0
+        # Header block continued in CONTINUATION frames: stream id, END_STREAM, fragments so far
+        self.block_stream = 0
+        self.block_end_stream = False
+        self.block: Optional[bytearray] = None
+        self.done = False
+        self.requests = 0
+        self.error: Optional[str] = None
+
+    def feed(self, data) -> bool:
+        """Parse the next stream bytes; False once the connection cannot be followed any further."""
+        if self.done:
+            return False
+        data = self.partial + bytes(data) if self.partial else bytes(data)
+        self.partial = b""
+        pos = 0
+        size = len(data)
+        try:
+            if not self.preface:
+                if size < len(HTTP2_PREFACE):
+                    if not HTTP2_PREFACE.startswith(data):
+                        return self._fail("no HTTP/2 connection preface")
+                    self.partial = data
+                    return True
+                if not data.startswith(HTTP2_PREFACE):
+                    return self._fail("no HTTP/2 connection preface")
+                self.preface = True
+                pos = len(HTTP2_PREFACE)
+            while pos < size and not self.done:
+                if self.frame is not None:
+                    pos = self._stream_frame(data, pos, size)
+                    continue
+                if size - pos < FRAME_HEADER_LENGTH:
+                    break
+                length = int.from_bytes(data[pos:pos + 3], "big")
+                frame_type = data[pos + 3]
+                flags = data[pos + 4]
+                stream_id = int.from_bytes(data[pos + 5:pos + 9], "big") & 0x7FFFFFFF
+                if self.block is not None and frame_type != FRAME_CONTINUATION:
+                    return self._fail("header block interrupted")
+                if frame_type in _BUFFERED_FRAMES:
+                    if length > self.max_head:
+                        return self._fail("header block too long")
+                    end = pos + FRAME_HEADER_LENGTH + length
+                    if end > size:
+                        break
+                    self._buffered_frame(frame_type, flags, stream_id, data[pos + FRAME_HEADER_LENGTH:end])
+                    pos = end
+                    continue
+                padding = 0
+                pos += FRAME_HEADER_LENGTH
+                if frame_type == FRAME_DATA and flags & FLAG_PADDED:
+                    if pos >= size:
+                        pos -= FRAME_HEADER_LENGTH
+                        break
+                    padding = data[pos]
+                    pos += 1
+                    length -= 1
+                    if padding > length:
+                        return self._fail("DATA padding longer than the frame")
+                self.frame = (frame_type, flags, stream_id)
+                self.remaining = length
+                self.padding = padding
+                if not length:
+                    self._end_frame()
+        except HTTPParseError as e:
+            return self._fail(str(e))
+        if pos < size and not self.done:
+            self.partial = data[pos:]
+        return not self.done
+
+    def _fail(self, reason: str) -> bool:
+        self.error = reason
+        self.done = True
+        self.streams.clear()
+        self.block = None
+        return False
+
+    def _stream_frame(self, data: bytes, pos: int, size: int) -> int:
+        """Consume DATA payload (or a skipped frame) without buffering it."""
+        take = min(self.remaining, size - pos)
+        frame_type, _, stream_id = self.frame
+        if frame_type == FRAME_DATA:
+            # Bytes before the trailing padding are body
+            body = min(take, self.remaining - self.padding)
+            request = self.streams.get(stream_id)
+            if body > 0 and request is not None:
+                request.body_length += body
+                room = self.max_body - len(request.body)
+                if room > 0:
+                    request.body += data[pos:pos + min(room, body)]
+        self.remaining -= take
+        if not self.remaining:
+            self._end_frame()
+        return pos + take
+
+    def _end_frame(self):
+        frame_type, flags, stream_id = self.frame
+        self.frame = None
+        if frame_type == FRAME_DATA and flags & FLAG_END_STREAM:
+            self._finish(stream_id)
+
+    def _buffered_frame(self, frame_type: int, flags: int, stream_id: int, payload: bytes):
+        if frame_type == FRAME_RST_STREAM:
+            # A reset request was still sent; hand on what arrived
+            self._finish(stream_id)
+            return
+        if frame_type == FRAME_CONTINUATION:
+            if self.block is None or stream_id != self.block_stream:
+                raise HTTPParseError("unexpected CONTINUATION")
+            self.block += payload
+            if len(self.block) > self.max_head:
+                raise HTTPParseError("header block too long")
+            if flags & FLAG_END_HEADERS:
+                block, self.block = bytes(self.block), None
+                self._headers(self.block_stream, block, self.block_end_stream)
+            return
+        start = 0
+        end = len(payload)
+        if flags & FLAG_PADDED:
+            if not end:
+                raise HTTPParseError("empty padded HEADERS")
+            end -= payload[0]
+            start = 1
+        if flags & FLAG_PRIORITY:
+            start += 5
+        if start > end:
+            raise HTTPParseError("HEADERS padding longer than the frame")
+        fragment = payload[start:end]
+        if flags & FLAG_END_HEADERS:
+            self._headers(stream_id, fragment, bool(flags & FLAG_END_STREAM))
+        else:
+            self.block = bytearray(fragment)
+            self.block_stream = stream_id
+            self.block_end_stream = bool(flags & FLAG_END_STREAM)
+
+    def _headers(self, stream_id: int, block: bytes, end_stream: bool):
+        headers = self.hpack.decode(block)
+        streams = self.streams
+        if stream_id not in streams:
+            request = None
+            for name, value in headers:
+                if name == b":method":
+                    request = HTTPRequest("HTTP/2", value, stream_id=stream_id)
+                    break
+            if request is None:
+                # Trailers of a request already handed on
+                return
+            for name, value in headers:
+                if name == b":path":
+                    request.uri = value
+                elif name == b":authority":
+                    request.keep_header(b"host", value)
+                elif name[:1] != b":":
+                    request.keep_header(name, value)
+            streams[stream_id] = request
+            if len(streams) > self.max_streams:
+                self._finish(next(iter(streams)))
+        if end_stream:
+            self._finish(stream_id)
+
+    def _finish(self, stream_id: int):
+        request = self.streams.pop(stream_id, None)
+        if request is not None:
+            self.requests += 1
+            self.on_request(request)
+
+
+class HTTPStreamParser:
+    """Client->server stream parser: HTTP/2 after the connection preface, HTTP/1.x otherwise."""
+
+    def __init__(self, on_request: RequestCallback, max_head: int = DEFAULT_MAX_HEAD,
+                 max_body: int = DEFAULT_MAX_BODY, max_streams: int = DEFAULT_MAX_STREAMS):
+        self.on_request = on_request
+        self.max_head = max_head
+        self.max_body = max_body
+        self.max_streams = max_streams
+        self.parser = None
+        self._head = b""
+
+    @property
+    def requests(self) -> int:
+        return self.parser.requests if self.parser is not None else 0
+
+    @property
+    def error(self) -> Optional[str]:
+        return self.parser.error if self.parser is not None else None
+
+    def feed(self, data) -> bool:
+        """Parse the next stream bytes; False once the stream cannot be followed any further."""
+        if self.parser is not None:
+            return self.parser.feed(data)
+        head = self._head + bytes(data)
+        if len(head) < len(HTTP2_PREFACE) and HTTP2_PREFACE.startswith(head):
+            # Could still be either protocol
+            self._head = head
+            return True
+        self._head = b""
+        if head.startswith(HTTP2_PREFACE):
+            self.parser = HTTP2Parser(self.on_request, self.max_head, self.max_body, self.max_streams)
+        else:
+            self.parser = HTTP1Parser(self.on_request, self.max_head, self.max_body)
+        return self.parser.feed(head)
@@ -0,0 +1,337 @@
+"""Incremental SSLKEYLOGFILE ingestion into a compact, bounded key store.
+
+``KeyStore`` maps the binary client random of a handshake to
+``{label: secret}`` (labels interned, secrets as bytes). It is bounded by
+session count and by age: the oldest sessions go first, except that a
+session looked up since it was stored gets a second chance (a CLOCK
+approximation of LRU that keeps lookups free of locks and reordering).
+Lookups are a single dict read, so the capture thread can call ``get``
+while the follower thread inserts.
+
+``KeyLogFollower`` tails the key log like ``tail -F``: it remembers its
+byte offset and ingests only lines appended since the last read, keeps a
+partial last line until its newline arrives, and starts over when the file
+is truncated or replaced. A worker thread wakes on inotify events for the
+file's directory (through libc via ctypes) or, where inotify is missing,
+polls every ``poll_interval`` seconds.
+"""
+import os
+import sys
+import time
+import errno
+import select
+import ctypes
+import ctypes.util
+import logging
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = 100_000
+DEFAULT_TTL = 24 * 3600.0
+DEFAULT_POLL_INTERVAL = 0.5
+# Longest line considered; anything longer is garbage and skipped
+MAX_LINE = 4096
+
+# NSS key log labels (TLS 1.2 and TLS 1.3)
+KEYLOG_LABELS = (
+    "CLIENT_RANDOM",
+    "CLIENT_EARLY_TRAFFIC_SECRET",
+    "CLIENT_HANDSHAKE_TRAFFIC_SECRET",
+    "SERVER_HANDSHAKE_TRAFFIC_SECRET",
+    "CLIENT_TRAFFIC_SECRET_0",
+    "SERVER_TRAFFIC_SECRET_0",
+    "EARLY_EXPORTER_SECRET",
+    "EXPORTER_SECRET",
+)
+_LABELS = {label.encode("ascii"): sys.intern(label) for label in KEYLOG_LABELS}
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+
+class KeyStore:
+    """Bounded client_random -> {label: secret} map with lock-free lookups."""
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, ttl: float = DEFAULT_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        # client random -> [stored at, looked up since stored, {label: secret}]
+        self._sessions: Dict[bytes, list] = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.added = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, client_random: bytes) -> bool:
+        return client_random in self._sessions
+
+    def add(self, client_random: bytes, label: str, secret: bytes, now: Optional[float] = None):
+        """Store one secret; a session keeps one secret per label."""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(client_random)
+            if entry is not None:
+                entry[2][label] = secret
+                return
+            self._sessions[client_random] = [now, False, {label: secret}]
+            self.added += 1
+            if len(self._sessions) > self.max_sessions:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        """Drop the oldest session not looked up since it was stored (caller holds the lock)."""
+        sessions = self._sessions
+        while len(sessions) > self.max_sessions:
+            client_random = next(iter(sessions))
+            entry = sessions.pop(client_random)
+            if entry[1]:
+                # Second chance: requeue at the young end
+                entry[0] = now
+                entry[1] = False
+                sessions[client_random] = entry
+                continue
+            self.evicted += 1
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Drop sessions stored more than ``ttl`` seconds ago; returns how many went."""
+        if now is None:
+            now = time.monotonic()
+        deadline = now - self.ttl
+        removed = 0
+        with self._lock:
+            sessions = self._sessions
+            while sessions:
+                client_random = next(iter(sessions))
+                entry = sessions[client_random]
+                if entry[0] > deadline:
+                    break
+                del sessions[client_random]
+                if entry[1]:
+                    # In use: renew once
+                    entry[0] = now
+                    entry[1] = False
+                    sessions[client_random] = entry
+                    continue
+                removed += 1
+            self.expired += removed
+        return removed
+
+    def get(self, client_random: bytes) -> Optional[Dict[str, bytes]]:
+        """Secrets logged for a handshake, or None; safe from any thread without locking."""
+        entry = self._sessions.get(bytes(client_random))
+        if entry is None:
+            self.misses += 1
+            return None
+        entry[1] = True
+        self.hits += 1
+        return entry[2]
+
+    def items(self) -> Iterator[Tuple[bytes, Dict[str, bytes]]]:
+        """Snapshot of (client_random, secrets), oldest first."""
+        with self._lock:
+            snapshot = [(client_random, dict(entry[2])) for client_random, entry in self._sessions.items()]
+        return iter(snapshot)
+
+    def get_stats(self) -> Dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl": self.ttl,
+            "added": self.added,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+
+def parse_keylog_line(line: bytes) -> Optional[Tuple[str, bytes, bytes]]:
+    """``LABEL <client_random hex> <secret hex>`` -> (label, client_random, secret), else None."""
+    parts = line.split()
+    if len(parts) != 3 or parts[0].startswith(b"#"):
+        return None
+    label = _LABELS.get(parts[0].upper())
+    if label is None:
+        return None
+    try:
+        return label, bytes.fromhex(parts[1].decode("ascii")), bytes.fromhex(parts[2].decode("ascii"))
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+def _load_inotify():
+    """libc's inotify functions, or None where unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class KeyLogFollower:
+    """Tails an SSLKEYLOGFILE into a KeyStore, reading only newly appended lines."""
+
+    def __init__(self, path: str, store: Optional[KeyStore] = None,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, use_inotify: bool = True):
+        self.path = path
+        self.store = store if store is not None else KeyStore()
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.offset = 0
+        self._inode = None
+        self._partial = b""
+        self._inotify_fd = -1
+        # "inotify" or "poll" once started
+        self.mode = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        # Counters
+        self.lines = 0
+        self.keys = 0
+        self.malformed = 0
+        self.reopened = 0
+        self.polls = 0
+
+    def poll(self) -> int:
+        """Ingest lines appended since the last call; returns the number of keys stored."""
+        self.polls += 1
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return 0
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self._inode or st.st_size < self.offset:
+                # New, replaced or truncated file: read it from the start
+                if self._inode is not None:
+                    self.reopened += 1
+                    logger.info(f"Key log {self.path} was replaced or truncated; rereading it")
+                self._inode = st.st_ino
+                self.offset = 0
+                self._partial = b""
+            if st.st_size == self.offset:
+                return 0
+            f.seek(self.offset)
+            data = f.read(st.st_size - self.offset)
+        self.offset += len(data)
+        return self._ingest(data)
+
+    def _ingest(self, data: bytes) -> int:
+        if self._partial:
+            data = self._partial + data
+        lines = data.split(b"\n")
+        # Last element is the (possibly empty) unterminated tail
+        tail = lines.pop()
+        self._partial = tail if len(tail) <= MAX_LINE else b""
+        add = self.store.add
+        now = time.monotonic()
+        stored = 0
+        for line in lines:
+            if not line or line[0] == 0x23 or line.isspace():  # comment / blank
+                continue
+            self.lines += 1
+            parsed = parse_keylog_line(line) if len(line) <= MAX_LINE else None
+            if parsed is None:
+                self.malformed += 1
+                continue
+            add(parsed[1], parsed[0], parsed[2], now)
+            stored += 1
+        self.keys += stored
+        return stored
+
+    def _open_inotify(self) -> bool:
+        libc = _load_inotify() if self.use_inotify else None
+        if libc is None:
+            return False
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            logger.debug(f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+            return False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            logger.debug(f"inotify_add_watch({directory}) failed: {os.strerror(ctypes.get_errno())}")
+            os.close(fd)
+            return False
+        self._inotify_fd = fd
+        return True
+
+    def _wait(self):
+        """Block until the directory changes (inotify) or the poll interval passes."""
+        if self._inotify_fd < 0:
+            self._stop.wait(self.poll_interval)
+            return
+        # The timeout also bounds how long stop() waits and catches missed events
+        readable, _, _ = select.select([self._inotify_fd], [], [], self.poll_interval)
+        if readable:
+            try:
+                while os.read(self._inotify_fd, 65536):
+                    pass
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    def run(self):
+        """Follow the file until ``stop`` is called."""
+        expire_every = max(1.0, min(60.0, self.store.ttl / 10))
+        next_expire = time.monotonic() + expire_every
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except OSError as e:
+                logger.warning(f"Key log {self.path} read failed: {e}")
+            now = time.monotonic()
+            if now >= next_expire:
+                self.store.expire(now)
+                next_expire = now + expire_every
+            self._wait()
+
+    def start(self) -> "KeyLogFollower":
+        """Read what is already logged, then follow the file on a daemon thread."""
+        self.poll()
+        self.mode = "inotify" if self._open_inotify() else "poll"
+        if self.mode == "poll":
+            logger.info(f"Following key log {self.path} by polling every {self.poll_interval}s")
+        self._thread = threading.Thread(target=self.run, name="keylog-follower", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._inotify_fd >= 0:
+            os.close(self._inotify_fd)
+            self._inotify_fd = -1
+
+    def get_stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "mode": self.mode,
+            "offset": self.offset,
+            "lines": self.lines,
+            "keys": self.keys,
+            "malformed": self.malformed,
+            "reopened": self.reopened,
+            "store": self.store.get_stats(),
+        }
@@ -1,7 +1,7 @@
 """Live packet capture using Scapy with TLS decryption support via SSLKEYLOG."""
-import os
 import time
 import json
+import select
 import logging
 from typing import Dict, List, Optional, Callable
 from collections import defaultdict
@@ -9,6 +9,35 @@ from scapy.all import sniff, IP, IPv6, TCP, UDP, ICMP, Raw, conf
 from scapy.layers.inet import IP
 from scapy.layers.l2 import Ether
 
+from .decoder import decode_frame, LINKTYPE_ETHERNET, TCP_SYN, TCP_ACK
+from .flow import FlowKey, FlowStats, flow_key_from_dict  # noqa: F401  (re-exported)
+from .emitter import FlowEmitter, EmitPolicy
+from .afpacket import AFPacketRing, read_socket_stats
+from .bpf import CaptureFilter
+from .app_id import APP_PORTS, DEFAULT_PROBE_PACKETS, UNKNOWN_APP, identify_payload
+from .sampling import Sampler, SamplingPolicy
+from .reassembly import (
+    TCPReassembler, DEFAULT_FLOW_LIMIT, DEFAULT_MEMORY_LIMIT, CLIENT_TO_SERVER, SERVER_TO_CLIENT
+)
+from .replay import replay_capture_file
+from .packet_ring import PacketRing
+from .keylog import DEFAULT_MAX_SESSIONS as KEYLOG_MAX_SESSIONS, DEFAULT_TTL as KEYLOG_TTL
+from .tls_session import TLSDecryptor
+from .tls_parser import (
+    ClientHello, parse_client_hello, parse_server_hello_records, TLSParseError, TLSIncomplete, TLS_VERSION_NAMES,
+)
+from .http_parser import HTTPStreamParser, HTTPRequest, DEFAULT_MAX_BODY as HTTP_MAX_BODY
+from .quic import (
+    QUICInitialTracker, MIN_INITIAL_DATAGRAM, DEFAULT_KEY_CACHE_SIZE as QUIC_KEY_CACHE_SIZE,
+    DEFAULT_MAX_CONNECTIONS as QUIC_MAX_CONNECTIONS
+)
+from .columnar import export_flows_columnar, DEFAULT_BATCH_SIZE as COLUMNAR_BATCH_SIZE
+from .flow_table import (
+    FlowTable, DEFAULT_IDLE_TIMEOUT, DEFAULT_ACTIVE_TIMEOUT, DEFAULT_MAX_FLOWS, EVICT_LRU
+)
+from ..metrics import StageMetrics, RateMeter, DEFAULT_TIMING_INTERVAL
+from ..pipeline import DEFAULT_QUEUE_SIZE as DECRYPT_QUEUE_SIZE
+
 # Import TLS decryption module
 try:
     from .tls_decryption import SSLKeyLogParser, TLSPacketInspector
@@ -21,77 +50,126 @@ logger = logging.getLogger(__name__)
 # Disable Scapy warnings
 conf.verb = 0
 
+# App types that start with a TLS handshake (ClientHello reassembled for SNI/version)
+TLS_APP_TYPES = frozenset(("HTTPS", "SMTPS", "POP3S", "IMAPS"))
+TLS_HANDSHAKE = 0x16
+# Packets of a TLS flow inspected for its ClientHello/ServerHello before giving up
+DEFAULT_TLS_PACKET_BUDGET = 32
 
-class FlowKey:
-    """Represents a network flow (5-tuple)."""
-    def __init__(self, src_ip: str, dst_ip: str, src_port: int, dst_port: int, protocol: str):
-        self.src_ip = src_ip
-        self.dst_ip = dst_ip
-        self.src_port = src_port
-        self.dst_port = dst_port
-        self.protocol = protocol
-
-    def __hash__(self):
-        return hash((self.src_ip, self.dst_ip, self.src_port, self.dst_port, self.protocol))
-
-    def __eq__(self, other):
-        return (self.src_ip == other.src_ip and self.dst_ip == other.dst_ip and
-                self.src_port == other.src_port and self.dst_port == other.dst_port and
-                self.protocol == other.protocol)
-
-
-class FlowStats:
-    """Aggregates statistics for a flow."""
-    def __init__(self, flow_key: FlowKey):
-        self.flow_key = flow_key
-        self.start_time = time.time()
-        self.last_seen = time.time()
-        self.packets = 0
-        self.bytes_sent = 0
-        self.bytes_received = 0
-        self.tls_version = None
-        self.sni = None
-        self.ja3 = None
-        self.app_type = "unknown"
-        self.payload_hashes = set()
-        self.ports_seen = set()
-
-    def to_dict(self) -> Dict:
-        return {
-            "src_ip": self.flow_key.src_ip,
-            "dst_ip": self.flow_key.dst_ip,
-            "src_port": self.flow_key.src_port,
-            "dst_port": self.flow_key.dst_port,
-            "protocol": self.flow_key.protocol,
-            "packets": self.packets,
-            "bytes_sent": self.bytes_sent,
-            "bytes_received": self.bytes_received,
-            "duration": self.last_seen - self.start_time,
-            "tls_version": self.tls_version,
-            "sni": self.sni,
-            "ja3": self.ja3,
-            "app_type": self.app_type,
-            "timestamp": self.start_time
-        }
+BACKEND_SCAPY = "scapy"
+BACKEND_AFPACKET = "afpacket"
+CAPTURE_BACKENDS = (BACKEND_SCAPY, BACKEND_AFPACKET)
 
 
 class PacketCapture:
     """Live packet capture with flow aggregation and TLS metadata extraction."""
     
-    def __init__(self, interface: Optional[str] = None, callback: Optional[Callable] = None):
+    def __init__(self, interface: Optional[str] = None, callback: Optional[Callable] = None,
+                 fast_path: bool = False, linktype: int = LINKTYPE_ETHERNET,
+                 flow_sink: Optional[Callable] = None,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 active_timeout: float = DEFAULT_ACTIVE_TIMEOUT,
+                 max_flows: int = DEFAULT_MAX_FLOWS,
+                 eviction_policy: str = EVICT_LRU,
+                 emit_policy: Optional[EmitPolicy] = None,
+                 batch_callback: Optional[Callable] = None,
+                 backend: str = BACKEND_SCAPY,
+                 capture_filter: Optional[CaptureFilter] = None,
+                 app_ports: Optional[Dict[int, str]] = None,
+                 app_probe_packets: int = DEFAULT_PROBE_PACKETS,
+                 stream_flow_limit: int = DEFAULT_FLOW_LIMIT,
+                 stream_memory_limit: int = DEFAULT_MEMORY_LIMIT,
+                 sampling: Optional[SamplingPolicy] = None,
+                 load_source: Optional[Callable[[], float]] = None,
+                 instrument: bool = True,
+                 timing_interval: int = DEFAULT_TIMING_INTERVAL,
+                 packet_ring: Optional[PacketRing] = None,
+                 keylog_file: Optional[str] = None,
+                 keylog_max_sessions: int = KEYLOG_MAX_SESSIONS,
+                 keylog_ttl: float = KEYLOG_TTL,
+                 decrypt_workers: int = 0,
+                 decrypt_queue_size: int = DECRYPT_QUEUE_SIZE,
+                 quic_key_cache_size: int = QUIC_KEY_CACHE_SIZE,
+                 quic_max_connections: int = QUIC_MAX_CONNECTIONS,
+                 tls_packet_budget: int = DEFAULT_TLS_PACKET_BUDGET,
+                 request_classifier: Optional[Callable[[str, Optional[int]], Optional[Dict]]] = None,
+                 http_max_body: int = HTTP_MAX_BODY):
+        if backend not in CAPTURE_BACKENDS:
+            raise ValueError(f"Unknown capture backend {backend!r}; expected one of {CAPTURE_BACKENDS}")
         self.interface = interface or self._default_interface()
         self.callback = callback
-        self.flows = {}
+        self.flow_sink = flow_sink
+        # Bounded flow table; expired/evicted flows leave as final records
+        self.flows = FlowTable(idle_timeout=idle_timeout, active_timeout=active_timeout,
+                               max_flows=max_flows, eviction_policy=eviction_policy,
+                               sink=self._flow_ended)
+        # Decides when flow records reach callback/batch_callback (default: every packet)
+        self.emitter = FlowEmitter(emit_policy or EmitPolicy.legacy(),
+                                   callback=callback, batch_callback=batch_callback)
         self.packet_count = 0
+        # Fast path: decode raw frame bytes with struct instead of Scapy layers
+        self.fast_path = fast_path
+        self.linktype = linktype
+        self.fallback_count = 0
+        # Capture time of the newest packet (packet timestamps, not wall clock)
+        self.last_packet_time = None
+        # "scapy" (sniff / L2listen) or "afpacket" (TPACKET_V3 mmap ring, Linux only)
+        self.backend = backend
+        self.ring: Optional[AFPacketRing] = None
+        # Kernel-side BPF filter attached to the live capture socket (None = everything)
+        self.capture_filter = capture_filter
+        # Server port -> app type, built once; payload probes per flow before freezing
+        self.app_ports = {**APP_PORTS, **(app_ports or {})}
+        self.app_probe_packets = app_probe_packets
+        # TCP reassembly of ClientHellos / HTTP request heads, bounded per flow and in total
+        self.streams = TCPReassembler(flow_limit=stream_flow_limit, memory_limit=stream_memory_limit)
+        # TLS flows are inspected until both hellos are parsed or this many packets went by
+        self.tls_packet_budget = tls_packet_budget
+        self.tls_inspected = 0
+        self.tls_budget_exhausted = 0
+        self.tls_skipped_packets = 0
+        # HTTP/1.x and HTTP/2 request streams are parsed as they arrive; request_classifier(fields,
+        # server port) returns a payload rule match (dict) or None for the fields of each request
+        self.request_classifier = request_classifier
+        self.http_max_body = http_max_body
+        self.http_requests = 0
+        self.http_parse_errors = 0
+        self.http_attacks = 0
+        # QUIC client Initials decrypted (keys cached per connection ID) until the ClientHello is seen
+        self.quic = QUICInitialTracker(max_connections=quic_max_connections, key_cache_size=quic_key_cache_size)
+        # Packet/flow sampling under overload; load_source() is the downstream queue fill ratio
+        self.sampler = Sampler(sampling, load_source) if sampling else None
+        # Hot-path instrumentation: byte counter plus stage timings of one packet in timing_interval
+        self.metrics = StageMetrics(timing_interval) if instrument else None
+        self.rates = RateMeter()
+        self.byte_count = 0
+        self._timing = False
+        # Plain AF_PACKET socket being read (Scapy backends), for kernel drop counters
+        self._capture_sock = None
+        self.kernel_packets = 0
+        self.kernel_drops = 0
+        # Recent raw frames per flow, dumped to pcap when a flow alerts (see AlertDumper)
+        self.packet_ring = packet_ring
         
         # Initialize TLS decryption if available
         if TLS_DECRYPTION_AVAILABLE:
-            self.keylog_parser = SSLKeyLogParser()
+            # Key log (default $SSLKEYLOGFILE) is followed, so new sessions' keys arrive while capturing
+            self.keylog_parser = SSLKeyLogParser(keylog_file, follow=True, max_sessions=keylog_max_sessions,
+                                                 ttl=keylog_ttl)
             self.tls_inspector = TLSPacketInspector()
-            logger.info(f"TLS decryption initialized (SSLKEYLOGFILE={os.getenv('SSLKEYLOGFILE', 'not set')})")
+            logger.info(f"TLS decryption initialized (SSLKEYLOGFILE={self.keylog_parser.filepath or 'not set'})")
         else:
             self.keylog_parser = None
             self.tls_inspector = None
+        # TLS connections with logged keys are decrypted on worker threads (off unless decrypt_workers)
+        self.decryptor: Optional[TLSDecryptor] = None
+        if decrypt_workers:
+            if self.keylog_parser is None or not self.keylog_parser.filepath:
+                logger.warning("TLS decryption needs an SSLKEYLOGFILE; not decrypting")
+            else:
+                self.decryptor = TLSDecryptor(self.keylog_parser.get_secrets, workers=decrypt_workers,
+                                              queue_size=decrypt_queue_size,
+                                              request_classifier=request_classifier).start()
         
     @staticmethod
     def _default_interface() -> str:
@@ -106,78 +184,245 @@ class PacketCapture:
         except:
             return "eth0"
 
-    def _extract_tls_metadata(self, packet):
-        """Extract TLS metadata (SNI, version, JA3 stub)."""
-        result = {"sni": None, "tls_version": None, "decryptable": False}
-        
-        if not self.tls_inspector or not TCP in packet:
-            return result
-        
+    def _extract_tls_metadata(self, payload) -> Optional[Dict]:
+        """Parse the ClientHello at the start of a client TLS stream into flow metadata.
+
+        Returns None while the ClientHello is still incomplete.
+        """
+        result = {"sni": None, "tls_version": None, "alpn": None, "ja3": None, "ja4": None,
+                  "client_random": None, "decryptable": False}
         try:
-            # Check if this is HTTPS (port 443)
-            if TCP in packet and packet[TCP].dport == 443:
-                if Raw in packet:
-                    payload = bytes(packet[Raw].load)
-                    
-                    # Extract SNI from CLIENT_HELLO
-                    sni = self.tls_inspector.extract_sni(payload)
-                    if sni:
-                        result["sni"] = sni
-                    
-                    # Extract TLS version
-                    tls_version = self.tls_inspector.extract_tls_version(payload)
-                    if tls_version:
-                        result["tls_version"] = tls_version
-                    
-                    # Check if we have decryption keys
-                    if self.keylog_parser and sni:
-                        result["decryptable"] = True
-                        logger.debug(f"SNI={sni} - decryption keys available: {bool(self.keylog_parser.keys_by_client_random)}")
-        except Exception as e:
-            logger.debug(f"TLS metadata extraction error: {e}")
-        
+            hello = parse_client_hello(payload)
+        except TLSIncomplete:
+            return None
+        except TLSParseError as e:
+            logger.debug(f"TLS ClientHello parse error: {e}")
+            return result
+        return self._hello_metadata(hello)
+
+    def _hello_metadata(self, hello: ClientHello, transport: str = "t") -> Dict:
+        """Flow metadata of a parsed ClientHello; ``transport`` is the JA4 transport ("t" or "q")."""
+        result = {"sni": hello.sni, "tls_version": hello.version_name,
+                  "alpn": hello.alpn[0] if hello.alpn else None, "ja3": hello.ja3(),
+                  "ja4": hello.ja4(transport), "client_random": hello.client_random, "decryptable": False}
+        # Decryptable if the key log has a secret for this handshake
+        if self.keylog_parser:
+            result["decryptable"] = self.keylog_parser.get_secrets(hello.random) is not None
         return result
 
-    def _guess_app_type(self, packet, flow_key: FlowKey) -> str:
-        """Heuristically classify application type based on port and payload."""
-        port = flow_key.dst_port
-        
-        # Common ports
-        port_map = {
-            80: "HTTP", 8080: "HTTP", 8000: "HTTP",
-            443: "HTTPS", 8443: "HTTPS",
-            25: "SMTP", 587: "SMTP", 465: "SMTPS",
-            110: "POP3", 995: "POP3S",
-            143: "IMAP", 993: "IMAPS",
-            53: "DNS",
-            22: "SSH", 2222: "SSH",
-            3306: "MySQL", 5432: "PostgreSQL",
-            6379: "Redis", 27017: "MongoDB",
-            3389: "RDP", 5900: "VNC",
-            5672: "AMQP", 9092: "Kafka"
-        }
-        
-        if port in port_map:
-            return port_map[port]
-        
-        # Check payload signatures
-        if Raw in packet:
-            payload = bytes(packet[Raw].load)[:100]
-            if b"HTTP/" in payload or b"GET " in payload or b"POST " in payload:
-                return "HTTP"
-            if b"SSH" in payload:
-                return "SSH"
-            if b"SMTP" in payload:
-                return "SMTP"
-        
-        return "Unknown"
+    def _identify_app(self, flow: FlowStats, payload, created: bool) -> bool:
+        """Per-flow app identification: decide from the port, else probe payloads, then freeze.
+
+        Returns True when this packet settled the app type.
+        """
+        if created:
+            app_type = self.app_ports.get(flow.dst_port)
+            if app_type:
+                flow.app_type = app_type
+                flow.app_probes = 0
+                return True
+            flow.app_type = UNKNOWN_APP
+        if payload is None or not len(payload):
+            return False
+        app_type = identify_payload(payload)
+        if app_type:
+            flow.app_type = app_type
+            flow.app_probes = 0
+            return True
+        flow.app_probes -= 1
+        return False
+
+    def _open_streams(self, flow: FlowStats):
+        """Start reassembling the client->server stream of flows whose first bytes we parse."""
+        if flow.app_type in TLS_APP_TYPES:
+            if self.decryptor is not None:
+                client, server = self._decrypt_consumers(flow)
+                self.streams.open(flow.key, CLIENT_TO_SERVER, client, streaming=True)
+                self.streams.open(flow.key, SERVER_TO_CLIENT, server, streaming=True)
+            else:
+                flow.tls_packets = self.tls_packet_budget
+                self.streams.open(flow.key, CLIENT_TO_SERVER, self._tls_consumer(flow))
+                self.streams.open(flow.key, SERVER_TO_CLIENT, self._server_hello_consumer(flow))
+        elif flow.app_type == "HTTP":
+            self.streams.open(flow.key, CLIENT_TO_SERVER, self._http_consumer(flow), streaming=True)
+
+    def _tls_consumer(self, flow: FlowStats):
+        """Stream consumer that waits for a complete ClientHello and fingerprints it."""
+        def consume(data: bytearray) -> bool:
+            if data[0] != TLS_HANDSHAKE:
+                return True
+            if self.metrics is not None:
+                with self.metrics.timed("tls_inspect"):
+                    tls_meta = self._extract_tls_metadata(data)
+            else:
+                tls_meta = self._extract_tls_metadata(data)
+            if tls_meta is None:
+                return False
+            flow.sni = tls_meta["sni"]
+            flow.tls_version = tls_meta["tls_version"]
+            flow.alpn = tls_meta["alpn"]
+            flow.ja3 = tls_meta["ja3"]
+            flow.ja4 = tls_meta["ja4"]
+            return True
+        return consume
+
+    def _server_hello_consumer(self, flow: FlowStats):
+        """Stream consumer that waits for the ServerHello and records the negotiated version."""
+        def consume(data: bytearray) -> bool:
+            if data[0] != TLS_HANDSHAKE:
+                return True
+            try:
+                hello = parse_server_hello_records(data)
+            except TLSIncomplete:
+                return False
+            except TLSParseError as e:
+                logger.debug(f"TLS ServerHello parse error: {e}")
+                return True
+            flow.tls_version = TLS_VERSION_NAMES.get(hello.version, flow.tls_version)
+            return True
+        return consume
+
+    def _decrypt_consumers(self, flow: FlowStats):
+        """Streaming consumers (client->server, server->client) passing every byte to the decryptor.
+
+        The client side also fingerprints the ClientHello from its own copy of
+        the first bytes; if the client does not start with a TLS handshake,
+        both directions are let go.
+        """
+        decryptor = self.decryptor
+        key = flow.key
+        hello = self._tls_consumer(flow)
+        head = bytearray()
+        limit = self.streams.flow_limit
+        not_tls = False
+
+        def client(data: bytearray) -> bool:
+            nonlocal hello, not_tls
+            if hello is not None:
+                if not head and data[0] != TLS_HANDSHAKE:
+                    not_tls = True
+                    decryptor.end(key)
+                    return True
+                head.extend(data)
+                if hello(head) or len(head) >= limit:
+                    hello = None
+                    head.clear()
+            decryptor.feed(key, CLIENT_TO_SERVER, bytes(data), flow.app_type, flow.reverse)
+            return False
+
+        def server(data: bytearray) -> bool:
+            if not_tls:
+                return True
+            decryptor.feed(key, SERVER_TO_CLIENT, bytes(data), flow.app_type, flow.reverse)
+            return False
+        return client, server
+
+    def _http_consumer(self, flow: FlowStats):
+        """Streaming consumer parsing every request of the client stream (bounded per request)."""
+        parser = HTTPStreamParser(lambda request: self._http_request(flow, request),
+                                  max_head=self.streams.flow_limit, max_body=self.http_max_body)
+
+        def consume(data: bytearray) -> bool:
+            if parser.feed(data):
+                return False
+            if parser.error:
+                self.http_parse_errors += 1
+                logger.debug(f"HTTP parsing of {flow.key} stopped: {parser.error}")
+            return True
+        return consume
+
+    def _http_request(self, flow: FlowStats, request: HTTPRequest):
+        """One parsed request: the first fills flow.http, each is matched against payload signatures."""
+        self.http_requests += 1
+        if flow.http is None:
+            flow.http = request.to_dict()
+        if self.request_classifier is None:
+            return
+        if self.metrics is not None:
+            with self.metrics.timed("http_classify"):
+                match = self.request_classifier(request.inspection_text(), flow.dst_port)
+        else:
+            match = self.request_classifier(request.inspection_text(), flow.dst_port)
+        if match is None:
+            return
+        self.http_attacks += 1
+        if flow.http_attack is None or match["confidence"] > flow.http_attack["confidence"]:
+            match["method"] = request.method.decode("ascii", "replace")
+            match["uri"] = request.uri.decode("latin-1")
+            flow.http_attack = match
 
     def process_packet(self, packet):
-        """Process a single packet and update flow stats."""
-        self.packet_count += 1
-        
+        """Process a single Scapy packet and update flow stats."""
+        metrics = self.metrics
+        if metrics is not None:
+            original = packet.original
+            self.byte_count += len(original) if original else len(packet)
+            metrics.countdown -= 1
+            if not metrics.countdown:
+                self._process_timed(self._process_packet, packet)
+                return
+        if self.sampler is None:
+            self._process_packet(packet)
+        else:
+            self._process_sampled(self._process_packet, packet)
+
+    def process_frame(self, frame, timestamp: Optional[float] = None):
+        """Process a raw link-layer frame via the struct decoder, falling back to Scapy.
+
+        ``timestamp`` is the capture time of the frame (e.g. from a pcap record);
+        it defaults to the current wall-clock time.
+        """
+        metrics = self.metrics
+        if metrics is not None:
+            self.byte_count += len(frame)
+            metrics.countdown -= 1
+            if not metrics.countdown:
+                self._process_timed(self._process_frame, frame, timestamp)
+                return
+        if self.sampler is None:
+            self._process_frame(frame, timestamp)
+        else:
+            self._process_sampled(self._process_frame, frame, timestamp)
+
+    def _process_sampled(self, process: Callable, *args):
+        """Run ``process`` unless packet sampling skips it, timing one packet in N for the sampler."""
+        sampler = self.sampler
+        if not sampler.admit_packet():
+            self.packet_count += 1
+            return
+        if sampler.should_time():
+            start = time.perf_counter()
+            process(*args)
+            sampler.observe_latency(time.perf_counter() - start)
+        else:
+            process(*args)
+
+    def _process_timed(self, process: Callable, *args):
+        """Run ``process`` with per-stage timing on (one packet in ``timing_interval``)."""
+        metrics = self.metrics
+        metrics.countdown = metrics.timing_interval
+        sampler = self.sampler
+        if sampler is not None and not sampler.admit_packet():
+            self.packet_count += 1
+            return
+        self._timing = True
+        start = time.perf_counter_ns()
+        try:
+            process(*args)
+        finally:
+            self._timing = False
+        elapsed = time.perf_counter_ns() - start
+        metrics.histogram("packet").observe_ns(elapsed)
+        if sampler is not None:
+            sampler.observe_latency(elapsed / 1e9)
+
+    def _process_packet(self, packet):
+        timing = self._timing
+        if timing:
+            start = time.perf_counter_ns()
         # Extract basic info
         src_ip = dst_ip = src_port = dst_port = protocol = None
+        tcp_flags = tcp_seq = 0
         
         if IP in packet:
             src_ip = packet[IP].src
@@ -186,6 +431,8 @@ class PacketCapture:
             if TCP in packet:
                 src_port = packet[TCP].sport
                 dst_port = packet[TCP].dport
+                tcp_flags = int(packet[TCP].flags)
+                tcp_seq = packet[TCP].seq
                 protocol = "TCP"
             elif UDP in packet:
                 src_port = packet[UDP].sport
@@ -203,6 +450,8 @@ class PacketCapture:
             if TCP in packet:
                 src_port = packet[TCP].sport
                 dst_port = packet[TCP].dport
+                tcp_flags = int(packet[TCP].flags)
+                tcp_seq = packet[TCP].seq
                 protocol = "TCP"
             elif UDP in packet:
                 src_port = packet[UDP].sport
@@ -210,47 +459,189 @@ class PacketCapture:
                 protocol = "UDP"
         
         if not src_ip or not protocol:
+            self.packet_count += 1
+            return
+        
+        payload = bytes(packet[Raw].load) if Raw in packet else None
+        if timing:
+            self.metrics.histogram("decode").observe_ns(time.perf_counter_ns() - start)
+        self._update_flow(src_ip, dst_ip, src_port or 0, dst_port or 0, protocol, tcp_flags,
+                          payload, float(packet.time), tcp_seq, packet.original)
+
+    def _process_frame(self, frame, timestamp: Optional[float] = None):
+        if timestamp is None:
+            timestamp = time.time()
+        if self._timing:
+            start = time.perf_counter_ns()
+            decoded = decode_frame(frame, self.linktype)
+            self.metrics.histogram("decode").observe_ns(time.perf_counter_ns() - start)
+        else:
+            decoded = decode_frame(frame, self.linktype)
+        if decoded is None:
+            # Unusual encapsulation (fragments, tunnels, ...): let Scapy dissect it
+            self.fallback_count += 1
+            packet = conf.l2types.get(self.linktype, Ether)(bytes(frame))
+            packet.time = timestamp
+            self._process_packet(packet)
+            return
+        if not decoded:
+            self.packet_count += 1
             return
         
-        # Create flow key
-        flow_key = FlowKey(src_ip, dst_ip, src_port or 0, dst_port or 0, protocol)
+        src_ip, dst_ip, src_port, dst_port, protocol, flags, seq, offset, length = decoded
+        payload = memoryview(frame)[offset:offset + length] if length else None
+        self._update_flow(src_ip, dst_ip, src_port, dst_port, protocol, flags, payload, timestamp, seq, frame)
+
+    def _update_flow(self, src_ip: str, dst_ip: str, src_port: int, dst_port: int,
+                     protocol: str, tcp_flags: int, payload, timestamp: float, tcp_seq: int = 0,
+                     frame=None):
+        """Update flow stats for one decoded packet; ``payload`` is the L4 payload or None.
+
+        ``frame`` is the raw link-layer frame, kept in the packet ring if one is configured.
+        """
+        self.packet_count += 1
+        self.last_packet_time = timestamp
+        
+        # Canonical (direction-independent) key; inlined canonical_flow_key()
+        if src_ip < dst_ip or (src_ip == dst_ip and src_port <= dst_port):
+            flow_key = (protocol, src_ip, src_port, dst_ip, dst_port)
+            reverse = False
+        else:
+            flow_key = (protocol, dst_ip, dst_port, src_ip, src_port)
+            reverse = True
+        
+        timing = self._timing
+        if timing:
+            start = time.perf_counter_ns()
+        
+        # Expire idle/active flows (no-op until the next wheel tick)
+        self.flows.expire(timestamp)
         
         # Update or create flow stats
-        if flow_key not in self.flows:
-            self.flows[flow_key] = FlowStats(flow_key)
+        flow = self.flows.lookup(flow_key)
+        created = flow is None
+        sampler = self.sampler
+        if created:
+            if sampler is not None and not sampler.admit_flow(flow_key):
+                return
+            # The first packet's sender is the initiator, unless it is a SYN-ACK
+            initiator_reverse = reverse
+            if tcp_flags & (TCP_SYN | TCP_ACK) == (TCP_SYN | TCP_ACK):
+                initiator_reverse = not reverse
+            flow = FlowStats(flow_key, initiator_reverse, timestamp)
+            flow.app_probes = self.app_probe_packets
+            if not self.flows.insert(flow_key, flow):
+                # Table full and the eviction policy refuses new flows
+                return
+        if timing:
+            self.metrics.histogram("flow_lookup").observe_ns(time.perf_counter_ns() - start)
+        
+        if self.packet_ring is not None and frame is not None:
+            self.packet_ring.record(flow_key, timestamp, frame, self.linktype)
         
-        flow = self.flows[flow_key]
-        flow.packets += 1
-        flow.last_seen = time.time()
+        # Under packet sampling each kept packet stands for `weight` packets;
+        # a flow admitted by flow sampling stands for `rate` flows
+        weight = 1
+        if sampler is not None and sampler.active:
+            weight = sampler.weight
+            if created or weight != 1:
+                flow.sample_rate = sampler.policy.rate
         
-        # Extract layer sizes
-        if Raw in packet:
-            payload_size = len(packet[Raw].load)
-            # Simple heuristic: if src == local and dst == remote, it's sent; else received
-            # In real scenario, you'd need interface info
-            flow.bytes_sent += payload_size
+        flow.packets += weight
+        flow.last_seen = timestamp
         
-        # Extract TLS metadata if present
-        if protocol == "TCP" and dst_port == 443:
-            tls_meta = self._extract_tls_metadata(packet)
-            if tls_meta["sni"]:
-                flow.sni = tls_meta["sni"]
-            if tls_meta["tls_version"]:
-                flow.tls_version = tls_meta["tls_version"]
+        # Payload bytes per direction (initiator -> responder is "sent")
+        if payload is not None:
+            if reverse == flow.reverse:
+                flow.bytes_sent += len(payload) * weight
+            else:
+                flow.bytes_received += len(payload) * weight
         
-        # Guess app type
-        flow.app_type = self._guess_app_type(packet, flow_key)
+        # App type from the responder (server) port or the first payloads, decided once
+        if flow.app_probes and self._identify_app(flow, payload, created) and protocol == "TCP":
+            self._open_streams(flow)
         
-        # Callback
-        if self.callback:
-            self.callback(flow.to_dict())
+        # Reassemble TLS handshakes / HTTP request heads that span segments
+        if protocol == "TCP":
+            if flow.tls_packets:
+                self._tls_segment(flow, CLIENT_TO_SERVER if reverse == flow.reverse else SERVER_TO_CLIENT,
+                                  tcp_seq, tcp_flags, payload)
+            elif flow.app_type in TLS_APP_TYPES and self.decryptor is None:
+                # Handshake already inspected (or given up on): no TLS work for the rest of the flow
+                self.tls_skipped_packets += 1
+            else:
+                self.streams.segment(flow_key, CLIENT_TO_SERVER if reverse == flow.reverse else SERVER_TO_CLIENT,
+                                     tcp_seq, tcp_flags, payload)
+        elif (flow.ja4 is None and payload is not None and len(payload) >= MIN_INITIAL_DATAGRAM
+              and reverse == flow.reverse and payload[0] & 0xC0 == 0xC0):
+            # Client datagram with a QUIC long header, padded like an Initial
+            self._quic_initial(flow, payload)
+        
+        # Emit start/interim/per-packet records according to the emission policy
+        self.emitter.flow_updated(flow_key, flow, created, timestamp)
+
+    def _tls_segment(self, flow: FlowStats, direction: int, tcp_seq: int, tcp_flags: int, payload):
+        """Feed a handshake-phase TLS segment; end inspection once both hellos are in or the budget is spent."""
+        key = flow.key
+        streams = self.streams
+        streams.segment(key, direction, tcp_seq, tcp_flags, payload)
+        flow.tls_packets -= 1
+        if not streams.is_open(key, CLIENT_TO_SERVER) and not streams.is_open(key, SERVER_TO_CLIENT):
+            flow.tls_packets = 0
+            self.tls_inspected += 1
+        elif not flow.tls_packets:
+            streams.close(key)
+            self.tls_budget_exhausted += 1
+
+    def _quic_initial(self, flow: FlowStats, payload):
+        """Decrypt a client QUIC Initial datagram; fingerprint the flow once its ClientHello is complete."""
+        if self.metrics is not None:
+            with self.metrics.timed("quic_initial"):
+                hello = self.quic.datagram(flow.key, payload)
+        else:
+            hello = self.quic.datagram(flow.key, payload)
+        if hello is None:
+            return
+        meta = self._hello_metadata(hello, transport="q")
+        flow.app_type = "QUIC"
+        flow.sni = meta["sni"]
+        flow.tls_version = meta["tls_version"]
+        flow.alpn = meta["alpn"]
+        flow.ja3 = meta["ja3"]
+        flow.ja4 = meta["ja4"]
+
+    def _flow_ended(self, record: Dict):
+        """FlowTable sink: forward a final flow record to flow_sink and the emitter."""
+        if self.flow_sink:
+            self.flow_sink(record)
+        key = flow_key_from_dict(record)
+        self.streams.close(key)
+        if key[0] == "UDP":
+            self.quic.close(key)
+        if self.decryptor is not None:
+            self.decryptor.end(key)
+        self.emitter.flow_ended(key, record, self.last_packet_time)
 
     def start_sniffing(self, packet_count: int = 0, timeout: int = 60):
         """Start live packet capture."""
-        logger.info(f"Starting packet capture on {self.interface}...")
+        logger.info(f"Starting packet capture on {self.interface} "
+                    f"(backend={self.backend}, fast_path={self.fast_path})...")
         try:
-            sniff(iface=self.interface, prn=self.process_packet, store=False, 
-                  count=packet_count, timeout=timeout, verbose=False)
+            if self.backend == BACKEND_AFPACKET:
+                self._sniff_ring(packet_count, timeout)
+            elif self.fast_path:
+                self._sniff_raw(packet_count, timeout)
+            else:
+                # Open the socket ourselves so our BPF program is attached to it
+                sock = conf.L2listen(iface=self.interface)
+                try:
+                    self._attach_filter(sock.ins)
+                    self._capture_sock = sock.ins
+                    self._sniff_scapy(sock, packet_count, timeout)
+                finally:
+                    self._read_kernel_stats()
+                    self._capture_sock = None
+                    sock.close()
         except PermissionError:
             logger.error("Packet capture requires root/CAP_NET_RAW. Run with: sudo python3 ...")
             raise
@@ -258,18 +649,226 @@ class PacketCapture:
             logger.error(f"Capture error: {e}")
             raise
 
-    def get_active_flows(self, max_age: int = 300) -> List[Dict]:
-        """Return active flows (not older than max_age seconds)."""
-        now = time.time()
+    def _sniff_scapy(self, sock, packet_count: int = 0, timeout: Optional[int] = 60):
+        """Dissect packets with Scapy's sniff, in slices of at most a second so idle flows expire."""
+        deadline = time.time() + timeout if timeout else None
+        received = 0
+
+        def handle(packet):
+            nonlocal received
+            received += 1
+            self.process_packet(packet)
+
+        while not packet_count or received < packet_count:
+            remaining = deadline - time.time() if deadline else None
+            if remaining is not None and remaining <= 0:
+                break
+            sniff(opened_socket=sock, prn=handle, store=False,
+                  count=packet_count - received if packet_count else 0,
+                  timeout=min(remaining, 1.0) if remaining is not None else 1.0)
+            # Expire idle flows and flush due records, whether or not packets arrived
+            now = time.time()
+            self.flows.expire(now)
+            self.emitter.tick(now)
+
+    def _sniff_raw(self, packet_count: int = 0, timeout: Optional[int] = 60):
+        """Read undissected frames from a Scapy L2 socket and feed process_frame."""
+        sock = conf.L2listen(iface=self.interface)
+        deadline = time.time() + timeout if timeout else None
+        received = 0
+        try:
+            self._attach_filter(sock.ins)
+            self._capture_sock = sock.ins
+            while not packet_count or received < packet_count:
+                remaining = deadline - time.time() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    break
+                # Wake up at least once a second so idle flows expire on a quiet link
+                wait = min(remaining, 1.0) if remaining is not None else 1.0
+                ready, _, _ = select.select([sock], [], [], wait)
+                if not ready:
+                    now = time.time()
+                    self.flows.expire(now)
+                    self.emitter.tick(now)
+                    continue
+                cls, frame, _ts = sock.recv_raw()
+                if frame is None:
+                    continue
+                received += 1
+                if cls is conf.l2types.get(self.linktype):
+                    self.process_frame(frame)
+                else:
+                    self.fallback_count += 1
+                    self.process_packet(cls(frame))
+        finally:
+            self._read_kernel_stats()
+            self._capture_sock = None
+            sock.close()
+
+    def _sniff_ring(self, packet_count: int = 0, timeout: Optional[int] = 60,
+                    fanout_group: Optional[int] = None, stop_event=None):
+        """Walk frames in place in a TPACKET_V3 ring and feed them to process_frame."""
+        self.linktype = LINKTYPE_ETHERNET
+        self.ring = AFPacketRing(self.interface, fanout_group=fanout_group,
+                                 bpf_program=self.capture_filter.compile(LINKTYPE_ETHERNET)
+                                 if self.capture_filter else None)
+        deadline = time.time() + timeout if timeout else None
+        received = 0
+        with self.ring:
+            frames = self.ring.iter_frames()
+            try:
+                for item in frames:
+                    if item is None:
+                        # Quiet link: expire idle flows and flush due records
+                        now = time.time()
+                        self.flows.expire(now)
+                        self.emitter.tick(now)
+                    else:
+                        timestamp, frame = item
+                        self.process_frame(frame, timestamp)
+                        received += 1
+                        if packet_count and received >= packet_count:
+                            break
+                    if deadline and time.time() >= deadline:
+                        break
+                    if stop_event is not None and stop_event.is_set():
+                        break
+            finally:
+                # Drop every view into the ring before it is unmapped
+                item = frame = None
+                frames.close()
+                self.ring.get_stats()
+
+    def _attach_filter(self, sock):
+        """Attach the configured capture filter to a raw capture socket."""
+        if self.capture_filter is not None:
+            self.capture_filter.attach(sock, self.linktype)
+
+    def _read_kernel_stats(self) -> Dict:
+        """Accumulate and return the kernel's received/dropped counters for the capture socket."""
+        if self.ring is not None:
+            ring = self.ring.get_stats()
+            return {"packets": ring["kernel_packets"], "drops": ring["kernel_drops"]}
+        sock = self._capture_sock
+        if sock is not None:
+            try:
+                packets, drops = read_socket_stats(sock)
+            except OSError:
+                # Socket closed under us, or not an AF_PACKET socket
+                pass
+            else:
+                self.kernel_packets += packets
+                self.kernel_drops += drops
+        return {"packets": self.kernel_packets, "drops": self.kernel_drops}
+
+    def get_metrics(self) -> Dict:
+        """Return packet/byte rates, flow table size, kernel and userspace drops and stage latencies."""
+        sampler = self.sampler
+        return {
+            "packets": self.packet_count,
+            "bytes": self.byte_count,
+            **self.rates.rates({"packets": self.packet_count, "bytes": self.byte_count}),
+            "flow_table_size": len(self.flows),
+            "kernel": self._read_kernel_stats(),
+            "userspace_drops": {
+                "sampled_out": sampler.sampled_out if sampler is not None else 0,
+                "flows_refused": self.flows.dropped_new,
+                "reassembly_segments": self.streams.dropped_segments,
+            },
+            "timing_interval": self.metrics.timing_interval if self.metrics is not None else None,
+            "stages": self.metrics.get_stats() if self.metrics is not None else {},
+        }
+
+    def get_capture_stats(self) -> Dict:
+        """Return capture counters: packets, Scapy fallbacks, flow table, emitter and kernel stats."""
+        stats = {
+            "backend": self.backend,
+            "capture_filter": self.capture_filter.to_expression() if self.capture_filter else None,
+            "packets": self.packet_count,
+            "scapy_fallbacks": self.fallback_count,
+            "flow_table": self.flows.get_stats(),
+            "emitter": self.emitter.get_stats(),
+            "reassembly": self.streams.get_stats(),
+            "quic": self.quic.get_stats(),
+            "tls_inspection": {
+                "packet_budget": self.tls_packet_budget,
+                "inspected": self.tls_inspected,
+                "budget_exhausted": self.tls_budget_exhausted,
+                "skipped_packets": self.tls_skipped_packets,
+            },
+            "http": {
+                "requests": self.http_requests,
+                "parse_errors": self.http_parse_errors,
+                "signature_matches": self.http_attacks,
+            },
+        }
+        if self.keylog_parser is not None and self.keylog_parser.filepath:
+            stats["keylog"] = self.keylog_parser.get_stats()
+        if self.decryptor is not None:
+            stats["tls_decryption"] = self.decryptor.get_stats()
+        if self.packet_ring is not None:
+            stats["packet_ring"] = self.packet_ring.get_stats()
+        if self.sampler is not None:
+            stats["sampling"] = self.sampler.get_stats()
+        if self.ring is not None:
+            stats["kernel"] = self.ring.get_stats()
+        return stats
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop the TLS decryption workers and the key log follower (capture is over)."""
+        if self.decryptor is not None:
+            self.decryptor.close(timeout)
+        if self.keylog_parser is not None:
+            self.keylog_parser.close()
+
+    def replay(self, filepath: str, realtime: bool = False, speed: float = 1.0) -> Dict:
+        """Replay a pcap/pcapng file through the flow pipeline using its packet timestamps.
+
+        ``realtime=False`` runs as fast as possible; ``realtime=True`` paces packets
+        by their capture timestamps (scaled by ``speed``).
+        """
+        logger.info(f"Replaying {filepath} (realtime={realtime}, speed={speed})...")
+        summary = replay_capture_file(self, filepath, realtime=realtime, speed=speed)
+        # End of capture: emit everything still in the table as final records
+        summary["flushed_flows"] = self.flows.flush()
+        self.emitter.flush()
+        return summary
+
+    def get_active_flows(self, max_age: int = 300, now: Optional[float] = None) -> List[Dict]:
+        """Return active flows (not older than max_age seconds).
+
+        ``now`` defaults to the wall clock; pass ``last_packet_time`` when
+        inspecting a replayed capture.
+        """
+        if now is None:
+            now = time.time()
         active = [
             flow.to_dict() for flow in self.flows.values()
             if (now - flow.last_seen) <= max_age
         ]
         return active
 
-    def export_flows(self, filepath: str):
-        """Export flows to JSON."""
-        flows = [flow.to_dict() for flow in self.flows.values()]
-        with open(filepath, 'w') as f:
-            json.dump(flows, f, indent=2, default=str)
-        logger.info(f"Exported {len(flows)} flows to {filepath}")
+    def export_flows(self, filepath: str, format: str = "json",
+                     batch_size: int = COLUMNAR_BATCH_SIZE) -> int:
+        """Export the flow table as JSON (default) or as a columnar ``.npy`` directory.
+
+        ``format="columnar"`` writes a columnar export (see ``columnar``) in
+        ``batch_size``-row batches. Returns the number of flows exported.
+        """
+        if format == "columnar":
+            count = export_flows_columnar(self.flows.values(), filepath, batch_size)
+        elif format == "json":
+            # One record at a time, never the whole table as a list of dicts
+            count = 0
+            with open(filepath, 'w') as f:
+                f.write("[")
+                for flow in self.flows.values():
+                    if count:
+                        f.write(",\n")
+                    json.dump(flow.to_dict(), f, default=str)
+                    count += 1
+                f.write("]\n")
+        else:
+            raise ValueError(f"Unknown export format {format!r}; expected 'json' or 'columnar'")
+        logger.info(f"Exported {count} flows to {filepath} ({format})")
+        return count
@@ -0,0 +1,331 @@
+"""Rolling in-memory ring of recent frames, dumped to pcap when a flow alerts.
+
+``PacketRing`` keeps the most recent raw frames in one preallocated byte
+arena plus fixed-size per-slot arrays (offset, length, timestamp, sequence
+number, flow key): recording a frame copies it into the arena and evicts the
+oldest frames it overwrites, without allocating per packet. Frames are
+truncated to ``snaplen`` and each flow may hold at most ``flow_limit``
+bytes, so a single bulk transfer cannot push every other flow out; a flow
+over its cap keeps its first frames (the handshake) and skips the rest.
+
+``AlertDumper`` takes dump requests from the analysis side and serves them
+on its own worker thread: it copies the flow's frames out of the ring
+(lock-free; a frame overwritten during the copy is detected through its
+sequence number and skipped) and appends them to a size-rotated pcap file.
+Frames already dumped for a flow are not written again when it alerts again.
+Each frame keeps the link type it was captured with; a pcap file holds one
+link type, so the writer starts a new file when it changes (e.g. between
+replays of Ethernet and Linux-cooked captures).
+"""
+import os
+import time
+import struct
+import logging
+from array import array
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+from .decoder import LINKTYPE_ETHERNET
+from ..pipeline import BoundedQueue, PipelineStage, OVERFLOW_DROP_NEWEST
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RING_BYTES = 64 * 1024 * 1024
+DEFAULT_RING_PACKETS = 131072
+DEFAULT_SNAPLEN = 2048
+DEFAULT_FLOW_LIMIT = 256 * 1024
+DEFAULT_PCAP_FILE_BYTES = 64 * 1024 * 1024
+DEFAULT_PCAP_FILES = 16
+# Flows remembered as already dumped (to append only newer frames on re-alerts)
+DUMPED_FLOWS = 10000
+
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+_PCAP_HEADER = struct.Struct("<IHHiIII")
+_PCAP_RECORD = struct.Struct("<IIII")
+
+# (sequence number, timestamp, original length, link type, frame bytes)
+RingPacket = Tuple[int, float, int, int, bytes]
+
+
+class PacketRing:
+    """Fixed-size ring of recent frames tagged with their flow key."""
+
+    def __init__(self, capacity: int = DEFAULT_RING_BYTES, max_packets: int = DEFAULT_RING_PACKETS,
+                 snaplen: int = DEFAULT_SNAPLEN, flow_limit: int = DEFAULT_FLOW_LIMIT):
+        self.capacity = capacity
+        self.max_packets = max_packets
+        self.snaplen = min(snaplen, capacity)
+        self.flow_limit = flow_limit
+        self._arena = bytearray(capacity)
+        self._view = memoryview(self._arena)
+        self._offsets = array("Q", bytes(8 * max_packets))
+        self._lengths = array("I", bytes(4 * max_packets))
+        self._orig_lengths = array("I", bytes(4 * max_packets))
+        self._timestamps = array("d", bytes(8 * max_packets))
+        self._linktypes = array("H", bytes(2 * max_packets))
+        # 0 = slot empty or being rewritten; otherwise the frame's sequence number
+        self._seqs = array("Q", bytes(8 * max_packets))
+        self._keys: List[Optional[tuple]] = [None] * max_packets
+        # flow key -> bytes of that flow currently held
+        self.flow_bytes: Dict[tuple, int] = {}
+        self._head = 0
+        self._tail = 0
+        self._count = 0
+        self._write = 0
+        self._bytes = 0
+
+        # Counters
+        self.seq = 0
+        self.recorded = 0
+        self.evicted = 0
+        self.flow_capped = 0
+        self.truncated = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def record(self, key: tuple, timestamp: float, frame, linktype: int = LINKTYPE_ETHERNET) -> bool:
+        """Copy one frame (with ``linktype`` framing) into the ring; False if the flow is over its byte cap."""
+        length = orig_length = len(frame)
+        if length > self.snaplen:
+            frame = memoryview(frame)[:self.snaplen]
+            length = self.snaplen
+            self.truncated += 1
+        flow_bytes = self.flow_bytes
+        held = flow_bytes.get(key, 0)
+        if held + length > self.flow_limit:
+            self.flow_capped += 1
+            return False
+
+        offsets = self._offsets
+        write = self._write
+        if write + length > self.capacity:
+            # Wrap: the oldest frames sit between here and the end of the arena
+            while self._count and offsets[self._tail] >= write:
+                self._evict()
+            write = 0
+        end = write + length
+        while self._count and (self._count == self.max_packets
+                               or write <= offsets[self._tail] < end):
+            self._evict()
+
+        slot = self._head
+        self._seqs[slot] = 0
+        self._view[write:end] = frame
+        offsets[slot] = write
+        self._lengths[slot] = length
+        self._orig_lengths[slot] = orig_length
+        self._timestamps[slot] = timestamp
+        self._linktypes[slot] = linktype
+        self._keys[slot] = key
+        self.seq += 1
+        self._seqs[slot] = self.seq
+        self._head = (slot + 1) % self.max_packets
+        self._count += 1
+        self._write = end
+        self._bytes += length
+        # Re-read: eviction above may have dropped older frames of this same flow
+        flow_bytes[key] = flow_bytes.get(key, 0) + length
+        self.recorded += 1
+        return True
+
+    def _evict(self):
+        slot = self._tail
+        key = self._keys[slot]
+        length = self._lengths[slot]
+        self._keys[slot] = None
+        self._seqs[slot] = 0
+        remaining = self.flow_bytes[key] - length
+        if remaining:
+            self.flow_bytes[key] = remaining
+        else:
+            del self.flow_bytes[key]
+        self._bytes -= length
+        self._tail = (slot + 1) % self.max_packets
+        self._count -= 1
+        self.evicted += 1
+
+    def snapshot(self, key: tuple, after_seq: int = 0) -> List[RingPacket]:
+        """Copy out the frames of flow ``key`` newer than ``after_seq``, oldest first.
+
+        Safe to call from another thread while ``record`` runs: frames
+        overwritten while being copied are left out.
+        """
+        if key not in self.flow_bytes:
+            return []
+        keys = self._keys
+        seqs = self._seqs
+        packets = []
+        for slot in [i for i, k in enumerate(keys) if k == key]:
+            seq = seqs[slot]
+            if seq <= after_seq:
+                continue
+            offset = self._offsets[slot]
+            packet = (seq, self._timestamps[slot], self._orig_lengths[slot], self._linktypes[slot],
+                      bytes(self._view[offset:offset + self._lengths[slot]]))
+            if seqs[slot] == seq and keys[slot] == key:
+                packets.append(packet)
+        packets.sort()
+        return packets
+
+    def get_stats(self) -> Dict:
+        """Return occupancy and record/evict counters."""
+        return {
+            "packets": self._count,
+            "bytes": self._bytes,
+            "capacity_bytes": self.capacity,
+            "max_packets": self.max_packets,
+            "flows": len(self.flow_bytes),
+            "recorded": self.recorded,
+            "evicted": self.evicted,
+            "flow_capped": self.flow_capped,
+            "truncated": self.truncated,
+        }
+
+
+class RotatingPcapWriter:
+    """Appends packets to ``<prefix>-<time>-<n>.pcap`` files, rotating by size and keeping the newest few.
+
+    ``linktype`` is the link type of the first file; packets of another link
+    type start a new file.
+    """
+
+    def __init__(self, directory: str, prefix: str = "sentinel-alerts", linktype: int = LINKTYPE_ETHERNET,
+                 snaplen: int = DEFAULT_SNAPLEN, max_file_bytes: int = DEFAULT_PCAP_FILE_BYTES,
+                 max_files: int = DEFAULT_PCAP_FILES):
+        self.directory = directory
+        self.prefix = prefix
+        self.linktype = linktype
+        self.snaplen = snaplen
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.files = deque()
+        self._file = None
+        self._size = 0
+        self._index = 0
+
+        # Counters
+        self.packets_written = 0
+        self.bytes_written = 0
+        self.rotations = 0
+
+    @property
+    def current_file(self) -> Optional[str]:
+        return self.files[-1] if self._file is not None else None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._index += 1
+        name = f"{self.prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{self._index:04d}.pcap"
+        path = os.path.join(self.directory, name)
+        self._file = open(path, "wb")
+        self._file.write(_PCAP_HEADER.pack(PCAP_MAGIC_USEC, 2, 4, 0, 0, self.snaplen, self.linktype))
+        self._size = _PCAP_HEADER.size
+        self.files.append(path)
+        while len(self.files) > self.max_files:
+            oldest = self.files.popleft()
+            try:
+                os.remove(oldest)
+            except OSError as e:
+                logger.warning(f"Could not remove rotated pcap {oldest}: {e}")
+
+    def write(self, packets: List[RingPacket]) -> Optional[str]:
+        """Write packets of one link type with one ``write`` call; returns the file they went to."""
+        if not packets:
+            return self.current_file
+        linktype = packets[0][3]
+        if self._file is None or self._size >= self.max_file_bytes or linktype != self.linktype:
+            if self._file is not None:
+                self._file.close()
+                self.rotations += 1
+            self.linktype = linktype
+            self._open()
+        chunks = []
+        pack = _PCAP_RECORD.pack
+        for _seq, timestamp, orig_length, _linktype, data in packets:
+            seconds = int(timestamp)
+            chunks.append(pack(seconds, int((timestamp - seconds) * 1e6), len(data), orig_length))
+            chunks.append(data)
+        blob = b"".join(chunks)
+        self._file.write(blob)
+        self._file.flush()
+        self._size += len(blob)
+        self.packets_written += len(packets)
+        self.bytes_written += len(blob)
+        return self.files[-1]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class AlertDumper:
+    """Writes alerted flows' buffered frames to rotating pcaps on a worker thread."""
+
+    def __init__(self, ring: PacketRing, writer: RotatingPcapWriter, queue_size: int = 1000):
+        self.ring = ring
+        self.writer = writer
+        self.queue = BoundedQueue("pcap_dump", queue_size, OVERFLOW_DROP_NEWEST)
+        self.stage = PipelineStage("pcap_dump", self.queue, self._dump_batch)
+        # flow key -> newest sequence number already written
+        self._dumped: "OrderedDict[tuple, int]" = OrderedDict()
+        self.recent = deque(maxlen=50)
+
+        # Counters
+        self.requests = 0
+        self.dumps = 0
+        self.empty = 0
+
+    def start(self) -> "AlertDumper":
+        self.stage.start()
+        return self
+
+    def close(self, timeout: Optional[float] = None):
+        self.queue.close()
+        self.stage.join(timeout)
+        self.writer.close()
+
+    def request(self, key: tuple, reason: str = "") -> bool:
+        """Ask for ``key``'s buffered frames to be dumped; never blocks the caller."""
+        self.requests += 1
+        return self.queue.put((key, reason))
+
+    def _dump_batch(self, batch: List):
+        # link type -> (packets, dump entries); one pcap write per link type
+        groups: Dict[int, Tuple[List[RingPacket], List[Dict]]] = {}
+        dumped = self._dumped
+        for key, reason in batch:
+            flow_packets = self.ring.snapshot(key, dumped.get(key, 0))
+            if not flow_packets:
+                self.empty += 1
+                continue
+            dumped[key] = flow_packets[-1][0]
+            dumped.move_to_end(key)
+            if len(dumped) > DUMPED_FLOWS:
+                dumped.popitem(last=False)
+            for packet in flow_packets:
+                groups.setdefault(packet[3], ([], []))[0].append(packet)
+            self.dumps += 1
+            groups[flow_packets[-1][3]][1].append({"flow": list(key), "packets": len(flow_packets), "reason": reason})
+        for packets, entries in groups.values():
+            path = self.writer.write(packets)
+            for entry in entries:
+                entry["file"] = path
+            self.recent.extend(entries)
+            logger.info(f"Dumped {len(packets)} packets of alerted flows to {path}")
+
+    def get_stats(self) -> Dict:
+        """Ring occupancy, dump counters and the most recent dumps."""
+        return {
+            "ring": self.ring.get_stats(),
+            "requests": self.requests,
+            "dumps": self.dumps,
+            "empty": self.empty,
+            "queue": self.queue.get_stats(),
+            "files": list(self.writer.files),
+            "packets_written": self.writer.packets_written,
+            "bytes_written": self.writer.bytes_written,
+            "rotations": self.writer.rotations,
+            "recent": list(self.recent)[-10:],
+        }
@@ -0,0 +1,324 @@
+"""QUIC v1 / v2 client Initial decryption for ClientHello (SNI, ALPN, JA4) extraction.
+
+Initial packets are protected with keys anyone can derive from the
+client's first Destination Connection ID (RFC 9001 section 5.2, RFC 9369
+for v2): HKDF-Extract with the version's salt, then HKDF-Expand-Label for
+the client key, IV and header protection key. ``QUICInitialTracker``
+removes header protection (AES-ECB mask over a ciphertext sample),
+decrypts the payload (AES-128-GCM), collects CRYPTO frames by offset
+across coalesced packets and datagrams, and hands the reassembled
+ClientHello to ``tls_parser.parse_handshake``.
+
+Derived keys are cached per (version, connection ID). A connection stops
+being parsed once its ClientHello is complete, or after
+``DEFAULT_MAX_DATAGRAMS`` client Initial datagrams without one.
+"""
+import hmac
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from .tls_crypto import hkdf_expand_label
+from .tls_parser import ClientHello, TLSParseError, parse_handshake
+
+logger = logging.getLogger(__name__)
+
+QUIC_V1 = 0x00000001
+QUIC_V2 = 0x6B3343CF
+
+# version -> (initial salt, key label, iv label, hp label, long-header type of Initial)
+_VERSIONS = {
+    QUIC_V1: (bytes.fromhex("38762cf7f55934b34d179ae6a4c80cadccbb7f0a"),
+              b"quic key", b"quic iv", b"quic hp", 0),
+    QUIC_V2: (bytes.fromhex("0dede3def700a6db819381be6e269dcbf9bd2ed9"),
+              b"quicv2 key", b"quicv2 iv", b"quicv2 hp", 1),
+}
+# Long-header packet type of Retry (no Length field: ends the datagram)
+_RETRY_TYPE = {QUIC_V1: 3, QUIC_V2: 0}
+
+# Clients pad every datagram carrying an Initial to at least this size
+MIN_INITIAL_DATAGRAM = 1200
+MAX_CONNECTION_ID = 20
+# CRYPTO bytes buffered per connection before giving up
+MAX_CRYPTO_BYTES = 64 * 1024
+DEFAULT_MAX_DATAGRAMS = 8
+DEFAULT_MAX_CONNECTIONS = 65536
+DEFAULT_KEY_CACHE_SIZE = 4096
+
+FRAME_PADDING = 0x00
+FRAME_PING = 0x01
+FRAME_ACK = 0x02
+FRAME_ACK_ECN = 0x03
+FRAME_CRYPTO = 0x06
+FRAME_CONNECTION_CLOSE = 0x1C
+
+
+class QUICParseError(ValueError):
+    """Raised for bytes that are not a decodable client Initial."""
+
+
+def is_long_header(payload) -> bool:
+    """Cheap pre-check: long header form and fixed bit set."""
+    return len(payload) > 0 and payload[0] & 0xC0 == 0xC0
+
+
+def read_varint(data, pos: int) -> Tuple[int, int]:
+    """QUIC variable-length integer at ``pos``; returns (value, next position)."""
+    if pos >= len(data):
+        raise QUICParseError("varint past end of packet")
+    first = data[pos]
+    length = 1 << (first >> 6)
+    if pos + length > len(data):
+        raise QUICParseError("varint past end of packet")
+    value = first & 0x3F
+    for i in range(1, length):
+        value = (value << 8) | data[pos + i]
+    return value, pos + length
+
+
+class InitialKeys:
+    """Client Initial AEAD, IV and header protection cipher of one connection ID."""
+    __slots__ = ("aead", "iv", "hp")
+
+    def __init__(self, version: int, dcid: bytes):
+        salt, key_label, iv_label, hp_label, _ = _VERSIONS[version]
+        initial_secret = hmac.digest(salt, dcid, "sha256")
+        client_secret = hkdf_expand_label(initial_secret, b"client in", b"", 32)
+        self.aead = AESGCM(hkdf_expand_label(client_secret, key_label, b"", 16))
+        self.iv = int.from_bytes(hkdf_expand_label(client_secret, iv_label, b"", 12), "big")
+        self.hp = Cipher(algorithms.AES(hkdf_expand_label(client_secret, hp_label, b"", 16)), modes.ECB())
+
+    def mask(self, sample: bytes) -> bytes:
+        encryptor = self.hp.encryptor()
+        return encryptor.update(sample) + encryptor.finalize()
+
+
+class _Connection:
+    """CRYPTO stream state of one flow's client Initials."""
+    __slots__ = ("version", "dcid", "fragments", "crypto_bytes", "datagrams", "done")
+
+    def __init__(self, version: int, dcid: bytes):
+        self.version = version
+        self.dcid = dcid
+        self.fragments: Dict[int, bytes] = {}
+        self.crypto_bytes = 0
+        self.datagrams = 0
+        self.done = False
+
+
+class QUICInitialTracker:
+    """Per-flow client Initial decryption until the ClientHello is complete."""
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 key_cache_size: int = DEFAULT_KEY_CACHE_SIZE, max_datagrams: int = DEFAULT_MAX_DATAGRAMS):
+        self.max_connections = max_connections
+        self.key_cache_size = key_cache_size
+        self.max_datagrams = max_datagrams
+        self.connections: "OrderedDict[tuple, _Connection]" = OrderedDict()
+        self._keys: "OrderedDict[Tuple[int, bytes], InitialKeys]" = OrderedDict()
+
+        # Counters
+        self.datagrams = 0
+        self.packets_decrypted = 0
+        self.decrypt_failures = 0
+        self.parse_errors = 0
+        self.hellos = 0
+        self.abandoned = 0
+        self.key_derivations = 0
+        self.key_cache_hits = 0
+
+    def keys(self, version: int, dcid: bytes) -> InitialKeys:
+        """Initial keys of a connection ID, derived once and kept in a bounded LRU."""
+        cache_key = (version, dcid)
+        keys = self._keys.get(cache_key)
+        if keys is not None:
+            self._keys.move_to_end(cache_key)
+            self.key_cache_hits += 1
+            return keys
+        keys = self._keys[cache_key] = InitialKeys(version, dcid)
+        self.key_derivations += 1
+        if len(self._keys) > self.key_cache_size:
+            self._keys.popitem(last=False)
+        return keys
+
+    def datagram(self, key: tuple, payload) -> Optional[ClientHello]:
+        """Feed one client->server UDP payload; returns the ClientHello once it is complete."""
+        connection = self.connections.get(key)
+        if connection is not None and connection.done:
+            return None
+        if len(payload) < MIN_INITIAL_DATAGRAM or not is_long_header(payload):
+            return None
+        self.datagrams += 1
+        data = bytes(payload)
+        try:
+            pos = 0
+            while pos < len(data) and is_long_header(data[pos:pos + 1]):
+                pos, connection = self._packet(key, data, pos, connection)
+                if connection is not None and connection.done:
+                    break
+        except QUICParseError as e:
+            self.parse_errors += 1
+            logger.debug(f"QUIC Initial parse error: {e}")
+        if connection is None:
+            return None
+        connection.datagrams += 1
+        hello = None if connection.done else self._client_hello(connection)
+        if hello is not None:
+            connection.done = True
+            connection.fragments = {}
+            self.hellos += 1
+        elif not connection.done and connection.datagrams >= self.max_datagrams:
+            connection.done = True
+            connection.fragments = {}
+            self.abandoned += 1
+        return hello
+
+    def _packet(self, key: tuple, data: bytes, pos: int, connection: Optional[_Connection]):
+        """Parse one long-header packet at ``pos``; returns (next packet position, connection)."""
+        start = pos
+        first = data[pos]
+        if len(data) < pos + 7:
+            raise QUICParseError("truncated long header")
+        version = int.from_bytes(data[pos + 1:pos + 5], "big")
+        params = _VERSIONS.get(version)
+        if params is None:
+            # Version negotiation or an unknown version: nothing we can decrypt
+            return len(data), connection
+        packet_type = (first >> 4) & 0x03
+        pos += 5
+        dcid_length = data[pos]
+        if dcid_length > MAX_CONNECTION_ID:
+            raise QUICParseError("connection ID too long")
+        dcid = data[pos + 1:pos + 1 + dcid_length]
+        pos += 1 + dcid_length
+        if pos >= len(data) or data[pos] > MAX_CONNECTION_ID:
+            raise QUICParseError("bad source connection ID")
+        pos += 1 + data[pos]
+        if packet_type == _RETRY_TYPE[version]:
+            return len(data), connection
+        if packet_type == params[4]:
+            token_length, pos = read_varint(data, pos)
+            pos += token_length
+        length, pos = read_varint(data, pos)
+        end = pos + length
+        if end > len(data) or length < 20:
+            raise QUICParseError("packet length past end of datagram")
+        if packet_type != params[4]:
+            # 0-RTT / Handshake packets coalesced after the Initial
+            return end, connection
+        if connection is None:
+            connection = _Connection(version, dcid)
+            self.connections[key] = connection
+            if len(self.connections) > self.max_connections:
+                self.connections.popitem(last=False)
+        plaintext = self._decrypt(connection, data, start, pos, end, dcid)
+        if plaintext is not None:
+            self._frames(connection, plaintext)
+        return end, connection
+
+    def _decrypt(self, connection: _Connection, data: bytes, start: int, pn_offset: int, end: int,
+                 dcid: bytes) -> Optional[bytes]:
+        """Remove header protection and decrypt one Initial; None if it does not authenticate."""
+        candidates = [connection.dcid]
+        if dcid != connection.dcid:
+            # After a Retry the client derives new Initial keys from the new connection ID
+            candidates.append(dcid)
+        for candidate in candidates:
+            keys = self.keys(connection.version, candidate)
+            mask = keys.mask(data[pn_offset + 4:pn_offset + 20])
+            first = data[start] ^ (mask[0] & 0x0F)
+            pn_length = (first & 0x03) + 1
+            packet_number = 0
+            for i in range(pn_length):
+                packet_number = (packet_number << 8) | (data[pn_offset + i] ^ mask[1 + i])
+            header = bytearray(data[start:pn_offset + pn_length])
+            header[0] = first
+            for i in range(pn_length):
+                header[pn_offset - start + i] = data[pn_offset + i] ^ mask[1 + i]
+            nonce = (keys.iv ^ packet_number).to_bytes(12, "big")
+            try:
+                plaintext = keys.aead.decrypt(nonce, data[pn_offset + pn_length:end], bytes(header))
+            except InvalidTag:
+                continue
+            connection.dcid = candidate
+            self.packets_decrypted += 1
+            return plaintext
+        self.decrypt_failures += 1
+        return None
+
+    def _frames(self, connection: _Connection, plaintext: bytes):
+        """Collect CRYPTO frames; stop at the first frame type an Initial should not carry."""
+        pos = 0
+        size = len(plaintext)
+        while pos < size:
+            frame_type = plaintext[pos]
+            pos += 1
+            if frame_type == FRAME_PADDING:
+                # Padding fills most of an Initial; skip the whole run at once
+                pos = size - len(plaintext[pos:].lstrip(b"\x00"))
+                continue
+            if frame_type == FRAME_PING:
+                continue
+            if frame_type == FRAME_CRYPTO:
+                offset, pos = read_varint(plaintext, pos)
+                length, pos = read_varint(plaintext, pos)
+                if pos + length > size:
+                    raise QUICParseError("CRYPTO frame past end of packet")
+                if connection.crypto_bytes + length > MAX_CRYPTO_BYTES:
+                    raise QUICParseError("too much CRYPTO data")
+                if length > len(connection.fragments.get(offset, b"")):
+                    connection.crypto_bytes += length
+                    connection.fragments[offset] = plaintext[pos:pos + length]
+                pos += length
+            elif frame_type in (FRAME_ACK, FRAME_ACK_ECN):
+                _, pos = read_varint(plaintext, pos)  # largest acknowledged
+                _, pos = read_varint(plaintext, pos)  # ack delay
+                ranges, pos = read_varint(plaintext, pos)
+                _, pos = read_varint(plaintext, pos)  # first range
+                for _ in range(2 * ranges + (3 if frame_type == FRAME_ACK_ECN else 0)):
+                    _, pos = read_varint(plaintext, pos)
+            elif frame_type == FRAME_CONNECTION_CLOSE:
+                return
+            else:
+                return
+
+    def _client_hello(self, connection: _Connection) -> Optional[ClientHello]:
+        """Parse the ClientHello once the CRYPTO stream from offset 0 covers it."""
+        fragments = connection.fragments
+        if 0 not in fragments:
+            return None
+        stream = bytearray()
+        for offset in sorted(fragments):
+            if offset > len(stream):
+                break
+            stream += fragments[offset][len(stream) - offset:]
+        if len(stream) < 4 or len(stream) < 4 + int.from_bytes(stream[1:4], "big"):
+            return None
+        try:
+            return parse_handshake(stream)
+        except TLSParseError as e:
+            self.parse_errors += 1
+            connection.done = True
+            logger.debug(f"QUIC ClientHello parse error: {e}")
+            return None
+
+    def close(self, key: tuple) -> None:
+        """Forget a flow (flow ended)."""
+        self.connections.pop(key, None)
+
+    def get_stats(self) -> Dict:
+        return {
+            "connections": len(self.connections),
+            "datagrams": self.datagrams,
+            "packets_decrypted": self.packets_decrypted,
+            "decrypt_failures": self.decrypt_failures,
+            "parse_errors": self.parse_errors,
+            "hellos": self.hellos,
+            "abandoned": self.abandoned,
+            "key_derivations": self.key_derivations,
+            "key_cache_hits": self.key_cache_hits,
+        }
@@ -0,0 +1,230 @@
+"""Bounded-memory TCP stream reassembly for handshake and request inspection.
+
+Only directions someone asked for are reassembled (``open``), and only until
+their consumer has seen enough: a consumer is called with the contiguous
+bytes of its direction every time they grow and returns True once it is done
+(e.g. a complete ClientHello or HTTP request head), at which point the
+buffers are released. A direction opened with ``streaming=True`` is instead
+handed only the bytes that arrived since the last call and keeps nothing
+once the consumer returns (it copies what it needs), so it can follow a
+whole connection, e.g. for decryption. Out-of-order segments are held in a small per-direction
+map; retransmissions and overlaps are trimmed against the next expected
+sequence number (modulo 2**32).
+
+Memory is capped per flow (both directions, in-order plus out-of-order bytes)
+and across all flows; a segment that would exceed a cap (or the
+out-of-order limit) is dropped and counted, and since a passive observer
+never sees it again, its direction is abandoned and its buffers released.
+"""
+import logging
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Per-flow buffered bytes (both directions) and total across all flows
+DEFAULT_FLOW_LIMIT = 64 * 1024
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+# Out-of-order segments held per direction
+DEFAULT_MAX_PENDING = 32
+
+# Stream directions: initiator -> responder and back
+CLIENT_TO_SERVER = 0
+SERVER_TO_CLIENT = 1
+
+_TCP_FIN = 0x01
+_TCP_SYN = 0x02
+_TCP_RST = 0x04
+
+# consumer(data) -> True when it has enough; ``data`` is only valid during the call
+StreamConsumer = Callable[[bytearray], bool]
+
+
+def _seq_delta(seq: int, expected: int) -> int:
+    """Signed distance of ``seq`` from ``expected`` in 32-bit sequence space."""
+    return ((seq - expected + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+class _Stream:
+    """One reassembled direction."""
+    __slots__ = ("consumer", "streaming", "next_seq", "data", "pending", "pending_bytes")
+
+    def __init__(self, consumer: StreamConsumer, streaming: bool = False):
+        self.consumer = consumer
+        self.streaming = streaming
+        self.next_seq: Optional[int] = None
+        self.data = bytearray()
+        self.pending: Dict[int, bytes] = {}
+        self.pending_bytes = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + self.pending_bytes
+
+
+class TCPReassembler:
+    """Reassembles selected TCP flow directions under per-flow and global memory caps."""
+
+    def __init__(self, flow_limit: int = DEFAULT_FLOW_LIMIT, memory_limit: int = DEFAULT_MEMORY_LIMIT,
+                 max_pending: int = DEFAULT_MAX_PENDING):
+        self.flow_limit = flow_limit
+        self.memory_limit = memory_limit
+        self.max_pending = max_pending
+        # flow key -> [client->server stream or None, server->client stream or None]
+        self.streams: Dict[tuple, list] = {}
+        self.memory = 0
+
+        # Counters
+        self.peak_memory = 0
+        self.segments = 0
+        self.bytes_reassembled = 0
+        self.out_of_order = 0
+        self.retransmitted = 0
+        self.completed = 0
+        self.abandoned = 0
+        self.dropped_segments = 0
+
+    def open(self, key, direction: int, consumer: StreamConsumer, streaming: bool = False) -> None:
+        """Start reassembling ``direction`` of flow ``key`` for ``consumer``."""
+        pair = self.streams.get(key)
+        if pair is None:
+            pair = self.streams[key] = [None, None]
+        if pair[direction] is None:
+            pair[direction] = _Stream(consumer, streaming)
+
+    def is_open(self, key, direction: int) -> bool:
+        pair = self.streams.get(key)
+        return pair is not None and pair[direction] is not None
+
+    def segment(self, key, direction: int, seq: int, flags: int, payload) -> None:
+        """Feed one TCP segment; a no-op unless that direction is being reassembled."""
+        pair = self.streams.get(key)
+        if pair is None:
+            return
+        stream = pair[direction]
+        if stream is None:
+            return
+        if flags & _TCP_SYN:
+            stream.next_seq = (seq + 1) & 0xFFFFFFFF
+            seq = stream.next_seq
+        if flags & _TCP_RST:
+            self.close(key)
+            return
+        if payload is not None and len(payload):
+            self.segments += 1
+            if stream.next_seq is None:
+                # Picked up mid-stream: the first data segment defines the start
+                stream.next_seq = seq
+            delta = _seq_delta(seq, stream.next_seq)
+            if delta > 0:
+                self._hold(key, pair, direction, stream, seq, delta, payload)
+            elif self._append(key, pair, direction, stream, payload, -delta):
+                self._drain(key, pair, direction, stream)
+                if pair[direction] is stream:
+                    if stream.consumer(stream.data):
+                        self.completed += 1
+                        self._release(key, pair, direction)
+                        return
+                    if stream.streaming:
+                        self.memory -= len(stream.data)
+                        stream.data.clear()
+        if flags & _TCP_FIN and pair[direction] is stream:
+            # No more data will come this way; the consumer never got enough
+            self._release(key, pair, direction)
+
+    def close(self, key) -> None:
+        """Drop all reassembly state of a flow (flow ended, RST)."""
+        pair = self.streams.pop(key, None)
+        if pair is None:
+            return
+        for stream in pair:
+            if stream is not None:
+                self.memory -= stream.size
+
+    def _append(self, key, pair, direction, stream, payload, skip: int) -> bool:
+        """Append in-order bytes (after trimming ``skip`` already-seen bytes)."""
+        length = len(payload) - skip
+        if length <= 0:
+            self.retransmitted += 1
+            return False
+        if skip:
+            self.retransmitted += 1
+        if not self._reserve(pair, length):
+            # A gap we can never fill: give up on this direction
+            self.abandoned += 1
+            self._release(key, pair, direction)
+            return False
+        stream.data += payload[skip:]
+        stream.next_seq = (stream.next_seq + length) & 0xFFFFFFFF
+        self.bytes_reassembled += length
+        return True
+
+    def _hold(self, key, pair, direction, stream, seq, delta, payload):
+        """Buffer an out-of-order segment (copied) until the gap before it fills."""
+        self.out_of_order += 1
+        length = len(payload)
+        previous = stream.pending.get(seq)
+        if previous is not None and len(previous) >= length:
+            # Same start seen twice: keep the longer copy
+            self.retransmitted += 1
+            return
+        if ((previous is None and len(stream.pending) >= self.max_pending) or delta + length > self.flow_limit
+                or not self._reserve(pair, length)):
+            # The receiver has this segment and will not see it again, so the gap is
+            # never filled: give up on this direction
+            self.dropped_segments += 1
+            self.abandoned += 1
+            self._release(key, pair, direction)
+            return
+        if previous is not None:
+            stream.pending_bytes -= len(previous)
+            self.memory -= len(previous)
+        stream.pending[seq] = bytes(payload)
+        stream.pending_bytes += length
+
+    def _drain(self, key, pair, direction, stream):
+        """Move buffered segments that are now contiguous onto the stream."""
+        pending = stream.pending
+        while pending and pair[direction] is stream:
+            for seq in pending:
+                delta = _seq_delta(seq, stream.next_seq)
+                if delta <= 0:
+                    break
+            else:
+                return
+            segment = pending.pop(seq)
+            stream.pending_bytes -= len(segment)
+            self.memory -= len(segment)
+            self._append(key, pair, direction, stream, segment, -delta)
+
+    def _reserve(self, pair, length: int) -> bool:
+        used = sum(s.size for s in pair if s is not None)
+        if used + length > self.flow_limit or self.memory + length > self.memory_limit:
+            return False
+        self.memory += length
+        if self.memory > self.peak_memory:
+            self.peak_memory = self.memory
+        return True
+
+    def _release(self, key, pair, direction):
+        stream = pair[direction]
+        self.memory -= stream.size
+        pair[direction] = None
+        if pair[0] is None and pair[1] is None:
+            self.streams.pop(key, None)
+
+    def get_stats(self) -> Dict:
+        """Return stream counts, memory use and reassembly counters."""
+        return {
+            "flows": len(self.streams),
+            "memory_bytes": self.memory,
+            "peak_memory_bytes": self.peak_memory,
+            "flow_limit": self.flow_limit,
+            "memory_limit": self.memory_limit,
+            "segments": self.segments,
+            "bytes_reassembled": self.bytes_reassembled,
+            "out_of_order": self.out_of_order,
+            "retransmitted": self.retransmitted,
+            "completed": self.completed,
+            "abandoned": self.abandoned,
+            "dropped_segments": self.dropped_segments,
+        }
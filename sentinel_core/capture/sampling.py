@@ -0,0 +1,149 @@
+"""Packet and flow sampling for graceful degradation under overload.
+
+Two modes, both keeping one in ``rate``:
+
+* ``packet``: deterministic 1-in-N over all packets. Kept packets count N
+  times in their flow's packet/byte counters, so per-flow totals stay
+  unbiased estimates and volume thresholds (e.g. ``bytes_sent > 50MB``)
+  keep their meaning.
+* ``flow``: a new flow is tracked only if its canonical key hashes into the
+  kept bucket; tracked flows see every packet, so their counters stay exact
+  and whole flows are kept or dropped together. Flows already in the table
+  when sampling switches on are never cut.
+
+With ``adaptive`` set, sampling switches itself on when the downstream
+queue fills past ``queue_high`` or the per-packet processing latency EWMA
+exceeds ``latency_high``, and off again below the ``*_low`` marks; a
+minimum hold time between switches avoids flapping.
+"""
+import time
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_PACKETS = "packet"
+SAMPLE_FLOWS = "flow"
+SAMPLING_MODES = (SAMPLE_PACKETS, SAMPLE_FLOWS)
+
+
+@dataclass
+class SamplingPolicy:
+    """How to sample and when to switch sampling on."""
+    mode: str = SAMPLE_FLOWS
+    # Keep one in `rate` packets / flows
+    rate: int = 10
+    # False: sample all the time; True: only while overloaded
+    adaptive: bool = True
+    # Downstream queue fill ratio (0..1) that switches sampling on / off
+    queue_high: float = 0.8
+    queue_low: float = 0.3
+    # Per-packet processing latency EWMA in seconds that switches sampling on / off
+    latency_high: float = 200e-6
+    latency_low: float = 50e-6
+    # Minimum seconds between switches
+    hold_time: float = 5.0
+    # Time one packet in this many for the latency EWMA
+    timing_interval: int = 64
+
+    def __post_init__(self):
+        if self.mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode {self.mode!r}; expected one of {SAMPLING_MODES}")
+        if self.rate < 1:
+            raise ValueError("Sampling rate must be >= 1")
+
+
+class Sampler:
+    """Applies a ``SamplingPolicy``; ``load_source()`` returns the downstream queue fill ratio."""
+
+    # Weight of a new latency sample in the EWMA
+    EWMA_ALPHA = 0.05
+
+    def __init__(self, policy: SamplingPolicy, load_source: Optional[Callable[[], float]] = None):
+        self.policy = policy
+        self.load_source = load_source
+        self.active = False
+        # Counter multiplier for kept packets (rate while packet sampling is active)
+        self.weight = 1
+        self.latency_ewma = 0.0
+        self._countdown = policy.timing_interval
+        self._packet_counter = 0
+        self._switched_at = float("-inf")
+
+        # Counters
+        self.sampled_out = 0
+        self.activations = 0
+        if not policy.adaptive:
+            self._switch(True)
+
+    def admit_packet(self) -> bool:
+        """Packet mode: True for one packet in ``rate`` while sampling is active."""
+        if not self.active or self.policy.mode != SAMPLE_PACKETS:
+            return True
+        self._packet_counter += 1
+        if self._packet_counter >= self.policy.rate:
+            self._packet_counter = 0
+            return True
+        self.sampled_out += 1
+        return False
+
+    def admit_flow(self, key) -> bool:
+        """Flow mode: whether a flow not yet in the table should be tracked."""
+        if not self.active or self.policy.mode != SAMPLE_FLOWS:
+            return True
+        if hash(key) % self.policy.rate == 0:
+            return True
+        self.sampled_out += 1
+        return False
+
+    def should_time(self) -> bool:
+        """True for one packet in ``timing_interval``; time it and call observe_latency()."""
+        self._countdown -= 1
+        if self._countdown:
+            return False
+        self._countdown = self.policy.timing_interval
+        return True
+
+    def observe_latency(self, seconds: float) -> None:
+        """Fold a per-packet processing time into the EWMA and re-evaluate the load."""
+        self.latency_ewma += self.EWMA_ALPHA * (seconds - self.latency_ewma)
+        self.update()
+
+    def update(self) -> None:
+        """Switch adaptive sampling on or off based on queue fill and latency."""
+        policy = self.policy
+        if not policy.adaptive:
+            return
+        now = time.monotonic()
+        if now - self._switched_at < policy.hold_time:
+            return
+        load = self.load_source() if self.load_source else 0.0
+        if not self.active:
+            if load >= policy.queue_high or self.latency_ewma >= policy.latency_high:
+                self._switch(True)
+                logger.warning(f"Overload (queue {load:.0%}, {self.latency_ewma * 1e6:.0f}us/packet): "
+                               f"{policy.mode} sampling 1-in-{policy.rate} on")
+        elif load <= policy.queue_low and self.latency_ewma <= policy.latency_low:
+            self._switch(False)
+            logger.warning(f"Load back to normal (queue {load:.0%}, "
+                           f"{self.latency_ewma * 1e6:.0f}us/packet): sampling off")
+
+    def _switch(self, active: bool) -> None:
+        self.active = active
+        self.weight = self.policy.rate if active and self.policy.mode == SAMPLE_PACKETS else 1
+        self._switched_at = time.monotonic()
+        if active:
+            self.activations += 1
+
+    def get_stats(self) -> Dict:
+        """Return the sampling state and counters."""
+        return {
+            "mode": self.policy.mode,
+            "rate": self.policy.rate,
+            "adaptive": self.policy.adaptive,
+            "active": self.active,
+            "activations": self.activations,
+            "sampled_out": self.sampled_out,
+            "latency_ewma_us": round(self.latency_ewma * 1e6, 2),
+        }
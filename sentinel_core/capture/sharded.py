@@ -0,0 +1,316 @@
+"""Multi-process capture sharded by canonical flow hash.
+
+Each worker process owns its own ``PacketCapture`` (flow table, emitter,
+TLS state) for a disjoint shard of flows. Two ways of feeding the shards:
+
+* ``fanout`` (Linux): every worker opens its own AF_PACKET socket joined to
+  one PACKET_FANOUT group in hash mode, so the kernel spreads frames over the
+  workers by a symmetric flow hash - both directions land in the same shard.
+* ``dispatcher`` (portable, also used for replay): the parent reads frames,
+  decodes the 5-tuple with the fast-path decoder and forwards batches of
+  frames to per-shard queues keyed by ``hash(canonical_flow_key)``.
+
+Workers hand their emitted flow record batches back over one result queue;
+a merge thread in the parent delivers them to a single ``batch_callback``.
+"""
+import os
+import time
+import queue
+import socket
+import logging
+import threading
+import multiprocessing
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .decoder import decode_frame, LINKTYPE_ETHERNET
+from .emitter import EmitPolicy
+
+logger = logging.getLogger(__name__)
+
+SHARD_MODE_DISPATCHER = "dispatcher"
+SHARD_MODE_FANOUT = "fanout"
+
+# Linux <linux/if_packet.h> constants (not all exported by the socket module)
+SOL_PACKET = 263
+PACKET_FANOUT = 18
+PACKET_FANOUT_HASH = 0
+PACKET_FANOUT_FLAG_DEFRAG = 0x8000
+ETH_P_ALL = 0x0003
+
+# Frames per queue message in dispatcher mode
+DISPATCH_BATCH = 256
+
+
+def _pin_cpu(shard_id: int, cpu: Optional[int]):
+    if cpu is None or not hasattr(os, "sched_setaffinity"):
+        return
+    try:
+        os.sched_setaffinity(0, {cpu})
+        logger.info(f"Shard {shard_id} pinned to CPU {cpu}")
+    except OSError as e:
+        logger.warning(f"Shard {shard_id}: could not pin to CPU {cpu}: {e}")
+
+
+def _shard_worker(shard_id: int, mode: str, interface: Optional[str], fanout_group: int,
+                  frame_queue, result_queue, stop_event, capture_kwargs: Dict,
+                  cpu: Optional[int]):
+    """Worker process entrypoint: run one PacketCapture over one shard of flows."""
+    # Imported here so the parent can shard without loading Scapy twice on spawn
+    from .live_capture import PacketCapture
+
+    _pin_cpu(shard_id, cpu)
+    capture = PacketCapture(interface=interface or f"shard-{shard_id}", batch_callback=result_queue.put,
+                            **capture_kwargs)
+    try:
+        if mode == SHARD_MODE_FANOUT:
+            _run_fanout(capture, interface, fanout_group, stop_event)
+        else:
+            _run_dispatched(capture, frame_queue)
+    except Exception as e:
+        logger.error(f"Shard {shard_id} capture error: {e}")
+    finally:
+        capture.flows.flush()
+        capture.emitter.flush()
+        capture.close()
+        result_queue.put(("__shard_done__", shard_id, capture.packet_count))
+
+
+def _run_dispatched(capture, frame_queue):
+    """Consume ``(linktype, [(timestamp, frame), ...])`` batches until a None sentinel."""
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            return
+        linktype, frames = item
+        capture.linktype = linktype
+        for timestamp, frame in frames:
+            capture.process_frame(frame, timestamp)
+
+
+def _run_fanout(capture, interface: str, fanout_group: int, stop_event):
+    """Read this shard's frames from an AF_PACKET socket in a hash fanout group."""
+    if capture.backend == "afpacket":
+        # Same fanout group, but frames are walked in place in a TPACKET_V3 ring
+        capture._sniff_ring(timeout=None, fanout_group=fanout_group, stop_event=stop_event)
+        return
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+    try:
+        capture._attach_filter(sock)
+        sock.bind((interface, 0))
+        fanout_arg = fanout_group | ((PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG) << 16)
+        sock.setsockopt(SOL_PACKET, PACKET_FANOUT, fanout_arg)
+        sock.settimeout(1.0)
+        buf = bytearray(65536)
+        view = memoryview(buf)
+        while not stop_event.is_set():
+            try:
+                length = sock.recv_into(buf)
+            except socket.timeout:
+                now = time.time()
+                capture.flows.expire(now)
+                capture.emitter.tick(now)
+                continue
+            capture.process_frame(view[:length], time.time())
+    finally:
+        sock.close()
+
+
+class ShardedCapture:
+    """Run N ``PacketCapture`` worker processes, each owning a disjoint flow shard.
+
+    ``cpus`` optionally pins worker ``i`` to ``cpus[i % len(cpus)]``.
+    ``capture_kwargs`` are passed to each worker's ``PacketCapture`` (they must
+    be picklable; callbacks are not - results arrive via ``batch_callback``).
+    """
+
+    def __init__(self, interface: Optional[str] = None, workers: int = 0,
+                 batch_callback: Optional[Callable[[List[Dict]], None]] = None,
+                 mode: str = SHARD_MODE_DISPATCHER,
+                 cpus: Optional[Sequence[int]] = None,
+                 capture_kwargs: Optional[Dict] = None,
+                 queue_size: int = 1024):
+        if mode not in (SHARD_MODE_DISPATCHER, SHARD_MODE_FANOUT):
+            raise ValueError(f"Unknown shard mode {mode!r}")
+        self.interface = interface
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_callback = batch_callback
+        self.mode = mode
+        self.cpus = list(cpus) if cpus else None
+        self.capture_kwargs = dict(capture_kwargs or {})
+        # Per-packet emission would flood the result queue; default to batched records
+        self.capture_kwargs.setdefault("emit_policy", EmitPolicy(batch_size=100))
+        self.queue_size = queue_size
+        self.fanout_group = os.getpid() & 0xFFFF
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._processes: List = []
+        self._frame_queues: List = []
+        self._result_queue = None
+        self._stop_event = None
+        self._merge_thread: Optional[threading.Thread] = None
+
+        # Counters
+        self.dispatched = [0] * self.workers
+        self.undecodable = 0
+        self.skipped = 0
+        self.shard_packets: Dict[int, int] = {}
+
+    def start(self):
+        """Spawn the worker processes and the merge thread."""
+        self._result_queue = self._ctx.Queue()
+        self._stop_event = self._ctx.Event()
+        for shard_id in range(self.workers):
+            frame_queue = self._ctx.Queue(self.queue_size) if self.mode == SHARD_MODE_DISPATCHER else None
+            cpu = self.cpus[shard_id % len(self.cpus)] if self.cpus else None
+            process = self._ctx.Process(
+                target=_shard_worker, name=f"sentinel-shard-{shard_id}", daemon=True,
+                args=(shard_id, self.mode, self.interface, self.fanout_group, frame_queue,
+                      self._result_queue, self._stop_event, self.capture_kwargs, cpu))
+            process.start()
+            self._processes.append(process)
+            self._frame_queues.append(frame_queue)
+        self._merge_thread = threading.Thread(target=self._merge, name="sentinel-shard-merge", daemon=True)
+        self._merge_thread.start()
+        logger.info(f"Started {self.workers} capture shards (mode={self.mode}, cpus={self.cpus})")
+
+    def _merge(self):
+        """Forward worker result batches to batch_callback until every shard is done."""
+        running = self.workers
+        while running:
+            try:
+                item = self._result_queue.get(timeout=0.5)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self._processes):
+                    break
+                continue
+            if isinstance(item, tuple) and item and item[0] == "__shard_done__":
+                _, shard_id, packets = item
+                self.shard_packets[shard_id] = packets
+                running -= 1
+                continue
+            if self.batch_callback:
+                try:
+                    self.batch_callback(item)
+                except Exception as e:
+                    logger.error(f"Shard merge callback error: {e}")
+
+    def dispatch(self, frames: Iterable[Tuple[float, int, bytes]]):
+        """Shard ``(timestamp, linktype, frame)`` records by canonical flow hash."""
+        workers = self.workers
+        pending: List[List] = [[] for _ in range(workers)]
+        pending_linktype = [LINKTYPE_ETHERNET] * workers
+        queues = self._frame_queues
+        for timestamp, linktype, frame in frames:
+            decoded = decode_frame(frame, linktype)
+            if decoded is None:
+                # Let shard 0's Scapy fallback deal with it
+                self.undecodable += 1
+                shard = 0
+            elif not decoded:
+                self.skipped += 1
+                continue
+            else:
+                src_ip, dst_ip, src_port, dst_port, protocol = decoded[:5]
+                # Order-independent hash so both directions reach the same shard
+                if src_ip < dst_ip or (src_ip == dst_ip and src_port <= dst_port):
+                    shard = hash((protocol, src_ip, src_port, dst_ip, dst_port)) % workers
+                else:
+                    shard = hash((protocol, dst_ip, dst_port, src_ip, src_port)) % workers
+            batch = pending[shard]
+            if batch and pending_linktype[shard] != linktype:
+                queues[shard].put((pending_linktype[shard], batch))
+                batch = pending[shard] = []
+            pending_linktype[shard] = linktype
+            batch.append((timestamp, bytes(frame)))
+            self.dispatched[shard] += 1
+            if len(batch) >= DISPATCH_BATCH:
+                queues[shard].put((linktype, batch))
+                pending[shard] = []
+        for shard, batch in enumerate(pending):
+            if batch:
+                queues[shard].put((pending_linktype[shard], batch))
+
+    def sniff(self, timeout: Optional[float] = None):
+        """Capture live traffic until ``timeout`` (or forever) and wait for the shards."""
+        if self.mode == SHARD_MODE_FANOUT:
+            # The kernel does the sharding; just wait
+            self._stop_event.wait(timeout)
+        else:
+            self.dispatch(self._iter_live_frames(timeout))
+        self.stop()
+
+    def replay(self, filepath: str):
+        """Shard a pcap/pcapng file over the workers (dispatcher mode only)."""
+        from .replay import iter_capture_file
+        if self.mode != SHARD_MODE_DISPATCHER:
+            raise ValueError("Replay requires dispatcher mode")
+        self.dispatch(iter_capture_file(filepath))
+        self.stop()
+
+    def _iter_live_frames(self, timeout: Optional[float]):
+        """Yield raw frames from a Scapy L2 socket without dissecting them."""
+        from scapy.all import conf
+        import select
+
+        sock = conf.L2listen(iface=self.interface)
+        deadline = time.time() + timeout if timeout else None
+        ethernet = conf.l2types.get(LINKTYPE_ETHERNET)
+        try:
+            capture_filter = self.capture_kwargs.get("capture_filter")
+            if capture_filter is not None:
+                capture_filter.attach(sock.ins, LINKTYPE_ETHERNET)
+            while not self._stop_event.is_set():
+                if deadline and time.time() >= deadline:
+                    return
+                ready, _, _ = select.select([sock], [], [], 1.0)
+                if not ready:
+                    continue
+                cls, frame, ts = sock.recv_raw()
+                if frame is None:
+                    continue
+                linktype = LINKTYPE_ETHERNET if cls is ethernet else conf.l2types.layer2num.get(cls, LINKTYPE_ETHERNET)
+                yield ts or time.time(), linktype, frame
+        finally:
+            sock.close()
+
+    def stop(self):
+        """Signal the workers to finish, then wait for them and the merge thread."""
+        if self._stop_event is not None:
+            self._stop_event.set()
+        for frame_queue in self._frame_queues:
+            if frame_queue is not None:
+                frame_queue.put(None)
+        for process in self._processes:
+            process.join()
+        if self._merge_thread:
+            self._merge_thread.join()
+        logger.info(f"Capture shards stopped: {self.get_stats()}")
+
+    def get_stats(self) -> Dict:
+        """Return per-shard dispatch counters and worker packet totals."""
+        return {
+            "workers": self.workers,
+            "mode": self.mode,
+            "dispatched": list(self.dispatched),
+            "undecodable": self.undecodable,
+            "skipped": self.skipped,
+            "shard_packets": dict(self.shard_packets),
+        }
+
+
+def parse_cpu_list(value: Optional[str], workers: int) -> Optional[List[int]]:
+    """Parse SENTINEL_CAPTURE_CPUS: "auto" (first N usable CPUs) or "2,3,6-9"."""
+    if not value:
+        return None
+    if value == "auto":
+        usable = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        return usable[:workers]
+    cpus = []
+    for part in value.split(","):
+        part = part.strip()
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            cpus.extend(range(int(lo), int(hi) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
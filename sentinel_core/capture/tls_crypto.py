@@ -0,0 +1,161 @@
+"""TLS 1.2 / 1.3 traffic key derivation and AEAD record decryption.
+
+Keys come from SSLKEYLOGFILE secrets: the TLS 1.2 master secret
+(``CLIENT_RANDOM``) is expanded with the PRF (RFC 5246 section 6.3), TLS
+1.3 traffic secrets with HKDF-Expand-Label (RFC 8446 section 7.1). Only
+AEAD cipher suites are supported (AES-GCM, ChaCha20-Poly1305 and, for TLS
+1.3, AES-CCM); the AEAD primitives come from ``cryptography``.
+"""
+import hmac
+import struct
+import hashlib
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESCCM, AESGCM, ChaCha20Poly1305
+
+TLS12 = 0x0303
+TLS13 = 0x0304
+
+CONTENT_CHANGE_CIPHER_SPEC = 20
+CONTENT_ALERT = 21
+CONTENT_HANDSHAKE = 22
+CONTENT_APPLICATION_DATA = 23
+
+AEAD_TAG_LENGTH = 16
+TLS12_EXPLICIT_NONCE_LENGTH = 8
+
+_AEADS = {"AES-GCM": AESGCM, "CHACHA20-POLY1305": ChaCha20Poly1305, "AES-CCM": AESCCM}
+
+
+class CipherSuite(NamedTuple):
+    """AEAD parameters of a cipher suite; ``iv_length`` is the TLS 1.2 fixed IV or the TLS 1.3 IV."""
+    name: str
+    version: int
+    aead: str
+    key_length: int
+    iv_length: int
+    hash_name: str
+
+
+CIPHER_SUITES: Dict[int, CipherSuite] = {
+    0x1301: CipherSuite("TLS_AES_128_GCM_SHA256", TLS13, "AES-GCM", 16, 12, "sha256"),
+    0x1302: CipherSuite("TLS_AES_256_GCM_SHA384", TLS13, "AES-GCM", 32, 12, "sha384"),
+    0x1303: CipherSuite("TLS_CHACHA20_POLY1305_SHA256", TLS13, "CHACHA20-POLY1305", 32, 12, "sha256"),
+    0x1304: CipherSuite("TLS_AES_128_CCM_SHA256", TLS13, "AES-CCM", 16, 12, "sha256"),
+    0x009C: CipherSuite("TLS_RSA_WITH_AES_128_GCM_SHA256", TLS12, "AES-GCM", 16, 4, "sha256"),
+    0x009D: CipherSuite("TLS_RSA_WITH_AES_256_GCM_SHA384", TLS12, "AES-GCM", 32, 4, "sha384"),
+    0x009E: CipherSuite("TLS_DHE_RSA_WITH_AES_128_GCM_SHA256", TLS12, "AES-GCM", 16, 4, "sha256"),
+    0x009F: CipherSuite("TLS_DHE_RSA_WITH_AES_256_GCM_SHA384", TLS12, "AES-GCM", 32, 4, "sha384"),
+    0xC02B: CipherSuite("TLS_ECDHE_ECDSA_WITH_AES_128_GCM_SHA256", TLS12, "AES-GCM", 16, 4, "sha256"),
+    0xC02C: CipherSuite("TLS_ECDHE_ECDSA_WITH_AES_256_GCM_SHA384", TLS12, "AES-GCM", 32, 4, "sha384"),
+    0xC02F: CipherSuite("TLS_ECDHE_RSA_WITH_AES_128_GCM_SHA256", TLS12, "AES-GCM", 16, 4, "sha256"),
+    0xC030: CipherSuite("TLS_ECDHE_RSA_WITH_AES_256_GCM_SHA384", TLS12, "AES-GCM", 32, 4, "sha384"),
+    0xCCA8: CipherSuite("TLS_ECDHE_RSA_WITH_CHACHA20_POLY1305_SHA256", TLS12, "CHACHA20-POLY1305", 32, 12, "sha256"),
+    0xCCA9: CipherSuite("TLS_ECDHE_ECDSA_WITH_CHACHA20_POLY1305_SHA256", TLS12, "CHACHA20-POLY1305", 32, 12,
+                        "sha256"),
+    0xCCAA: CipherSuite("TLS_DHE_RSA_WITH_CHACHA20_POLY1305_SHA256", TLS12, "CHACHA20-POLY1305", 32, 12, "sha256"),
+}
+
+_pack_aad12 = struct.Struct("!QBHH").pack
+
+
+def tls12_prf(secret: bytes, label: bytes, seed: bytes, length: int, hash_name: str = "sha256") -> bytes:
+    """TLS 1.2 PRF: P_hash(secret, label + seed) truncated to ``length``."""
+    seed = label + seed
+    out = bytearray()
+    a = seed
+    while len(out) < length:
+        a = hmac.digest(secret, a, hash_name)
+        out += hmac.digest(secret, a + seed, hash_name)
+    return bytes(out[:length])
+
+
+def hkdf_expand_label(secret: bytes, label: bytes, context: bytes, length: int, hash_name: str = "sha256") -> bytes:
+    """TLS 1.3 HKDF-Expand-Label."""
+    full_label = b"tls13 " + label
+    info = struct.pack("!HB", length, len(full_label)) + full_label + bytes((len(context),)) + context
+    out = bytearray()
+    block = b""
+    counter = 1
+    while len(out) < length:
+        block = hmac.digest(secret, block + info + bytes((counter,)), hash_name)
+        out += block
+        counter += 1
+    return bytes(out[:length])
+
+
+def tls12_key_block(suite: CipherSuite, master_secret: bytes, client_random: bytes,
+                    server_random: bytes) -> Tuple[Tuple[bytes, bytes], Tuple[bytes, bytes]]:
+    """((client key, client IV), (server key, server IV)) for an AEAD suite (no MAC keys)."""
+    key_length, iv_length = suite.key_length, suite.iv_length
+    block = tls12_prf(master_secret, b"key expansion", server_random + client_random,
+                      2 * (key_length + iv_length), suite.hash_name)
+    client_key = block[:key_length]
+    server_key = block[key_length:2 * key_length]
+    client_iv = block[2 * key_length:2 * key_length + iv_length]
+    server_iv = block[2 * key_length + iv_length:]
+    return (client_key, client_iv), (server_key, server_iv)
+
+
+def tls13_traffic_keys(suite: CipherSuite, secret: bytes) -> Tuple[bytes, bytes]:
+    """(key, IV) of a TLS 1.3 traffic secret."""
+    return (hkdf_expand_label(secret, b"key", b"", suite.key_length, suite.hash_name),
+            hkdf_expand_label(secret, b"iv", b"", suite.iv_length, suite.hash_name))
+
+
+def tls13_next_secret(suite: CipherSuite, secret: bytes) -> bytes:
+    """Application traffic secret after a KeyUpdate."""
+    return hkdf_expand_label(secret, b"traffic upd", b"", hashlib.new(suite.hash_name).digest_size,
+                             suite.hash_name)
+
+
+class RecordDecryptor:
+    """Decrypts one direction's records under one key, tracking the record sequence number."""
+    __slots__ = ("suite", "aead", "iv", "seq", "_iv_int")
+
+    def __init__(self, suite: CipherSuite, key: bytes, iv: bytes):
+        self.suite = suite
+        self.aead = _AEADS[suite.aead](key)
+        self.iv = iv
+        self.seq = 0
+        self._iv_int = int.from_bytes(iv, "big") if len(iv) == 12 else 0
+
+    def _xor_nonce(self, seq: int) -> bytes:
+        return (self._iv_int ^ seq).to_bytes(12, "big")
+
+    def decrypt(self, content_type: int, version: int, body: bytes) -> Optional[Tuple[int, bytes]]:
+        """Decrypt a record body; (content type, plaintext), or None if it does not authenticate.
+
+        The sequence number only advances on success, so a failed record can
+        be retried under another key.
+        """
+        seq = self.seq
+        try:
+            if self.suite.version == TLS13:
+                header = struct.pack("!BHH", content_type, version, len(body))
+                inner = self.aead.decrypt(self._xor_nonce(seq), body, header)
+                # TLSInnerPlaintext: content, real type, zero padding
+                end = len(inner)
+                while end and not inner[end - 1]:
+                    end -= 1
+                if not end:
+                    return None
+                result = inner[end - 1], inner[:end - 1]
+            elif self.suite.aead == "AES-GCM":
+                if len(body) < TLS12_EXPLICIT_NONCE_LENGTH + AEAD_TAG_LENGTH:
+                    return None
+                length = len(body) - TLS12_EXPLICIT_NONCE_LENGTH - AEAD_TAG_LENGTH
+                nonce = self.iv + body[:TLS12_EXPLICIT_NONCE_LENGTH]
+                plaintext = self.aead.decrypt(nonce, body[TLS12_EXPLICIT_NONCE_LENGTH:],
+                                              _pack_aad12(seq, content_type, version, length))
+                result = content_type, plaintext
+            else:
+                if len(body) < AEAD_TAG_LENGTH:
+                    return None
+                aad = _pack_aad12(seq, content_type, version, len(body) - AEAD_TAG_LENGTH)
+                result = content_type, self.aead.decrypt(self._xor_nonce(seq), body, aad)
+        except InvalidTag:
+            return None
+        self.seq = seq + 1
+        return result
@@ -9,13 +9,16 @@ This module provides:
 """
 
 import os
-import re
 import json
 import logging
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 from dataclasses import dataclass, asdict
-from datetime import datetime
+
+from .tls_parser import parse_client_hello, TLSParseError
+from .keylog import (
+    KeyStore, KeyLogFollower, DEFAULT_MAX_SESSIONS, DEFAULT_TTL, DEFAULT_POLL_INTERVAL
+)
 
 logger = logging.getLogger(__name__)
 
@@ -26,71 +29,86 @@ class TLSKeyLogEntry:
     label: str  # CLIENT_RANDOM, SERVER_HANDSHAKE_TRAFFIC_SECRET, etc.
     client_random: str
     secret: str
-    timestamp: str
 
 
 class SSLKeyLogParser:
-    """Parse SSLKEYLOG file for TLS session keys."""
-    
-    # Format: CLIENT_RANDOM <hex> <hex>
-    # or: SERVER_HANDSHAKE_TRAFFIC_SECRET <hex> <hex>
-    SSLKEYLOG_PATTERN = re.compile(
-        r'^([A-Z_]+)\s+([a-f0-9]+)\s+([a-f0-9]+)$',
-        re.IGNORECASE
-    )
+    """Parse (and optionally follow) an SSLKEYLOG file for TLS session keys.
+
+    Keys live in a bounded ``KeyStore`` keyed by binary client random; with
+    ``follow=True`` a ``KeyLogFollower`` thread ingests lines as they are
+    appended.
+    """
     
-    def __init__(self, filepath: Optional[str] = None):
+    def __init__(self, filepath: Optional[str] = None, follow: bool = False,
+                 max_sessions: int = DEFAULT_MAX_SESSIONS, ttl: float = DEFAULT_TTL,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL):
         """Initialize parser with optional SSLKEYLOG file path."""
         self.filepath = filepath or os.getenv('SSLKEYLOGFILE')
-        self.entries: List[TLSKeyLogEntry] = []
-        self.keys_by_client_random: Dict[str, str] = {}
+        self.store = KeyStore(max_sessions=max_sessions, ttl=ttl)
+        self.follower: Optional[KeyLogFollower] = None
         
-        if self.filepath and os.path.exists(self.filepath):
-            self.parse()
+        if self.filepath:
+            self.follower = KeyLogFollower(self.filepath, self.store, poll_interval=poll_interval)
+            if follow:
+                self.follower.start()
+                logger.info(f"Following {self.filepath} ({self.follower.mode}): {len(self.store)} TLS sessions")
+            elif os.path.exists(self.filepath):
+                self.parse()
     
     def parse(self):
-        """Parse SSLKEYLOG file."""
-        if not self.filepath or not os.path.exists(self.filepath):
+        """Read lines added to the SSLKEYLOG file since the last parse."""
+        if not self.follower or not os.path.exists(self.filepath):
             logger.warning(f"SSLKEYLOG file not found: {self.filepath}")
             return
         
         try:
-            with open(self.filepath, 'r') as f:
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if not line or line.startswith('#'):
-                        continue
-                    
-                    match = self.SSLKEYLOG_PATTERN.match(line)
-                    if match:
-                        label, client_random, secret = match.groups()
-                        entry = TLSKeyLogEntry(
-                            label=label,
-                            client_random=client_random.lower(),
-                            secret=secret,
-                            timestamp=datetime.utcnow().isoformat()
-                        )
-                        self.entries.append(entry)
-                        self.keys_by_client_random[client_random.lower()] = secret
-                    else:
-                        logger.debug(f"Skipped malformed line {line_num}: {line}")
-            
-            logger.info(f"Parsed {len(self.entries)} TLS keys from {self.filepath}")
-        except Exception as e:
+            keys = self.follower.poll()
+            logger.info(f"Parsed {keys} TLS keys from {self.filepath}")
+        except OSError as e:
             logger.error(f"Error parsing SSLKEYLOG: {e}")
     
+    @property
+    def entries(self) -> List[TLSKeyLogEntry]:
+        """Stored keys as entries (built on demand)."""
+        return [TLSKeyLogEntry(label, client_random.hex(), secret.hex())
+                for client_random, secrets in self.store.items()
+                for label, secret in secrets.items()]
+    
+    def get_secrets(self, client_random: bytes) -> Optional[Dict[str, bytes]]:
+        """All secrets logged for a handshake, keyed by label; cheap enough for the capture path."""
+        return self.store.get(client_random)
+    
     def get_secret_for_client_random(self, client_random: str) -> Optional[str]:
-        """Lookup TLS secret by CLIENT_RANDOM."""
-        return self.keys_by_client_random.get(client_random.lower())
+        """Lookup TLS secret by CLIENT_RANDOM (hex); the TLS 1.2 master secret if logged."""
+        try:
+            secrets = self.store.get(bytes.fromhex(client_random))
+        except ValueError:
+            return None
+        if not secrets:
+            return None
+        secret = secrets.get("CLIENT_RANDOM") or next(iter(secrets.values()))
+        return secret.hex()
+    
+    def close(self):
+        if self.follower is not None:
+            self.follower.stop()
+    
+    def get_stats(self) -> Dict:
+        if self.follower is not None:
+            return self.follower.get_stats()
+        return {"path": None, "store": self.store.get_stats()}
     
     def export_for_wireshark(self, output_path: str):
         """Export keys in Wireshark-compatible format."""
+        count = 0
         with open(output_path, 'w') as f:
             f.write("# SSLKEYLOGFILE export for Wireshark\n")
             f.write("# Generated by Sentinel\n")
-            for entry in self.entries:
-                f.write(f"{entry.label} {entry.client_random} {entry.secret}\n")
-        logger.info(f"Exported {len(self.entries)} keys to {output_path}")
+            for client_random, secrets in self.store.items():
+                for label, secret in secrets.items():
+                    f.write(f"{label} {client_random.hex()} {secret.hex()}\n")
+                    count += 1
+        logger.info(f"Exported {count} keys to {output_path}")
 
 
 class TLSPacketInspector:
@@ -134,24 +152,9 @@ class TLSPacketInspector:
     def extract_sni(payload: bytes) -> Optional[str]:
         """Extract SNI (Server Name Indication) from CLIENT_HELLO."""
         try:
-            # Skip TLS record header (5 bytes) + handshake header (4 bytes)
-            if len(payload) < 50:
-                return None
-            
-            # Look for SNI extension (0x0000)
-            sni_pattern = b'\x00\x00'  # SNI extension type
-            idx = payload.find(sni_pattern)
-            
-            if idx > 0 and idx + 10 < len(payload):
-                # SNI format: type(2) + length(2) + list_length(2) + name_type(1) + name_length(2) + name
-                name_start = idx + 9
-                name_length = int.from_bytes(payload[idx+7:idx+9], 'big')
-                if name_start + name_length <= len(payload):
-                    sni = payload[name_start:name_start+name_length].decode('utf-8', errors='ignore')
-                    return sni
-        except Exception as e:
+            return parse_client_hello(payload).sni
+        except TLSParseError as e:
             logger.debug(f"SNI extraction error: {e}")
-        
         return None
     
     @staticmethod
@@ -359,17 +362,20 @@ class TLSDecryptionPipeline:
     def analyze_tls_handshake(self, packet_bytes: bytes) -> Dict:
         """Analyze TLS handshake packet."""
         result = {
-            "tls_version": self.tls_inspector.extract_tls_version(packet_bytes),
-            "sni": self.tls_inspector.extract_sni(packet_bytes),
-            "has_keylog": False,
+            "tls_version": None,
+            "sni": None,
+            "has_keylog": bool(self.keylog_parser.filepath),
             "decryptable": False
         }
-        
-        # Check if we have keys for this session
-        if result.get("sni"):
-            # In real scenario, would use CLIENT_RANDOM from packet
-            result["decryptable"] = True
-        
+        try:
+            hello = parse_client_hello(packet_bytes)
+        except TLSParseError as e:
+            logger.debug(f"TLS handshake parse error: {e}")
+            return result
+        result["tls_version"] = hello.version_name
+        result["sni"] = hello.sni
+        # Decryptable only if the key log holds secrets for this handshake's client random
+        result["decryptable"] = self.keylog_parser.get_secrets(hello.random) is not None
         return result
     
     def setup_wireshark(self, pcap_path: str):
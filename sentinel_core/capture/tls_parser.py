@@ -0,0 +1,354 @@
+"""Single-pass TLS ClientHello parser with JA3 / JA4 fingerprints.
+
+``parse_client_hello`` walks the TLS record header, the handshake header and
+every ClientHello field and extension exactly once over a ``memoryview``,
+bounds-checking each length against its enclosing structure. Only the
+values we keep (SNI, ALPN strings, the random) are copied out.
+
+Truncated input raises ``TLSIncomplete`` (the caller should wait for more
+stream bytes); anything malformed raises ``TLSParseError``. A ClientHello
+that spans several handshake records is supported; its fragments are joined
+before parsing.
+
+Fingerprints follow the published definitions: JA3 is the MD5 of
+``version,ciphers,extensions,groups,point_formats`` (decimal, GREASE
+removed); JA4 is ``<proto><version><sni><#ciphers><#exts><alpn>_<sha256 of
+sorted ciphers>_<sha256 of sorted extensions _ signature algorithms>``.
+"""
+import hashlib
+import struct
+from typing import List, Optional, Tuple
+
+TLS_HANDSHAKE = 0x16
+HANDSHAKE_CLIENT_HELLO = 0x01
+HANDSHAKE_SERVER_HELLO = 0x02
+# ServerHello.random of a HelloRetryRequest (RFC 8446 section 4.1.3)
+HELLO_RETRY_REQUEST_RANDOM = bytes.fromhex("cf21ad74e59a6111be1d8c021e65b891c2a211167abb8c5e079e09e2c8a8339c")
+
+EXT_SERVER_NAME = 0x0000
+EXT_SUPPORTED_GROUPS = 0x000A
+EXT_EC_POINT_FORMATS = 0x000B
+EXT_SIGNATURE_ALGORITHMS = 0x000D
+EXT_ALPN = 0x0010
+EXT_SUPPORTED_VERSIONS = 0x002B
+
+TLS_VERSION_NAMES = {
+    0x0300: "SSL 3.0",
+    0x0301: "TLS 1.0",
+    0x0302: "TLS 1.1",
+    0x0303: "TLS 1.2",
+    0x0304: "TLS 1.3",
+}
+
+# JA4 version field
+_JA4_VERSIONS = {
+    0x0304: "13", 0x0303: "12", 0x0302: "11", 0x0301: "10", 0x0300: "s3", 0x0002: "s2",
+    0xFEFF: "d1", 0xFEFD: "d2", 0xFEFC: "d3",
+}
+_JA4_EMPTY_HASH = "000000000000"
+
+_unpack_u16 = struct.Struct("!H").unpack_from
+_unpack_record = struct.Struct("!BHH").unpack_from
+
+
+class TLSParseError(ValueError):
+    """Raised for bytes that are not a well-formed ClientHello."""
+
+
+class TLSIncomplete(TLSParseError):
+    """Raised when the bytes end before the ClientHello does."""
+
+
+def is_grease(value: int) -> bool:
+    """GREASE values (RFC 8701): 0x0a0a, 0x1a1a, ..., 0xfafa."""
+    return value & 0x0F0F == 0x0A0A and value >> 8 == value & 0xFF
+
+
+class ClientHello:
+    """Fields of a parsed ClientHello; lists keep wire order and include GREASE values."""
+    __slots__ = (
+        "record_version", "legacy_version", "random", "session_id_length", "cipher_suites",
+        "compression_methods", "extensions", "sni", "alpn", "supported_versions",
+        "supported_groups", "ec_point_formats", "signature_algorithms",
+    )
+
+    def __init__(self):
+        self.record_version = 0
+        self.legacy_version = 0
+        self.random = b""
+        self.session_id_length = 0
+        self.cipher_suites: List[int] = []
+        self.compression_methods = b""
+        self.extensions: List[int] = []
+        self.sni: Optional[str] = None
+        self.alpn: List[str] = []
+        self.supported_versions: List[int] = []
+        self.supported_groups: List[int] = []
+        self.ec_point_formats: List[int] = []
+        self.signature_algorithms: List[int] = []
+
+    @property
+    def version(self) -> int:
+        """Highest non-GREASE supported_versions entry, else the legacy client_version."""
+        versions = [v for v in self.supported_versions if not is_grease(v)]
+        return max(versions) if versions else self.legacy_version
+
+    @property
+    def version_name(self) -> str:
+        version = self.version
+        return TLS_VERSION_NAMES.get(version, f"Unknown (0x{version:04x})")
+
+    @property
+    def client_random(self) -> str:
+        """Hex client random, the key into an SSLKEYLOG file."""
+        return self.random.hex()
+
+    def ja3_string(self) -> str:
+        def join(values):
+            return "-".join(str(v) for v in values if not is_grease(v))
+        return ",".join((str(self.legacy_version), join(self.cipher_suites), join(self.extensions),
+                         join(self.supported_groups), join(self.ec_point_formats)))
+
+    def ja3(self) -> str:
+        return hashlib.md5(self.ja3_string().encode("ascii")).hexdigest()
+
+    def ja4(self, transport: str = "t") -> str:
+        """JA4 fingerprint; ``transport`` is "t" (TCP), "q" (QUIC) or "d" (DTLS)."""
+        ciphers = [c for c in self.cipher_suites if not is_grease(c)]
+        extensions = [e for e in self.extensions if not is_grease(e)]
+        if self.alpn:
+            first = self.alpn[0]
+            if first and first[0].isascii() and first[0].isalnum() and first[-1].isascii() and first[-1].isalnum():
+                alpn = first[0] + first[-1]
+            else:
+                raw = first.encode("utf-8", "surrogateescape").hex() or "00"
+                alpn = raw[0] + raw[-1]
+        else:
+            alpn = "00"
+        ja4_a = (f"{transport}{_JA4_VERSIONS.get(self.version, '00')}{'d' if self.sni else 'i'}"
+                 f"{min(len(ciphers), 99):02d}{min(len(extensions), 99):02d}{alpn}")
+        ja4_b = _truncated_sha256(",".join(f"{c:04x}" for c in sorted(ciphers)))
+        hashed_extensions = ",".join(f"{e:04x}" for e in sorted(extensions)
+                                     if e not in (EXT_SERVER_NAME, EXT_ALPN))
+        signatures = ",".join(f"{s:04x}" for s in self.signature_algorithms if not is_grease(s))
+        ja4_c = _truncated_sha256(f"{hashed_extensions}_{signatures}" if signatures else hashed_extensions)
+        return f"{ja4_a}_{ja4_b}_{ja4_c}"
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version_name,
+            "sni": self.sni,
+            "alpn": self.alpn,
+            "cipher_suites": self.cipher_suites,
+            "extensions": self.extensions,
+            "supported_versions": self.supported_versions,
+            "ja3": self.ja3(),
+            "ja4": self.ja4(),
+        }
+
+
+class ServerHello:
+    """The ServerHello fields needed to pick the session's keys."""
+    __slots__ = ("legacy_version", "random", "cipher_suite", "extensions", "selected_version")
+
+    def __init__(self):
+        self.legacy_version = 0
+        self.random = b""
+        self.cipher_suite = 0
+        self.extensions: List[int] = []
+        self.selected_version = 0
+
+    @property
+    def version(self) -> int:
+        """Negotiated version: supported_versions (TLS 1.3) or the legacy server_version."""
+        return self.selected_version or self.legacy_version
+
+    @property
+    def is_hello_retry_request(self) -> bool:
+        return self.random == HELLO_RETRY_REQUEST_RANDOM
+
+
+def _truncated_sha256(text: str) -> str:
+    if not text:
+        return _JA4_EMPTY_HASH
+    return hashlib.sha256(text.encode("ascii")).hexdigest()[:12]
+
+
+def _u16_list(view: memoryview, start: int, end: int) -> List[int]:
+    if (end - start) & 1:
+        raise TLSParseError("odd-length u16 list")
+    return list(struct.unpack_from(f"!{(end - start) >> 1}H", view, start))
+
+
+def _vector(view: memoryview, pos: int, end: int, length_size: int) -> Tuple[int, int]:
+    """Return (start, end) of a length-prefixed vector at ``pos`` inside ``[pos, end)``."""
+    if pos + length_size > end:
+        raise TLSParseError("vector length runs past its container")
+    length = view[pos] if length_size == 1 else _unpack_u16(view, pos)[0]
+    start = pos + length_size
+    if start + length > end:
+        raise TLSParseError("vector runs past its container")
+    return start, start + length
+
+
+def client_hello_records(data) -> Tuple[memoryview, int]:
+    """Return (ClientHello handshake message, first record version) from TLS records.
+
+    Zero-copy when the message fits in the first record; raises TLSIncomplete
+    until every record carrying it is present.
+    """
+    return handshake_records(data, HANDSHAKE_CLIENT_HELLO)
+
+
+def handshake_records(data, handshake_type: int) -> Tuple[memoryview, int]:
+    """Return (first handshake message, first record version), which must be ``handshake_type``."""
+    view = memoryview(data)
+    size = len(view)
+    fragments = []
+    have = 0
+    needed = None
+    pos = 0
+    record_version = 0
+    while needed is None or have < needed:
+        if pos + 5 > size:
+            raise TLSIncomplete("handshake continues in a later record")
+        content_type, version, length = _unpack_record(view, pos)
+        if content_type != TLS_HANDSHAKE:
+            raise TLSParseError(f"not a handshake record (content type {content_type})")
+        if version >> 8 != 3 or length == 0:
+            raise TLSParseError(f"bad record header (version 0x{version:04x}, length {length})")
+        if not pos:
+            record_version = version
+        fragment = view[pos + 5:pos + 5 + length]
+        fragments.append(fragment)
+        have += len(fragment)
+        if needed is None and have >= 4:
+            head = fragments[0] if len(fragments[0]) >= 4 else b"".join(fragments)
+            if head[0] != handshake_type:
+                raise TLSParseError(f"unexpected handshake type {head[0]} (expected {handshake_type})")
+            needed = 4 + int.from_bytes(head[1:4], "big")
+        if pos + 5 + length > size:
+            if needed is None or have < needed:
+                raise TLSIncomplete("record truncated")
+            break
+        pos += 5 + length
+    if len(fragments) == 1:
+        return fragments[0][:needed], record_version
+    return memoryview(b"".join(fragments))[:needed], record_version
+
+
+def parse_handshake(message, record_version: int = 0) -> ClientHello:
+    """Parse a ClientHello handshake message (type, 3-byte length, body)."""
+    view = memoryview(message)
+    if len(view) < 4:
+        raise TLSIncomplete("short handshake header")
+    if view[0] != HANDSHAKE_CLIENT_HELLO:
+        raise TLSParseError(f"not a ClientHello (handshake type {view[0]})")
+    end = 4 + int.from_bytes(view[1:4], "big")
+    if len(view) < end:
+        raise TLSIncomplete("handshake message truncated")
+    hello = ClientHello()
+    hello.record_version = record_version
+    pos = 4
+    if pos + 34 > end:
+        raise TLSParseError("ClientHello too short")
+    hello.legacy_version = _unpack_u16(view, pos)[0]
+    hello.random = bytes(view[pos + 2:pos + 34])
+    pos += 34
+    start, pos = _vector(view, pos, end, 1)
+    hello.session_id_length = pos - start
+    start, pos = _vector(view, pos, end, 2)
+    hello.cipher_suites = _u16_list(view, start, pos)
+    start, pos = _vector(view, pos, end, 1)
+    hello.compression_methods = bytes(view[start:pos])
+    if pos == end:
+        # No extensions (SSL 3.0 style hello)
+        return hello
+    start, pos = _vector(view, pos, end, 2)
+    if pos != end:
+        raise TLSParseError("trailing bytes after extensions")
+    _parse_extensions(hello, view, start, pos)
+    return hello
+
+
+def _parse_extensions(hello: ClientHello, view: memoryview, pos: int, end: int):
+    extensions = hello.extensions
+    while pos < end:
+        if pos + 4 > end:
+            raise TLSParseError("truncated extension header")
+        ext_type = _unpack_u16(view, pos)[0]
+        start, pos = _vector(view, pos + 2, end, 2)
+        extensions.append(ext_type)
+        if ext_type == EXT_SERVER_NAME:
+            if start == pos:
+                # Empty server_name (allowed in a ServerHello-style echo)
+                continue
+            list_start, list_end = _vector(view, start, pos, 2)
+            while list_start < list_end:
+                name_type = view[list_start]
+                name_start, list_start = _vector(view, list_start + 1, list_end, 2)
+                if name_type == 0 and hello.sni is None:
+                    hello.sni = bytes(view[name_start:list_start]).decode("ascii", "replace")
+        elif ext_type == EXT_ALPN:
+            list_start, list_end = _vector(view, start, pos, 2)
+            while list_start < list_end:
+                proto_start, list_start = _vector(view, list_start, list_end, 1)
+                hello.alpn.append(bytes(view[proto_start:list_start]).decode("utf-8", "surrogateescape"))
+        elif ext_type == EXT_SUPPORTED_VERSIONS:
+            list_start, list_end = _vector(view, start, pos, 1)
+            hello.supported_versions = _u16_list(view, list_start, list_end)
+        elif ext_type == EXT_SUPPORTED_GROUPS:
+            list_start, list_end = _vector(view, start, pos, 2)
+            hello.supported_groups = _u16_list(view, list_start, list_end)
+        elif ext_type == EXT_EC_POINT_FORMATS:
+            list_start, list_end = _vector(view, start, pos, 1)
+            hello.ec_point_formats = list(view[list_start:list_end])
+        elif ext_type == EXT_SIGNATURE_ALGORITHMS:
+            list_start, list_end = _vector(view, start, pos, 2)
+            hello.signature_algorithms = _u16_list(view, list_start, list_end)
+
+
+def parse_server_hello(message) -> ServerHello:
+    """Parse a ServerHello handshake message (type, 3-byte length, body)."""
+    view = memoryview(message)
+    if len(view) < 4:
+        raise TLSIncomplete("short handshake header")
+    if view[0] != HANDSHAKE_SERVER_HELLO:
+        raise TLSParseError(f"not a ServerHello (handshake type {view[0]})")
+    end = 4 + int.from_bytes(view[1:4], "big")
+    if len(view) < end:
+        raise TLSIncomplete("handshake message truncated")
+    hello = ServerHello()
+    pos = 4
+    if pos + 34 > end:
+        raise TLSParseError("ServerHello too short")
+    hello.legacy_version = _unpack_u16(view, pos)[0]
+    hello.random = bytes(view[pos + 2:pos + 34])
+    _, pos = _vector(view, pos + 34, end, 1)
+    if pos + 3 > end:
+        raise TLSParseError("ServerHello too short")
+    hello.cipher_suite = _unpack_u16(view, pos)[0]
+    pos += 3
+    if pos == end:
+        return hello
+    pos, ext_end = _vector(view, pos, end, 2)
+    while pos < ext_end:
+        if pos + 4 > ext_end:
+            raise TLSParseError("truncated extension header")
+        ext_type = _unpack_u16(view, pos)[0]
+        start, pos = _vector(view, pos + 2, ext_end, 2)
+        hello.extensions.append(ext_type)
+        if ext_type == EXT_SUPPORTED_VERSIONS and pos - start == 2:
+            hello.selected_version = _unpack_u16(view, start)[0]
+    return hello
+
+
+def parse_client_hello(data) -> ClientHello:
+    """Parse the ClientHello at the start of a client->server TLS byte stream."""
+    message, record_version = client_hello_records(data)
+    return parse_handshake(message, record_version)
+
+
+def parse_server_hello_records(data) -> ServerHello:
+    """Parse the ServerHello at the start of a server->client TLS byte stream."""
+    return parse_server_hello(handshake_records(data, HANDSHAKE_SERVER_HELLO)[0])
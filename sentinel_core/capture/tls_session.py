@@ -0,0 +1,521 @@
+"""Decryption of captured TLS connections with SSLKEYLOGFILE secrets.
+
+``TLSSession`` follows both byte streams of one TCP connection: it frames
+TLS records, reads the ClientHello random and the ServerHello (version,
+cipher suite, server random) from the clear-text handshake, looks the
+client random up in the key log and derives traffic keys once, when the
+first protected record needs them. TLS 1.2 keys come from the master
+secret (one key per direction after ChangeCipherSpec); TLS 1.3 moves from
+early to handshake to application traffic keys (and through KeyUpdates),
+which the session follows by trying the next key when a record fails to
+authenticate under the current one. Application data is handed on as
+plaintext in stream order. Protected records that arrive before their keys
+are logged are held (bounded) and decrypted once the keys show up.
+
+``TLSDecryptor`` runs sessions on worker threads off the capture path.
+Capture only enqueues stream chunks; every chunk of a connection goes to
+the same worker (sharded by flow key), so records are decrypted in order.
+"""
+import time
+import struct
+import logging
+from collections import OrderedDict, deque
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+from .http_parser import HTTPStreamParser, HTTPRequest
+from .reassembly import CLIENT_TO_SERVER, SERVER_TO_CLIENT
+from .tls_parser import (
+    parse_handshake, parse_server_hello, TLSParseError, HANDSHAKE_CLIENT_HELLO, HANDSHAKE_SERVER_HELLO,
+    TLS_VERSION_NAMES
+)
+from .tls_crypto import (
+    CIPHER_SUITES, TLS12, TLS13, CONTENT_CHANGE_CIPHER_SPEC, CONTENT_ALERT, CONTENT_HANDSHAKE,
+    CONTENT_APPLICATION_DATA, RecordDecryptor, tls12_key_block, tls13_traffic_keys, tls13_next_secret
+)
+from ..pipeline import BoundedQueue, PipelineStage, DEFAULT_QUEUE_SIZE, OVERFLOW_DROP_NEWEST
+
+logger = logging.getLogger(__name__)
+
+# Largest TLSCiphertext fragment (RFC 5246: 2^14 + 2048)
+MAX_RECORD_LENGTH = 2 ** 14 + 2048
+# Protected bytes held per session while waiting for its keys
+DEFAULT_MAX_PENDING = 1024 * 1024
+# Plaintext kept per direction for display
+DEFAULT_PREVIEW_BYTES = 1024
+DEFAULT_MAX_SESSIONS = 10_000
+DEFAULT_RECENT = 200
+# Consecutive records that fail to authenticate before a session gives up
+MAX_FAILED_RECORDS = 8
+
+STATE_HANDSHAKE = "handshake"
+STATE_WAITING_FOR_KEYS = "waiting_for_keys"
+STATE_DECRYPTING = "decrypting"
+STATE_UNSUPPORTED = "unsupported"
+STATE_FAILED = "failed"
+
+_unpack_record = struct.Struct("!BHH").unpack_from
+
+# Key log labels of the TLS 1.3 traffic secrets, in the order each direction uses them
+_TLS13_LABELS = (
+    ("CLIENT_EARLY_TRAFFIC_SECRET", "CLIENT_HANDSHAKE_TRAFFIC_SECRET", "CLIENT_TRAFFIC_SECRET_0"),
+    (None, "SERVER_HANDSHAKE_TRAFFIC_SECRET", "SERVER_TRAFFIC_SECRET_0"),
+)
+
+# plaintext_sink(flow key, direction, plaintext), called on a decryption worker
+PlaintextSink = Callable[[tuple, int, bytes], None]
+# request_classifier(inspected request fields, server port) -> rule match dict or None, on a decryption worker
+RequestClassifier = Callable[[str, Optional[int]], Optional[Dict]]
+
+
+class _Direction:
+    """Record framing and key state of one direction."""
+    __slots__ = ("buffer", "handshake", "protected", "cipher", "epoch", "secrets", "ciphers", "app_epoch",
+                 "pending", "records", "plaintext_bytes", "preview")
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # Clear-text handshake bytes until the hello of this direction is parsed
+        self.handshake: Optional[bytearray] = bytearray()
+        # TLS 1.2: records after ChangeCipherSpec are protected
+        self.protected = False
+        self.cipher: Optional[RecordDecryptor] = None
+        # TLS 1.3: index into secrets/ciphers of the key in use
+        self.epoch = 0
+        self.secrets: List[bytes] = []
+        self.ciphers: Dict[int, RecordDecryptor] = {}
+        self.app_epoch: Optional[int] = None
+        # (content type, version, body) of protected records waiting for keys
+        self.pending: List[tuple] = []
+        self.records = 0
+        self.plaintext_bytes = 0
+        self.preview = bytearray()
+
+
+class TLSSession:
+    """One TLS connection: framing, handshake tracking, key setup and record decryption."""
+
+    def __init__(self, key: tuple, lookup: Callable[[bytes], Optional[Dict[str, bytes]]],
+                 sink: Optional[PlaintextSink] = None, app_type: Optional[str] = None, reverse: bool = False,
+                 max_pending: int = DEFAULT_MAX_PENDING, preview_bytes: int = DEFAULT_PREVIEW_BYTES,
+                 request_classifier: Optional[RequestClassifier] = None):
+        self.key = key
+        self.lookup = lookup
+        self.sink = sink
+        self.app_type = app_type
+        # The key is canonical; reverse means its second endpoint is the client
+        self.reverse = reverse
+        self.max_pending = max_pending
+        self.preview_bytes = preview_bytes
+        self.started = time.time()
+        self.state = STATE_HANDSHAKE
+        self.reason: Optional[str] = None
+        self.client_random: Optional[bytes] = None
+        self.server_random: Optional[bytes] = None
+        self.sni: Optional[str] = None
+        self.version: Optional[int] = None
+        self.cipher_suite: Optional[int] = None
+        self.suite = None
+        # First request of the client plaintext; every request is parsed and classified
+        self.http: Optional[Dict] = None
+        self.request_classifier = request_classifier
+        self.http_parser: Optional[HTTPStreamParser] = HTTPStreamParser(self._http_request)
+        self.requests = 0
+        self.attack: Optional[Dict] = None
+        self.directions = (_Direction(), _Direction())
+        self.pending_bytes = 0
+
+        # Counters
+        self.records_decrypted = 0
+        self.records_failed = 0
+        self.records_dropped = 0
+        self.key_derivations = 0
+        self._failed_run = 0
+
+    @property
+    def plaintext_bytes(self) -> int:
+        return self.directions[0].plaintext_bytes + self.directions[1].plaintext_bytes
+
+    def fail(self, reason: str):
+        self.state = STATE_FAILED
+        self.reason = reason
+        self._drop_pending()
+
+    def feed(self, direction: int, data: bytes):
+        """Feed the next bytes of one direction's TCP stream."""
+        if self.state in (STATE_FAILED, STATE_UNSUPPORTED):
+            return
+        d = self.directions[direction]
+        buffer = d.buffer
+        buffer += data
+        pos = 0
+        size = len(buffer)
+        while size - pos >= 5:
+            content_type, version, length = _unpack_record(buffer, pos)
+            if not CONTENT_CHANGE_CIPHER_SPEC <= content_type <= CONTENT_APPLICATION_DATA \
+                    or version >> 8 != 3 or length > MAX_RECORD_LENGTH:
+                self.fail(f"not a TLS record stream (type {content_type}, version 0x{version:04x})")
+                buffer.clear()
+                return
+            end = pos + 5 + length
+            if end > size:
+                break
+            self._record(direction, d, content_type, version, bytes(buffer[pos + 5:end]))
+            pos = end
+            if self.state in (STATE_FAILED, STATE_UNSUPPORTED):
+                buffer.clear()
+                return
+        del buffer[:pos]
+
+    def _record(self, direction: int, d: _Direction, content_type: int, version: int, body: bytes):
+        if d.protected or (self.version == TLS13 and content_type == CONTENT_APPLICATION_DATA):
+            self._protected(direction, d, content_type, version, body)
+        elif content_type == CONTENT_HANDSHAKE:
+            self._handshake(direction, d, body)
+        elif content_type == CONTENT_CHANGE_CIPHER_SPEC:
+            # TLS 1.3 sends it only for middlebox compatibility
+            if self.version != TLS13:
+                d.protected = True
+        elif content_type == CONTENT_APPLICATION_DATA:
+            # Protected data without a handshake we saw (picked up mid-connection)
+            self.records_dropped += 1
+
+    def _handshake(self, direction: int, d: _Direction, body: bytes):
+        if d.handshake is None:
+            return
+        handshake = d.handshake
+        handshake += body
+        while len(handshake) >= 4:
+            end = 4 + int.from_bytes(handshake[1:4], "big")
+            if len(handshake) < end:
+                if end > MAX_RECORD_LENGTH * 4:
+                    self.fail("oversized handshake message")
+                return
+            message = bytes(handshake[:end])
+            del handshake[:end]
+            try:
+                if direction == CLIENT_TO_SERVER and message[0] == HANDSHAKE_CLIENT_HELLO:
+                    hello = parse_handshake(message)
+                    self.client_random = hello.random
+                    self.sni = hello.sni
+                    d.handshake = None
+                    return
+                if direction == SERVER_TO_CLIENT and message[0] == HANDSHAKE_SERVER_HELLO:
+                    hello = parse_server_hello(message)
+                    if hello.is_hello_retry_request:
+                        continue
+                    self._server_hello(hello)
+                    d.handshake = None
+                    return
+            except TLSParseError as e:
+                self.fail(f"bad hello: {e}")
+                return
+
+    def _server_hello(self, hello):
+        self.server_random = hello.random
+        self.version = hello.version
+        self.cipher_suite = hello.cipher_suite
+        suite = CIPHER_SUITES.get(hello.cipher_suite)
+        if suite is None or suite.version != self.version:
+            self.state = STATE_UNSUPPORTED
+            self.reason = f"cipher suite 0x{hello.cipher_suite:04x} not supported"
+            self._drop_pending()
+            return
+        self.suite = suite
+
+    def _setup_keys(self) -> bool:
+        """Derive both directions' keys from the key log; False until they are available."""
+        if self.suite is None or self.client_random is None:
+            return False
+        secrets = self.lookup(self.client_random)
+        if not secrets:
+            self.state = STATE_WAITING_FOR_KEYS
+            return False
+        suite = self.suite
+        if suite.version == TLS12:
+            master = secrets.get("CLIENT_RANDOM")
+            if master is None or self.server_random is None:
+                self.state = STATE_WAITING_FOR_KEYS
+                return False
+            client, server = tls12_key_block(suite, master, self.client_random, self.server_random)
+            self.directions[CLIENT_TO_SERVER].cipher = RecordDecryptor(suite, *client)
+            self.directions[SERVER_TO_CLIENT].cipher = RecordDecryptor(suite, *server)
+            self.key_derivations += 1
+        else:
+            if not any(secrets.get(label) for labels in _TLS13_LABELS for label in labels if label):
+                self.state = STATE_WAITING_FOR_KEYS
+                return False
+            for direction, labels in enumerate(_TLS13_LABELS):
+                d = self.directions[direction]
+                d.secrets = []
+                d.app_epoch = None
+                for label in labels:
+                    secret = secrets.get(label) if label else None
+                    if secret is None:
+                        continue
+                    if label.endswith("_TRAFFIC_SECRET_0"):
+                        d.app_epoch = len(d.secrets)
+                    d.secrets.append(secret)
+                d.epoch = 0
+                d.ciphers = {}
+                d.cipher = self._epoch_cipher(d, 0)
+        self.state = STATE_DECRYPTING
+        for direction, d in enumerate(self.directions):
+            pending, d.pending = d.pending, []
+            for record in pending:
+                self._decrypt(direction, d, *record)
+        self.pending_bytes = 0
+        return True
+
+    def _epoch_cipher(self, d: _Direction, epoch: int) -> Optional[RecordDecryptor]:
+        """TLS 1.3 record decryptor of key ``epoch``, derived once; past the log's secrets come KeyUpdates."""
+        cipher = d.ciphers.get(epoch)
+        if cipher is not None:
+            return cipher
+        if epoch == len(d.secrets) and d.app_epoch is not None:
+            d.secrets.append(tls13_next_secret(self.suite, d.secrets[-1]))
+        if epoch >= len(d.secrets):
+            return None
+        cipher = d.ciphers[epoch] = RecordDecryptor(self.suite, *tls13_traffic_keys(self.suite, d.secrets[epoch]))
+        self.key_derivations += 1
+        return cipher
+
+    def _protected(self, direction: int, d: _Direction, content_type: int, version: int, body: bytes):
+        if d.cipher is None and self.state != STATE_DECRYPTING and not self._setup_keys():
+            if self.pending_bytes + len(body) > self.max_pending:
+                self.records_dropped += 1
+                return
+            d.pending.append((content_type, version, body))
+            self.pending_bytes += len(body)
+            return
+        self._decrypt(direction, d, content_type, version, body)
+
+    def _decrypt(self, direction: int, d: _Direction, content_type: int, version: int, body: bytes):
+        cipher = d.cipher
+        if cipher is None:
+            self.records_dropped += 1
+            return
+        result = cipher.decrypt(content_type, version, body)
+        if result is None and self.version == TLS13:
+            # Handshake -> application keys, or a KeyUpdate: the next key starts at sequence 0
+            for epoch in (d.epoch + 1, d.epoch + 2):
+                candidate = self._epoch_cipher(d, epoch)
+                if candidate is None:
+                    break
+                result = candidate.decrypt(content_type, version, body)
+                if result is not None:
+                    d.epoch = epoch
+                    d.cipher = candidate
+                    break
+        if result is None:
+            self.records_failed += 1
+            self._failed_run += 1
+            if self._failed_run >= MAX_FAILED_RECORDS:
+                self.fail("records do not authenticate with the logged keys")
+            return
+        self._failed_run = 0
+        self.records_decrypted += 1
+        inner_type, plaintext = result
+        if inner_type == CONTENT_APPLICATION_DATA and plaintext:
+            self._deliver(direction, d, plaintext)
+        elif inner_type == CONTENT_ALERT and len(plaintext) >= 2 and plaintext[0] == 2:
+            self.reason = f"fatal alert {plaintext[1]}"
+
+    def _deliver(self, direction: int, d: _Direction, plaintext: bytes):
+        d.records += 1
+        d.plaintext_bytes += len(plaintext)
+        room = self.preview_bytes - len(d.preview)
+        if room > 0:
+            d.preview += plaintext[:room]
+        if direction == CLIENT_TO_SERVER and self.http_parser is not None and not self.http_parser.feed(plaintext):
+            # Not (or no longer) HTTP
+            self.http_parser = None
+        if self.sink is not None:
+            self.sink(self.key, direction, plaintext)
+
+    def _http_request(self, request: HTTPRequest):
+        self.requests += 1
+        if self.http is None:
+            self.http = request.to_dict()
+        if self.request_classifier is None:
+            return
+        match = self.request_classifier(request.inspection_text(), self.key[2] if self.reverse else self.key[4])
+        if match is not None and (self.attack is None or match["confidence"] > self.attack["confidence"]):
+            match["method"] = request.method.decode("ascii", "replace")
+            match["uri"] = request.uri.decode("latin-1")
+            self.attack = match
+
+    def retry(self) -> bool:
+        """Try again to set up keys for records held while waiting; True once decrypting."""
+        if self.state == STATE_WAITING_FOR_KEYS:
+            return self._setup_keys()
+        return self.state == STATE_DECRYPTING
+
+    def _drop_pending(self):
+        for d in self.directions:
+            self.records_dropped += len(d.pending)
+            d.pending = []
+        self.pending_bytes = 0
+
+    def summary(self) -> Dict:
+        """Session metadata, decrypted byte counts and a plaintext preview per direction."""
+        protocol, src_ip, src_port, dst_ip, dst_port = self.key
+        if self.reverse:
+            src_ip, src_port, dst_ip, dst_port = dst_ip, dst_port, src_ip, src_port
+        http = self.http or {}
+        client, server = self.directions
+        return {
+            "flow_id": f"{src_ip}:{src_port}-{dst_ip}:{dst_port}/{protocol}",
+            "src_ip": src_ip,
+            "src_port": src_port,
+            "dst_ip": dst_ip,
+            "dst_port": dst_port,
+            "protocol": self.app_type or "TLS",
+            "status": "decrypted" if self.plaintext_bytes else self.state,
+            "state": self.state,
+            "reason": self.reason,
+            "sni": self.sni,
+            "host": http.get("host") or self.sni,
+            "method": http.get("method"),
+            "path": http.get("uri"),
+            "user_agent": http.get("user_agent"),
+            "requests": self.requests,
+            "http_attack": self.attack,
+            "tls_version": TLS_VERSION_NAMES.get(self.version) if self.version else None,
+            "cipher_suite": self.suite.name if self.suite else (
+                f"0x{self.cipher_suite:04x}" if self.cipher_suite is not None else None),
+            "client_bytes": client.plaintext_bytes,
+            "server_bytes": server.plaintext_bytes,
+            "records_decrypted": self.records_decrypted,
+            "records_failed": self.records_failed,
+            "request_preview": client.preview.decode("latin-1"),
+            "response_preview": server.preview.decode("latin-1"),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self.started)),
+        }
+
+
+class TLSDecryptor:
+    """Worker pool decrypting TLS sessions fed from capture-thread stream chunks."""
+
+    def __init__(self, lookup: Callable[[bytes], Optional[Dict[str, bytes]]], workers: int = 1,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 max_pending: int = DEFAULT_MAX_PENDING, plaintext_sink: Optional[PlaintextSink] = None,
+                 recent: int = DEFAULT_RECENT, request_classifier: Optional[RequestClassifier] = None):
+        self.lookup = lookup
+        self.workers = max(1, workers)
+        self.max_sessions = max(1, max_sessions // self.workers)
+        self.max_pending = max_pending
+        self.plaintext_sink = plaintext_sink
+        self.request_classifier = request_classifier
+        # Chunks are dropped rather than stall capture; the affected session is then abandoned
+        self.queues = [BoundedQueue(f"tls_decrypt_{i}", queue_size, OVERFLOW_DROP_NEWEST)
+                       for i in range(self.workers)]
+        self.stages = [PipelineStage(f"tls_decrypt_{i}", queue, partial(self._handle, i))
+                       for i, queue in enumerate(self.queues)]
+        # Per worker: flow key -> TLSSession, only touched by that worker's thread
+        self._sessions: List["OrderedDict[tuple, TLSSession]"] = [OrderedDict() for _ in range(self.workers)]
+        # Keys that lost a chunk to a full queue (set by capture, read by workers)
+        self._broken = set()
+        self.recent = deque(maxlen=recent)
+
+        # Per-worker counters of finished sessions, summed by get_stats
+        self._finished = [dict(sessions=0, decrypted=0, records_decrypted=0, records_failed=0,
+                               records_dropped=0, plaintext_bytes=0, no_keys=0, unsupported=0, failed=0,
+                               evicted=0)
+                          for _ in range(self.workers)]
+
+    def start(self) -> "TLSDecryptor":
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def close(self, timeout: Optional[float] = None):
+        for queue in self.queues:
+            queue.close()
+        for stage in self.stages:
+            stage.join(timeout)
+
+    def feed(self, key: tuple, direction: int, data: bytes, app_type: Optional[str] = None,
+             reverse: bool = False):
+        """Queue the next stream bytes of a connection (capture thread); never blocks.
+
+        ``app_type`` and ``reverse`` (the client is the key's second endpoint)
+        are taken from the first chunk of a connection.
+        """
+        if not self.queues[hash(key) % self.workers].put((key, direction, data, app_type, reverse)):
+            self._broken.add(key)
+
+    def end(self, key: tuple):
+        """The connection is over: finish its session."""
+        self.queues[hash(key) % self.workers].put((key, None, None, None, False))
+
+    def _handle(self, worker: int, batch: List):
+        sessions = self._sessions[worker]
+        broken = self._broken
+        for key, direction, data, app_type, reverse in batch:
+            session = sessions.get(key)
+            if direction is None:
+                if session is not None:
+                    del sessions[key]
+                    self._retire(worker, session)
+                broken.discard(key)
+                continue
+            if session is None:
+                session = sessions[key] = TLSSession(key, self.lookup, self.plaintext_sink, app_type, reverse,
+                                                     self.max_pending, request_classifier=self.request_classifier)
+                if len(sessions) > self.max_sessions:
+                    _, oldest = sessions.popitem(last=False)
+                    self._finished[worker]["evicted"] += 1
+                    self._retire(worker, oldest)
+            if broken and key in broken:
+                broken.discard(key)
+                session.fail("stream bytes lost to a full decryption queue")
+            session.feed(direction, data)
+
+    def _retire(self, worker: int, session: TLSSession):
+        # Keys are often logged just after the handshake; one last look before giving up
+        session.retry()
+        counters = self._finished[worker]
+        counters["sessions"] += 1
+        counters["records_decrypted"] += session.records_decrypted
+        counters["records_failed"] += session.records_failed
+        counters["records_dropped"] += session.records_dropped + sum(len(d.pending) for d in session.directions)
+        counters["plaintext_bytes"] += session.plaintext_bytes
+        if session.plaintext_bytes:
+            counters["decrypted"] += 1
+            self.recent.append(session.summary())
+        elif session.state == STATE_WAITING_FOR_KEYS:
+            counters["no_keys"] += 1
+        elif session.state == STATE_UNSUPPORTED:
+            counters["unsupported"] += 1
+        elif session.state == STATE_FAILED:
+            counters["failed"] += 1
+
+    def _active(self) -> List[TLSSession]:
+        active = []
+        for sessions in self._sessions:
+            try:
+                active.extend(sessions.values())
+            except RuntimeError:
+                # Changed size under us on a worker thread; skip it this time
+                continue
+        return active
+
+    def get_decrypted(self, limit: int = 50) -> List[Dict]:
+        """Summaries of sessions with decrypted data, newest first (active ones included)."""
+        active = [s.summary() for s in self._active() if s.plaintext_bytes]
+        finished = list(self.recent)
+        finished.reverse()
+        return (active[::-1] + finished)[:limit]
+
+    def get_stats(self) -> Dict:
+        """Session counts by state, record/plaintext counters and per-worker queues."""
+        stats = {name: sum(c[name] for c in self._finished) for name in self._finished[0]}
+        states = {}
+        for session in self._active():
+            states[session.state] = states.get(session.state, 0) + 1
+            stats["records_decrypted"] += session.records_decrypted
+            stats["plaintext_bytes"] += session.plaintext_bytes
+        stats["active"] = states
+        stats["workers"] = [stage.get_stats() for stage in self.stages]
+        return stats
@@ -0,0 +1,132 @@
+"""Low-overhead instrumentation: latency histograms, stage timers and rates.
+
+Hot paths are not timed on every packet. A caller decrements a countdown and
+times only one packet in ``timing_interval`` with ``time.perf_counter_ns``;
+the histograms are then an unbiased sample of per-packet stage latencies at
+a cost of a couple of integer operations for every other packet.
+
+Histograms use power-of-two nanosecond buckets (bucket ``i`` holds values
+below ``2**i`` ns), so recording is a ``bit_length()`` and an increment and
+percentiles are accurate to within a factor of two.
+"""
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Time one packet in this many on the capture hot path
+DEFAULT_TIMING_INTERVAL = 64
+
+# 2**33 ns ~ 8.6 s; slower observations land in the last bucket
+HISTOGRAM_BUCKETS = 34
+
+# Window over which packets/sec and bytes/sec are computed
+DEFAULT_RATE_WINDOW = 10.0
+
+
+class LatencyHistogram:
+    """Log2-bucketed latency histogram in nanoseconds."""
+    __slots__ = ("counts", "count", "total_ns", "max_ns")
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def observe_ns(self, ns: int) -> None:
+        bucket = ns.bit_length()
+        if bucket >= HISTOGRAM_BUCKETS:
+            bucket = HISTOGRAM_BUCKETS - 1
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def observe(self, seconds: float) -> None:
+        self.observe_ns(int(seconds * 1e9))
+
+    def percentile(self, q: float) -> int:
+        """Upper bound in ns of the bucket holding the ``q`` quantile (0..1)."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(1 << bucket, self.max_ns)
+        return self.max_ns
+
+    def get_stats(self) -> Dict:
+        """Return count, mean/max and p50/p90/p99 in microseconds, plus non-empty buckets."""
+        count = self.count
+        return {
+            "count": count,
+            "mean_us": round(self.total_ns / count / 1e3, 3) if count else 0.0,
+            "max_us": round(self.max_ns / 1e3, 3),
+            "p50_us": round(self.percentile(0.5) / 1e3, 3),
+            "p90_us": round(self.percentile(0.9) / 1e3, 3),
+            "p99_us": round(self.percentile(0.99) / 1e3, 3),
+            # "<= N us" upper bound -> observations
+            "buckets": {f"{(1 << bucket) / 1e3:g}": n for bucket, n in enumerate(self.counts) if n},
+        }
+
+
+class StageMetrics:
+    """Named latency histograms for the stages of one component."""
+
+    def __init__(self, timing_interval: int = DEFAULT_TIMING_INTERVAL):
+        self.timing_interval = max(1, timing_interval)
+        # Hot-path callers decrement this and time the packet that brings it to zero
+        self.countdown = self.timing_interval
+        self.histograms: Dict[str, LatencyHistogram] = {}
+
+    def histogram(self, stage: str) -> LatencyHistogram:
+        """Return (creating on first use) the histogram of ``stage``."""
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        return histogram
+
+    @contextmanager
+    def timed(self, stage: str):
+        """Time a block into ``stage``; meant for per-batch work, not per-packet code."""
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.histogram(stage).observe_ns(time.perf_counter_ns() - start)
+
+    def get_stats(self) -> Dict:
+        """Per-stage histogram summaries."""
+        return {stage: histogram.get_stats() for stage, histogram in self.histograms.items()}
+
+
+class RateMeter:
+    """Turns monotonically increasing counters into per-second rates over a sliding window."""
+
+    def __init__(self, window: float = DEFAULT_RATE_WINDOW):
+        self.window = window
+        self.started = time.monotonic()
+        # (time, {counter: value}) snapshots taken by rates()
+        self._samples = deque()
+
+    def rates(self, counters: Dict[str, int], now: Optional[float] = None) -> Dict[str, float]:
+        """Record a snapshot and return ``{name}_per_sec`` over the last ``window`` seconds."""
+        if now is None:
+            now = time.monotonic()
+        samples = self._samples
+        while len(samples) > 1 and now - samples[1][0] >= self.window:
+            samples.popleft()
+        if samples:
+            then, previous = samples[0]
+        else:
+            then, previous = self.started, {}
+        samples.append((now, dict(counters)))
+        elapsed = now - then
+        return {
+            f"{name}_per_sec": round((value - previous.get(name, 0)) / elapsed, 1) if elapsed > 0 else 0.0
+            for name, value in counters.items()
+        }
@@ -0,0 +1,238 @@
+"""Bounded queues and worker stages between capture, analysis and broadcast.
+
+Capture threads only ``put`` flow records into a ``BoundedQueue``; a
+``PipelineStage`` thread drains it in batches, so a slow classifier or a
+slow WebSocket client backs up a queue of known size instead of stalling
+packet reading. What happens when a queue is full is explicit and counted:
+
+* ``block``: the producer waits (backpressure; the kernel drops instead)
+* ``drop_oldest``: the oldest queued item makes room for the new one
+* ``drop_newest``: the new item is discarded
+* ``sample``: like ``drop_newest``, but every ``sample_every``-th new item
+  is admitted in place of the oldest, so a trickle of fresh data gets through
+"""
+import time
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_SAMPLE = "sample"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_SAMPLE)
+
+DEFAULT_QUEUE_SIZE = 10_000
+DEFAULT_BATCH_SIZE = 256
+
+
+class BoundedQueue:
+    """A fixed-capacity FIFO with an overflow policy and depth/drop counters."""
+
+    def __init__(self, name: str, maxsize: int = DEFAULT_QUEUE_SIZE, overflow: str = OVERFLOW_DROP_OLDEST,
+                 sample_every: int = 10):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}; expected one of {OVERFLOW_POLICIES}")
+        self.name = name
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.sample_every = max(1, sample_every)
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+        self._overflow_seen = 0
+
+        # Counters
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.blocked_puts = 0
+        self.blocked_seconds = 0.0
+        self.high_watermark = 0
+
+    def put(self, item) -> bool:
+        """Enqueue one item; returns False if it was dropped."""
+        return self.put_many((item,)) == 1
+
+    def put_many(self, items: Iterable) -> int:
+        """Enqueue items under one lock acquisition; returns how many were admitted."""
+        admitted = 0
+        with self._lock:
+            for item in items:
+                if self._closed:
+                    self.dropped += 1
+                    continue
+                if len(self._items) >= self.maxsize and not self._make_room():
+                    self.dropped += 1
+                    continue
+                self._items.append(item)
+                admitted += 1
+            if admitted:
+                self.enqueued += admitted
+                depth = len(self._items)
+                if depth > self.high_watermark:
+                    self.high_watermark = depth
+                self._not_empty.notify()
+        return admitted
+
+    def _make_room(self) -> bool:
+        """Apply the overflow policy to a full queue (lock held); True if the new item fits."""
+        overflow = self.overflow
+        if overflow == OVERFLOW_BLOCK:
+            self.blocked_puts += 1
+            start = time.monotonic()
+            while len(self._items) >= self.maxsize and not self._closed:
+                self._not_full.wait(0.5)
+            self.blocked_seconds += time.monotonic() - start
+            return not self._closed
+        if overflow == OVERFLOW_DROP_NEWEST:
+            return False
+        if overflow == OVERFLOW_SAMPLE:
+            self._overflow_seen += 1
+            if self._overflow_seen % self.sample_every:
+                return False
+        # drop_oldest, or a sampled admission
+        self._items.popleft()
+        self.dropped += 1
+        return True
+
+    def get_batch(self, max_items: int = DEFAULT_BATCH_SIZE, timeout: Optional[float] = None) -> List:
+        """Dequeue up to ``max_items``, waiting up to ``timeout`` for the first one."""
+        with self._lock:
+            if not self._items and not self._closed:
+                self._not_empty.wait(timeout)
+            items = self._items
+            count = min(max_items, len(items))
+            batch = [items.popleft() for _ in range(count)]
+            if batch:
+                self.dequeued += count
+                self._not_full.notify_all()
+            return batch
+
+    def close(self) -> None:
+        """Refuse further items and wake up every waiter."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def fill_ratio(self) -> float:
+        """Current depth as a fraction of capacity (a load signal for producers)."""
+        return len(self._items) / self.maxsize
+
+    def get_stats(self) -> Dict:
+        """Return depth, capacity and enqueue/dequeue/drop counters."""
+        return {
+            "depth": len(self._items),
+            "capacity": self.maxsize,
+            "overflow": self.overflow,
+            "high_watermark": self.high_watermark,
+            "enqueued": self.enqueued,
+            "dequeued": self.dequeued,
+            "dropped": self.dropped,
+            "blocked_puts": self.blocked_puts,
+            "blocked_seconds": round(self.blocked_seconds, 3),
+        }
+
+
+class PipelineStage:
+    """A worker thread that drains ``source`` in batches through ``handler``.
+
+    ``handler(batch)`` may return items for the next stage, which are put
+    into ``sink`` (if any) with that queue's overflow policy.
+    """
+
+    def __init__(self, name: str, source: BoundedQueue, handler: Callable[[List], Optional[List]],
+                 sink: Optional[BoundedQueue] = None, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.name = name
+        self.source = source
+        self.handler = handler
+        self.sink = sink
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+
+        # Counters
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+
+    def start(self) -> "PipelineStage":
+        self._thread = threading.Thread(target=self._run, name=f"sentinel-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        source = self.source
+        while True:
+            batch = source.get_batch(self.batch_size, timeout=1.0)
+            if not batch:
+                if source.closed:
+                    break
+                continue
+            start = time.perf_counter()
+            try:
+                output = self.handler(batch)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Pipeline stage {self.name} error: {e}")
+                output = None
+            self.busy_seconds += time.perf_counter() - start
+            self.processed += len(batch)
+            self.batches += 1
+            if output and self.sink is not None:
+                self.sink.put_many(output)
+        if self.sink is not None:
+            self.sink.close()
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def get_stats(self) -> Dict:
+        """Return this stage's throughput counters and its input queue's counters."""
+        return {
+            "processed": self.processed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "queue": self.source.get_stats(),
+        }
+
+
+class Pipeline:
+    """An ordered chain of stages; closing the head drains and stops them in order."""
+
+    def __init__(self, stages: List[PipelineStage]):
+        self.stages = stages
+
+    @property
+    def head(self) -> BoundedQueue:
+        return self.stages[0].source
+
+    def start(self) -> "Pipeline":
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop accepting input, let queued items drain, and wait for every stage."""
+        self.head.close()
+        for stage in self.stages:
+            stage.join(timeout)
+
+    def get_stats(self) -> Dict:
+        """Per-stage counters, keyed by stage name."""
+        return {stage.name: stage.get_stats() for stage in self.stages}
@@ -2,83 +2,458 @@
 """Sentinel backend entrypoint: capture + analysis + API."""
 import os
 import sys
+import time
 import logging
 import asyncio
 import threading
-from sentinel_core.capture.live_capture import PacketCapture
-from sentinel_core.analysis.attack_classifier import AttackClassifier, CVSSScore
+import functools
+from typing import Optional
+from sentinel_core.capture.live_capture import PacketCapture, DEFAULT_TLS_PACKET_BUDGET
+from sentinel_core.capture.emitter import EmitPolicy, EVENT_START, EVENT_END
+from sentinel_core.capture.sharded import ShardedCapture, SHARD_MODE_DISPATCHER, parse_cpu_list
+from sentinel_core.capture.bpf import parse_filter_spec
+from sentinel_core.capture.app_id import parse_app_ports, DEFAULT_PROBE_PACKETS
+from sentinel_core.capture.reassembly import DEFAULT_FLOW_LIMIT, DEFAULT_MEMORY_LIMIT
+from sentinel_core.capture.sampling import SamplingPolicy
+from sentinel_core.capture.flow import flow_key_from_dict
+from sentinel_core.capture.keylog import DEFAULT_MAX_SESSIONS as KEYLOG_MAX_SESSIONS, DEFAULT_TTL as KEYLOG_TTL
+from sentinel_core.capture.http_parser import DEFAULT_MAX_BODY as HTTP_MAX_BODY
+from sentinel_core.capture.quic import (
+    DEFAULT_KEY_CACHE_SIZE as QUIC_KEY_CACHE_SIZE, DEFAULT_MAX_CONNECTIONS as QUIC_MAX_CONNECTIONS
+)
+from sentinel_core.capture.packet_ring import (
+    PacketRing, RotatingPcapWriter, AlertDumper, DEFAULT_RING_PACKETS, DEFAULT_SNAPLEN,
+    DEFAULT_FLOW_LIMIT as DEFAULT_RING_FLOW_LIMIT, DEFAULT_PCAP_FILE_BYTES, DEFAULT_PCAP_FILES
+)
+from sentinel_core.analysis.attack_classifier import AttackClassifier, AttackType, CVSSScore
+from sentinel_core.analysis.rules import RuleEngine, DEFAULT_RELOAD_INTERVAL as RULES_RELOAD_INTERVAL
+from sentinel_core.analysis.intel import (
+    ThreatIntel, default_index_path, DEFAULT_FEEDS_PATH, DEFAULT_BLOOM_BITS,
+    DEFAULT_RELOAD_INTERVAL as INTEL_RELOAD_INTERVAL
+)
+from sentinel_core.analysis.correlation import CorrelationEngine, CorrelationThresholds, AUTH_SERVICES
+from sentinel_core.analysis.sketches import DEFAULT_WINDOW as CORRELATION_WINDOW, DEFAULT_MAX_KEYS
 from sentinel_core.api.main import create_app
+from sentinel_core.pipeline import (
+    Pipeline, PipelineStage, BoundedQueue, DEFAULT_QUEUE_SIZE, OVERFLOW_DROP_OLDEST
+)
+from sentinel_core.metrics import StageMetrics, DEFAULT_TIMING_INTERVAL
 import uvicorn
 from datetime import datetime
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global app instance
-app = create_app()
+# Global app instance and analysis components, built by setup() in the server process only:
+# ShardedCapture's spawned workers re-import this module and must not build them again
+app = None
+rule_engine: Optional[RuleEngine] = None
+threat_intel: Optional[ThreatIntel] = None
+correlator: Optional[CorrelationEngine] = None
+pipeline: Optional[Pipeline] = None
+alert_dumper: Optional[AlertDumper] = None
+
+# Enqueue / classification / broadcast latencies, served with the capture metrics
+analysis_metrics = StageMetrics()
+
+
+def rule_engine_from_env() -> RuleEngine:
+    """Detection rules from SENTINEL_RULES_FILE (default: the bundled default.rules)."""
+    return RuleEngine(
+        os.getenv("SENTINEL_RULES_FILE") or None,
+        # Seconds between checks of the rule file for changes (0 = no hot reload)
+        reload_interval=float(os.getenv("SENTINEL_RULES_RELOAD_INTERVAL", RULES_RELOAD_INTERVAL)),
+    )
+
+
+
+def threat_intel_from_env() -> ThreatIntel:
+    """Threat intel from SENTINEL_INTEL_FEEDS (default: the bundled feeds/ directory)."""
+    feeds = os.getenv("SENTINEL_INTEL_FEEDS")
+    feeds = feeds.split(",") if feeds else [DEFAULT_FEEDS_PATH]
+    # Bloom filter bits per domain in front of the domain index (0 = none)
+    bloom_bits = int(os.getenv("SENTINEL_INTEL_BLOOM_BITS", DEFAULT_BLOOM_BITS))
+    return ThreatIntel(
+        # Comma-separated feed files / directories
+        feeds,
+        # Compiled index file, memory-mapped and shared by every process that maps it (built
+        # from the feeds when they are newer; default: a cache file named after the feeds)
+        index_path=os.getenv("SENTINEL_INTEL_INDEX") or default_index_path(feeds, bloom_bits),
+        # Seconds between checks of the feeds / index for changes (0 = no hot reload)
+        reload_interval=float(os.getenv("SENTINEL_INTEL_RELOAD_INTERVAL", INTEL_RELOAD_INTERVAL)),
+        bloom_bits=bloom_bits,
+    )
+
+
+def analyze_flow(flow: dict):
+    """Classify and enrich a flow record in place; return an alert dict for critical/high flows."""
+    # Classify the flow
+    attack_type, confidence, reasons = AttackClassifier.classify_flow(flow)
+    
+    # Payload signatures matched by capture on the flow's HTTP requests
+    http_attack = flow.get("http_attack")
+    if http_attack:
+        reasons = reasons + [f"{reason} in {http_attack['method']} {http_attack['uri']}"
+                             for reason in http_attack["reasons"]]
+        if http_attack["confidence"] >= confidence:
+            attack_type = AttackType(http_attack["attack_type"])
+            confidence = http_attack["confidence"]
+    
+    # Brute force, scans and floods seen across the source's / destination's recent flows;
+    # repeats of attacks already alerted on are classified but do not raise another alert
+    correlated = fresh = False
+    if correlator is not None:
+        for correlated_type, correlated_confidence, reason, alert in correlator.observe(flow):
+            reasons = reasons + [reason]
+            fresh = fresh or alert
+            if correlated_confidence >= confidence:
+                attack_type = correlated_type
+                confidence = correlated_confidence
+                correlated = True
+    repeat = correlated and not fresh
+    
+    # Get CVSS parameters
+    cvss_params = AttackClassifier.get_cvss_for_attack(attack_type)
+    cvss_score = cvss_params.get("base", 0.0)
+    
+    # Determine severity
+    if cvss_score >= 9.0:
+        severity = "critical"
+    elif cvss_score >= 7.0:
+        severity = "high"
+    elif cvss_score >= 4.0:
+        severity = "medium"
+    else:
+        severity = "low"
+    
+    # Enrich flow; flow_id is stable so start/update/end records replace each other
+    flow_id = f"{flow.get('src_ip')}:{flow.get('src_port')}-{flow.get('dst_ip')}:{flow.get('dst_port')}"
+    flow.setdefault("flow_id", f"{flow_id}/{flow.get('protocol')}")
+    flow["attack_type"] = attack_type.value
+    flow["cvss_score"] = cvss_score
+    flow["confidence"] = confidence
+    flow["severity"] = severity
+    flow["detection_reasons"] = reasons
+    http = flow.get("http")
+    if http:
+        flow["method"] = http["method"]
+        flow["host"] = http["host"]
+        flow["path"] = http["uri"]
+        flow["user_agent"] = http["user_agent"]
+    flow["timestamp"] = datetime.utcnow().isoformat()
+    
+    logger.info(f"[{severity.upper()}] {attack_type.value} - CVSS {cvss_score} - {reasons}")
+    
+    if severity in ("critical", "high") and not repeat:
+        return {
+            "type": "THREAT_DETECTED",
+            "attack_type": attack_type.value,
+            "flow_id": flow_id,
+            "severity": severity,
+            "cvss_score": cvss_score,
+            "reasons": reasons,
+            "timestamp": flow["timestamp"]
+        }
+    return None
 
 
 def packet_callback(flow: dict):
     """Called when a new flow is detected."""
+    packet_batch_callback([flow])
+
+
+def packet_batch_callback(flows: list):
+    """Hand flow records to the analysis stage; never blocks capture unless overflow=block."""
+    start = time.perf_counter_ns()
+    pipeline.head.put_many(flows)
+    analysis_metrics.histogram("enqueue").observe_ns(time.perf_counter_ns() - start)
+
+
+def analyze_batch(flows: list) -> list:
+    """Analysis stage: classify flow records, returning alert and flow items to broadcast."""
+    enriched = []
+    alerts = []
+    classify = analysis_metrics.histogram("classify")
+    for flow in flows:
+        start = time.perf_counter_ns()
+        try:
+            alert = analyze_flow(flow)
+        except Exception as e:
+            logger.error(f"Error processing flow: {e}")
+            continue
+        finally:
+            classify.observe_ns(time.perf_counter_ns() - start)
+        enriched.append(("flow", flow))
+        if alert:
+            alerts.append(("alert", alert))
+            if alert_dumper is not None and alert["severity"] in PCAP_DUMP_SEVERITIES:
+                # The dumper thread copies the flow's recent frames out of the ring into a pcap
+                alert_dumper.request(flow_key_from_dict(flow), f"{alert['attack_type']} ({alert['severity']})")
+    return alerts + enriched
+
+
+_broadcast_loop = None
+
+
+def broadcast_batch(items: list):
+    """Broadcast stage: push a batch of alerts and flows to WebSocket clients in one loop run."""
+    global _broadcast_loop
+    
+    async def broadcast():
+        for kind, payload in items:
+            if kind == "alert":
+                await app.broadcast_alert(payload)
+            else:
+                await app.broadcast_flow(payload)
+    
+    # Broadcast to WebSocket clients
     try:
-        # Classify the flow
-        attack_type, confidence, reasons = AttackClassifier.classify_flow(flow)
-        
-        # Get CVSS parameters
-        cvss_params = AttackClassifier.get_cvss_for_attack(attack_type)
-        cvss_score = cvss_params.get("base", 0.0)
-        
-        # Determine severity
-        if cvss_score >= 9.0:
-            severity = "critical"
-        elif cvss_score >= 7.0:
-            severity = "high"
-        elif cvss_score >= 4.0:
-            severity = "medium"
-        else:
-            severity = "low"
-        
-        # Enrich flow
-        flow["attack_type"] = attack_type.value
-        flow["cvss_score"] = cvss_score
-        flow["confidence"] = confidence
-        flow["severity"] = severity
-        flow["detection_reasons"] = reasons
-        flow["timestamp"] = datetime.utcnow().isoformat()
-        
-        # Broadcast to WebSocket clients
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        if severity in ("critical", "high"):
-            alert = {
-                "type": "THREAT_DETECTED",
-                "attack_type": attack_type.value,
-                "flow_id": f"{flow.get('src_ip')}:{flow.get('src_port')}-{flow.get('dst_ip')}:{flow.get('dst_port')}",
-                "severity": severity,
-                "cvss_score": cvss_score,
-                "reasons": reasons,
-                "timestamp": flow["timestamp"]
-            }
-            loop.run_until_complete(app.broadcast_alert(alert))
-        
-        loop.run_until_complete(app.broadcast_flow(flow))
-        loop.close()
-        
-        logger.info(f"[{severity.upper()}] {attack_type.value} - CVSS {cvss_score} - {reasons}")
+        if _broadcast_loop is None:
+            _broadcast_loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(_broadcast_loop)
+        with analysis_metrics.timed("broadcast"):
+            _broadcast_loop.run_until_complete(broadcast())
     except Exception as e:
-        logger.error(f"Error processing flow: {e}")
+        logger.error(f"Error broadcasting flows: {e}")
+
+
+def pipeline_from_env() -> Pipeline:
+    """Capture -> analysis -> broadcast, decoupled by bounded queues (SENTINEL_PIPELINE_*)."""
+    size = int(os.getenv("SENTINEL_PIPELINE_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+    # block, drop_oldest, drop_newest or sample
+    overflow = os.getenv("SENTINEL_PIPELINE_OVERFLOW", OVERFLOW_DROP_OLDEST)
+    analysis_queue = BoundedQueue("analysis", size, overflow)
+    broadcast_queue = BoundedQueue("broadcast", size, os.getenv("SENTINEL_PIPELINE_BROADCAST_OVERFLOW", overflow))
+    return Pipeline([
+        PipelineStage("analysis", analysis_queue, analyze_batch, sink=broadcast_queue),
+        PipelineStage("broadcast", broadcast_queue, broadcast_batch),
+    ])
+
+
+
+def alert_dumper_from_env() -> Optional[AlertDumper]:
+    """Packet ring + pcap dumps of alerted flows (SENTINEL_PACKET_RING_*; off unless _MB > 0)."""
+    ring_mb = float(os.getenv("SENTINEL_PACKET_RING_MB", 0))
+    if ring_mb <= 0:
+        return None
+    ring = PacketRing(
+        capacity=int(ring_mb * 1024 * 1024),
+        max_packets=int(os.getenv("SENTINEL_PACKET_RING_PACKETS", DEFAULT_RING_PACKETS)),
+        snaplen=int(os.getenv("SENTINEL_PACKET_RING_SNAPLEN", DEFAULT_SNAPLEN)),
+        flow_limit=int(os.getenv("SENTINEL_PACKET_RING_FLOW_BYTES", DEFAULT_RING_FLOW_LIMIT)),
+    )
+    writer = RotatingPcapWriter(
+        os.getenv("SENTINEL_PCAP_DIR", "alert_pcaps"),
+        snaplen=ring.snaplen,
+        max_file_bytes=int(os.getenv("SENTINEL_PCAP_FILE_BYTES", DEFAULT_PCAP_FILE_BYTES)),
+        max_files=int(os.getenv("SENTINEL_PCAP_FILES", DEFAULT_PCAP_FILES)),
+    )
+    return AlertDumper(ring, writer)
+
+
+# Alert severities whose flows get their buffered packets dumped
+PCAP_DUMP_SEVERITIES = frozenset(os.getenv("SENTINEL_PCAP_DUMP_SEVERITY", "critical").split(","))
+
+
+def get_analysis_metrics() -> dict:
+    """Analysis-side stage latencies and queue drops for /api/metrics."""
+    return {
+        "stages": analysis_metrics.get_stats(),
+        "queue_drops": {stage.name: stage.source.dropped for stage in pipeline.stages},
+        "queue_depths": {stage.name: len(stage.source) for stage in pipeline.stages},
+    }
+
+
+
+def emit_policy_from_env() -> EmitPolicy:
+    """Build the flow emission policy from SENTINEL_EMIT_* environment variables."""
+    if os.getenv("SENTINEL_EMIT_PER_PACKET", "0").lower() in ("1", "true", "yes"):
+        return EmitPolicy.legacy()
+    interim = float(os.getenv("SENTINEL_EMIT_INTERIM", 5))
+    return EmitPolicy(
+        on_start=os.getenv("SENTINEL_EMIT_ON_START", "1").lower() in ("1", "true", "yes"),
+        on_end=os.getenv("SENTINEL_EMIT_ON_END", "1").lower() in ("1", "true", "yes"),
+        interim_interval=interim or None,
+        batch_size=int(os.getenv("SENTINEL_EMIT_BATCH_SIZE", 100)),
+        batch_interval=float(os.getenv("SENTINEL_EMIT_BATCH_INTERVAL", 1.0)),
+    )
+
+
+def sampling_policy_from_env() -> Optional[SamplingPolicy]:
+    """Build the overload sampling policy from SENTINEL_SAMPLING_* (None = never sample)."""
+    mode = os.getenv("SENTINEL_SAMPLING", "off").lower()
+    if mode in ("off", "0", "false", "none", ""):
+        return None
+    return SamplingPolicy(
+        mode=mode,
+        rate=int(os.getenv("SENTINEL_SAMPLING_RATE", 10)),
+        adaptive=os.getenv("SENTINEL_SAMPLING_ADAPTIVE", "1").lower() in ("1", "true", "yes"),
+        queue_high=float(os.getenv("SENTINEL_SAMPLING_QUEUE_HIGH", 0.8)),
+        queue_low=float(os.getenv("SENTINEL_SAMPLING_QUEUE_LOW", 0.3)),
+        latency_high=float(os.getenv("SENTINEL_SAMPLING_LATENCY_HIGH_US", 200)) / 1e6,
+        latency_low=float(os.getenv("SENTINEL_SAMPLING_LATENCY_LOW_US", 50)) / 1e6,
+        hold_time=float(os.getenv("SENTINEL_SAMPLING_HOLD", 5.0)),
+    )
+
+
+def correlation_engine_from_env() -> Optional[CorrelationEngine]:
+    """Cross-flow brute force / scan / flood / DDoS detection (SENTINEL_CORRELATION_*; None if off)."""
+    if os.getenv("SENTINEL_CORRELATION", "1").lower() not in ("1", "true", "yes"):
+        return None
+    defaults = CorrelationThresholds()
+    thresholds = CorrelationThresholds(**{
+        name: int(os.getenv(f"SENTINEL_CORRELATION_{name.upper()}", value))
+        for name, value in vars(defaults).items()
+    })
+    # Flows are counted on their start records, or on their end records if starts are not emitted
+    policy = emit_policy_from_env()
+    auth_services = os.getenv("SENTINEL_CORRELATION_AUTH_SERVICES")
+    return CorrelationEngine(
+        thresholds,
+        window=float(os.getenv("SENTINEL_CORRELATION_WINDOW", CORRELATION_WINDOW)),
+        # Keys per HyperLogLog table (vertical scans, horizontal scans, DDoS sources)
+        max_tracked=int(os.getenv("SENTINEL_CORRELATION_MAX_TRACKED", DEFAULT_MAX_KEYS)),
+        auth_services=auth_services.split(",") if auth_services else AUTH_SERVICES,
+        count_event=EVENT_START if policy.on_start or policy.per_packet else EVENT_END,
+        # Seconds before an attack already alerted on alerts again (default: the window)
+        realert_interval=float(os.environ["SENTINEL_CORRELATION_REALERT"])
+        if os.getenv("SENTINEL_CORRELATION_REALERT") else None,
+    )
+
+
+def setup():
+    """Build the app and the analysis components from the environment and register their stats."""
+    global app, rule_engine, threat_intel, correlator, pipeline, alert_dumper
+    app = create_app()
+    
+    rule_engine = rule_engine_from_env()
+    AttackClassifier.use_rules(rule_engine)
+    app.register_stats_source("rules", rule_engine.get_stats)
+    
+    threat_intel = threat_intel_from_env()
+    AttackClassifier.use_intel(threat_intel)
+    app.register_stats_source("intel", threat_intel.get_stats)
+    
+    correlator = correlation_engine_from_env()
+    if correlator is not None:
+        app.register_stats_source("correlation", correlator.get_stats)
+    
+    pipeline = pipeline_from_env()
+    app.register_stats_source("pipeline", pipeline.get_stats)
+    
+    alert_dumper = alert_dumper_from_env()
+    if alert_dumper is not None:
+        app.register_stats_source("packet_ring", alert_dumper.get_stats)
+    
+    app.register_metrics_source("analysis", get_analysis_metrics)
+
+
+def capture_kwargs_from_env() -> dict:
+    """PacketCapture settings shared by the single-process and sharded capture modes."""
+    return dict(
+        fast_path=os.getenv("SENTINEL_FAST_PATH", "0").lower() in ("1", "true", "yes"),
+        # "scapy" or "afpacket" (TPACKET_V3 mmap ring)
+        backend=os.getenv("SENTINEL_CAPTURE_BACKEND", "scapy"),
+        # Flow start/interim/end records are classified in batches, not per packet
+        emit_policy=emit_policy_from_env(),
+        idle_timeout=float(os.getenv("SENTINEL_FLOW_IDLE_TIMEOUT", 15)),
+        active_timeout=float(os.getenv("SENTINEL_FLOW_ACTIVE_TIMEOUT", 1800)),
+        max_flows=int(os.getenv("SENTINEL_MAX_FLOWS", 1_000_000)),
+        eviction_policy=os.getenv("SENTINEL_FLOW_EVICTION", "lru"),
+        # Extra PORT=APP mappings (or a JSON file) and payload packets probed per flow
+        app_ports=parse_app_ports(os.getenv("SENTINEL_APP_PORTS")),
+        app_probe_packets=int(os.getenv("SENTINEL_APP_PROBE_PACKETS", DEFAULT_PROBE_PACKETS)),
+        # TCP reassembly caps (bytes buffered per flow / across all flows)
+        stream_flow_limit=int(os.getenv("SENTINEL_REASSEMBLY_FLOW_LIMIT", DEFAULT_FLOW_LIMIT)),
+        stream_memory_limit=int(os.getenv("SENTINEL_REASSEMBLY_MEMORY_LIMIT", DEFAULT_MEMORY_LIMIT)),
+        # "packet" (1-in-N, counters scaled) or "flow" (hash-selected whole flows)
+        sampling=sampling_policy_from_env(),
+        # Kernel BPF filter: "default" (flows we track), "classifier", "none" or an expression
+        capture_filter=parse_filter_spec(
+            os.getenv("SENTINEL_CAPTURE_FILTER"),
+            protocols=os.getenv("SENTINEL_CAPTURE_PROTOCOLS"),
+            ports=os.getenv("SENTINEL_CAPTURE_PORTS"),
+            subnets=os.getenv("SENTINEL_CAPTURE_SUBNETS"),
+        ),
+        # Hot-path counters and stage latencies (one packet in N timed) for /api/metrics
+        instrument=os.getenv("SENTINEL_METRICS", "1").lower() in ("1", "true", "yes"),
+        timing_interval=int(os.getenv("SENTINEL_METRICS_TIMING_INTERVAL", DEFAULT_TIMING_INTERVAL)),
+        # SSLKEYLOGFILE is tailed; sessions kept (oldest unused first) and their max age in seconds
+        keylog_max_sessions=int(os.getenv("SENTINEL_KEYLOG_MAX_SESSIONS", KEYLOG_MAX_SESSIONS)),
+        keylog_ttl=float(os.getenv("SENTINEL_KEYLOG_TTL", KEYLOG_TTL)),
+        # QUIC Initial keys cached per destination connection ID
+        quic_key_cache_size=int(os.getenv("SENTINEL_QUIC_KEY_CACHE_SIZE", QUIC_KEY_CACHE_SIZE)),
+        # QUIC connections tracked at once until their ClientHello is seen
+        quic_max_connections=int(os.getenv("SENTINEL_QUIC_MAX_CONNECTIONS", QUIC_MAX_CONNECTIONS)),
+        # Packets per TLS flow inspected for its ClientHello/ServerHello, then TLS work stops
+        tls_packet_budget=int(os.getenv("SENTINEL_TLS_PACKET_BUDGET", DEFAULT_TLS_PACKET_BUDGET)),
+        # HTTP/1.x and HTTP/2 requests (plain and decrypted) matched against the payload rules
+        # (the rule engine travels to shard workers as its file path and reloads there)
+        request_classifier=(functools.partial(AttackClassifier.classify_request, rules=rule_engine)
+                            if os.getenv("SENTINEL_HTTP_INSPECT", "1").lower() in ("1", "true", "yes") else None),
+        http_max_body=int(os.getenv("SENTINEL_HTTP_MAX_BODY", HTTP_MAX_BODY)),
+    )
+
+
+def run_sharded_capture(interface: str, workers: int):
+    """Run capture in N worker processes, each owning a shard of the flow table."""
+    mode = os.getenv("SENTINEL_CAPTURE_SHARD_MODE", SHARD_MODE_DISPATCHER)
+    cpus = parse_cpu_list(os.getenv("SENTINEL_CAPTURE_CPUS"), workers)
+    if alert_dumper is not None:
+        logger.warning("Packet ring is not shared with capture worker processes; no alert pcaps in sharded mode")
+    if int(os.getenv("SENTINEL_TLS_DECRYPT_WORKERS", 0)):
+        logger.warning("TLS decryption runs only in single-process capture; not decrypting in sharded mode")
+    sharded = ShardedCapture(interface=interface, workers=workers, batch_callback=packet_batch_callback,
+                             mode=mode, cpus=cpus, capture_kwargs=capture_kwargs_from_env())
+    app.register_stats_source("capture", sharded.get_stats)
+    app.register_metrics_source("capture", sharded.get_stats)
+    sharded.start()
+    replay_file = os.getenv("SENTINEL_REPLAY_FILE")
+    if replay_file:
+        sharded.replay(replay_file)
+    else:
+        sharded.sniff()
 
 
 def run_capture_thread(interface: str = None):
     """Run packet capture in background thread."""
     try:
         logger.info("Initializing packet capture...")
-        capture = PacketCapture(interface=interface, callback=packet_callback)
-        logger.info(f"Starting live packet capture on {capture.interface}...")
-        logger.warning("⚠️  Packet capture requires root privileges!")
-        logger.info("Run with: sudo python3 -m sentinel_core.run_server")
-        capture.start_sniffing(timeout=None)
+        workers = int(os.getenv("SENTINEL_CAPTURE_WORKERS", 1))
+        if workers > 1:
+            run_sharded_capture(interface, workers)
+            return
+        
+        capture = PacketCapture(interface=interface, batch_callback=packet_batch_callback,
+                                load_source=pipeline.head.fill_ratio,
+                                packet_ring=alert_dumper.ring if alert_dumper is not None else None,
+                                # Decrypt TLS with SSLKEYLOGFILE keys on N worker threads (0 = off)
+                                decrypt_workers=int(os.getenv("SENTINEL_TLS_DECRYPT_WORKERS", 0)),
+                                decrypt_queue_size=int(os.getenv("SENTINEL_TLS_DECRYPT_QUEUE_SIZE",
+                                                                 DEFAULT_QUEUE_SIZE)),
+                                **capture_kwargs_from_env())
+        app.register_stats_source("capture", capture.get_capture_stats)
+        app.register_metrics_source("capture", capture.get_metrics)
+        # Decryption counters are part of the capture stats (capture["tls_decryption"])
+        if capture.decryptor is not None:
+            app.register_decrypted_source("capture", capture.decryptor.get_decrypted)
+        
+        try:
+            replay_file = os.getenv("SENTINEL_REPLAY_FILE")
+            if replay_file:
+                # Offline mode: stream a pcap/pcapng through the same flow pipeline
+                realtime = os.getenv("SENTINEL_REPLAY_REALTIME", "0").lower() in ("1", "true", "yes")
+                speed = float(os.getenv("SENTINEL_REPLAY_SPEED", "1.0"))
+                capture.replay(replay_file, realtime=realtime, speed=speed)
+                return
+            
+            logger.info(f"Starting live packet capture on {capture.interface}...")
+            logger.warning("⚠️  Packet capture requires root privileges!")
+            logger.info("Run with: sudo python3 -m sentinel_core.run_server")
+            capture.start_sniffing(timeout=None)
+        finally:
+            # Stop the decryption workers and key log follower
+            capture.close()
     except PermissionError:
         logger.error("Packet capture requires root. Run with: sudo python3 -m sentinel_core.run_server")
     except Exception as e:
@@ -95,6 +470,15 @@ def main():
     logger.info("SENTINEL v2.0 — Network Threat Intelligence Platform")
     logger.info("=" * 60)
     
+    setup()
+    
+    # Analysis and broadcast run in their own threads, fed through bounded queues
+    pipeline.start()
+    rule_engine.start()
+    threat_intel.start()
+    if alert_dumper is not None:
+        alert_dumper.start()
+    
     # Start packet capture in background
     capture_thread = threading.Thread(target=run_capture_thread, args=(interface,), daemon=True)
     capture_thread.start()
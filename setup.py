@@ -6,6 +6,7 @@ setup(
     description="Network packet analysis with TLS decryption",
     author="SmitAsher",
     packages=find_packages(),
+    package_data={"sentinel_core.analysis": ["default.rules", "feeds/*.txt"]},
     python_requires=">=3.8",
     install_requires=[],
 )